@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark：掃描角色卡資料夾取出 trailing 的耗時，比較
+  legacy      舊版 find_iend_end（逐 chunk f.read(length) 讀過 IDAT）+ read_trailing_data 重新開檔
+  seek        現行 read_hs2_card.read_trailing_data（只讀 chunk header、seek 跳過 payload、同一個 file handle）
+  mmap_view   read_hs2_card.open_card（mmap + zero-copy trailing memoryview），並解析 trailing header
+
+用法：
+  python bench_card_scan.py D:/HS2/UserData/chara/female
+  python bench_card_scan.py SRC/AI_191856.png --replicate 3000     # 複製成 3000 張到暫存資料夾再測
+  python bench_card_scan.py <dir> --repeat 3 -o bench_output.txt
+--replicate 測的是 OS page cache 熱的情況；冷快取請直接對真實卡片庫跑第一次。
+"""
+import argparse
+import json
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def _collect_cards(paths):
+    cards = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            cards.extend(sorted(x for x in p.rglob("*.png")))
+        elif p.exists():
+            cards.append(p)
+    return cards
+
+
+def _legacy_find_iend_end(path):
+    # 與舊版 read_hs2_card.find_iend_end 相同：payload 以 f.read 讀掉
+    with open(path, "rb") as f:
+        if f.read(8) != b"\x89PNG\r\n\x1a\n":
+            return None
+        while True:
+            raw_len = f.read(4)
+            if len(raw_len) < 4:
+                return None
+            length = struct.unpack(">I", raw_len)[0]
+            ctype = f.read(4)
+            f.read(length)
+            f.read(4)
+            if ctype == b"IEND":
+                return f.tell()
+
+
+def _legacy_read_trailing(path):
+    iend = _legacy_find_iend_end(path)
+    if iend is None:
+        return None
+    with open(path, "rb") as f:
+        f.seek(iend)
+        return f.read()
+
+
+def _scan_legacy(cards):
+    n_ok = 0
+    for p in cards:
+        if _legacy_read_trailing(p):
+            n_ok += 1
+    return n_ok
+
+
+def _scan_seek(cards):
+    from read_hs2_card import read_trailing_data
+    n_ok = 0
+    for p in cards:
+        trailing, _ = read_trailing_data(p)
+        if trailing:
+            n_ok += 1
+    return n_ok
+
+
+def _scan_mmap_view(cards):
+    from read_hs2_card import open_card
+    from parse_chafile_blocks import read_trailing_header
+    n_ok = 0
+    for p in cards:
+        try:
+            with open_card(p) as card:
+                _, _, err = read_trailing_header(card.trailing)
+                if not err:
+                    n_ok += 1
+        except ValueError:
+            pass
+    return n_ok
+
+
+MODES = (("legacy", _scan_legacy), ("seek", _scan_seek), ("mmap_view", _scan_mmap_view))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark PNG IEND scan / trailing extraction over a card library.")
+    ap.add_argument("cards", type=Path, nargs="+", help="Card PNG files or directories (recursive)")
+    ap.add_argument("--replicate", type=int, default=0, metavar="N", help="Copy the given cards into a temp dir until there are N files")
+    ap.add_argument("--repeat", type=int, default=3, help="Passes per mode; best pass is reported (default 3)")
+    ap.add_argument("-o", "--output", type=Path, default=None, help="Optional JSON output path")
+    args = ap.parse_args()
+
+    cards = _collect_cards(args.cards)
+    if not cards:
+        raise SystemExit("No PNG cards found in %s" % [str(p) for p in args.cards])
+
+    tmp = None
+    if args.replicate > len(cards):
+        tmp = tempfile.mkdtemp(prefix="bench_cards_")
+        src = cards
+        cards = []
+        for i in range(args.replicate):
+            dst = Path(tmp) / ("card_%05d.png" % i)
+            shutil.copyfile(src[i % len(src)], dst)
+            cards.append(dst)
+
+    try:
+        total_mb = sum(p.stat().st_size for p in cards) / 1e6
+        _out("Cards: %d (%.1f MB), repeat: %d" % (len(cards), total_mb, args.repeat))
+        results = []
+        for name, fn in MODES:
+            best = None
+            n_ok = 0
+            for _ in range(max(1, args.repeat)):
+                t0 = time.perf_counter()
+                n_ok = fn(cards)
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            r = {
+                "mode": name,
+                "best_sec": round(best, 4),
+                "cards_per_sec": round(len(cards) / best, 1) if best > 0 else None,
+                "us_per_card": round(best / len(cards) * 1e6, 1),
+                "ok": n_ok,
+            }
+            results.append(r)
+            _out("  %-10s %8.3f s  %10.1f cards/s  %8.1f us/card  (ok: %d)" % (
+                name, r["best_sec"], r["cards_per_sec"] or 0.0, r["us_per_card"], n_ok))
+        for r in results[1:]:
+            if r["best_sec"] > 0:
+                _out("  speedup vs legacy (%s): %.1fx" % (r["mode"], results[0]["best_sec"] / r["best_sec"]))
+        if args.output:
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"n_cards": len(cards), "total_mb": round(total_mb, 2), "results": results}, f, indent=2, ensure_ascii=False)
+            _out("Wrote: %s" % args.output)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark：extract_ratios 每張圖的耗時，比較「每次重建 FaceLandmarker」（舊行為）、「長駐 FaceLandmarkerSession」
+與「landmark 快取命中」（landmark_cache，暫存目錄、先暖一輪）。
+
+用法：
+  python bench_face_landmarker.py SRC/AI_191856.png "1 (1).jfif" --repeat 20
+  python bench_face_landmarker.py output/experiments/onedim_xxx --repeat 1 -o bench_output.txt
+目錄參數會遞迴收集 png/jpg/jfif。輸出每種模式的總時間、每張平均與 p50/p95（毫秒）。
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".jfif")
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def _collect_images(paths):
+    images = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            images.extend(sorted(x for x in p.rglob("*") if x.suffix.lower() in IMAGE_SUFFIXES))
+        elif p.exists():
+            images.append(p)
+    return images
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(q / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def _run(images, repeat, fresh_per_image, cache=False):
+    from extract_face_ratios import extract_ratios, FaceLandmarkerSession
+
+    per_image_ms = []
+    failures = 0
+    session = None if fresh_per_image else FaceLandmarkerSession()
+    if cache:
+        for img in images:  # 暖快取，不計時
+            try:
+                extract_ratios(img, session=session, cache=cache)
+            except ValueError:
+                pass
+    t_start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            for img in images:
+                t0 = time.perf_counter()
+                try:
+                    if fresh_per_image:
+                        # 舊行為：每次呼叫都重新載入 face_landmarker.task
+                        with FaceLandmarkerSession() as s:
+                            extract_ratios(img, session=s, cache=False)
+                    else:
+                        extract_ratios(img, session=session, cache=cache)
+                except ValueError:
+                    failures += 1
+                per_image_ms.append((time.perf_counter() - t0) * 1000.0)
+    finally:
+        if session is not None:
+            session.close()
+    total_sec = time.perf_counter() - t_start
+    if cache:
+        mode = "landmark_cache_hit"
+    else:
+        mode = "fresh_landmarker_per_image" if fresh_per_image else "persistent_session"
+    return {
+        "mode": mode,
+        "n_calls": len(per_image_ms),
+        "failures": failures,
+        "total_sec": round(total_sec, 3),
+        "mean_ms": round(sum(per_image_ms) / len(per_image_ms), 2) if per_image_ms else 0.0,
+        "p50_ms": round(_percentile(per_image_ms, 50), 2),
+        "p95_ms": round(_percentile(per_image_ms, 95), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark per-image extract_ratios cost: fresh FaceLandmarker per call vs persistent session.")
+    ap.add_argument("images", type=Path, nargs="+", help="Image files or directories (recursive)")
+    ap.add_argument("--repeat", type=int, default=10, help="Passes over the image list per mode (default 10)")
+    ap.add_argument("-o", "--output", type=Path, default=None, help="Optional JSON output path")
+    args = ap.parse_args()
+
+    images = _collect_images(args.images)
+    if not images:
+        raise SystemExit("No images found in %s" % [str(p) for p in args.images])
+
+    _out("Images: %d, repeat: %d" % (len(images), args.repeat))
+    from landmark_cache import LandmarkCache
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fresh, cache in ((True, False), (False, False), (False, LandmarkCache(root=tmp))):
+            r = _run(images, args.repeat, fresh, cache=cache)
+            results.append(r)
+            _out("  %-28s calls=%d  mean=%.2f ms  p50=%.2f ms  p95=%.2f ms  total=%.2f s  (no face: %d)" % (
+                r["mode"], r["n_calls"], r["mean_ms"], r["p50_ms"], r["p95_ms"], r["total_sec"], r["failures"]))
+    for r in results[1:]:
+        if r["mean_ms"] > 0:
+            _out("  speedup vs fresh (%s): %.1fx" % (r["mode"], results[0]["mean_ms"] / r["mean_ms"]))
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"images": [str(p) for p in images], "repeat": args.repeat, "results": results}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
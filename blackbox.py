@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 """
 黑盒子介面：get_next_guesses 供 run_experiment 每輪取得 N 組猜測（params dict）。
-Stub 實作：一組輸入參數 → 10 組輸出（100%、101%、…、109% 縮放），clamp 在 game_slider_range。
+strategy="stub"（預設）：一組輸入參數 → 10 組輸出（100%、101%、…、109% 縮放），clamp 在 game_slider_range。
+strategy="cmaes"：CMA-ES，每輪 N 組為一代族群；見 _cmaes_next_guesses。
 依臉型導入與反覆測試架構 §10。
 """
+import zlib
 from pathlib import Path
 
 
@@ -12,14 +14,10 @@ def _load_game_slider_range(map_path=None):
     if map_path is None:
         map_path = Path(__file__).resolve().parent / "ratio_to_slider_map.json"
     try:
-        from ratio_to_slider import load_map
-        m = load_map(map_path)
-        gr = m.get("game_slider_range")
-        if isinstance(gr, (list, tuple)) and len(gr) >= 2:
-            return float(gr[0]), float(gr[1])
+        from ratio_to_slider import load_compiled_map
+        return load_compiled_map(map_path).game_slider_range
     except Exception:
-        pass
-    return -100.0, 200.0
+        return -100.0, 200.0
 
 
 def _scale_params_one(params: dict, scale: float, lo: float, hi: float) -> dict:
@@ -43,6 +41,7 @@ def get_next_guesses(
     experiment_id,
     map_path=None,
     input_params=None,
+    strategy="stub",
     **kwargs
 ):
     """
@@ -51,8 +50,13 @@ def get_next_guesses(
     previous_rounds: 先前輪次結果（本 stub 可從中取最佳一組作為 input）。
     n_guesses: 欲產出的組數；stub 僅實作 n_guesses=10（100%～109%）。
     input_params: 一組 params 作為本輪輸入；若 None 且 previous_rounds 非空，可從上輪最佳取。
+    strategy: "stub" 或 "cmaes"（kwargs 可帶 sigma0、seed、stall_rounds，見 _cmaes_next_guesses）。
     """
     lo, hi = _load_game_slider_range(map_path)
+    if strategy == "cmaes":
+        return _cmaes_next_guesses(previous_rounds, n_guesses, lo, hi, experiment_id, input_params, **kwargs)
+    if strategy != "stub":
+        raise ValueError("Unknown blackbox strategy: %s" % strategy)
 
     # 取得本輪輸入的一組 params
     single = input_params
@@ -80,3 +84,146 @@ def get_next_guesses(
 
     # 其他 n_guesses：重複輸入 n 份（fallback）
     return [_scale_params_one(single, 1.0, lo, hi) for _ in range(n_guesses)]
+
+
+# ---------------------------------------------------------------------------
+# CMA-ES（Hansen, "The CMA Evolution Strategy: A Tutorial" 的標準參數）
+# get_next_guesses 無狀態：每次由 previous_rounds（各輪 guesses + total_losses）重播更新，得到目前的
+# mean / sigma / C / 演化路徑，再以 (experiment_id, 輪次) 為種子抽下一代。座標正規化到 [0, 1]（game_slider_range），
+# 抽出的點夾在範圍內，更新時用夾過（實際評估）的點。失敗（loss None）排在最後。
+# 重啟：sigma 過小、C 病態、或連續 stall_rounds 代最佳值沒有進步 → 以目前最佳點為中心、sigma0 重新開始。
+# ---------------------------------------------------------------------------
+
+
+class _CMAState:
+    def __init__(self, mean, sigma, lam):
+        import numpy as np
+        n = len(mean)
+        self.n = n
+        self.lam = lam
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.sigma = float(sigma)
+        self.C = np.eye(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        mu = lam // 2
+        w = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = w / w.sum()
+        self.mu = mu
+        self.mueff = 1.0 / float((self.weights ** 2).sum())
+        me = self.mueff
+        self.cc = (4 + me / n) / (n + 4 + 2 * me / n)
+        self.cs = (me + 2) / (n + me + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + me)
+        self.cmu = min(1 - self.c1, 2 * (me - 2 + 1 / me) / ((n + 2) ** 2 + me))
+        self.damps = 1 + 2 * max(0.0, np.sqrt((me - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+        self.generation = 0
+
+    def tell(self, ys, losses):
+        """ys: (λ', n) 已評估的正規化點；losses 中 None 視為最差。"""
+        import numpy as np
+        order = sorted(range(len(ys)), key=lambda i: (losses[i] is None, losses[i] if losses[i] is not None else 0.0))
+        mu = min(self.mu, len(order))
+        w = self.weights[:mu] / self.weights[:mu].sum()
+        sel = np.asarray([ys[i] for i in order[:mu]])
+        old = self.mean
+        steps = (sel - old) / self.sigma
+        yw = w @ steps
+        self.mean = old + self.sigma * yw
+        vals, vecs = np.linalg.eigh(self.C)
+        vals = np.maximum(vals, 1e-20)
+        c_inv_sqrt = vecs @ np.diag(vals ** -0.5) @ vecs.T
+        n, me = self.n, self.mueff
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * me) * (c_inv_sqrt @ yw)
+        self.generation += 1
+        hsig = np.linalg.norm(self.ps) / np.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi_n < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2 - self.cc) * me) * yw
+        rank_mu = (steps.T * w) @ steps
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc) + (not hsig) * self.cc * (2 - self.cc) * self.C)
+                  + self.cmu * rank_mu)
+        self.C = (self.C + self.C.T) / 2
+        self.sigma *= float(np.exp((self.cs / self.damps) * (np.linalg.norm(self.ps) / self.chi_n - 1)))
+
+    def ill_conditioned(self):
+        import numpy as np
+        vals = np.linalg.eigvalsh(self.C)
+        return self.sigma * np.sqrt(max(vals.max(), 0.0)) < 1e-4 or vals.max() > 1e14 * max(vals.min(), 1e-300)
+
+    def ask(self, rng, count):
+        import numpy as np
+        vals, vecs = np.linalg.eigh(self.C)
+        B = vecs * np.sqrt(np.maximum(vals, 0.0))
+        z = rng.standard_normal((count, self.n))
+        return np.clip(self.mean + self.sigma * (z @ B.T), 0.0, 1.0)
+
+
+def _seed_for(experiment_id, generation, seed=None):
+    base = zlib.crc32(str(experiment_id or "").encode("utf-8")) if seed is None else int(seed)
+    return (base * 1000003 + generation) & 0xFFFFFFFF
+
+
+def cmaes_replay(previous_rounds, n_guesses, lo, hi, input_params=None, sigma0=0.2, stall_rounds=8):
+    """
+    由 previous_rounds 重播 CMA-ES，回傳 (state, names, template, info)。
+    round 0 的第一組 guess 是起點（mean 本身），之後各輪 guesses 皆為抽樣點。
+    info: {"restarts", "best_loss", "best_params"}。
+    """
+    import numpy as np
+    first = input_params
+    if previous_rounds:
+        first = previous_rounds[0]["guesses"][0]
+    if not first:
+        return None, [], {}, {}
+    names = [k for k, v in first.items() if isinstance(v, (int, float))]
+    span = hi - lo
+
+    def norm(p):
+        return np.clip([(float(p.get(k, first[k])) - lo) / span for k in names], 0.0, 1.0)
+
+    lam = max(2, n_guesses)
+    state = _CMAState(norm(first), sigma0, lam)
+    best_loss, best_params = None, dict(first)
+    since_best = 0  # 自上次改善（或重啟）以來已 tell 的世代數
+    restarts = 0
+    for rd in previous_rounds or []:
+        guesses = rd.get("guesses") or []
+        losses = list(rd.get("total_losses") or [None] * len(guesses))
+        if not guesses:
+            continue
+        since_best += 1
+        for g, L in zip(guesses, losses):
+            if L is not None and (best_loss is None or L < best_loss):
+                best_loss, best_params = L, dict(g)
+                since_best = 0
+        state.tell([norm(g) for g in guesses], losses)
+        stalled = best_loss is not None and since_best >= stall_rounds
+        if state.ill_conditioned() or stalled:
+            state = _CMAState(norm(best_params), sigma0, lam)
+            restarts += 1
+            since_best = 0  # 重新計算停滯
+    return state, names, first, {"restarts": restarts, "best_loss": best_loss, "best_params": best_params}
+
+
+def _cmaes_next_guesses(previous_rounds, n_guesses, lo, hi, experiment_id=None, input_params=None,
+                        sigma0=0.2, seed=None, stall_rounds=8, **kwargs):
+    """
+    CMA-ES 下一代 N 組猜測。sigma0：初始步長（game_slider_range 的比例，0.2 = 60 遊戲單位）。
+    round 0（previous_rounds 為空）第一組為 input_params 本身，其餘 N-1 組為抽樣。
+    """
+    import numpy as np
+    state, names, template, info = cmaes_replay(previous_rounds, n_guesses, lo, hi, input_params, sigma0, stall_rounds)
+    if state is None:
+        return []
+    rng = np.random.default_rng(_seed_for(experiment_id, len(previous_rounds or []), seed))
+    ys = state.ask(rng, n_guesses)
+    if not previous_rounds:
+        ys[0] = state.mean
+    out = []
+    for y in ys:
+        p = dict(template)
+        for k, v in zip(names, y):
+            p[k] = round(float(lo + v * (hi - lo)), 2)
+        out.append(p)
+    return out
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+多點曲線校正：由 slider_sweep.py 的響應張量（每個 slider K 個 level 的實測 ratio）擬合單調分段曲線，
+寫入 ratio_to_slider_map.json 的 calibration[slider].curve（slider 遊戲值 → ratio 節點）。
+取代 calibrate_from_reference 的單點線性（ratio_min=0）；face_ratios_to_params 遇到 curve 時改走
+ratio_to_slider.CurveLUT 反查（單調三次內插、編譯一次、整批一次 NumPy 運算）。
+
+map 的 slider 為 PoC 名稱（eye_size 等），對應 PARAM_TO_LIST_INDICES 的第一個 index（同 face_knn）；
+同時改多個 index 的 slider（eye_size = eyeWidth + eyeHeight）只以第一個的響應擬合。
+
+Usage:
+  python calibrate_from_sweep.py --sweep output/slider_sweep/<sweep-id> [--write]
+"""
+import argparse
+import json
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+
+
+def fit_curves(response, map_data):
+    """
+    response（slider_sweep.load_response）+ map dict → {slider: calibration entry}，以及略過的 [(slider, 原因)]。
+    """
+    from ratio_to_slider import fit_monotone_curve
+    from write_face_params_to_card import PARAM_TO_LIST_INDICES, ALL_FACE_CHA_NAMES
+
+    sweep_sliders = [str(s) for s in response["slider_names"]]
+    ratio_names = [str(r) for r in response["ratio_names"]]
+    levels = response["levels"]
+    entries = {}
+    skipped = []
+    for ratio_name, r in (map_data.get("ratios") or {}).items():
+        slider = r.get("slider")
+        if not slider or slider in entries:
+            continue
+        indices = PARAM_TO_LIST_INDICES.get(slider)
+        if not indices:
+            skipped.append((slider, "not in PARAM_TO_LIST_INDICES"))
+            continue
+        cha_name = ALL_FACE_CHA_NAMES[indices[0]]
+        if cha_name not in sweep_sliders:
+            skipped.append((slider, "%s not in sweep" % cha_name))
+            continue
+        if ratio_name not in ratio_names:
+            skipped.append((slider, "ratio %s not in sweep" % ratio_name))
+            continue
+        s = sweep_sliders.index(cha_name)
+        curve = fit_monotone_curve(levels, response["ratios"][s, :, ratio_names.index(ratio_name)])
+        if curve is None:
+            skipped.append((slider, "flat or too few valid levels"))
+            continue
+        entries[slider] = {"ratio_name": ratio_name, "cha_name": cha_name, "curve": curve}
+    return entries, skipped
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit monotone slider->ratio curves from a slider_sweep response tensor")
+    ap.add_argument("--sweep", type=Path, required=True, help="slider_sweep 的 response.npz 或其目錄")
+    ap.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="寫入校準結果的 mapping JSON")
+    ap.add_argument("--write", action="store_true", help="寫入 ratio_to_slider_map.json；不加則只列印預覽")
+    args = ap.parse_args()
+
+    if not args.sweep.exists():
+        raise SystemExit("File not found: %s" % args.sweep)
+    if not args.map.exists():
+        raise SystemExit("File not found: %s" % args.map)
+
+    from slider_sweep import load_response
+    response = load_response(args.sweep)
+    m = json.loads(args.map.read_text(encoding="utf-8"))
+    entries, skipped = fit_curves(response, m)
+
+    calibration = dict(m.get("calibration") or {})
+    source = str(Path(args.sweep).resolve())
+    for slider, entry in entries.items():
+        entry["source"] = source
+        calibration[slider] = entry
+        c = entry["curve"]
+        print("%s: ratio_name=%s (%s) %d points, ratio %.4f .. %.4f over slider %.0f .. %.0f" % (
+            slider, entry["ratio_name"], entry["cha_name"], len(c["slider"]), c["ratio"][0], c["ratio"][-1],
+            c["slider"][0], c["slider"][-1]))
+    for slider, reason in skipped:
+        print("%s: skipped (%s), keeps existing calibration" % (slider, reason))
+
+    if args.write:
+        m["calibration"] = calibration
+        args.map.write_text(json.dumps(m, indent=2, ensure_ascii=False), encoding="utf-8")
+        print("Written to %s" % args.map)
+    else:
+        print("Preview only. Run with --write to update ratio_to_slider_map.json.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
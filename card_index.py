@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+角色卡庫索引：平行掃描資料夾樹，把每張卡的 59 個臉部滑桿值、ABMX 臉部骨骼摘要、ChaFile header 欄位、檔案 hash
+存成一個欄式（columnar）NumPy .npz 檔，供找 base card 用。
+
+增量更新：路徑 + size + mtime 沒變的卡直接沿用舊列；mtime 變了但內容 SHA-256 相同也不重新解析；刪除的檔案自動移除。
+
+用法：
+  python card_index.py build D:/HS2/UserData/chara/female -o output/card_index.npz --workers 8
+  python card_index.py query --index output/card_index.npz --where "eyeVertical<0" --where "jawWidth>50" --sort jawWidth --desc
+  python card_index.py stats --index output/card_index.npz
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_INDEX = BASE / "output" / "card_index.npz"
+INDEX_VERSION = 1
+N_FACE = 59
+
+# 非臉部滑桿的欄位（query --where / --sort 也可用這些數值欄位）
+NUMERIC_COLUMNS = ("size", "mtime_ns", "load_product_no", "language", "abmx_bones", "abmx_face_bones", "abmx_face_max_scale_dev")
+STRING_COLUMNS = ("path", "sha256", "marker", "version", "user_id", "data_id", "blocks", "error")
+BOOL_COLUMNS = ("ok", "abmx_present")
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def _face_names():
+    from write_face_params_to_card import ALL_FACE_CHA_NAMES
+    return list(ALL_FACE_CHA_NAMES)
+
+
+def _header_fields(trailing):
+    """ChaFile trailing 開頭：loadProductNo, marker, version, language, userID, dataID。"""
+    import struct
+    from validate_card_format import read_7bit_length_string
+    out = {"load_product_no": -1, "marker": "", "version": "", "language": -1, "user_id": "", "data_id": ""}
+    if len(trailing) < 4:
+        return out
+    out["load_product_no"] = struct.unpack_from("<i", trailing, 0)[0]
+    pos = 4
+    marker, pos = read_7bit_length_string(trailing, pos)
+    version, pos = read_7bit_length_string(trailing, pos) if marker is not None else (None, pos)
+    out["marker"] = marker or ""
+    out["version"] = version or ""
+    if version is None or pos + 4 > len(trailing):
+        return out
+    out["language"] = struct.unpack_from("<i", trailing, pos)[0]
+    pos += 4
+    user_id, pos = read_7bit_length_string(trailing, pos)
+    data_id, pos = read_7bit_length_string(trailing, pos) if user_id is not None else (None, pos)
+    out["user_id"] = user_id or ""
+    out["data_id"] = data_id or ""
+    return out
+
+
+def _abmx_summary(card):
+    """ABMX 摘要：是否存在、骨骼數、臉部骨骼數、臉部骨骼 scale 與 1 的最大偏差。"""
+    from parse_chafile_blocks import ABMX_GUID, parse_abmx_plugin_data, abmx_data_to_bone_list, is_face_bone
+    out = {"abmx_present": False, "abmx_bones": 0, "abmx_face_bones": 0, "abmx_face_max_scale_dev": 0.0}
+    try:
+        kkex = card.kkex()
+    except ValueError:
+        return out
+    if not isinstance(kkex, dict) or kkex.get(ABMX_GUID) is None:
+        return out
+    out["abmx_present"] = True
+    _, data, err = parse_abmx_plugin_data(kkex[ABMX_GUID])
+    if err:
+        return out
+    bones, err = abmx_data_to_bone_list(data)
+    if err:
+        return out
+    out["abmx_bones"] = len(bones)
+    dev = 0.0
+    for b in bones:
+        if not isinstance(b, (list, tuple)) or not b or not is_face_bone(b[0]):
+            continue
+        out["abmx_face_bones"] += 1
+        coords = b[1] if len(b) > 1 else None
+        c0 = coords[0] if isinstance(coords, (list, tuple)) and coords else None
+        scale = c0[0] if isinstance(c0, (list, tuple)) and c0 else None
+        if isinstance(scale, (list, tuple)):
+            for s in scale[:3]:
+                try:
+                    dev = max(dev, abs(float(s) - 1.0))
+                except (TypeError, ValueError):
+                    pass
+    out["abmx_face_max_scale_dev"] = dev
+    return out
+
+
+def _index_one(task):
+    """
+    Worker：task = (path, size, mtime_ns, known_sha)。known_sha 與檔案內容相同時回傳 {"same_as_known": True}。
+    回傳一列 dict（face 為 59 個遊戲值或 None）。
+    """
+    from read_hs2_card import open_card
+    from chafile_card import ChaFileCard
+
+    path, size, mtime_ns, known_sha = task
+    row = {"path": path, "size": size, "mtime_ns": mtime_ns, "sha256": "", "ok": False, "error": "", "face": None}
+    try:
+        mapped = open_card(path)
+    except (OSError, ValueError) as e:
+        row["error"] = str(e)
+        try:
+            with open(path, "rb") as f:
+                row["sha256"] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            pass
+        return row
+    with mapped:
+        row["sha256"] = hashlib.sha256(mapped.view).hexdigest()
+        if known_sha and row["sha256"] == known_sha:
+            return {"path": path, "size": size, "mtime_ns": mtime_ns, "same_as_known": True}
+        card = ChaFileCard.from_mapped(mapped)
+        try:
+            row.update(_header_fields(mapped.trailing))
+            row["blocks"] = ",".join(card.block_names())
+            face = card.read_face_params()
+            row["face"] = [face[n] for n in _face_names()]
+            row.update(_abmx_summary(card))
+            row["ok"] = True
+        except ValueError as e:
+            row["error"] = str(e)
+        finally:
+            del card
+    return row
+
+
+def _empty_columns():
+    return {
+        "path": [], "size": [], "mtime_ns": [], "sha256": [], "ok": [], "error": [],
+        "load_product_no": [], "marker": [], "version": [], "language": [], "user_id": [], "data_id": [],
+        "blocks": [], "abmx_present": [], "abmx_bones": [], "abmx_face_bones": [], "abmx_face_max_scale_dev": [],
+        "face": [],
+    }
+
+
+_DEFAULTS = {
+    "load_product_no": -1, "marker": "", "version": "", "language": -1, "user_id": "", "data_id": "",
+    "blocks": "", "abmx_present": False, "abmx_bones": 0, "abmx_face_bones": 0, "abmx_face_max_scale_dev": 0.0,
+}
+
+
+def load_index(path):
+    """讀 .npz 索引 → dict of numpy arrays（含 "face" (N, 59) float32、"face_names"）；不存在時回傳 None。"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        idx = {k: z[k] for k in z.files}
+    if int(idx.get("index_version", 0)) != INDEX_VERSION:
+        return None
+    return idx
+
+
+def save_index(path, columns, face_names):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrays = {
+        "index_version": np.array(INDEX_VERSION),
+        "face_names": np.array(face_names),
+        "face": np.asarray(columns["face"], dtype=np.float32).reshape(-1, N_FACE),
+        "size": np.asarray(columns["size"], dtype=np.int64),
+        "mtime_ns": np.asarray(columns["mtime_ns"], dtype=np.int64),
+        "load_product_no": np.asarray(columns["load_product_no"], dtype=np.int32),
+        "language": np.asarray(columns["language"], dtype=np.int32),
+        "abmx_bones": np.asarray(columns["abmx_bones"], dtype=np.int32),
+        "abmx_face_bones": np.asarray(columns["abmx_face_bones"], dtype=np.int32),
+        "abmx_face_max_scale_dev": np.asarray(columns["abmx_face_max_scale_dev"], dtype=np.float32),
+        "ok": np.asarray(columns["ok"], dtype=bool),
+        "abmx_present": np.asarray(columns["abmx_present"], dtype=bool),
+    }
+    for k in STRING_COLUMNS:
+        arrays[k] = np.array(columns[k], dtype=str) if columns[k] else np.array([], dtype="U1")
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _collect_cards(root):
+    root = Path(root)
+    if root.is_file():
+        return [root]
+    return sorted(p for p in root.rglob("*") if p.suffix.lower() == ".png" and p.is_file())
+
+
+def build_index(roots, index_path, workers=0, progress_interval=2.0):
+    """
+    掃描 roots 下所有 .png，增量更新 index_path。回傳統計 dict：total / reused / rehashed_same / parsed / removed / failed。
+    """
+    face_names = _face_names()
+    old = load_index(index_path)
+    old_rows = {}
+    if old is not None:
+        for i, p in enumerate(old["path"]):
+            old_rows[str(p)] = i
+
+    files = []
+    for r in roots:
+        files.extend(_collect_cards(r))
+    seen = set()
+    tasks = []
+    keep = []  # (path, old_row_index, new_mtime or None)
+    for p in files:
+        key = str(p.resolve())
+        if key in seen:
+            continue
+        seen.add(key)
+        st = p.stat()
+        i = old_rows.get(key)
+        if i is not None and int(old["size"][i]) == st.st_size and int(old["mtime_ns"][i]) == st.st_mtime_ns:
+            keep.append((key, i, None))
+            continue
+        known_sha = str(old["sha256"][i]) if i is not None and int(old["size"][i]) == st.st_size else ""
+        tasks.append((key, st.st_size, st.st_mtime_ns, known_sha))
+
+    results = []
+    t_last = time.time()
+    if workers and workers >= 2 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for row in pool.map(_index_one, tasks, chunksize=max(1, min(64, len(tasks) // (workers * 4) or 1))):
+                results.append(row)
+                if progress_interval and time.time() - t_last >= progress_interval:
+                    _out("  indexed %d / %d changed cards" % (len(results), len(tasks)))
+                    t_last = time.time()
+    else:
+        for t in tasks:
+            results.append(_index_one(t))
+            if progress_interval and time.time() - t_last >= progress_interval:
+                _out("  indexed %d / %d changed cards" % (len(results), len(tasks)))
+                t_last = time.time()
+
+    cols = _empty_columns()
+
+    def add_old(i, mtime_ns=None):
+        for k in cols:
+            if k == "face":
+                cols[k].append(old["face"][i])
+            elif k == "mtime_ns" and mtime_ns is not None:
+                cols[k].append(mtime_ns)
+            else:
+                cols[k].append(old[k][i].item() if hasattr(old[k][i], "item") else old[k][i])
+
+    rehashed_same = 0
+    failed = 0
+    for key, i, _ in keep:
+        add_old(i)
+    for row in results:
+        if row.get("same_as_known"):
+            rehashed_same += 1
+            add_old(old_rows[row["path"]], mtime_ns=row["mtime_ns"])
+            continue
+        if not row["ok"]:
+            failed += 1
+        for k in cols:
+            if k == "face":
+                face = row.get("face")
+                cols[k].append(np.array(face, dtype=np.float32) if face is not None else np.full(N_FACE, np.nan, dtype=np.float32))
+            else:
+                cols[k].append(row.get(k, _DEFAULTS.get(k)))
+
+    # 依路徑排序，讓索引內容與掃描順序無關
+    order = sorted(range(len(cols["path"])), key=lambda j: cols["path"][j])
+    cols = {k: [v[j] for j in order] for k, v in cols.items()}
+    save_index(index_path, cols, face_names)
+    return {
+        "total": len(cols["path"]),
+        "reused": len(keep),
+        "rehashed_same": rehashed_same,
+        "parsed": len(results) - rehashed_same,
+        "failed": failed,
+        "removed": len(set(old_rows) - seen) if old is not None else 0,
+    }
+
+
+_WHERE_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(<=|>=|==|!=|<|>)\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s*$")
+
+
+def column_values(idx, name):
+    """索引欄位 → 1D numpy array；name 可為臉部滑桿 cha_name（如 eyeVertical）或數值欄位。"""
+    face_names = [str(n) for n in idx["face_names"]]
+    if name in face_names:
+        return idx["face"][:, face_names.index(name)]
+    if name in NUMERIC_COLUMNS or name in BOOL_COLUMNS:
+        return idx[name]
+    raise ValueError("Unknown column: %s (face sliders: %s ...; numeric: %s)" % (name, ", ".join(face_names[:5]), ", ".join(NUMERIC_COLUMNS)))
+
+
+def query_index(idx, where=(), require_ok=True):
+    """where: ["eyeVertical<0", "jawWidth>50", ...]（AND）。回傳符合的列索引（numpy int array）。"""
+    mask = idx["ok"].copy() if require_ok else np.ones(len(idx["path"]), dtype=bool)
+    ops = {
+        "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+        "==": np.equal, "!=": np.not_equal,
+    }
+    for cond in where:
+        m = _WHERE_RE.match(cond)
+        if not m:
+            raise ValueError("Bad --where condition: %r (expected e.g. eyeVertical<0)" % cond)
+        name, op, val = m.groups()
+        col = column_values(idx, name)
+        with np.errstate(invalid="ignore"):
+            mask &= ops[op](col, float(val))
+    return np.nonzero(mask)[0]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / query an index of HS2 character cards by face slider values.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Scan directories (recursive) and update the index incrementally")
+    b.add_argument("roots", type=Path, nargs="+", help="Card directories or files")
+    b.add_argument("-o", "--index", type=Path, default=DEFAULT_INDEX, help="Index path (default: output/card_index.npz)")
+    b.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel worker processes (default: CPU count; 0/1 = serial)")
+    q = sub.add_parser("query", help="Filter cards by slider / column conditions")
+    q.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    q.add_argument("--where", action="append", default=[], metavar="COND", help="e.g. eyeVertical<0 (repeatable, AND)")
+    q.add_argument("--sort", default=None, metavar="COLUMN", help="Sort by column (ascending)")
+    q.add_argument("--desc", action="store_true", help="Sort descending")
+    q.add_argument("--limit", type=int, default=50)
+    q.add_argument("--show", default="", help="Comma-separated extra columns to print (e.g. eyeVertical,jawWidth)")
+    q.add_argument("--json", type=Path, default=None, help="Write matches (path + all 59 face values) to JSON")
+    s = sub.add_parser("stats", help="Index summary")
+    s.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    args = ap.parse_args()
+
+    if args.command == "build":
+        for r in args.roots:
+            if not r.exists():
+                raise SystemExit("Not found: %s" % r)
+        t0 = time.perf_counter()
+        st = build_index(args.roots, args.index, workers=args.workers)
+        _out("Index: %s" % args.index)
+        _out("  cards: %d  reused: %d  same hash: %d  parsed: %d  failed: %d  removed: %d  (%.2f s)" % (
+            st["total"], st["reused"], st["rehashed_same"], st["parsed"], st["failed"], st["removed"], time.perf_counter() - t0))
+        return 0
+
+    idx = load_index(args.index)
+    if idx is None:
+        raise SystemExit("Index not found or outdated: %s (run: python card_index.py build <dir>)" % args.index)
+
+    if args.command == "stats":
+        n = len(idx["path"])
+        _out("Index: %s" % args.index)
+        _out("  cards: %d  ok: %d  failed: %d  with ABMX: %d" % (n, int(idx["ok"].sum()), n - int(idx["ok"].sum()), int(idx["abmx_present"].sum())))
+        _out("  total size: %.1f MB" % (idx["size"].sum() / 1e6))
+        return 0
+
+    try:
+        rows = query_index(idx, args.where)
+        show = [c.strip() for c in args.show.split(",") if c.strip()]
+        for c in show:
+            column_values(idx, c)
+        if args.sort:
+            key = column_values(idx, args.sort)[rows].astype(np.float64)
+            order = np.argsort(-key if args.desc else key, kind="stable")
+            rows = rows[order]
+    except ValueError as e:
+        raise SystemExit(str(e))
+    _out("Matches: %d" % len(rows))
+    for r in rows[: args.limit]:
+        extra = "  ".join("%s=%g" % (c, column_values(idx, c)[r]) for c in show)
+        _out("  %s  %s" % (idx["path"][r], extra))
+    if args.json:
+        face_names = [str(n) for n in idx["face_names"]]
+        out = [
+            {"path": str(idx["path"][r]), "sha256": str(idx["sha256"][r]),
+             "face": {n: int(v) for n, v in zip(face_names, idx["face"][r])}}
+            for r in rows
+        ]
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"where": args.where, "matches": out}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
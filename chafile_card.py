@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+ChaFileCard：HS2 角色卡（PNG + IEND 後的 ChaFile trailing）只解析一次的物件模型。
+
+- PNG / trailing 分界、trailing header、BlockHeader（lstInfo）在建立時解析一次。
+- 各 block（Custom、Coordinate、KKEx…）以 memoryview 切片提供，用到時才解碼（lazy）。
+- Custom block 只用 msgpack skip 掃出各 object 邊界，只有含 shapeValueFace 的那個 object 會被 unpack；
+  之後重複 set_face_params 只重新 pack 該 object，其他 bytes 原封不動。
+
+用法：
+  card = ChaFileCard.from_path("SRC/AI_191856.png")
+  card.set_face_params({"eye_vertical": 30, "jawWidth": -20})
+  card.save("output/edited.png")
+
+優化迴圈（同一張 base card 產上千張卡）請用 CardTemplate / write_card_from_base。
+"""
+import struct
+import threading
+from pathlib import Path
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from read_hs2_card import find_iend_in_bytes
+from parse_chafile_blocks import read_trailing_header, parse_block_header, parse_kkex
+from write_face_params_to_card import (
+    ALL_FACE_CHA_NAMES,
+    KEY_FACE,
+    _apply_face_params,
+    _msgpack_pack,
+)
+
+FACE_KEY = "shapeValueFace"
+N_FACE_VALUES = 59
+
+
+def _unpacker():
+    try:
+        return msgpack.Unpacker(raw=False, strict_map_key=False)
+    except TypeError:
+        return msgpack.Unpacker(raw=False)
+
+
+class ChaFileCard:
+    """
+    data: 整張卡 bytes（PNG + trailing）；或以 from_trailing 只給 trailing（png_bytes 為 None）。
+    也可用 from_mapped(MappedCard) 直接建在 mmap 上（卡片庫掃描用，MappedCard 關閉前有效）。
+    格式錯誤（非 PNG、header/BlockHeader 壞掉、無 shapeValueFace）以 ValueError 回報。
+    """
+
+    def __init__(self, data, trailing_offset=None):
+        # bytes / memoryview（如 read_hs2_card.open_card 的 mmap view）直接沿用不複製；其他可變 buffer 先複製
+        self._data = data if isinstance(data, (bytes, memoryview)) else bytes(data)
+        view = memoryview(self._data)
+        if trailing_offset is None:
+            trailing_offset = find_iend_in_bytes(self._data)
+            if trailing_offset is None:
+                raise ValueError("Not a valid PNG (IEND not found)")
+        self.trailing_offset = trailing_offset
+        self.png_bytes = view[:trailing_offset] if trailing_offset > 0 else None
+        self.trailing = view[trailing_offset:]
+        self._header = None
+        self._blocks = {}
+        # Custom block 的 object 邊界與 face object（lazy）
+        self._custom_spans = None
+        self._face_span = None
+        self._face_obj = None
+        self._face_blob = None
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(Path(path).read_bytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data)
+
+    @classmethod
+    def from_trailing(cls, trailing):
+        return cls(trailing, trailing_offset=0)
+
+    @classmethod
+    def from_mapped(cls, mapped):
+        """read_hs2_card.MappedCard → ChaFileCard（zero-copy；IEND 已由 MappedCard 找到）。"""
+        return cls(mapped.view, trailing_offset=mapped.iend)
+
+    # ---- header / blocks ----
+
+    def _parse_header(self):
+        if self._header is None:
+            bh_bytes, base_pos, err = read_trailing_header(self.trailing)
+            if err:
+                raise ValueError("ChaFile header: %s" % err)
+            lst_info, err = parse_block_header(bh_bytes)
+            if err:
+                raise ValueError("BlockHeader: %s" % err)
+            infos = []
+            for info in lst_info:
+                if isinstance(info, dict):
+                    get = info.get
+                else:
+                    get = lambda k, d=None, _i=info: getattr(_i, k, d)  # noqa: E731
+                infos.append({
+                    "name": get("name", ""),
+                    "version": get("version", ""),
+                    "pos": int(get("pos", 0)),
+                    "size": int(get("size", 0)),
+                })
+            self._header = (base_pos, infos)
+        return self._header
+
+    @property
+    def base_position(self):
+        return self._parse_header()[0]
+
+    def block_infos(self):
+        """lstInfo：[{name, version, pos, size}, ...]（pos 相對於 base_position）。"""
+        return list(self._parse_header()[1])
+
+    def block_names(self):
+        return [info["name"] for info in self._parse_header()[1]]
+
+    def block_info(self, name):
+        for info in self._parse_header()[1]:
+            if info["name"] == name:
+                return info
+        return None
+
+    def _block_range(self, name):
+        info = self.block_info(name)
+        if info is None:
+            return None
+        start = self.base_position + info["pos"]
+        end = start + info["size"]
+        if end > len(self.trailing):
+            raise ValueError("Block %s out of range" % name)
+        return start, end
+
+    def block(self, name):
+        """原始 block bytes 的 memoryview（不複製）；不存在時回傳 None。"""
+        rng = self._block_range(name)
+        if rng is None:
+            return None
+        view = self._blocks.get(name)
+        if view is None:
+            view = self.trailing[rng[0] : rng[1]]
+            self._blocks[name] = view
+        return view
+
+    def kkex(self):
+        """KKEx block → dict（plugin GUID → PluginData）；無此 block 時回傳 None。"""
+        blob = self.block("KKEx")
+        if blob is None:
+            return None
+        d, err = parse_kkex(blob)
+        if err:
+            raise ValueError("KKEx: %s" % err)
+        return d
+
+    # ---- Custom block / face ----
+
+    def custom_object_spans(self):
+        """Custom block 內每個 msgpack object 的 (start, end)（相對於 block 起點），只 skip 不解碼。"""
+        if self._custom_spans is None:
+            if msgpack is None:
+                raise ValueError("msgpack not installed")
+            blob = self.block("Custom")
+            if blob is None:
+                raise ValueError("No Custom block")
+            up = _unpacker()
+            up.feed(blob)
+            spans = []
+            while up.tell() < len(blob):
+                start = up.tell()
+                try:
+                    up.skip()
+                except Exception:
+                    break
+                spans.append((start, up.tell()))
+            self._custom_spans = spans
+        return self._custom_spans
+
+    def _load_face(self):
+        if self._face_obj is not None:
+            return
+        blob = self.block("Custom")
+        spans = self.custom_object_spans()
+        for start, end in spans:
+            if bytes(blob[start:end]).find(KEY_FACE) < 0:
+                continue
+            up = _unpacker()
+            up.feed(blob[start:end])
+            obj = up.unpack()
+            if isinstance(obj, dict) and FACE_KEY in obj:
+                self._face_span = (start, end)
+                self._face_obj = obj
+                self._face_blob = bytes(blob[start:end])
+                return
+        raise ValueError("shapeValueFace not found in Custom block")
+
+    @property
+    def has_face(self):
+        try:
+            self._load_face()
+        except ValueError:
+            return False
+        return True
+
+    def face_values(self):
+        """目前的 59 個 shapeValueFace float（含尚未存檔的修改）。"""
+        self._load_face()
+        return list(self._face_obj[FACE_KEY])
+
+    def read_face_params(self):
+        """cha_name → 遊戲值（round(float*100)），同 read_face_from_trailing_messagepack。"""
+        face_list = self.face_values()
+        if len(face_list) < N_FACE_VALUES:
+            raise ValueError("shapeValueFace has %d values, expected %d" % (len(face_list), N_FACE_VALUES))
+        return {name: round(float(face_list[i]) * 100) for i, name in enumerate(ALL_FACE_CHA_NAMES)}
+
+    def set_face_params(self, params):
+        """
+        params: dict（cha_name 或 PoC 名稱 → 遊戲值）或 59 個值的 list；套用在目前值上（多次呼叫會累積）。
+        回傳 written [(name, list_index, value), ...]。只重新 pack face object；pack 後大小必須不變，否則 ValueError（卡不變）。
+        """
+        self._load_face()
+        face_list = list(self._face_obj[FACE_KEY])
+        if len(face_list) < N_FACE_VALUES:
+            raise ValueError("shapeValueFace has %d values, expected %d" % (len(face_list), N_FACE_VALUES))
+        if isinstance(params, list) and len(params) != N_FACE_VALUES:
+            raise ValueError("face list must have exactly %d values" % N_FACE_VALUES)
+        written = _apply_face_params(face_list, params)
+        new_obj = dict(self._face_obj)
+        new_obj[FACE_KEY] = face_list
+        new_blob = _msgpack_pack(new_obj)
+        start, end = self._face_span
+        if len(new_blob) != end - start:
+            raise ValueError("Repacked face object size changed (%d -> %d)" % (end - start, len(new_blob)))
+        self._face_obj = new_obj
+        self._face_blob = new_blob
+        return written
+
+    # ---- output ----
+
+    def trailing_bytes(self):
+        """含 face 修改的 trailing bytes。"""
+        if self._face_span is None:
+            return bytes(self.trailing)
+        custom_start = self._block_range("Custom")[0]
+        a = custom_start + self._face_span[0]
+        b = custom_start + self._face_span[1]
+        return b"".join((self.trailing[:a], self._face_blob, self.trailing[b:]))
+
+    def to_bytes(self, png_bytes=None):
+        """整張卡 bytes；png_bytes 可換掉預覽圖（如 --preview-image 合成圖）。"""
+        png = png_bytes if png_bytes is not None else self.png_bytes
+        if png is None:
+            raise ValueError("Card was built from trailing only; pass png_bytes")
+        return b"".join((png, self.trailing_bytes()))
+
+    def save(self, path, png_bytes=None):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.to_bytes(png_bytes=png_bytes))
+        return path
+
+
+# ---- 優化迴圈用：固定位置 float patch 的卡模板 ----
+
+# msgpack fixstr "shapeValueFace"（14 bytes → 0xa0 | 14）
+_FACE_KEY_PACKED = b"\xae" + KEY_FACE
+_F32_BE = struct.Struct(">f")
+
+
+def _array_header(buf, pos):
+    """msgpack array header at pos → (length, first_element_pos)；非 array 時 ValueError。"""
+    t = buf[pos]
+    if 0x90 <= t <= 0x9F:
+        return t & 0x0F, pos + 1
+    if t == 0xDC:
+        return struct.unpack_from(">H", buf, pos + 1)[0], pos + 3
+    if t == 0xDD:
+        return struct.unpack_from(">I", buf, pos + 1)[0], pos + 5
+    raise ValueError("shapeValueFace is not a msgpack array (type byte 0x%02x)" % t)
+
+
+class CardTemplate:
+    """
+    由 base card 建一次：記下 shapeValueFace 陣列中 59 個 float32（0xCA + 4 bytes big-endian）在整張卡中的絕對位置。
+    之後每張卡只是把 59 個值 struct.pack_into(">f") 到預先配置的 buffer，不再 unpack/repack msgpack。
+    輸出與 write_face_params_into_trailing（MessagePack 路徑）逐 byte 相同。
+    陣列元素不全是 float32（例如被存成 int / float64）時建構失敗（ValueError），呼叫端應退回一般寫入路徑。
+    """
+
+    def __init__(self, card):
+        card._load_face()
+        face_blob = card._face_blob
+        key_at = face_blob.find(_FACE_KEY_PACKED)
+        if key_at < 0:
+            raise ValueError("shapeValueFace key not found in face object")
+        n, p = _array_header(face_blob, key_at + len(_FACE_KEY_PACKED))
+        if n < N_FACE_VALUES:
+            raise ValueError("shapeValueFace has %d values, expected %d" % (n, N_FACE_VALUES))
+        face_abs = card.trailing_offset + card._block_range("Custom")[0] + card._face_span[0]
+        offsets = []
+        for _ in range(N_FACE_VALUES):
+            if face_blob[p] != 0xCA:
+                raise ValueError("shapeValueFace element at +%d is not float32 (0x%02x)" % (p, face_blob[p]))
+            offsets.append(face_abs + p + 1)
+            p += 5
+        self.offsets = tuple(offsets)
+        self.base_values = card.face_values()[:N_FACE_VALUES]
+        self._buf = bytearray(card.to_bytes())
+        self._lock = threading.Lock()
+        for off, v in zip(self.offsets, self.base_values):
+            if _F32_BE.unpack_from(self._buf, off)[0] != v:
+                raise ValueError("Template offset check failed at %d" % off)
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(ChaFileCard.from_path(path))
+
+    @property
+    def size(self):
+        return len(self._buf)
+
+    def face_list_for(self, params):
+        """params（dict 或 59 值 list，語意同 write_face_params_into_trailing）→ (59 個 stored float, written)。"""
+        if isinstance(params, list) and len(params) != N_FACE_VALUES:
+            raise ValueError("face list must have exactly %d values" % N_FACE_VALUES)
+        values = list(self.base_values)
+        written = _apply_face_params(values, params)
+        return values, written
+
+    def _patch(self, values):
+        buf = self._buf
+        pack_into = _F32_BE.pack_into
+        for off, v in zip(self.offsets, values):
+            pack_into(buf, off, v)
+
+    def render_values(self, values):
+        """59 個 stored float → 整張卡 bytes。"""
+        with self._lock:
+            self._patch(values)
+            return bytes(self._buf)
+
+    def render(self, params):
+        """params → (整張卡 bytes, written)。"""
+        values, written = self.face_list_for(params)
+        return self.render_values(values), written
+
+    def write(self, path, params):
+        """params → 直接由預配置 buffer 寫檔（不另外複製整張卡）；回傳 written。"""
+        values, written = self.face_list_for(params)
+        with self._lock:
+            self._patch(values)
+            with open(path, "wb") as f:
+                f.write(self._buf)
+        return written
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_card_template(path):
+    """依 (路徑, mtime, size) 快取的 CardTemplate；base card 被改寫後自動重建。"""
+    p = Path(path).resolve()
+    st = p.stat()
+    key = (str(p), st.st_mtime_ns, st.st_size)
+    with _templates_lock:
+        tpl = _templates.get(key)
+    if tpl is None:
+        tpl = CardTemplate.from_path(p)
+        with _templates_lock:
+            for k in [k for k in _templates if k[0] == key[0]]:
+                del _templates[k]
+            _templates[key] = tpl
+    return tpl
+
+
+def write_card_from_base(base_card_path, params, out_path):
+    """
+    優化器 trial 用：base card + params → out_path。優先用 CardTemplate（固定位置 patch），
+    模板建不起來時退回 write_face_params_into_trailing（含 raw offset fallback）。
+    回傳 written display list [(cha_name, value), ...]；寫入失敗回傳 None。
+    """
+    from write_face_params_to_card import write_face_params_into_trailing, _display_written
+    try:
+        tpl = load_card_template(base_card_path)
+    except ValueError:
+        tpl = None
+    if tpl is not None:
+        try:
+            written = tpl.write(out_path, params)
+        except ValueError:
+            return None
+        return _display_written(written)
+    base_bytes = Path(base_card_path).read_bytes()
+    iend = find_iend_in_bytes(base_bytes)
+    if iend is None:
+        return None
+    result = write_face_params_into_trailing(base_bytes[iend:], params)
+    if result is None:
+        return None
+    new_trailing, written = result
+    with open(out_path, "wb") as f:
+        f.write(base_bytes[:iend])
+        f.write(new_trailing)
+    return written
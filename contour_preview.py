@@ -353,15 +353,15 @@ def _fallback_tkinter(contour_xy, photo_contour_xy, title):
     root.mainloop()
 
 
-def get_photo_contour_and_measurements(image_path):
+def get_photo_contour_and_measurements(image_path, session=None):
     """
-    Run MediaPipe once; return (contour_xy, segments, edge_landmarks_xy, all_landmarks_468_xy, precise_landmarks_xy).
+    Run MediaPipe once (shared FaceLandmarkerSession unless session is given); return (contour_xy, segments, edge_landmarks_xy, all_landmarks_468_xy, precise_landmarks_xy).
     contour_xy: (K, 2) FACE_OVAL smoothed in [0,1]; segments: green measurement lines; edge: 50 (yellow);
     all_landmarks_468_xy: (468, 2) cyan; precise_landmarks_xy: (N, 2) FACE_SHAPE_INDICES (36 face contour pts) for purple.
     """
     try:
         from extract_face_ratios import (
-            _get_model_path,
+            get_default_session,
             get_xy,
             FACE_OVAL_INDICES,
             EDGE_RELATED_50_INDICES,
@@ -380,8 +380,7 @@ def get_photo_contour_and_measurements(image_path):
             UPPER_LIP_RIGHT,
             LOWER_LIP,
         )
-        import mediapipe as mp
-        from mediapipe.tasks.python import vision
+        import mediapipe  # noqa: F401
     except ImportError:
         return None, [], None, None, None, []
 
@@ -389,102 +388,95 @@ def get_photo_contour_and_measurements(image_path):
     if not path.exists():
         return None, [], None, None, None, []
 
-    model_path = _get_model_path()
-    base_options = mp.tasks.BaseOptions(model_asset_path=model_path)
-    options = vision.FaceLandmarkerOptions(
-        base_options=base_options,
-        running_mode=vision.RunningMode.IMAGE,
-        num_faces=1,
-    )
-    with vision.FaceLandmarker.create_from_options(options) as landmarker:
-        mp_image = mp.Image.create_from_file(str(path))
-        result = landmarker.detect(mp_image)
-        if not result.face_landmarks:
-            return None, [], None, None, None, []  # no face
-        lm = result.face_landmarks[0]
-
-        # All 468 landmarks (for full mesh preview)
-        all_pts = []
+    if session is None:
+        session = get_default_session()
+    # 不做中央裁切重試：裁切後座標系與原圖不同，疊圖會錯位
+    lm = session.detect(path, crop_fallback=False)
+    if lm is None:
+        return None, [], None, None, None, []  # no face
+
+    # All 468 landmarks (for full mesh preview)
+    all_pts = []
+    for i in range(len(lm)):
+        x, y = get_xy(lm[i])
+        all_pts.append([x, y])
+    all_landmarks_468_xy = np.array(all_pts, dtype=np.float64) if all_pts else None
+
+    # 輸出所有 landmark 索引與座標，供比對哪些點精準（[0,1] 圖座標，y 向下）
+    out_dir = Path(__file__).resolve().parent
+    out_file = out_dir / "landmarks_coords.txt"
+    with open(out_file, "w", encoding="utf-8") as f:
+        f.write("index,x,y  # MediaPipe 468, image coords [0,1] y-down\n")
         for i in range(len(lm)):
             x, y = get_xy(lm[i])
-            all_pts.append([x, y])
-        all_landmarks_468_xy = np.array(all_pts, dtype=np.float64) if all_pts else None
-
-        # 輸出所有 landmark 索引與座標，供比對哪些點精準（[0,1] 圖座標，y 向下）
-        out_dir = Path(__file__).resolve().parent
-        out_file = out_dir / "landmarks_coords.txt"
-        with open(out_file, "w", encoding="utf-8") as f:
-            f.write("index,x,y  # MediaPipe 468, image coords [0,1] y-down\n")
-            for i in range(len(lm)):
-                x, y = get_xy(lm[i])
-                f.write(f"{i},{x:.6f},{y:.6f}\n")
-        precise_landmarks_xy = None  # 紫色已移除，不再計算
-
-        # Edge-related 50 points (raw, for yellow dots); contour already included in these
-        edge_pts = []
-        for i in EDGE_RELATED_50_INDICES:
-            if i < len(lm):
-                x, y = get_xy(lm[i])
-                edge_pts.append([x, y])
-        edge_landmarks_xy = np.array(edge_pts, dtype=np.float64) if edge_pts else None
-
-        # Contour: FACE_OVAL 36 points, then smooth via closed spline and resample (72–128 pts)
-        pts = []
-        for i in FACE_OVAL_INDICES:
-            if i < len(lm):
-                x, y = get_xy(lm[i])
-                pts.append([x, y])
-        contour_xy = np.array(pts, dtype=np.float64) if len(pts) >= 4 else None
-        if contour_xy is not None:
-            raw_bbox = {}
-            # #region agent log
-            try:
-                raw_bbox = {"xmin": float(contour_xy[:, 0].min()), "xmax": float(contour_xy[:, 0].max()), "ymin": float(contour_xy[:, 1].min()), "ymax": float(contour_xy[:, 1].max())}
-            except Exception:
-                pass
-            # #endregion
-            contour_xy = _smooth_contour_closed(contour_xy, num_points=96)
-            # #region agent log
-            try:
-                import json
-                s = np.asarray(contour_xy, dtype=np.float64)
-                smooth_bbox = {"xmin": float(s[:, 0].min()), "xmax": float(s[:, 0].max()), "ymin": float(s[:, 1].min()), "ymax": float(s[:, 1].max())}
-                _logpath = Path(__file__).resolve().parent / "debug-ce42d5.log"
-                _f = open(_logpath, "a", encoding="utf-8")
-                _f.write(json.dumps({"sessionId": "ce42d5", "hypothesisId": "H1", "location": "contour_preview.get_photo_contour", "message": "raw36 vs smoothed96 bbox", "data": {"raw_36_bbox": raw_bbox, "smoothed_96_bbox": smooth_bbox}, "timestamp": __import__("time").time() * 1000}, ensure_ascii=False) + "\n")
-                _f.close()
-            except Exception:
-                pass
-            # #endregion
+            f.write(f"{i},{x:.6f},{y:.6f}\n")
+    precise_landmarks_xy = None  # 紫色已移除，不再計算
 
-        # Measurement segments (same landmarks as extract_ratios)
-        def pt(idx):
-            if idx < len(lm):
-                return get_xy(lm[idx])
-            return (0.5, 0.5)
+    # Edge-related 50 points (raw, for yellow dots); contour already included in these
+    edge_pts = []
+    for i in EDGE_RELATED_50_INDICES:
+        if i < len(lm):
+            x, y = get_xy(lm[i])
+            edge_pts.append([x, y])
+    edge_landmarks_xy = np.array(edge_pts, dtype=np.float64) if edge_pts else None
 
-        segments = []
+    # Contour: FACE_OVAL 36 points, then smooth via closed spline and resample (72–128 pts)
+    pts = []
+    for i in FACE_OVAL_INDICES:
+        if i < len(lm):
+            x, y = get_xy(lm[i])
+            pts.append([x, y])
+    contour_xy = np.array(pts, dtype=np.float64) if len(pts) >= 4 else None
+    if contour_xy is not None:
+        raw_bbox = {}
+        # #region agent log
         try:
-            segments.append(("eye_span", pt(LEFT_EYE_INNER), pt(RIGHT_EYE_INNER)))
-            segments.append(("L_eye", pt(LEFT_EYE_INNER), pt(LEFT_EYE_OUTER)))
-            segments.append(("R_eye", pt(RIGHT_EYE_INNER), pt(RIGHT_EYE_OUTER)))
-            segments.append(("mouth_w", pt(MOUTH_LEFT), pt(MOUTH_RIGHT)))
-            segments.append(("nose_w", pt(NOSE_LEFT), pt(NOSE_RIGHT)))
-            segments.append(("nose_h", pt(NOSE_BRIDGE), pt(NOSE_TIP)))
-            ux = (pt(UPPER_LIP_LEFT)[0] + pt(UPPER_LIP_RIGHT)[0]) / 2
-            uy = (pt(UPPER_LIP_LEFT)[1] + pt(UPPER_LIP_RIGHT)[1]) / 2
-            segments.append(("lip_h", (ux, uy), pt(LOWER_LIP)))
+            raw_bbox = {"xmin": float(contour_xy[:, 0].min()), "xmax": float(contour_xy[:, 0].max()), "ymin": float(contour_xy[:, 1].min()), "ymax": float(contour_xy[:, 1].max())}
         except Exception:
-            segments = []
-
-        # 五官邊緣（眼、眉、唇）線段，用紫色畫
-        facial_feature_edges = []
+            pass
+        # #endregion
+        contour_xy = _smooth_contour_closed(contour_xy, num_points=96)
+        # #region agent log
         try:
-            for (i, j) in FACE_FEATURE_EDGES:
-                if i < len(lm) and j < len(lm):
-                    facial_feature_edges.append((pt(i), pt(j)))
+            import json
+            s = np.asarray(contour_xy, dtype=np.float64)
+            smooth_bbox = {"xmin": float(s[:, 0].min()), "xmax": float(s[:, 0].max()), "ymin": float(s[:, 1].min()), "ymax": float(s[:, 1].max())}
+            _logpath = Path(__file__).resolve().parent / "debug-ce42d5.log"
+            _f = open(_logpath, "a", encoding="utf-8")
+            _f.write(json.dumps({"sessionId": "ce42d5", "hypothesisId": "H1", "location": "contour_preview.get_photo_contour", "message": "raw36 vs smoothed96 bbox", "data": {"raw_36_bbox": raw_bbox, "smoothed_96_bbox": smooth_bbox}, "timestamp": __import__("time").time() * 1000}, ensure_ascii=False) + "\n")
+            _f.close()
         except Exception:
-            facial_feature_edges = []
+            pass
+        # #endregion
+
+    # Measurement segments (same landmarks as extract_ratios)
+    def pt(idx):
+        if idx < len(lm):
+            return get_xy(lm[idx])
+        return (0.5, 0.5)
+
+    segments = []
+    try:
+        segments.append(("eye_span", pt(LEFT_EYE_INNER), pt(RIGHT_EYE_INNER)))
+        segments.append(("L_eye", pt(LEFT_EYE_INNER), pt(LEFT_EYE_OUTER)))
+        segments.append(("R_eye", pt(RIGHT_EYE_INNER), pt(RIGHT_EYE_OUTER)))
+        segments.append(("mouth_w", pt(MOUTH_LEFT), pt(MOUTH_RIGHT)))
+        segments.append(("nose_w", pt(NOSE_LEFT), pt(NOSE_RIGHT)))
+        segments.append(("nose_h", pt(NOSE_BRIDGE), pt(NOSE_TIP)))
+        ux = (pt(UPPER_LIP_LEFT)[0] + pt(UPPER_LIP_RIGHT)[0]) / 2
+        uy = (pt(UPPER_LIP_LEFT)[1] + pt(UPPER_LIP_RIGHT)[1]) / 2
+        segments.append(("lip_h", (ux, uy), pt(LOWER_LIP)))
+    except Exception:
+        segments = []
+
+    # 五官邊緣（眼、眉、唇）線段，用紫色畫
+    facial_feature_edges = []
+    try:
+        for (i, j) in FACE_FEATURE_EDGES:
+            if i < len(lm) and j < len(lm):
+                facial_feature_edges.append((pt(i), pt(j)))
+    except Exception:
+        facial_feature_edges = []
 
     return contour_xy, segments, edge_landmarks_xy, all_landmarks_468_xy, precise_landmarks_xy, facial_feature_edges
 
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+評估結果 memo 快取：key = base card 內容 SHA-256 + 套用 params 後 59 個 shapeValueFace 值（量化到 0.01 遊戲單位）。
+兩個優化器都把值對齊格點（run_optuna_face._align_step、run_onedim_face._values_for_dim），Optuna 常重複建議
+同一組 slider，一維掃描每輪也會回到目前中心點；命中時直接回傳先前的 ratio，不再載卡截圖。
+快取跨實驗保留：同一張 base card 換目標重跑時，已評估過的臉直接命中（loss 由呼叫端對新目標重算）。
+
+每筆存 face_ratios、468 點 landmark（可取得時，取自 landmark_cache）與當時的截圖路徑；ratio 定義改名時
+由 landmark 重算，不會讀到舊定義的值。截圖失敗、偵測不到臉的結果不快取（下次重試）。
+子目錄依 landmark 模型 hash 分開（同 landmark_cache），換模型即換一組條目。
+
+環境變數 HS4_EVAL_CACHE：未設定 = 預設目錄 output/eval_cache；"off" / "0" / 空字串 = 停用；其他值 = 快取目錄路徑
+（解析同 landmark_cache.cache_dir_from_env）。
+
+CLI：
+  python eval_cache.py stats
+  python eval_cache.py show --base-card SRC/AI_191856.png --params best_params.json
+  python eval_cache.py clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = BASE / "output" / "eval_cache"
+ENV_VAR = "HS4_EVAL_CACHE"
+# 快取格式版本；改變 key 或儲存內容時遞增，舊條目自然失效
+CACHE_VERSION = "v1"
+# stored 值 = 遊戲值 / 100；量化到 1e-4 stored = 0.01 遊戲單位（與 _align_step 的 round(..., 2) 一致）
+QUANT = 1e4
+
+_card_hash_memo = {}
+
+
+def card_hash(path):
+    """base card SHA-256（依 path + size + mtime 記憶，process 內只算一次）。"""
+    from landmark_cache import file_sha256
+    p = Path(path).resolve()
+    st = p.stat()
+    memo_key = (str(p), st.st_size, st.st_mtime_ns)
+    h = _card_hash_memo.get(memo_key)
+    if h is None:
+        h = file_sha256(p)
+        _card_hash_memo[memo_key] = h
+    return h
+
+
+def face_values_for(base_card_path, params):
+    """base card + params → 寫卡時實際會寫入的 59 個 stored 值；模板建不起來時回傳 None（不快取）。"""
+    from chafile_card import load_card_template
+    try:
+        values, _ = load_card_template(base_card_path).face_list_for(params)
+    except (ValueError, OSError):
+        return None
+    return values
+
+
+def _screenshot_aspect(screenshot_path):
+    """截圖寬 / 高（只讀檔頭）；無截圖或讀不到時 None。"""
+    if screenshot_path is None:
+        return None
+    from landmark_loss import image_aspect
+    aspect = image_aspect(screenshot_path)
+    return round(aspect, 6) if aspect is not None else None
+
+
+class EvalCache:
+    """
+    root/<version>_<model_hash[:16]>/<key[:2]>/<key>.json
+    get() 回傳 {"key", "face_ratios", "landmarks", "aspect", "screenshot_path", "created"} 或 None
+    （aspect 為截圖寬 / 高，供截圖刪掉後 Procrustes 計分；舊 entry 沒有此欄）。
+    """
+
+    def __init__(self, root=None, model_path=None):
+        self.root = Path(root) if root else DEFAULT_CACHE_DIR
+        self._model_path = model_path
+        self._namespace = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def namespace(self):
+        if self._namespace is None:
+            from landmark_cache import model_hash
+            model_path = self._model_path
+            if model_path is None:
+                from extract_face_ratios import _get_model_path
+                model_path = _get_model_path()
+            self._namespace = "%s_%s" % (CACHE_VERSION, model_hash(model_path)[:16])
+        return self._namespace
+
+    def key(self, base_card_path, params):
+        """(base card hash, 量化後 59 值) → hex key；無法計算時 None。"""
+        values = face_values_for(base_card_path, params)
+        if values is None:
+            return None
+        q = ",".join(str(int(round(v * QUANT))) for v in values)
+        return hashlib.sha256(("%s|%s" % (card_hash(base_card_path), q)).encode("ascii")).hexdigest()
+
+    def _entry_path(self, key):
+        return self.root / self.namespace() / key[:2] / (key + ".json")
+
+    def get(self, base_card_path, params, need_landmarks=False):
+        """need_landmarks=True（Procrustes 等全 landmark objective）時，沒存 landmark 的 entry 視為未命中，由呼叫端重新評估。"""
+        key = self.key(base_card_path, params)
+        if key is None:
+            return None
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is None or (need_landmarks and not entry.get("landmarks")):
+            with self._lock:
+                self.misses += 1
+            return None
+        from extract_face_ratios import RATIO_NAMES
+        if entry.get("landmarks") and set(entry.get("face_ratios") or ()) - set(RATIO_NAMES):
+            # ratio 定義已改（存的 key 不在目前 RATIO_NAMES）：由 landmark 重算
+            from extract_face_ratios import _ratios_from_points
+            import numpy as np
+            entry["face_ratios"] = _ratios_from_points(np.asarray(entry["landmarks"], dtype=np.float32))
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, base_card_path, params, face_ratios, landmarks=None, screenshot_path=None):
+        """
+        記錄一次成功的評估。landmarks 為 None 且有截圖時，嘗試由 landmark_cache 取（不另跑 MediaPipe）。
+        回傳 key；無法計算 key 時 None。
+        """
+        key = self.key(base_card_path, params)
+        if key is None:
+            return None
+        if landmarks is None and screenshot_path is not None:
+            try:
+                from landmark_cache import get_default_cache
+                lm_cache = get_default_cache()
+                if lm_cache:
+                    _, landmarks = lm_cache.get(screenshot_path)
+            except OSError:
+                landmarks = None
+        entry = {
+            "key": key,
+            "base_card": str(Path(base_card_path).resolve()),
+            "base_card_sha256": card_hash(base_card_path),
+            "params": params if isinstance(params, dict) else list(params),
+            "face_ratios": face_ratios,
+            "landmarks": [[round(float(x), 6), round(float(y), 6)] for x, y in landmarks] if landmarks is not None else None,
+            "aspect": _screenshot_aspect(screenshot_path),
+            "screenshot_path": str(Path(screenshot_path).resolve()) if screenshot_path else None,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        p = self._entry_path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name("%s.%d.%d.tmp" % (p.stem, os.getpid(), threading.get_ident()))
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, p)
+        return key
+
+    def _entries(self):
+        if not self.root.is_dir():
+            return []
+        return list(self.root.rglob("*.json"))
+
+    def clear(self):
+        removed = 0
+        for p in self._entries():
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        namespaces = {}
+        cards = set()
+        for p in entries:
+            ns = p.relative_to(self.root).parts[0]
+            namespaces[ns] = namespaces.get(ns, 0) + 1
+        for p in entries[:10000]:
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    cards.add(json.load(f).get("base_card_sha256"))
+            except (OSError, ValueError):
+                pass
+        return {
+            "root": str(self.root),
+            "entries": len(entries),
+            "base_cards": len(cards),
+            "total_bytes": sum(p.stat().st_size for p in entries),
+            "namespaces": dict(sorted(namespaces.items())),
+        }
+
+
+_default_cache = None
+_default_cache_resolved = False
+
+
+def get_default_cache():
+    """依 HS4_EVAL_CACHE 回傳共用 EvalCache；停用時回傳 None。"""
+    global _default_cache, _default_cache_resolved
+    if not _default_cache_resolved:
+        from landmark_cache import cache_dir_from_env
+        root = cache_dir_from_env(ENV_VAR, DEFAULT_CACHE_DIR)
+        _default_cache = EvalCache(root=root) if root is not None else None
+        _default_cache_resolved = True
+    return _default_cache
+
+
+def lookup(base_card_path, params, need_landmarks=False):
+    """預設快取的 get；停用或未命中回傳 None。need_landmarks 見 EvalCache.get。"""
+    cache = get_default_cache()
+    return cache.get(base_card_path, params, need_landmarks=need_landmarks) if cache else None
+
+
+def record(base_card_path, params, face_ratios, landmarks=None, screenshot_path=None):
+    """預設快取的 put；寫入失敗不影響評估結果。"""
+    cache = get_default_cache()
+    if not cache or face_ratios is None:
+        return None
+    try:
+        return cache.put(base_card_path, params, face_ratios, landmarks=landmarks, screenshot_path=screenshot_path)
+    except OSError:
+        return None
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect the evaluation memo cache (base card + quantized face values -> ratios).")
+    ap.add_argument("--cache-dir", type=Path, default=None, help="Cache root (default: $%s or %s)" % (ENV_VAR, DEFAULT_CACHE_DIR))
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entry count, distinct base cards, size")
+    sub.add_parser("clear", help="Delete every cached entry")
+    show_p = sub.add_parser("show", help="Show the cached evaluation for a base card + params JSON")
+    show_p.add_argument("--base-card", type=Path, required=True)
+    show_p.add_argument("--params", type=Path, required=True, help="JSON: params dict, or an object with best_params")
+    args = ap.parse_args()
+
+    from landmark_cache import cache_dir_from_env
+    root = args.cache_dir or cache_dir_from_env(ENV_VAR, DEFAULT_CACHE_DIR)
+    if root is None:
+        raise SystemExit("%s disables the eval cache; pass --cache-dir to inspect a cache directory." % ENV_VAR)
+    cache = EvalCache(root=root)
+
+    if args.command == "stats":
+        st = cache.stats()
+        _out("root: %s" % st["root"])
+        _out("entries: %d (base cards: %d)" % (st["entries"], st["base_cards"]))
+        _out("size: %.2f MB" % (st["total_bytes"] / 1e6))
+        for ns, n in st["namespaces"].items():
+            _out("  %s: %d entries" % (ns, n))
+    elif args.command == "clear":
+        _out("Removed %d entries" % cache.clear())
+    elif args.command == "show":
+        for p in (args.base_card, args.params):
+            if not p.exists():
+                raise SystemExit("File not found: %s" % p)
+        with open(args.params, "r", encoding="utf-8") as f:
+            params = json.load(f)
+        if isinstance(params, dict) and isinstance(params.get("best_params"), dict):
+            params = params["best_params"]
+        entry = cache.get(args.base_card, params)
+        _out("key: %s" % cache.key(args.base_card, params))
+        if entry is None:
+            _out("not cached")
+        else:
+            _out("cached %s, screenshot: %s" % (entry["created"], entry["screenshot_path"]))
+            for k, v in entry["face_ratios"].items():
+                _out("  %s: %s" % (k, v))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
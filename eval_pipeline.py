@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+非同步評估管線：產卡 → 載卡截圖 → MediaPipe → loss / 紀錄 四個 stage 以有界 asyncio.Queue 串接，
+遊戲算繪下一張卡的同時 CPU 正在對上一張截圖跑 MediaPipe（原本 evaluate_one_guess_and_record /
+run_experiment._run_one_round 是一張做完才做下一張，MediaPipe 期間遊戲閒置）。
+
+  write_card   write_card_from_base（CardTemplate patch），單執行緒
+  screenshot   instance_scheduler.InstanceScheduler（同一組請求檔共用一個，見 get_scheduler）；每個遊戲實例一條 lane，
+               逾時的卡換實例重試，連續逾時的實例停用（跨 round 保留）
+  extract      extract_face_ratios：score_workers <= 1 用本 process 的共用 session（單執行緒），
+               >= 2 用 get_batch_pool 的 process pool
+  record       loss（landmark_loss.compute_loss；預設 ratio loss）、寫 comparison JSON、呼叫 on_result（在 event loop 執行緒）
+
+objective 給 landmark_loss 的 objective（如 Procrustes）時以全 landmark 計分；取不到 landmark 的 job 視為失敗。
+write_card 前先查 eval_cache（同 base card + 相同臉型值已評估過）：命中的 job 不產卡不截圖，直接進 record。
+
+每個 stage 記錄忙碌秒數；utilisation = busy / (wall × lanes)。screenshot 的 utilisation 接近 1 表示遊戲沒在等 CPU。
+stats["instances"] 為 scheduler 各實例的累計 done / timeouts / 停用原因。
+
+  results, stats = run_pipeline(jobs, target_ratios, base_card, [request_file])
+jobs：[{"params", "card_path", "screenshot_path", 可選 "comparison_path", "run_ts"}]；
+results 與 jobs 同順序：{"index", "ok", "params", "card_path", "screenshot_path", "face_ratios", "errors_percent",
+"loss_contributions", "total_loss", "error", "cache_hit"}；命中快取時 card_path 為 None、screenshot_path 為當時的截圖。
+
+對照（hs2_emulator 模擬遊戲）：逐張串行 vs 管線
+  python eval_pipeline.py bench --target-image SRC/AI_191856.png --base-card SRC/AI_191856.png -n 12 --latency const:1.0
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+STAGES = ("write_card", "screenshot", "extract", "record")
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(request_files, screenshot_timeout=120, progress_interval=10):
+    """
+    request_files 的共用 InstanceScheduler（同一組請求檔與逾時只建一次）：各 round 共用，停用的實例不再接工作。
+    呼叫端已等過 game_ready.txt，故 wait_ready=False。
+    """
+    from instance_scheduler import InstanceScheduler
+    key = (tuple(str(Path(p).resolve()) for p in request_files), screenshot_timeout, progress_interval)
+    with _schedulers_lock:
+        sched = _schedulers.get(key)
+        if sched is None:
+            sched = InstanceScheduler(
+                request_files=request_files, timeout_sec=screenshot_timeout,
+                progress_interval=progress_interval, wait_ready=False,
+            )
+            _schedulers[key] = sched
+        return sched
+
+
+def close_schedulers():
+    with _schedulers_lock:
+        for sched in _schedulers.values():
+            sched.close(wait=False)
+        _schedulers.clear()
+
+
+atexit.register(close_schedulers)
+
+
+def _score_one(path):
+    from extract_face_ratios import _ratios_result
+    return _ratios_result(path, None)
+
+
+def _write_comparison(job, result):
+    """與 evaluate_one_guess_and_record 相同格式的比較紀錄。"""
+    comparison = {
+        "run_ts": job.get("run_ts"),
+        "params": job["params"],
+        "errors_percent": result["errors_percent"],
+        "loss_contributions": result["loss_contributions"],
+        "total_loss": round(result["total_loss"], 4),
+        "card_path": str(Path(result["card_path"]).resolve()) if result["card_path"] else None,
+        "screenshot_path": str(Path(result["screenshot_path"]).resolve()) if result["screenshot_path"] else None,
+    }
+    Path(job["comparison_path"]).parent.mkdir(parents=True, exist_ok=True)
+    with open(job["comparison_path"], "w", encoding="utf-8") as f:
+        json.dump(comparison, f, indent=2, ensure_ascii=False)
+
+
+async def run_pipeline_async(jobs, target_ratios, base_card_path, request_files, screenshot_timeout=120,
+                             progress_interval=10, queue_size=2, score_workers=0, on_result=None, use_cache=True,
+                             objective=None):
+    """見模組說明。回傳 (results, stats)。use_cache=False 時不查也不寫 eval_cache。"""
+    from chafile_card import write_card_from_base
+    from landmark_loss import compute_loss
+    from eval_cache import lookup, record
+
+    jobs = list(jobs)
+    request_files = [Path(p) for p in request_files]
+    if not request_files:
+        raise ValueError("run_pipeline needs at least one request file")
+    scheduler = get_scheduler(request_files, screenshot_timeout, progress_interval)
+    loop = asyncio.get_running_loop()
+    n = len(jobs)
+    results = [None] * n
+    lanes = {"write_card": 1, "screenshot": len(request_files), "extract": max(1, score_workers), "record": 1}
+    busy = {s: 0.0 for s in STAGES}
+    items = {s: 0 for s in STAGES}
+    cache_hits = 0
+    q_shot = asyncio.Queue(maxsize=queue_size)
+    q_score = asyncio.Queue(maxsize=queue_size)
+    q_record = asyncio.Queue(maxsize=queue_size)
+
+    write_exec = ThreadPoolExecutor(1, thread_name_prefix="pipe-write")
+    own_score_exec = None
+    if score_workers >= 2:
+        from extract_face_ratios import get_batch_pool, _batch_worker_extract
+        score_exec, score_fn = get_batch_pool(int(score_workers)), _batch_worker_extract
+    else:
+        own_score_exec = score_exec = ThreadPoolExecutor(1, thread_name_prefix="pipe-score")
+        score_fn = _score_one
+
+    async def timed(stage, executor, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            busy[stage] += time.perf_counter() - t0
+            items[stage] += 1
+
+    async def guarded(stage, label, executor, fn, *args):
+        """timed + 例外轉成該 job 的 error 字串：回傳 (result, error)。stage 不因單張失敗而結束（否則 recorder 永遠等不到）。"""
+        try:
+            return await timed(stage, executor, fn, *args), None
+        except Exception as e:
+            return None, "%s: %s: %s" % (label, type(e).__name__, e)
+
+    async def writer():
+        nonlocal cache_hits
+        for i, job in enumerate(jobs):
+            if use_cache:
+                try:
+                    # objective 要 landmark 時，沒存 landmark 的 entry 當未命中（重新截圖，不在 event loop 上跑 MediaPipe）
+                    cached = await loop.run_in_executor(write_exec, lookup, base_card_path, job["params"], objective is not None)
+                except Exception:
+                    cached = None
+                if cached is not None:
+                    cache_hits += 1
+                    await q_record.put((i, None, {"ratios": cached["face_ratios"], "cached": cached}))
+                    continue
+            try:
+                Path(job["card_path"]).parent.mkdir(parents=True, exist_ok=True)
+                Path(job["screenshot_path"]).parent.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                await q_shot.put((i, "card write failed: %s: %s" % (type(e).__name__, e)))
+                continue
+            written, error = await guarded(
+                "write_card", "card write failed", write_exec, write_card_from_base, base_card_path, job["params"], job["card_path"],
+            )
+            if error is None and written is None:
+                error = "card write failed"
+            await q_shot.put((i, error))
+
+    async def shooter():
+        while True:
+            i, error = await q_shot.get()
+            if error is None:
+                job = jobs[i]
+                t0 = time.perf_counter()
+                try:
+                    shot = await asyncio.wrap_future(scheduler.submit(job["card_path"], job["screenshot_path"]))
+                except Exception as e:
+                    shot = {"ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+                finally:
+                    busy["screenshot"] += time.perf_counter() - t0
+                    items["screenshot"] += 1
+                if not shot["ok"] or not Path(job["screenshot_path"]).exists():
+                    # 重試用盡的逾時沿用 "screenshot timeout"；其他（實例全停用、請求檔寫不進去）帶原因
+                    error = "screenshot timeout" if shot["error"] in (None, "timeout") else "screenshot failed: %s" % shot["error"]
+            await q_score.put((i, error, None))
+
+    async def scorer():
+        while True:
+            i, error, _ = await q_score.get()
+            res = None
+            if error is None:
+                res, error = await guarded("extract", "extract failed", score_exec, score_fn, str(jobs[i]["screenshot_path"]))
+                if error is None and res["ratios"] is None:
+                    error = res["error"] or "no face"
+            await q_record.put((i, error, res))
+
+    async def recorder():
+        for _ in range(n):
+            i, error, res = await q_record.get()
+            t0 = time.perf_counter()
+            job = jobs[i]
+            result = {
+                "index": i,
+                "ok": error is None,
+                "params": job["params"],
+                "card_path": str(job["card_path"]),
+                "screenshot_path": str(job["screenshot_path"]),
+                "face_ratios": None,
+                "errors_percent": None,
+                "loss_contributions": None,
+                "total_loss": None,
+                "error": error,
+                "cache_hit": False,
+            }
+            if error is None and res.get("cached"):
+                result.update(card_path=None, screenshot_path=res["cached"]["screenshot_path"], cache_hit=True)
+            elif error is None and use_cache:
+                record(base_card_path, job["params"], res["ratios"], landmarks=res.get("landmarks"),
+                       screenshot_path=job["screenshot_path"])
+            if error is None:
+                # landmark 由 extract stage（或 eval_cache）帶來，這裡不在 event loop 上再跑 MediaPipe
+                cached = res.get("cached") or {}
+                try:
+                    errors, contributions, total_loss = compute_loss(
+                        target_ratios, res["ratios"], objective, screenshot_path=result["screenshot_path"],
+                        landmarks=cached.get("landmarks") if cached else res.get("landmarks"), aspect=cached.get("aspect"),
+                    )
+                except ValueError as e:
+                    error = str(e)
+                    result.update(ok=False, error=error)
+            if error is None:
+                result.update(face_ratios=res["ratios"], errors_percent=errors,
+                              loss_contributions=contributions, total_loss=float(total_loss))
+                if job.get("comparison_path"):
+                    _write_comparison(job, result)
+            results[i] = result
+            if on_result is not None:
+                on_result(result)
+            busy["record"] += time.perf_counter() - t0
+            items["record"] += 1
+
+    t_start = time.perf_counter()
+    workers = [asyncio.ensure_future(shooter()) for _ in range(lanes["screenshot"])]
+    workers += [asyncio.ensure_future(scorer()) for _ in range(lanes["extract"])]
+    try:
+        await asyncio.gather(writer(), recorder())
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        write_exec.shutdown(wait=True)
+        if own_score_exec is not None:
+            own_score_exec.shutdown(wait=True)
+    wall = time.perf_counter() - t_start
+    stats = {
+        "wall_sec": round(wall, 3),
+        "jobs": n,
+        "cache_hits": cache_hits,
+        "stages": {
+            s: {
+                "items": items[s],
+                "lanes": lanes[s],
+                "busy_sec": round(busy[s], 3),
+                "utilisation": round(busy[s] / (wall * lanes[s]), 3) if wall > 0 else None,
+            }
+            for s in STAGES
+        },
+        "instances": scheduler.stats()["instances"],
+    }
+    return results, stats
+
+
+def run_pipeline(jobs, target_ratios, base_card_path, request_files, **kwargs):
+    """run_pipeline_async 的同步版本（asyncio.run）。"""
+    return asyncio.run(run_pipeline_async(jobs, target_ratios, base_card_path, request_files, **kwargs))
+
+
+def format_stage_stats(stats):
+    """一行一個 stage 的 utilisation 摘要（供 _out 印出）。"""
+    lines = ["pipeline: %d jobs in %.1fs (%d eval cache hits)" % (stats["jobs"], stats["wall_sec"], stats.get("cache_hits", 0))]
+    for s in STAGES:
+        st = stats["stages"][s]
+        util = st["utilisation"]
+        lines.append("  %-10s x%d  busy %7.2fs  utilisation %s" % (
+            s, st["lanes"], st["busy_sec"], "%.0f%%" % (util * 100) if util is not None else "-"))
+    for st in stats.get("instances") or []:
+        if st["timeouts"] or st["disabled"]:
+            lines.append("  %-10s done %d  timeouts %d%s" % (
+                st["instance"], st["done"], st["timeouts"], "  DISABLED: %s" % st["disabled"] if st["disabled"] else ""))
+    return lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the evaluation pipeline against hs2_emulator (serial vs overlapped).")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench")
+    b.add_argument("--target-image", type=Path, required=True)
+    b.add_argument("--base-card", type=Path, required=True)
+    b.add_argument("-n", type=int, default=12, help="Cards per mode")
+    b.add_argument("--instances", type=int, default=1, help="Emulated game instances (screenshot lanes)")
+    b.add_argument("--latency", default="const:1.0", help="hs2_emulator latency spec")
+    b.add_argument("--score-workers", type=int, default=0)
+    b.add_argument("-o", "--output", type=Path, default=None)
+    args = ap.parse_args()
+    for p in (args.target_image, args.base_card):
+        if not p.exists():
+            raise SystemExit("Not found: %s" % p)
+
+    import random
+    from extract_face_ratios import extract_ratios
+    from hs2_emulator import start_emulators
+    target_ratios = extract_ratios(args.target_image)
+    rng = random.Random(0)
+    guesses = [{"eye_size": rng.randint(0, 100), "mouth_width": rng.randint(0, 100), "jaw_width": rng.randint(0, 100)} for _ in range(args.n)]
+    out = {}
+    tmp = Path(tempfile.mkdtemp(prefix="pipe_bench_"))
+    emus = start_emulators(tmp, args.instances, latency=args.latency, seed=0)
+    try:
+        request_files = [e.request_file for e in emus]
+        for mode in ("serial", "pipeline"):
+            jobs = [{
+                "params": g,
+                "card_path": tmp / mode / "cards" / ("card_%02d.png" % i),
+                "screenshot_path": tmp / mode / "screenshots" / ("screenshot_%02d.png" % i),
+            } for i, g in enumerate(guesses)]
+            t0 = time.perf_counter()
+            if mode == "serial":
+                results = [run_pipeline([job], target_ratios, args.base_card, request_files[:1], use_cache=False)[0][0] for job in jobs]
+                stats = {"wall_sec": round(time.perf_counter() - t0, 3), "jobs": len(jobs)}
+            else:
+                results, stats = run_pipeline(jobs, target_ratios, args.base_card, request_files, score_workers=args.score_workers, use_cache=False)
+            n_ok = sum(1 for r in results if r["ok"])
+            out[mode] = {"ok": n_ok, "stats": stats}
+            _out("%s: %d/%d ok, %.2fs (%.2f cards/s)" % (mode, n_ok, len(jobs), stats["wall_sec"], len(jobs) / stats["wall_sec"]))
+            if "stages" in stats:
+                for line in format_stage_stats(stats)[1:]:
+                    _out(line)
+    finally:
+        for e in emus:
+            e.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
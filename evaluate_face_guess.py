@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """
-單一猜測評估並寫入比較紀錄（人物卡路徑、截圖路徑、誤差百分比、total_loss）。
-僅呼叫既有模組（read_hs2_card, write_face_params_to_card, run_phase1, extract_face_ratios），不修改既有程式。
-供 run_onedim_face 等需要「每次產出＋比較結果紀錄」的流程使用。
+猜測評估的共用入口（run_onedim_face、run_lm_face、run_optuna_face 等）：
+  evaluate_card                  單一猜測：eval_cache 查詢 → 以 CardTemplate 產卡（write_card_from_base）→ 截圖（由呼叫端給 shoot）
+                                 → landmark → eval_cache 記錄 → loss（ratio loss 或 landmark_loss 的 objective，如 Procrustes）
+  evaluate_one_guess_and_record  evaluate_card + 寫比較紀錄 comparison_<run_ts>.json（人物卡路徑、截圖路徑、誤差百分比、total_loss）
+  evaluate_guesses_and_record    批次版：交給 eval_pipeline（產卡 / 截圖 / MediaPipe 重疊執行，多實例經 InstanceScheduler）
 """
 import json
 import time
@@ -12,6 +14,98 @@ from pathlib import Path
 FAIL_LOSS = 1e9
 
 
+def evaluate_card(params, target_ratios, base_card_path, trial_dir, run_ts, shoot, objective=None, details=None,
+                  extract_lock=None):
+    """
+    單一猜測的評估流程（evaluate_one_guess_and_record / run_optuna_face 共用）：
+    eval_cache 查詢 → write_card_from_base → shoot(card_path, dest) → extract_landmarks → eval_cache 記錄 → compute_loss。
+    shoot：截圖函數，回傳是否成功（request_screenshot_and_wait 綁定請求檔，或 InstanceScheduler.submit(...).result()）。
+    extract_lock：多執行緒共用 MediaPipe session 時的鎖（只鎖 landmark 抽取）；None 不加鎖。
+    details 給 dict 時填入 face_ratios（命中快取時另有 cache_hit=True）。
+    回傳 {"ok", "error", "total_loss", "errors_percent", "loss_contributions", "face_ratios", "card_path",
+    "screenshot_path", "cache_key", "screenshot_sec", "extract_sec"}；失敗時 ok=False、error 為原因。
+    """
+    from chafile_card import write_card_from_base
+    from landmark_loss import compute_loss
+    from extract_face_ratios import extract_landmarks, _ratios_from_points
+    from eval_cache import lookup, record
+
+    result = {
+        "ok": False, "error": None, "total_loss": None, "errors_percent": None, "loss_contributions": None,
+        "face_ratios": None, "card_path": None, "screenshot_path": None, "cache_key": None,
+        "screenshot_sec": None, "extract_sec": None,
+    }
+    # objective（Procrustes）要 landmark：沒存 landmark 的舊 entry 當未命中重新評估，不在計分時再跑 MediaPipe
+    cached = lookup(base_card_path, params, need_landmarks=objective is not None)
+    if cached is not None:
+        if details is not None:
+            details["face_ratios"] = cached["face_ratios"]
+            details["cache_hit"] = True
+        result.update(face_ratios=cached["face_ratios"], screenshot_path=cached["screenshot_path"], cache_key=cached["key"])
+        landmarks, aspect, dest = cached.get("landmarks"), cached.get("aspect"), cached["screenshot_path"]
+    else:
+        trial_dir = Path(trial_dir)
+        cards_dir = trial_dir / "cards"
+        screenshots_dir = trial_dir / "screenshots"
+        cards_dir.mkdir(parents=True, exist_ok=True)
+        screenshots_dir.mkdir(parents=True, exist_ok=True)
+
+        # base card 只解析一次（load_card_template 快取），每個 trial 只 patch 59 個 float
+        card_path = cards_dir / ("card_00_%s.png" % run_ts)
+        if write_card_from_base(base_card_path, params, card_path) is None:
+            result["error"] = "card write failed"
+            return result
+        result["card_path"] = str(card_path.resolve())
+
+        dest = screenshots_dir / ("screenshot_00_%s.png" % run_ts)
+        t0 = time.perf_counter()
+        ok = shoot(card_path, dest)
+        result["screenshot_sec"] = round(time.perf_counter() - t0, 2)
+        if not ok or not dest.exists():
+            result["error"] = "screenshot timeout"
+            return result
+        result["screenshot_path"] = str(dest.resolve())
+
+        t0 = time.perf_counter()
+        try:
+            if extract_lock is not None:
+                with extract_lock:
+                    landmarks = extract_landmarks(dest)
+            else:
+                landmarks = extract_landmarks(dest)
+            face_ratios = _ratios_from_points(landmarks)
+        except Exception as e:
+            result["error"] = str(e) or "no face"
+            return result
+        result["extract_sec"] = round(time.perf_counter() - t0, 2)
+        record(base_card_path, params, face_ratios, landmarks=landmarks, screenshot_path=dest)
+        if details is not None:
+            details["face_ratios"] = face_ratios
+        result["face_ratios"] = face_ratios
+        aspect = None
+
+    try:
+        errors, contributions, total_loss = compute_loss(
+            target_ratios, result["face_ratios"], objective, screenshot_path=dest, landmarks=landmarks, aspect=aspect,
+        )
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+    result.update(ok=True, total_loss=float(total_loss), errors_percent=errors, loss_contributions=contributions)
+    return result
+
+
+def _debug_log(hypothesis_id, location, message, data):
+    # #region agent log
+    try:
+        _lp = Path(__file__).resolve().parent / "debug-e56dbd.log"
+        with open(_lp, "a", encoding="utf-8") as _f:
+            _f.write(json.dumps({"sessionId": "e56dbd", "hypothesisId": hypothesis_id, "location": location, "message": message, "data": data, "timestamp": int(time.time() * 1000)}) + "\n")
+    except Exception:
+        pass
+    # #endregion
+
+
 def evaluate_one_guess_and_record(
     params,
     target_ratios,
@@ -22,98 +116,93 @@ def evaluate_one_guess_and_record(
     screenshot_timeout,
     progress_interval,
     trial_index=None,
+    details=None,
+    objective=None,
 ):
     """
-    給定一組 params、目標 target_ratios，產一張卡 → 請求截圖 → MediaPipe → 寫入比較紀錄（errors_percent 百分比）→ 回傳 total_loss。
-    僅呼叫既有函數。截圖失敗或無臉時回傳 FAIL_LOSS，不寫比較紀錄。
+    以 evaluate_card（截圖經 request_file 的單一遊戲實例）評估一組 params，寫入比較紀錄（errors_percent 百分比）後回傳 total_loss。
+    產卡、截圖失敗或無臉時回傳 FAIL_LOSS，不寫比較紀錄。
     寫入 trial_dir/comparison_<run_ts>.json：run_ts, params, errors_percent, total_loss, card_path, screenshot_path。
+    details 給 dict 時填入 face_ratios（供續跑 / 暖啟動記錄）。
+    objective 為 landmark_loss 的 objective（如 ProcrustesObjective）時以其計分；None 即 ratio loss。
+    同一 base card + 相同臉型值已評估過時（eval_cache）不載卡截圖，比較紀錄的 screenshot_path 指向當時的截圖、card_path 為 null。
     """
-    from read_hs2_card import find_iend_in_bytes
-    from write_face_params_to_card import write_face_params_into_trailing
-    from run_phase1 import request_screenshot_and_wait, _compute_errors_and_loss
-    from extract_face_ratios import extract_ratios
+    from run_phase1 import request_screenshot_and_wait
 
     trial_dir = Path(trial_dir)
-    cards_dir = trial_dir / "cards"
-    screenshots_dir = trial_dir / "screenshots"
     trial_dir.mkdir(parents=True, exist_ok=True)
-    cards_dir.mkdir(parents=True, exist_ok=True)
-    screenshots_dir.mkdir(parents=True, exist_ok=True)
 
-    base_bytes = Path(base_card_path).read_bytes()
-    iend = find_iend_in_bytes(base_bytes)
-    if iend is None:
-        return FAIL_LOSS
-    base_png = base_bytes[:iend]
-    base_trailing = base_bytes[iend:]
+    def shoot(card_path, dest):
+        return request_screenshot_and_wait(
+            card_path.resolve(), Path(request_file), dest,
+            timeout_sec=screenshot_timeout, progress_interval=progress_interval,
+        )
 
-    result = write_face_params_into_trailing(base_trailing, params)
-    if result is None:
+    res = evaluate_card(params, target_ratios, base_card_path, trial_dir, run_ts, shoot, objective=objective, details=details)
+    if res["error"] == "screenshot timeout":
+        _debug_log("H3,H4", "evaluate_face_guess.py:trial_timeout", "trial_timeout",
+                   {"trial_index": trial_index, "trial_dir": str(trial_dir), "screenshot_wait_sec": res["screenshot_sec"]})
+    elif res["extract_sec"] is not None:
+        _debug_log("H1,H2,H3,H4", "evaluate_face_guess.py:trial_timing", "trial_timing", {
+            "trial_index": trial_index, "screenshot_wait_sec": res["screenshot_sec"], "mediapipe_sec": res["extract_sec"],
+            "total_sec": round(res["screenshot_sec"] + res["extract_sec"], 2), "trial_dir": str(trial_dir)})
+    if not res["ok"]:
         return FAIL_LOSS
-    new_trailing, _ = result
-    card_path = cards_dir / ("card_00_%s.png" % run_ts)
-    with open(card_path, "wb") as f:
-        f.write(base_png)
-        f.write(new_trailing)
-
-    dest = screenshots_dir / ("screenshot_00_%s.png" % run_ts)
-    # #region agent log
-    t0 = time.perf_counter()
-    # #endregion
-    ok = request_screenshot_and_wait(
-        card_path.resolve(),
-        Path(request_file),
-        dest,
-        timeout_sec=screenshot_timeout,
-        progress_interval=progress_interval,
-    )
-    # #region agent log
-    t1 = time.perf_counter()
-    screenshot_wait_sec = round(t1 - t0, 2)
-    # #endregion
-    if not ok or not dest.exists():
-        # #region agent log
-        try:
-            _lp = Path(__file__).resolve().parent / "debug-e56dbd.log"
-            with open(_lp, "a", encoding="utf-8") as _f:
-                _f.write(json.dumps({"sessionId": "e56dbd", "hypothesisId": "H3,H4", "location": "evaluate_face_guess.py:trial_timeout", "message": "trial_timeout", "data": {"trial_index": trial_index, "trial_dir": str(trial_dir), "screenshot_wait_sec": screenshot_wait_sec}, "timestamp": int(time.time() * 1000)}) + "\n")
-        except Exception:
-            pass
-        # #endregion
-        return FAIL_LOSS
-
-    try:
-        # #region agent log
-        t_mp0 = time.perf_counter()
-        # #endregion
-        actual_ratios = extract_ratios(dest)
-        # #region agent log
-        mediapipe_sec = round(time.perf_counter() - t_mp0, 2)
-        total_sec = round(t1 - t0 + (time.perf_counter() - t_mp0), 2)
-        try:
-            _lp = Path(__file__).resolve().parent / "debug-e56dbd.log"
-            with open(_lp, "a", encoding="utf-8") as _f:
-                _f.write(json.dumps({"sessionId": "e56dbd", "hypothesisId": "H1,H2,H3,H4", "location": "evaluate_face_guess.py:trial_timing", "message": "trial_timing", "data": {"trial_index": trial_index, "screenshot_wait_sec": screenshot_wait_sec, "mediapipe_sec": mediapipe_sec, "total_sec": total_sec, "trial_dir": str(trial_dir)}, "timestamp": int(time.time() * 1000)}) + "\n")
-        except Exception:
-            pass
-        # #endregion
-    except Exception:
-        return FAIL_LOSS
-    errors, contributions, total_loss = _compute_errors_and_loss(target_ratios, actual_ratios)
-    total_loss = float(total_loss)
 
     # 比較結果紀錄：誤差以百分比表示，檔名含時間戳
     comparison = {
         "run_ts": run_ts,
         "params": params,
-        "errors_percent": errors,
-        "loss_contributions": contributions,
-        "total_loss": round(total_loss, 4),
-        "card_path": str(card_path.resolve()),
-        "screenshot_path": str(dest.resolve()),
+        "errors_percent": res["errors_percent"],
+        "loss_contributions": res["loss_contributions"],
+        "total_loss": round(res["total_loss"], 4),
+        "card_path": res["card_path"],
+        "screenshot_path": res["screenshot_path"],
     }
-    comparison_path = trial_dir / ("comparison_%s.json" % run_ts)
-    with open(comparison_path, "w", encoding="utf-8") as f:
+    if res["cache_key"] is not None:
+        comparison["eval_cache_key"] = res["cache_key"]
+    with open(trial_dir / ("comparison_%s.json" % run_ts), "w", encoding="utf-8") as f:
         json.dump(comparison, f, indent=2, ensure_ascii=False)
+    return res["total_loss"]
+
 
-    return total_loss
+def evaluate_guesses_and_record(
+    guesses,
+    target_ratios,
+    base_card_path,
+    request_files,
+    trial_dirs,
+    run_ts,
+    screenshot_timeout,
+    progress_interval,
+    score_workers=0,
+    on_result=None,
+    objective=None,
+):
+    """
+    evaluate_one_guess_and_record 的批次版：多組 params 經 eval_pipeline 重疊執行（產卡 / 截圖 / MediaPipe 同時進行），
+    每組寫入各自 trial_dirs[i] 下與單次版相同的 cards/、screenshots/、comparison_<run_ts>.json。
+    request_files: 一個或多個載卡請求檔（多個遊戲實例時截圖平行）。
+    回傳 (losses, stats)：losses 與 guesses 同順序，失敗為 FAIL_LOSS；stats 為各 stage utilisation。
+    """
+    from eval_pipeline import run_pipeline
+
+    if isinstance(request_files, (str, Path)):
+        request_files = [request_files]
+    jobs = []
+    for params, trial_dir in zip(guesses, trial_dirs):
+        trial_dir = Path(trial_dir)
+        jobs.append({
+            "params": params,
+            "card_path": trial_dir / "cards" / ("card_00_%s.png" % run_ts),
+            "screenshot_path": trial_dir / "screenshots" / ("screenshot_00_%s.png" % run_ts),
+            "comparison_path": trial_dir / ("comparison_%s.json" % run_ts),
+            "run_ts": run_ts,
+        })
+    results, stats = run_pipeline(
+        jobs, target_ratios, base_card_path, request_files,
+        screenshot_timeout=screenshot_timeout, progress_interval=progress_interval,
+        score_workers=score_workers, on_result=on_result, objective=objective,
+    )
+    losses = [r["total_loss"] if r["ok"] else FAIL_LOSS for r in results]
+    return losses, stats
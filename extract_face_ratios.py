@@ -3,8 +3,10 @@
 Stage 1.1: Extract face ratios from a single image (for PoC: map to HS2 params later).
 Uses MediaPipe Face Landmarker (0.10+ Tasks API); outputs a small JSON of 5-8 ratios.
 """
+import atexit
 import json
 import argparse
+import threading
 import urllib.request
 from pathlib import Path
 
@@ -68,21 +70,19 @@ FACE_FEATURE_EDGES = (
     + [(46, 53), (53, 52), (52, 65), (65, 55), (70, 63), (63, 105), (105, 66), (66, 107)]
 )
 
+# 各五官區域的 landmark（MediaPipe face_landmarks_connections）；landmark_loss 的分區殘差也用這些
+LIPS_INDICES = [61, 146, 91, 181, 84, 17, 314, 405, 321, 375, 291, 185, 40, 39, 37, 0, 267, 269, 270, 409,
+                78, 95, 88, 178, 87, 14, 317, 402, 318, 324, 308, 191, 80, 81, 82, 13, 312, 311, 310, 415]
+LEFT_EYE_INDICES = [263, 249, 390, 373, 374, 380, 381, 382, 362, 466, 388, 387, 386, 385, 384, 398]
+RIGHT_EYE_INDICES = [33, 7, 163, 144, 145, 153, 154, 155, 133, 246, 161, 160, 159, 158, 157, 173]
+LEFT_EYEBROW_INDICES = [276, 283, 282, 295, 285, 300, 293, 334, 296, 336]
+RIGHT_EYEBROW_INDICES = [46, 53, 52, 65, 55, 70, 63, 105, 66, 107]
+# Nose: tip, bridge, sides
+NOSE_INDICES = [1, 2, 3, 4, 5, 6, 98, 97, 99, 195, 197, 240, 326, 327, 328, 460]
+
 # 研究用：視覺上較精準的特徵點（眼、眉、鼻、唇）；目前不用於紫色，保留供後用。
 PRECISE_FEATURE_INDICES = sorted(set(
-    # Lips (FACE_LANDMARKS_LIPS)
-    [61, 146, 91, 181, 84, 17, 314, 405, 321, 375, 291, 185, 40, 39, 37, 0, 267, 269, 270, 409,
-     78, 95, 88, 178, 87, 14, 317, 402, 318, 324, 308, 191, 80, 81, 82, 13, 312, 311, 310, 415]
-    # Left eye
-    + [263, 249, 390, 373, 374, 380, 381, 382, 362, 466, 388, 387, 386, 385, 384, 398]
-    # Right eye
-    + [33, 7, 163, 144, 145, 153, 154, 155, 133, 246, 161, 160, 159, 158, 157, 173]
-    # Left eyebrow
-    + [276, 283, 282, 295, 285, 300, 293, 334, 296, 336]
-    # Right eyebrow
-    + [46, 53, 52, 65, 55, 70, 63, 105, 66, 107]
-    # Nose: tip, bridge, sides
-    + [1, 2, 3, 4, 5, 6, 98, 97, 99, 195, 197, 240, 326, 327, 328, 460]
+    LIPS_INDICES + LEFT_EYE_INDICES + RIGHT_EYE_INDICES + LEFT_EYEBROW_INDICES + RIGHT_EYEBROW_INDICES + NOSE_INDICES
 ))
 
 FACE_LANDMARKER_MODEL_URL = (
@@ -109,6 +109,15 @@ def get_xy(landmark):
     return (x, y)
 
 
+def landmarks_to_array(lm, n=468):
+    """MediaPipe landmark 列表 → (n, 2) float32 歸一化 (x, y) 陣列（landmark_cache 的儲存格式）。"""
+    import numpy as np
+    arr = np.empty((n, 2), dtype=np.float32)
+    for i in range(n):
+        arr[i] = get_xy(lm[i])
+    return arr
+
+
 def dist(a, b):
     return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
 
@@ -133,116 +142,340 @@ def _crop_center_for_face(img_path, width_frac=0.5, height_frac=0.6):
         return None
 
 
-def extract_ratios(image_path):
-    import math
+def _import_mediapipe():
     try:
         import mediapipe as mp
-        from mediapipe.tasks import python
         from mediapipe.tasks.python import vision
     except ImportError as e:
         raise SystemExit(
             "Install dependencies: pip install Pillow mediapipe numpy\n" + str(e)
         ) from e
+    return mp, vision
 
-    model_path = _get_model_path()
-    base_options = mp.tasks.BaseOptions(model_asset_path=model_path)
-    try:
-        options = vision.FaceLandmarkerOptions(
-            base_options=base_options,
-            running_mode=vision.RunningMode.IMAGE,
-            num_faces=1,
-            min_face_detection_confidence=0.3,
-            min_face_presence_confidence=0.3,
-        )
-    except TypeError:
-        options = vision.FaceLandmarkerOptions(
-            base_options=base_options,
-            running_mode=vision.RunningMode.IMAGE,
-            num_faces=1,
-        )
-    ratios = {}
-    image_path = Path(image_path)
-    with vision.FaceLandmarker.create_from_options(options) as landmarker:
-        mp_image = mp.Image.create_from_file(str(image_path))
-        result = landmarker.detect(mp_image)
-        if not result.face_landmarks:
-            arr = _crop_center_for_face(image_path)
-            if arr is not None:
-                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=arr)
-                result = landmarker.detect(mp_image)
+
+class FaceLandmarkerSession:
+    """
+    長駐的 FaceLandmarker：模型（face_landmarker.task）只在建立時載入一次，之後每張圖只付 detect 成本。
+    供優化器在同一 process 內對上千張截圖重複使用；用完呼叫 close()，或以 with 區塊自動關閉。
+    MediaPipe landmarker 非 thread-safe，detect 以 lock 序列化。
+    """
+
+    def __init__(self, model_path=None, min_confidence=0.3):
+        mp, vision = _import_mediapipe()
+        self._mp = mp
+        self.model_path = str(model_path) if model_path else _get_model_path()
+        base_options = mp.tasks.BaseOptions(model_asset_path=self.model_path)
+        try:
+            options = vision.FaceLandmarkerOptions(
+                base_options=base_options,
+                running_mode=vision.RunningMode.IMAGE,
+                num_faces=1,
+                min_face_detection_confidence=min_confidence,
+                min_face_presence_confidence=min_confidence,
+            )
+        except TypeError:
+            options = vision.FaceLandmarkerOptions(
+                base_options=base_options,
+                running_mode=vision.RunningMode.IMAGE,
+                num_faces=1,
+            )
+        self._landmarker = vision.FaceLandmarker.create_from_options(options)
+        self._lock = threading.Lock()
+        self.n_detect = 0
+
+    @property
+    def closed(self):
+        return self._landmarker is None
+
+    def detect(self, image_path, crop_fallback=True):
+        """回傳第一張臉的 landmark 列表（MediaPipe NormalizedLandmark），無臉時回傳 None。
+        crop_fallback: 整張圖偵測不到時，改用中央裁切再試一次（與 extract_ratios 原行為一致）。"""
+        if self._landmarker is None:
+            raise RuntimeError("FaceLandmarkerSession is closed")
+        mp = self._mp
+        image_path = Path(image_path)
+        with self._lock:
+            mp_image = mp.Image.create_from_file(str(image_path))
+            result = self._landmarker.detect(mp_image)
+            if not result.face_landmarks and crop_fallback:
+                arr = _crop_center_for_face(image_path)
+                if arr is not None:
+                    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=arr)
+                    result = self._landmarker.detect(mp_image)
+            self.n_detect += 1
         if not result.face_landmarks:
-            raise ValueError("No face detected in image")
-        lm = result.face_landmarks[0]
-
-        pts = {k: get_xy(lm[k]) for k in [
-            LEFT_EYE_INNER, RIGHT_EYE_INNER, LEFT_EYE_OUTER, RIGHT_EYE_OUTER,
-            NOSE_TIP, NOSE_BRIDGE, LEFT_FACE, RIGHT_FACE, FOREHEAD, CHIN,
-            MOUTH_LEFT, MOUTH_RIGHT, NOSE_LEFT, NOSE_RIGHT,
-            UPPER_LIP_LEFT, UPPER_LIP_RIGHT, LOWER_LIP,
-            PHILTRUM, LEFT_JAW, RIGHT_JAW,
-        ]}
-
-        face_w = dist(pts[LEFT_FACE], pts[RIGHT_FACE])
-        face_h = dist(pts[FOREHEAD], pts[CHIN])
-        eye_span = dist(pts[LEFT_EYE_INNER], pts[RIGHT_EYE_INNER])
-        eye_left_w = dist(pts[LEFT_EYE_INNER], pts[LEFT_EYE_OUTER])
-        eye_right_w = dist(pts[RIGHT_EYE_INNER], pts[RIGHT_EYE_OUTER])
-        mouth_w = dist(pts[MOUTH_LEFT], pts[MOUTH_RIGHT])
-        nose_w = dist(pts[NOSE_LEFT], pts[NOSE_RIGHT])
-        nose_h = dist(pts[NOSE_BRIDGE], pts[NOSE_TIP])
-        upper_lip_mid = ((pts[UPPER_LIP_LEFT][0] + pts[UPPER_LIP_RIGHT][0]) / 2, (pts[UPPER_LIP_LEFT][1] + pts[UPPER_LIP_RIGHT][1]) / 2)
-        mouth_h = dist(upper_lip_mid, pts[LOWER_LIP])
-        # 眼睛垂直：兩眼中心 Y 在臉高上的相對位置（0=額頭、1=下巴），對應 HS2 eyeVertical
-        left_eye_center_y = (pts[LEFT_EYE_INNER][1] + pts[LEFT_EYE_OUTER][1]) / 2
-        right_eye_center_y = (pts[RIGHT_EYE_INNER][1] + pts[RIGHT_EYE_OUTER][1]) / 2
-        eye_center_y = (left_eye_center_y + right_eye_center_y) / 2
-        forehead_y = pts[FOREHEAD][1]
-        chin_y = pts[CHIN][1]
-        face_h_y = chin_y - forehead_y if abs(chin_y - forehead_y) > 1e-6 else 1.0
-        eye_vertical_ratio = (eye_center_y - forehead_y) / face_h_y
-
-        if face_w > 0:
-            ratios["eye_span_to_face_width"] = round(eye_span / face_w, 4)
-        if face_h > 0:
-            ratios["face_width_to_height"] = round(face_w / face_h, 4)
-        if face_w > 0:
-            ratios["mouth_width_to_face_width"] = round(mouth_w / face_w, 4)
-        if face_w > 0:
-            ratios["nose_width_to_face_width"] = round(nose_w / face_w, 4)
-        if eye_span > 0:
-            ratios["eye_size_ratio"] = round((eye_left_w + eye_right_w) / (2 * eye_span), 4)
-        if face_h > 0:
-            ratios["nose_height_to_face_height"] = round(nose_h / face_h, 4)
-        if face_h > 0:
-            ratios["mouth_height_to_face_height"] = round(mouth_h / face_h, 4)
-        if face_h > 0 and face_w > 0:
-            ratios["head_width_to_face_height"] = round(face_w / face_h, 4)
-        if mouth_w > 0:
-            ratios["lip_thickness_to_mouth_width"] = round(mouth_h / mouth_w, 4)
-        ratios["eye_vertical_to_face_height"] = round(eye_vertical_ratio, 4)
-        # 額外比例（多算多採用）
-        if face_w > 0:
-            jaw_w = dist(pts[LEFT_JAW], pts[RIGHT_JAW])
-            ratios["jaw_width_to_face_width"] = round(jaw_w / face_w, 4)
-            if face_h > 0:
-                ratios["face_width_to_height_lower"] = round(jaw_w / face_h, 4)
-        if face_h > 0:
-            mouth_center_y = (pts[UPPER_LIP_LEFT][1] + pts[UPPER_LIP_RIGHT][1]) / 2 + pts[LOWER_LIP][1]
-            mouth_center_y /= 2
-            chin_to_mouth = pts[CHIN][1] - mouth_center_y
-            ratios["chin_to_mouth_face_height"] = round(chin_to_mouth / face_h, 4)
-        dx = (pts[RIGHT_EYE_INNER][0] + pts[RIGHT_EYE_OUTER][0]) / 2 - (pts[LEFT_EYE_INNER][0] + pts[LEFT_EYE_OUTER][0]) / 2
-        dy = (pts[RIGHT_EYE_INNER][1] + pts[RIGHT_EYE_OUTER][1]) / 2 - (pts[LEFT_EYE_INNER][1] + pts[LEFT_EYE_OUTER][1]) / 2
-        angle = math.atan2(dy, dx)
-        ratios["eye_angle_z_ratio"] = round((angle / math.pi + 0.5), 4)
-        if face_h > 0:
-            ratios["nose_bridge_position_ratio"] = round((pts[NOSE_BRIDGE][1] - pts[FOREHEAD][1]) / face_h, 4)
-        lip_total_h = pts[LOWER_LIP][1] - pts[PHILTRUM][1]
-        if lip_total_h > 1e-6:
-            upper_h = (pts[UPPER_LIP_LEFT][1] + pts[UPPER_LIP_RIGHT][1]) / 2 - pts[PHILTRUM][1]
-            ratios["upper_lip_to_total_lip_ratio"] = round(upper_h / lip_total_h, 4)
-            ratios["lower_lip_to_total_lip_ratio"] = round(1.0 - upper_h / lip_total_h, 4)
-    return ratios
+            return None
+        return result.face_landmarks[0]
+
+    def close(self):
+        if self._landmarker is not None:
+            self._landmarker.close()
+            self._landmarker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    """Process 內共用的 FaceLandmarkerSession（第一次呼叫時建立，process 結束時自動 close）。"""
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None or _default_session.closed:
+            _default_session = FaceLandmarkerSession()
+        return _default_session
+
+
+def close_default_session():
+    global _default_session
+    with _default_session_lock:
+        if _default_session is not None:
+            _default_session.close()
+            _default_session = None
+
+
+atexit.register(close_default_session)
+
+
+def extract_landmarks(image_path, session=None, cache=None):
+    """
+    回傳 (468, 2) float32 歸一化 (x, y) landmark 陣列；無臉時丟 ValueError。
+    cache: LandmarkCache；None 時使用 landmark_cache.get_default_cache()（依 HS4_LANDMARK_CACHE），False 停用。
+    命中快取時完全不碰 MediaPipe（連 session 都不建立）；無臉結果也會快取。
+    """
+    if cache is None:
+        from landmark_cache import get_default_cache
+        cache = get_default_cache()
+    model_path = session.model_path if session is not None else None
+    image_sha = None
+    if cache:
+        from landmark_cache import file_sha256
+        image_sha = file_sha256(image_path)
+        hit, xy = cache.get(image_path, image_sha=image_sha, model_path=model_path)
+        if hit:
+            if xy is None:
+                raise ValueError("No face detected in image")
+            return xy
+    if session is None:
+        session = get_default_session()
+    lm = session.detect(image_path)
+    xy = landmarks_to_array(lm) if lm is not None else None
+    if cache:
+        try:
+            cache.put(image_path, xy, image_sha=image_sha, model_path=session.model_path)
+        except OSError:
+            pass  # 快取寫入失敗不影響結果
+    if xy is None:
+        raise ValueError("No face detected in image")
+    return xy
+
+
+def extract_ratios(image_path, session=None, cache=None):
+    """
+    對單張圖跑 MediaPipe 並回傳 face_ratios (dict)。
+    session: FaceLandmarkerSession；None 時使用 process 共用的 get_default_session()，不再每次重新載入模型。
+    cache: 見 extract_landmarks；同一張圖（內容相同）第二次起直接由快取的 landmark 算 ratio。
+    """
+    return _ratios_from_points(extract_landmarks(image_path, session=session, cache=cache))
+
+
+def _ratios_result(image_path, session):
+    """
+    單張結果（不丟例外）：{"path", "ratios", "landmarks", "error"}；失敗時 ratios / landmarks 為 None、error 為訊息。
+    landmarks 一併回傳，呼叫端（eval_cache、Procrustes objective）不必再抽一次。
+    """
+    try:
+        xy = extract_landmarks(image_path, session=session)
+        return {"path": str(image_path), "ratios": _ratios_from_points(xy), "landmarks": xy, "error": None}
+    except Exception as e:
+        return {"path": str(image_path), "ratios": None, "landmarks": None, "error": str(e)}
+
+
+# 批次 worker process 內的 landmarker（每個 worker 各自一份，由 initializer 建立）
+_worker_session = None
+
+
+def _batch_worker_init(model_path):
+    global _worker_session
+    _worker_session = FaceLandmarkerSession(model_path=model_path)
+
+
+def _batch_worker_extract(image_path):
+    return _ratios_result(image_path, _worker_session)
+
+
+_batch_pools = {}
+_batch_pools_lock = threading.Lock()
+
+
+def get_batch_pool(workers):
+    """回傳 workers 個 process 的共用 pool（同一 workers 數只建一次，worker 內 landmarker 長駐）。"""
+    from concurrent.futures import ProcessPoolExecutor
+    with _batch_pools_lock:
+        pool = _batch_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_batch_worker_init,
+                initargs=(_get_model_path(),),
+            )
+            _batch_pools[workers] = pool
+        return pool
+
+
+def close_batch_pools():
+    with _batch_pools_lock:
+        for pool in _batch_pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+        _batch_pools.clear()
+
+
+atexit.register(close_batch_pools)
+
+
+def iter_ratios_batch(image_paths, workers=0, session=None):
+    """
+    依輸入順序逐張 yield {"path", "ratios", "landmarks", "error"}；單張失敗（如 No face detected）放在 error，不丟例外。
+    workers <= 1：本 process 內以 session（預設共用 session）依序處理。
+    workers >= 2：交給 get_batch_pool(workers)，每個 worker 各自持有 landmarker，結果依輸入順序串流回來。
+    """
+    image_paths = list(image_paths)
+    if workers is None or workers <= 1 or len(image_paths) <= 1:
+        # session 為 None 時由 extract_ratios 在快取未命中時才建立共用 session
+        for path in image_paths:
+            yield _ratios_result(path, session)
+        return
+    pool = get_batch_pool(int(workers))
+    for result in pool.map(_batch_worker_extract, [str(p) for p in image_paths]):
+        yield result
+
+
+def extract_ratios_batch(image_paths, workers=0, session=None):
+    """iter_ratios_batch 的 list 版本：回傳與 image_paths 同順序的結果列表。"""
+    return list(iter_ratios_batch(image_paths, workers=workers, session=session))
+
+
+def _ratios_from_landmarks(lm):
+    return _ratios_from_points(landmarks_to_array(lm))
+
+
+# compute_ratio_matrix 的欄位順序（= extract_ratios 回傳 dict 的 key 順序）
+RATIO_NAMES = (
+    "eye_span_to_face_width",
+    "face_width_to_height",
+    "mouth_width_to_face_width",
+    "nose_width_to_face_width",
+    "eye_size_ratio",
+    "nose_height_to_face_height",
+    "mouth_height_to_face_height",
+    "head_width_to_face_height",
+    "lip_thickness_to_mouth_width",
+    "eye_vertical_to_face_height",
+    "jaw_width_to_face_width",
+    "face_width_to_height_lower",
+    "chin_to_mouth_face_height",
+    "eye_angle_z_ratio",
+    "nose_bridge_position_ratio",
+    "upper_lip_to_total_lip_ratio",
+    "lower_lip_to_total_lip_ratio",
+)
+
+
+def compute_ratio_matrix(landmarks):
+    """
+    向量化的 ratio 定義：landmarks (N, 468, 2) 或 (468, 2) 歸一化座標 → (N, 17) float64，欄位順序同 RATIO_NAMES。
+    分母不合法（臉寬/臉高/眼距/嘴寬 <= 0、唇高 <= 1e-6）的 ratio 為 NaN（對應舊版 dict 中缺少該 key）。
+    不做四捨五入；要與 extract_ratios 相同的 dict 請用 ratio_rows_to_dicts。
+    """
+    import numpy as np
+    a = np.asarray(landmarks, dtype=np.float64)
+    if a.ndim == 2:
+        a = a[None]
+    x = a[:, :, 0]
+    y = a[:, :, 1]
+
+    def d(i, j):
+        dx = x[:, i] - x[:, j]
+        dy = y[:, i] - y[:, j]
+        return np.sqrt(dx * dx + dy * dy)
+
+    def safe_div(num, den, valid):
+        out = np.full(num.shape, np.nan)
+        np.divide(num, den, out=out, where=valid)
+        return out
+
+    face_w = d(LEFT_FACE, RIGHT_FACE)
+    face_h = d(FOREHEAD, CHIN)
+    eye_span = d(LEFT_EYE_INNER, RIGHT_EYE_INNER)
+    eye_left_w = d(LEFT_EYE_INNER, LEFT_EYE_OUTER)
+    eye_right_w = d(RIGHT_EYE_INNER, RIGHT_EYE_OUTER)
+    mouth_w = d(MOUTH_LEFT, MOUTH_RIGHT)
+    nose_w = d(NOSE_LEFT, NOSE_RIGHT)
+    nose_h = d(NOSE_BRIDGE, NOSE_TIP)
+    jaw_w = d(LEFT_JAW, RIGHT_JAW)
+    upper_lip_x = (x[:, UPPER_LIP_LEFT] + x[:, UPPER_LIP_RIGHT]) / 2
+    upper_lip_y = (y[:, UPPER_LIP_LEFT] + y[:, UPPER_LIP_RIGHT]) / 2
+    mdx = upper_lip_x - x[:, LOWER_LIP]
+    mdy = upper_lip_y - y[:, LOWER_LIP]
+    mouth_h = np.sqrt(mdx * mdx + mdy * mdy)
+    # 眼睛垂直：兩眼中心 Y 在臉高上的相對位置（0=額頭、1=下巴），對應 HS2 eyeVertical
+    left_eye_cx = (x[:, LEFT_EYE_INNER] + x[:, LEFT_EYE_OUTER]) / 2
+    left_eye_cy = (y[:, LEFT_EYE_INNER] + y[:, LEFT_EYE_OUTER]) / 2
+    right_eye_cx = (x[:, RIGHT_EYE_INNER] + x[:, RIGHT_EYE_OUTER]) / 2
+    right_eye_cy = (y[:, RIGHT_EYE_INNER] + y[:, RIGHT_EYE_OUTER]) / 2
+    eye_center_y = (left_eye_cy + right_eye_cy) / 2
+    forehead_y = y[:, FOREHEAD]
+    chin_y = y[:, CHIN]
+    face_h_y = chin_y - forehead_y
+    face_h_y = np.where(np.abs(face_h_y) > 1e-6, face_h_y, 1.0)
+    mouth_center_y = (upper_lip_y + y[:, LOWER_LIP]) / 2
+    lip_total_h = y[:, LOWER_LIP] - y[:, PHILTRUM]
+    lip_ok = lip_total_h > 1e-6
+    upper_lip_ratio = safe_div(upper_lip_y - y[:, PHILTRUM], lip_total_h, lip_ok)
+
+    w_ok = face_w > 0
+    h_ok = face_h > 0
+    cols = (
+        safe_div(eye_span, face_w, w_ok),
+        safe_div(face_w, face_h, h_ok),
+        safe_div(mouth_w, face_w, w_ok),
+        safe_div(nose_w, face_w, w_ok),
+        safe_div(eye_left_w + eye_right_w, 2 * eye_span, eye_span > 0),
+        safe_div(nose_h, face_h, h_ok),
+        safe_div(mouth_h, face_h, h_ok),
+        safe_div(face_w, face_h, h_ok & w_ok),
+        safe_div(mouth_h, mouth_w, mouth_w > 0),
+        (eye_center_y - forehead_y) / face_h_y,
+        safe_div(jaw_w, face_w, w_ok),
+        safe_div(jaw_w, face_h, w_ok & h_ok),
+        safe_div(chin_y - mouth_center_y, face_h, h_ok),
+        np.arctan2(right_eye_cy - left_eye_cy, right_eye_cx - left_eye_cx) / np.pi + 0.5,
+        safe_div(y[:, NOSE_BRIDGE] - forehead_y, face_h, h_ok),
+        upper_lip_ratio,
+        np.where(lip_ok, 1.0 - upper_lip_ratio, np.nan),
+    )
+    return np.stack(cols, axis=1)
+
+
+def ratio_rows_to_dicts(matrix, ndigits=4):
+    """(N, 17) ratio 矩陣 → N 個 dict（key 順序同 RATIO_NAMES，NaN 欄位略過，數值 round 到 ndigits）。"""
+    import math
+    out = []
+    for row in matrix:
+        out.append({name: round(float(v), ndigits) for name, v in zip(RATIO_NAMES, row) if not math.isnan(v)})
+    return out
+
+
+def _ratios_from_points(xy):
+    """xy: (468, 2) 歸一化座標陣列 → extract_ratios 格式的 dict。"""
+    return ratio_rows_to_dicts(compute_ratio_matrix(xy))[0]
 
 
 def extract_ratios_mock(image_path):
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Nearest-neighbour base card：以過去實驗的（人物卡, 截圖）配對建 ratio 索引，
+對目標圖的 17 維 ratio 做向量化 k-NN，找出已算繪過、臉型最接近的卡，讓優化器從它的 shapeValueFace 出發。
+
+配對規則：任何 <dir>/screenshots/screenshot_<suffix>.png 與 <dir>/cards/card_<suffix>.png
+（run_experiment 的 round、run_optuna_face / run_onedim_face 的 trial 目錄皆是此結構）。
+截圖的 ratio 走 landmark 快取（extract_ratios），卡的 59 個臉部值以 ChaFileCard 讀取。
+
+用法：
+  python face_knn.py build output/experiments -o output/face_knn_index.npz --workers 4
+  python face_knn.py query --target-image SRC/AI_191856.png -k 5
+優化器：run_optuna_face.py / run_onedim_face.py / run_poc.py 加 --knn-index output/face_knn_index.npz
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_INDEX = BASE / "output" / "face_knn_index.npz"
+INDEX_VERSION = 1
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def find_card_screenshot_pairs(roots):
+    """回傳 [(card_path, screenshot_path), ...]，依截圖路徑排序。"""
+    pairs = []
+    seen = set()
+    for root in roots:
+        root = Path(root)
+        for shot in sorted(root.rglob("screenshots/screenshot_*.png")):
+            suffix = shot.name[len("screenshot_"):]
+            card = shot.parent.parent / "cards" / ("card_" + suffix)
+            key = str(shot.resolve())
+            if card.exists() and key not in seen:
+                seen.add(key)
+                pairs.append((card, shot))
+    return pairs
+
+
+def ratios_to_vector(ratios):
+    """ratio dict → RATIO_NAMES 順序的 float64 向量（缺值 NaN）。"""
+    from extract_face_ratios import RATIO_NAMES
+    return np.array([float(ratios[n]) if ratios.get(n) is not None else np.nan for n in RATIO_NAMES], dtype=np.float64)
+
+
+def build_index(roots, index_path, workers=0):
+    """掃描 roots 下的卡/截圖配對，寫 .npz：ratios (N, 17)、face (N, 59) 遊戲值、card_path、screenshot_path。"""
+    from extract_face_ratios import RATIO_NAMES, iter_ratios_batch
+    from chafile_card import ChaFileCard
+    from write_face_params_to_card import ALL_FACE_CHA_NAMES
+
+    pairs = find_card_screenshot_pairs(roots)
+    ratios_rows, face_rows, cards, shots = [], [], [], []
+    n_no_face = 0
+    n_bad_card = 0
+    results = iter_ratios_batch([s for _, s in pairs], workers=workers)
+    for (card, shot), res in zip(pairs, results):
+        if res["ratios"] is None:
+            n_no_face += 1
+            continue
+        try:
+            face = ChaFileCard.from_path(card).read_face_params()
+        except (OSError, ValueError):
+            n_bad_card += 1
+            continue
+        ratios_rows.append(ratios_to_vector(res["ratios"]))
+        face_rows.append([face[n] for n in ALL_FACE_CHA_NAMES])
+        cards.append(str(card.resolve()))
+        shots.append(str(shot.resolve()))
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        index_path,
+        index_version=np.array(INDEX_VERSION),
+        ratio_names=np.array(RATIO_NAMES),
+        face_names=np.array(ALL_FACE_CHA_NAMES),
+        ratios=np.array(ratios_rows, dtype=np.float64).reshape(-1, len(RATIO_NAMES)),
+        face=np.array(face_rows, dtype=np.float32).reshape(-1, len(ALL_FACE_CHA_NAMES)),
+        card_path=np.array(cards, dtype=str) if cards else np.array([], dtype="U1"),
+        screenshot_path=np.array(shots, dtype=str) if shots else np.array([], dtype="U1"),
+    )
+    return {"pairs": len(pairs), "indexed": len(cards), "no_face": n_no_face, "bad_card": n_bad_card}
+
+
+def load_index(index_path):
+    index_path = Path(index_path)
+    if not index_path.exists():
+        return None
+    with np.load(index_path, allow_pickle=False) as z:
+        idx = {k: z[k] for k in z.files}
+    if int(idx.get("index_version", 0)) != INDEX_VERSION:
+        return None
+    return idx
+
+
+def nearest(idx, target_ratios, k=5, ratio_names=None):
+    """
+    向量化 k-NN：每個 ratio 以索引內標準差正規化，距離 = 有效維度上的 RMS 差（NaN 維度忽略）。
+    ratio_names: 只用這些 ratio（預設全部 17 個）。回傳依距離排序的 [{"rank", "distance", "card_path", "screenshot_path", "face"}]。
+    """
+    X = idx["ratios"]
+    if len(X) == 0:
+        return []
+    names = [str(n) for n in idx["ratio_names"]]
+    t = ratios_to_vector(target_ratios) if isinstance(target_ratios, dict) else np.asarray(target_ratios, dtype=np.float64)
+    cols = np.ones(len(names), dtype=bool)
+    if ratio_names:
+        cols = np.array([n in set(ratio_names) for n in names])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.nanstd(X, axis=0)
+    scale = np.where(np.isfinite(scale) & (scale > 1e-9), scale, 1.0)
+    z = (X[:, cols] - t[cols]) / scale[cols]
+    valid = np.isfinite(z)
+    n_valid = valid.sum(axis=1)
+    sq = np.where(valid, z * z, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dist = np.sqrt(sq / n_valid)
+    dist = np.where(n_valid > 0, dist, np.inf)
+    k = max(1, min(int(k), len(dist)))
+    top = np.argpartition(dist, k - 1)[:k]
+    top = top[np.argsort(dist[top], kind="stable")]
+    face_names = [str(n) for n in idx["face_names"]]
+    out = []
+    for rank, i in enumerate(top):
+        out.append({
+            "rank": rank,
+            "distance": float(dist[i]),
+            "card_path": str(idx["card_path"][i]),
+            "screenshot_path": str(idx["screenshot_path"][i]),
+            "face": {n: int(round(float(v))) for n, v in zip(face_names, idx["face"][i])},
+        })
+    return out
+
+
+def face_to_slider_params(face, slider_names):
+    """59 個 cha_name 遊戲值 → 優化器的 slider（PoC 名稱）起點；每個 slider 取 PARAM_TO_LIST_INDICES 的第一個 index。"""
+    from write_face_params_to_card import PARAM_TO_LIST_INDICES, ALL_FACE_CHA_NAMES
+    params = {}
+    for name in slider_names:
+        indices = PARAM_TO_LIST_INDICES.get(name)
+        if indices:
+            params[name] = float(face[ALL_FACE_CHA_NAMES[indices[0]]])
+    return params
+
+
+def knn_start(index_path, target_ratios, slider_names, k=5):
+    """
+    優化器用：回傳 (matches, match, start_params)。match 為實際採用的那一筆（卡檔仍存在的最近鄰，
+    base card 即 Path(match["card_path"])）；索引不存在、為空或候選的卡都已不存在時回傳 (matches, None, None)。
+    """
+    idx = load_index(index_path)
+    if idx is None:
+        return [], None, None
+    matches = nearest(idx, target_ratios, k=k)
+    for m in matches:
+        if Path(m["card_path"]).exists():
+            return matches, m, face_to_slider_params(m["face"], slider_names)
+    return matches, None, None
+
+
+def resolve_start(knn_index, knn_k, target_ratios, slider_names, base_card, start_params, exp_dir, run_ts):
+    """
+    run_optuna_face / run_onedim_face 共用：有 --knn-index 時以最近鄰的卡當 base card、其 slider 值當起點
+    （映射值只補缺的 slider），並寫 exp_dir/knn_start_<run_ts>.json。回傳 (base_card, start_params)。
+    """
+    if not knn_index:
+        return base_card, start_params
+    matches, match, knn_params = knn_start(knn_index, target_ratios, slider_names, k=knn_k)
+    if match is None:
+        _out("  k-NN: no usable match in %s; using --base-card and mapped params" % knn_index)
+        return base_card, start_params
+    knn_card = Path(match["card_path"])
+    merged = dict(start_params)
+    merged.update(knn_params)
+    with open(Path(exp_dir) / ("knn_start_%s.json" % run_ts), "w", encoding="utf-8") as f:
+        json.dump({
+            "knn_index": str(knn_index),
+            "base_card": str(knn_card),
+            "mapped_start_params": dict(start_params),
+            "knn_start_params": merged,
+            "match": match,
+            "matches": matches,
+        }, f, indent=2, ensure_ascii=False)
+    _out("  k-NN start: %s (dist=%.4f)" % (knn_card, match["distance"]))
+    return knn_card, merged
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / query a ratio k-NN index over past (card, screenshot) pairs.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Index card/screenshot pairs under experiment directories")
+    b.add_argument("roots", type=Path, nargs="+", help="e.g. output/experiments")
+    b.add_argument("-o", "--index", type=Path, default=DEFAULT_INDEX)
+    b.add_argument("--workers", type=int, default=0, help="MediaPipe worker processes for uncached screenshots")
+    q = sub.add_parser("query", help="Nearest indexed faces for a target image")
+    q.add_argument("--target-image", type=Path, required=True)
+    q.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    q.add_argument("-k", type=int, default=5)
+    q.add_argument("-o", "--output", type=Path, default=None, help="Optional JSON output")
+    args = ap.parse_args()
+
+    if args.command == "build":
+        st = build_index(args.roots, args.index, workers=args.workers)
+        _out("Index: %s" % args.index)
+        _out("  pairs: %d  indexed: %d  no face: %d  unreadable card: %d" % (st["pairs"], st["indexed"], st["no_face"], st["bad_card"]))
+        return 0
+
+    if not args.target_image.exists():
+        raise SystemExit("Target image not found: %s" % args.target_image)
+    idx = load_index(args.index)
+    if idx is None:
+        raise SystemExit("Index not found or outdated: %s (run: python face_knn.py build output/experiments)" % args.index)
+    from extract_face_ratios import extract_ratios
+    matches = nearest(idx, extract_ratios(args.target_image), k=args.k)
+    for m in matches:
+        _out("  #%d  dist=%.4f  %s" % (m["rank"], m["distance"], m["card_path"]))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"target_image": str(args.target_image), "matches": matches}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
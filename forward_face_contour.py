@@ -1,68 +1,267 @@
 # -*- coding: utf-8 -*-
 """
-Forward model stub: shapeValueFace[0..18] -> 2D frontal contour points.
-Used by contour preview; full implementation will use list/customshape + ShapeAnime.
-Params index: 0=FaceBaseW, 2=FaceUpY, 4=FaceLowW, 5=ChinW, 6=ChinY, 10=ChinTipW, 15=CheekLowW, 18=CheekUpW.
+Forward model: shapeValueFace[0..18] -> 2D frontal FACE_OVAL contour (MediaPipe FACE_OVAL_INDICES, 36 points).
+
+ShapeAnime 的作法是每個 slider（cf_customhead 的 category）有 K 個 key，rate ∈ [0, 1] → index = (K-1)*rate，
+相鄰兩 key Lerp，各 category 的結果疊加到骨骼上。這裡沒有頭部 mesh / 蒙皮 / ShapeAnime 二進位
+（見 docs/ShapeAnime_還原FaceBase_2D投影量_計算步驟.md §5），所以 key 直接用遊戲當 oracle：
+slider_sweep.py 的響應張量裡，每個 slider 在 K 個 level 的實測 landmark 相對 base card 的位移
+就是該 slider 的 2D key。任意 19 維參數的輪廓 = base landmark + Σ_s Lerp_s(rate_s)，
+與 ShapeAnime 同一個「逐 category Lerp、再疊加」的結構。
+
+Lerp 寫成 hat basis：每組參數 → (19·K,) 權重，整批一次 (N, 19·K) @ (19·K, P·2) 矩陣乘法，
+每秒可評估數十萬組，供 optimize_contour 在送任何截圖前先離線擬合輪廓 slider（fit_contour_params）。
+
+未掃描的 slider（或掃描全失敗）位移為 0；第 19 之後的 slider 固定為 sweep base card 的值。
+座標：landmarks_batch / contour_batch 為 MediaPipe 的歸一化影像座標（y 向下）；
+get_contour_xy_from_params 維持舊介面（face-up = +y）。
+
+模型來源（load_contour_model）：參數 → 環境變數 HS4_CONTOUR_SWEEP → output/slider_sweep 下最新的 response.npz。
+
+  python forward_face_contour.py check [--sweep output/slider_sweep/<sweep-id>]
 """
-import math
+import argparse
+import os
+import sys
+import time
 from pathlib import Path
 
 import numpy as np
 
+BASE = Path(__file__).resolve().parent
+N_CONTOUR = 19
+# 遊戲值 -100..200 ↔ rate 0..1（同 optimize_contour._params_0_18_to_write_dict）
+GAME_MIN, GAME_MAX = -100.0, 200.0
+
 # Default: 19 floats in [0, 1] for contour-only sliders (indices 0..18)
 DEFAULT_CONTOUR_PARAMS = [0.5] * 19
 
 
-def get_contour_xy_from_params(params_0_18):
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def rates_to_game(rates):
+    """[0, 1] rate → 遊戲值（-100..200）。"""
+    return GAME_MIN + np.asarray(rates, dtype=np.float64) * (GAME_MAX - GAME_MIN)
+
+
+def game_to_rates(values):
+    return (np.asarray(values, dtype=np.float64) - GAME_MIN) / (GAME_MAX - GAME_MIN)
+
+
+def _fill_missing_levels(levels, keys, ok):
+    """keys (K, P, 2) 中 ok=False 的 level 以有效 level 線性內插補上；有效 level 不足 2 個回傳 None。"""
+    if ok.sum() < 2:
+        return None
+    if ok.all():
+        return keys
+    flat = keys.reshape(len(levels), -1)
+    good = np.flatnonzero(ok)
+    filled = np.empty_like(flat)
+    for j in range(flat.shape[1]):
+        filled[:, j] = np.interp(levels, levels[good], flat[good, j])
+    return filled.reshape(keys.shape)
+
+
+class ContourModel:
     """
-    Stub: build a simple 2D frontal face contour from params.
-    params_0_18: list of 19 floats in [0, 1] (shapeValueFace[0..18]).
-    Returns: (N, 2) array, normalized roughly to [0,1] x [0,1], face-up = +y.
+    由 slider_sweep 響應張量建立的向量化前向模型。
+    deltas (19, K, 468, 2)：slider i 在 level k 相對 base 的 landmark 位移（已扣掉 base 值處的內插，base 參數時位移恰為 0）。
     """
-    p = list(params_0_18)
-    while len(p) < 19:
-        p.append(0.5)
-    p = p[:19]
-
-    # Face ellipse (frontal): center (0.5, 0.5), radii from params
-    # FaceBaseW(0), FaceUpY(2), FaceLowW(4) -> width/height
-    rx = 0.25 + 0.2 * p[0]   # face width
-    ry_upper = 0.15 + 0.1 * p[2]
-    ry_lower = 0.2 + 0.15 * p[4]
-    ry = ry_upper + ry_lower
-
-    points = []
-    n = 48
-    for i in range(n):
-        t = 2 * math.pi * i / n
-        # Ellipse with different top/bottom radii (egg-like)
-        y_frac = 0.5 + 0.5 * math.sin(t)
-        ry_t = ry_upper if y_frac >= 0.5 else ry_lower
-        x = 0.5 + rx * math.cos(t)
-        y = 0.5 + ry_t * math.sin(t)
-        points.append([x, y])
-
-    # Chin emphasis from ChinW(5), ChinTipW(10)
-    chin_narrow = 0.85 + 0.15 * (1.0 - p[5])
-    tip_y = 0.5 - ry_lower - 0.05 * (1.0 - p[10])
-    points.append([0.5 - rx * chin_narrow * 0.5, tip_y])
-    points.append([0.5 + rx * chin_narrow * 0.5, tip_y])
-
-    out = np.array(points, dtype=np.float64)
-    # #region agent log
-    try:
-        import json
-        _logpath = Path(__file__).resolve().parent / "debug-079f6a.log"
-        _log = open(_logpath, "a", encoding="utf-8")
-        _log.write(json.dumps({"sessionId": "079f6a", "hypothesisId": "H1,H2,H3", "location": "forward_face_contour.get_contour_xy_from_params", "message": "contour bounds and params", "data": {"params_0_2_4_5_10": [p[0], p[2], p[4], p[5], p[10]], "xmin": float(out[:, 0].min()), "xmax": float(out[:, 0].max()), "ymin": float(out[:, 1].min()), "ymax": float(out[:, 1].max()), "first_pt": out[0].tolist(), "top_pt_idx24": out[24].tolist(), "n_pts": len(out)}, "timestamp": __import__("time").time() * 1000}, ensure_ascii=False) + "\n")
-        _log.close()
-    except Exception:
-        pass
-    # #endregion
+
+    def __init__(self, levels, deltas, base_landmarks, base_values, swept, aspect=1.0, source=None):
+        from extract_face_ratios import FACE_OVAL_INDICES
+        self.levels = np.asarray(levels, dtype=np.float64)
+        self.deltas = np.asarray(deltas, dtype=np.float64)
+        self.base_landmarks = np.asarray(base_landmarks, dtype=np.float64)
+        self.base_values = np.asarray(base_values, dtype=np.float64)
+        self.swept = np.asarray(swept, dtype=bool)
+        self.aspect = float(aspect)
+        self.source = source
+        self.contour_indices = np.asarray(FACE_OVAL_INDICES, dtype=np.intp)
+        K = len(self.levels)
+        self._basis_all = self.deltas.reshape(N_CONTOUR * K, -1)
+        self._basis_oval = self.deltas[:, :, self.contour_indices].reshape(N_CONTOUR * K, -1)
+        # 輪廓上的最大位移（歸一化座標）；近 0 的 slider 正面看不出來（深度類），擬合時不動
+        self.response = np.sqrt((self.deltas[:, :, self.contour_indices] ** 2).sum(axis=-1)).max(axis=(1, 2))
+
+    @classmethod
+    def from_response(cls, response, source=None, aspect=1.0):
+        """slider_sweep.load_response 的 dict → ContourModel；base card 截圖失敗時 ValueError。"""
+        from write_face_params_to_card import ALL_FACE_CHA_NAMES
+        base = response["base_landmarks"].astype(np.float64)
+        if not np.isfinite(base).all():
+            raise ValueError("Sweep has no base card landmarks")
+        levels = response["levels"].astype(np.float64)
+        names = [str(n) for n in response["slider_names"]]
+        K = len(levels)
+        deltas = np.zeros((N_CONTOUR, K) + base.shape)
+        base_values = np.zeros(N_CONTOUR)
+        swept = np.zeros(N_CONTOUR, dtype=bool)
+        for i in range(N_CONTOUR):
+            cha = ALL_FACE_CHA_NAMES[i]
+            if cha not in names:
+                continue
+            s = names.index(cha)
+            base_values[i] = float(response["base_values"][s])
+            keys = _fill_missing_levels(levels, response["landmarks"][s].astype(np.float64), response["ok"][s])
+            if keys is None:
+                continue
+            # 以 base 值處的內插當零點（掃描格與 base 值通常不重合，直接減 base_landmarks 會帶進截圖雜訊）
+            w = _hat_weights(levels, np.asarray([base_values[i]]))[0]
+            deltas[i] = keys - np.tensordot(w, keys, axes=1)
+            swept[i] = True
+        return cls(levels, deltas, base, base_values, swept, aspect=aspect, source=source)
+
+    def _weights(self, rates):
+        rates = np.asarray(rates, dtype=np.float64)
+        if rates.ndim == 1:
+            rates = rates[None]
+        if rates.shape[1] != N_CONTOUR:
+            raise ValueError("Expected (N, %d) contour rates, got %s" % (N_CONTOUR, rates.shape))
+        n = len(rates)
+        return _hat_weights(self.levels, rates_to_game(np.clip(rates, 0.0, 1.0)).ravel()).reshape(n, -1)
+
+    def landmarks_batch(self, rates):
+        """rates (N, 19) ∈ [0, 1] → (N, 468, 2) 預測 landmark（歸一化影像座標）。"""
+        W = self._weights(rates)
+        return self.base_landmarks + (W @ self._basis_all).reshape(len(W), -1, 2)
+
+    def contour_batch(self, rates):
+        """rates (N, 19) → (N, 36, 2) FACE_OVAL 輪廓（歸一化影像座標，y 向下）。"""
+        W = self._weights(rates)
+        return self.base_landmarks[self.contour_indices] + (W @ self._basis_oval).reshape(len(W), -1, 2)
+
+    def base_rates(self):
+        """sweep base card 的 19 個 rate（未掃描者 0.5）。"""
+        rates = game_to_rates(self.base_values)
+        rates[~self.swept] = 0.5
+        return rates
+
+
+def _hat_weights(levels, values):
+    """分段線性內插的 hat basis：values (M,) → (M, K) 權重，每列至多兩個非零且和為 1；超出 levels 範圍時夾在端點。"""
+    K = len(levels)
+    v = np.clip(np.asarray(values, dtype=np.float64), levels[0], levels[-1])
+    j = np.clip(np.searchsorted(levels, v, side="right") - 1, 0, K - 2)
+    t = (v - levels[j]) / (levels[j + 1] - levels[j])
+    W = np.zeros((len(v), K))
+    rows = np.arange(len(v))
+    W[rows, j] = 1.0 - t
+    W[rows, j + 1] = t
+    return W
+
+
+def _resolve_sweep(path=None):
+    if path is None:
+        env = (os.environ.get("HS4_CONTOUR_SWEEP") or "").strip()
+        if env:
+            path = env
+    if path is not None:
+        path = Path(path)
+        return path / "response.npz" if path.is_dir() else path
+    candidates = sorted((BASE / "output" / "slider_sweep").glob("*/response.npz"), key=lambda p: p.stat().st_mtime)
+    return candidates[-1] if candidates else None
+
+
+def _sweep_aspect(response_path):
+    """sweep 截圖的寬高比（base card 截圖）；找不到時 1.0。"""
+    from landmark_loss import image_aspect
+    for shot in sorted((Path(response_path).parent / "base" / "screenshots").glob("*.png")):
+        aspect = image_aspect(shot)
+        if aspect:
+            return aspect
+    return 1.0
+
+
+_model_cache = {}
+
+
+def load_contour_model(path=None):
+    """
+    載入（並依檔案 mtime 快取）前向模型。path 為 response.npz 或 sweep 目錄；
+    None 時用 HS4_CONTOUR_SWEEP 或 output/slider_sweep 下最新一次掃描。找不到時 FileNotFoundError。
+    """
+    from slider_sweep import load_response
+    response_path = _resolve_sweep(path)
+    if response_path is None or not response_path.exists():
+        raise FileNotFoundError(
+            "No slider sweep response found (%s); run slider_sweep.py run or set HS4_CONTOUR_SWEEP."
+            % (response_path or BASE / "output" / "slider_sweep"))
+    key = str(response_path.resolve())
+    mtime = response_path.stat().st_mtime
+    cached = _model_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    model = ContourModel.from_response(load_response(response_path), source=key, aspect=_sweep_aspect(response_path))
+    _model_cache[key] = (mtime, model)
+    return model
+
+
+def get_contour_xy_from_params(params_0_18, model=None):
+    """
+    params_0_18: 19 floats in [0, 1] (shapeValueFace[0..18] rates); shorter lists are padded with 0.5.
+    Returns: (36, 2) FACE_OVAL contour in normalized screenshot coords, face-up = +y.
+    """
+    p = list(params_0_18)[:N_CONTOUR]
+    p += [0.5] * (N_CONTOUR - len(p))
+    model = model or load_contour_model()
+    out = model.contour_batch(np.asarray(p))[0]
+    out[:, 1] = 1.0 - out[:, 1]
     return out
 
 
-def get_contour_xy_from_card(card_path):
+def fit_contour_params(model, target_landmarks, target_aspect=1.0, start_rates=None, generations=150, popsize=48,
+                       sigma0=0.15, seed=0):
+    """
+    離線擬合：以 CMA-ES（blackbox._CMAState）在 rate 空間找使預測輪廓與目標 FACE_OVAL 的 Procrustes 殘差最小的參數。
+    只動正面看得出來的 slider（model.response 大於最大值 1%），其餘維持 start_rates。
+    回傳 (rates (19,), info)；info: {"loss_start", "loss", "sliders", "evaluations", "sec"}（loss 為目標臉大小的 %）。
+    """
+    from blackbox import _CMAState
+    from landmark_loss import ProcrustesObjective
+
+    objective = ProcrustesObjective(target_landmarks, target_aspect, weights={"face_oval": 1.0})
+    start = np.clip(np.asarray(model.base_rates() if start_rates is None else start_rates, dtype=np.float64), 0.0, 1.0)
+    active = np.flatnonzero(model.swept & (model.response > 0.01 * max(model.response.max(), 1e-12)))
+
+    def losses(R):
+        return objective.loss_batch(model.landmarks_batch(R), model.aspect)
+
+    t0 = time.perf_counter()
+    loss_start = float(losses(start)[0])
+    best, best_loss = start.copy(), loss_start
+    n_eval = 1
+    if len(active):
+        rng = np.random.default_rng(seed)
+        es = _CMAState(start[active], sigma0, popsize)
+        for _ in range(generations):
+            ys = es.ask(rng, popsize)
+            R = np.repeat(start[None], popsize, axis=0)
+            R[:, active] = ys
+            L = losses(R)
+            n_eval += popsize
+            k = int(np.argmin(L))
+            if L[k] < best_loss:
+                best, best_loss = R[k].copy(), float(L[k])
+            es.tell(list(ys), list(L))
+            if es.ill_conditioned():
+                break
+    return best, {
+        "loss_start": round(loss_start, 4),
+        "loss": round(best_loss, 4),
+        "sliders": [int(i) for i in active],
+        "evaluations": n_eval,
+        "sec": round(time.perf_counter() - t0, 3),
+    }
+
+
+def get_contour_xy_from_card(card_path, model=None):
     """
     Read shapeValueFace[0..18] from card and return contour points.
     Uses read_face_params_from_card / ChaFile MessagePack when available.
@@ -70,49 +269,72 @@ def get_contour_xy_from_card(card_path):
     from pathlib import Path
     card_path = Path(card_path)
     if not card_path.exists():
-        return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS)
+        return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS, model)
 
     try:
         from read_hs2_card import read_trailing_data
         from read_face_params_from_card import read_face_params
         trailing, _ = read_trailing_data(card_path)
         if trailing is None:
-            return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS)
+            return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS, model)
         fp = read_face_params(trailing)
-        # Build list index 0..18 from offset names (see ChaFile_變數位置對照表)
-        # read_face_params returns by cha_name; we need list indices 0..18
-        list_indices = [
-            0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18
-        ]
-        cha_to_idx = {
-            "headWidth": 0, "headUpperDepth": 1, "headUpperHeight": 2,
-            "headLowerDepth": 3, "headLowerWidth": 4, "jawWidth": 5,
-            "jawHeight": 6, "jawDepth": 7, "jawAngle": 8, "neckDroop": 9,
-            "chinSize": 10, "chinHeight": 11, "chinDepth": 12,
-            "cheekLowerHeight": 13, "cheekLowerDepth": 14, "cheekLowerWidth": 15,
-            "cheekUpperHeight": 16, "cheekUpperDepth": 17, "cheekUpperWidth": 18,
-        }
-        idx_to_cha = {
-            0: "headWidth", 1: "headUpperDepth", 2: "headUpperHeight",
-            3: "headLowerDepth", 4: "headLowerWidth", 5: "jawWidth",
-            6: "jawHeight", 7: "jawDepth", 8: "jawAngle", 9: "neckDroop",
-            10: "chinSize", 11: "chinHeight", 12: "chinDepth",
-            13: "cheekLowerHeight", 14: "cheekLowerDepth", 15: "cheekLowerWidth",
-            16: "cheekUpperHeight", 17: "cheekUpperDepth", 18: "cheekUpperWidth",
-        }
-        params_0_18 = [0.5] * 19
-        for idx, cha in idx_to_cha.items():
-            if cha in fp:
-                v = fp[cha]
-                if isinstance(v, (int, float)):
-                    v = float(v)
-                    if v <= 1.0 and v >= 0.0:
-                        params_0_18[idx] = v
-                    else:
-                        params_0_18[idx] = (v + 100.0) / 300.0
-                        params_0_18[idx] = max(0.0, min(1.0, params_0_18[idx]))
-                else:
-                    params_0_18[idx] = 0.5
-        return get_contour_xy_from_params(params_0_18)
     except Exception:
-        return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS)
+        return get_contour_xy_from_params(DEFAULT_CONTOUR_PARAMS, model)
+    # read_face_params 依 cha_name 回傳遊戲值（-100..200）；list index 0..18 即 ALL_FACE_CHA_NAMES 前 19 個
+    from write_face_params_to_card import ALL_FACE_CHA_NAMES
+    params_0_18 = [0.5] * N_CONTOUR
+    for idx, cha in enumerate(ALL_FACE_CHA_NAMES[:N_CONTOUR]):
+        v = fp.get(cha)
+        if isinstance(v, (int, float)):
+            params_0_18[idx] = float(np.clip(game_to_rates(v), 0.0, 1.0))
+    return get_contour_xy_from_params(params_0_18, model)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Forward contour model built from a slider_sweep response tensor.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    ck = sub.add_parser("check", help="Per-slider response, leave-one-level-out interpolation error and throughput")
+    ck.add_argument("--sweep", type=Path, default=None, help="response.npz 或 sweep 目錄（預設 HS4_CONTOUR_SWEEP / 最新一次掃描）")
+    ck.add_argument("--batch", type=int, default=10000, help="吞吐量測試的參數組數")
+    args = ap.parse_args()
+
+    from write_face_params_to_card import ALL_FACE_CHA_NAMES
+    try:
+        model = load_contour_model(args.sweep)
+    except (FileNotFoundError, ValueError) as e:
+        raise SystemExit(str(e))
+    _out("model: %s (K=%d levels %s, aspect %.3f)" % (model.source, len(model.levels), model.levels.tolist(), model.aspect))
+
+    # 中間 level 以兩側 level Lerp 預測、與實測比：衡量分段線性 key 夠不夠密（輪廓點 RMS，歸一化座標 ×1000）
+    from slider_sweep import load_response
+    response = load_response(model.source)
+    names = [str(n) for n in response["slider_names"]]
+    oval = model.contour_indices
+    _out("%-18s %5s %12s %14s" % ("slider", "idx", "max disp‰", "lerp err‰"))
+    for i in range(N_CONTOUR):
+        cha = ALL_FACE_CHA_NAMES[i]
+        if not model.swept[i]:
+            _out("%-18s %5d %12s %14s" % (cha, i, "-", "-"))
+            continue
+        s = names.index(cha)
+        L, ok = response["landmarks"][s][:, oval].astype(np.float64), response["ok"][s]
+        errs = [np.sqrt(((0.5 * (L[k - 1] + L[k + 1]) - L[k]) ** 2).sum(axis=-1).mean())
+                for k in range(1, len(L) - 1) if ok[k - 1] and ok[k] and ok[k + 1]]
+        _out("%-18s %5d %12.2f %14s" % (cha, i, model.response[i] * 1000,
+                                         "%.2f" % (max(errs) * 1000) if errs else "-"))
+
+    rng = np.random.default_rng(0)
+    R = rng.random((args.batch, N_CONTOUR))
+    t0 = time.perf_counter()
+    model.contour_batch(R)
+    dt = time.perf_counter() - t0
+    _out("contour_batch: %d parameter vectors in %.3fs (%.0f / s)" % (args.batch, dt, args.batch / dt))
+    t0 = time.perf_counter()
+    model.landmarks_batch(R)
+    dt = time.perf_counter() - t0
+    _out("landmarks_batch: %d parameter vectors in %.3fs (%.0f / s)" % (args.batch, dt, args.batch / dt))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+"""
+HS2 + BepInEx_HS2_PhotoToCard 的離線替身：以 Python 講同一套檔案協定，讓優化器、多實例排程與 benchmark
+不必開 Windows + HoneySelect2 也能在一般 Linux 機器上壓測。
+
+協定（同 HS2PhotoToCardPlugin.cs）：
+  1. ready_delay 秒後在 instance 目錄寫 game_ready.txt（內容 UTC ISO 時間）
+  2. 監看 load_card_request.txt：第一個非空、非 # 開頭的行為卡路徑；空白 → 略過；卡不存在 → 清空請求、不截圖
+  3. 清空請求檔 → 讀卡的 shapeValueFace → 等待「算繪延遲」→ 原地分段寫出 game_screenshot.png
+  4. 每個 session 第一次截圖前寫 game_screenshot_fov.txt（"F2" 格式）
+
+可調行為：
+  latency      算繪延遲分佈：const:S / uniform:A,B / normal:MU,SD / lognormal:MEDIAN,SIGMA / exp:MEAN（秒）
+  failure_rate 機率性「載卡例外」：請求被清空但不產生截圖（呼叫端會逾時）
+  drift        每處理一個請求延遲乘上 (1 + drift * n)，模擬 lstLoadAssetBundleInfo 累積造成的越跑越慢
+
+合成臉：以一張真實臉圖（預設 SRC/AI_191856.png）為底，MediaPipe 468 點為控制點，依卡片 59 個臉部值
+相對參考值的差量移動眼、鼻、嘴、下顎等點群，再以高斯權重內插成位移場做 backward warp。
+截圖的 17 個 ratio 因此隨 slider 平滑變化（方向與遊戲大致相同，幅度不等於遊戲），足以測試優化流程。
+
+用法：
+  python hs2_emulator.py serve --output-base output --instances 2 --latency lognormal:2.5,0.3 --failure-rate 0.02 --drift 0.001
+  python hs2_emulator.py render output/cards/card_001.png -o synthetic.png
+搭配：python hs2_photo_to_card_config.py 的 instance_<N> 目錄結構；request_screenshot_and_wait / wait_for_ready_file 不需修改。
+"""
+import argparse
+import io
+import json
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_FACE_IMAGE = BASE / "SRC" / "AI_191856.png"
+REQUEST_FILE_NAME = "load_card_request.txt"
+READY_FILE_NAME = "game_ready.txt"
+SCREENSHOT_NAME = "game_screenshot.png"
+FOV_FILE_NAME = "game_screenshot_fov.txt"
+NEUTRAL_VALUE = 50
+
+# MediaPipe 點群（與 extract_face_ratios.FACE_FEATURE_EDGES 同源）
+_LEFT_EYE = [33, 7, 163, 144, 145, 153, 154, 155, 133, 246, 161, 160, 159, 158, 157, 173]
+_RIGHT_EYE = [263, 249, 390, 373, 374, 380, 381, 382, 362, 466, 388, 387, 386, 385, 384, 398]
+_UPPER_LIP = [61, 185, 40, 39, 37, 0, 267, 269, 270, 409, 291, 78, 191, 80, 81, 82, 13, 312, 311, 310, 415, 308, 12]
+_LOWER_LIP = [146, 91, 181, 84, 17, 314, 405, 321, 375, 95, 88, 178, 87, 14, 317, 402, 318, 324]
+_NOSE = [1, 2, 3, 4, 5, 19, 94, 97, 98, 99, 326, 327, 328, 240, 460, 64, 294, 48, 278, 49, 279, 129, 358, 102, 331]
+_JAW = [172, 136, 150, 149, 176, 148, 377, 400, 378, 379, 365, 397, 58, 288]
+_CHIN = [152, 148, 176, 377, 400, 149, 378, 175, 199, 200, 18]
+_FOREHEAD = [10, 338, 297, 332, 109, 67, 103, 151, 108, 69, 337, 299]
+
+# (cha_name, 點群, 動作, 幅度)：差量 t = (value - reference) / 100 時的變形
+#   scale_x / scale_y：對點群中心縮放 (1 + 幅度 * t)；eyes 類對每隻眼各自中心
+#   shift_x_out：左右兩側往外移 幅度 * t * 臉寬；shift_y：往下移 幅度 * t * 臉高
+#   rotate：兩眼鏡像旋轉 幅度 * t 弧度
+_EFFECTS = (
+    ("headWidth", "oval", "scale_x", 0.10),
+    ("headUpperHeight", "forehead", "shift_y", -0.05),
+    ("headLowerWidth", "lower_oval", "scale_x", 0.10),
+    ("jawWidth", "jaw", "scale_x", 0.15),
+    ("jawHeight", "jaw", "shift_y", 0.03),
+    ("chinHeight", "chin", "shift_y", 0.05),
+    ("chinSize", "chin", "scale_x", 0.15),
+    ("cheekLowerWidth", "lower_oval", "scale_x", 0.05),
+    ("cheekUpperWidth", "upper_oval", "scale_x", 0.05),
+    ("eyeVertical", "eyes", "shift_y", -0.06),
+    ("eyeSpacing", "eyes", "shift_x_out", 0.04),
+    ("eyeWidth", "eyes", "scale_x", 0.30),
+    ("eyeHeight", "eyes", "scale_y", 0.40),
+    ("eyeAngleZ", "eyes", "rotate", 0.30),
+    ("noseHeight", "nose", "shift_y", -0.04),
+    ("noseSize", "nose", "scale_x", 0.15),
+    ("nostrilWidth", "nose", "scale_x", 0.20),
+    ("mouthHeight", "mouth", "shift_y", -0.04),
+    ("mouthWidth", "mouth", "scale_x", 0.25),
+    ("lipThickness", "mouth", "scale_y", 0.35),
+    ("upperLipThick", "upper_lip", "scale_y", 0.40),
+    ("lowerLipThick", "lower_lip", "scale_y", 0.40),
+)
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def make_latency_sampler(spec, rng):
+    """spec 字串 → 回傳秒數（>= 0）的 callable。見模組說明的格式。"""
+    kind, _, rest = str(spec).partition(":")
+    kind = kind.strip().lower()
+    try:
+        vals = [float(v) for v in rest.split(",") if v.strip()]
+    except ValueError:
+        raise ValueError("Bad latency spec: %r" % spec)
+    need = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+    if kind not in need or len(vals) != need[kind]:
+        raise ValueError("Bad latency spec: %r (const:S | uniform:A,B | normal:MU,SD | lognormal:MEDIAN,SIGMA | exp:MEAN)" % spec)
+    if kind == "const":
+        return lambda: max(0.0, vals[0])
+    if kind == "uniform":
+        return lambda: max(0.0, rng.uniform(vals[0], vals[1]))
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(vals[0], vals[1]))
+    if kind == "lognormal":
+        mu = math.log(max(vals[0], 1e-9))
+        return lambda: rng.lognormvariate(mu, vals[1])
+    return lambda: rng.expovariate(1.0 / max(vals[0], 1e-9))
+
+
+class SyntheticFaceRenderer:
+    """底圖 + 468 控制點；render(face_values) → RGB uint8 陣列。執行緒安全（唯讀狀態）。"""
+
+    def __init__(self, face_image=DEFAULT_FACE_IMAGE, reference=None, grid_step=4, sigma_frac=0.035):
+        """
+        reference: 底圖對應的 59 個臉部值 dict；None 時若底圖本身是帶臉部資料的角色卡就用卡內值，否則全部 50。
+        """
+        from PIL import Image
+        from extract_face_ratios import extract_landmarks
+        from write_face_params_to_card import ALL_FACE_CHA_NAMES
+
+        self.face_image = Path(face_image)
+        self.image = np.asarray(Image.open(self.face_image).convert("RGB"), dtype=np.uint8)
+        h, w = self.image.shape[:2]
+        xy = extract_landmarks(self.face_image)
+        self.points = np.asarray(xy, dtype=np.float64) * np.array([w, h], dtype=np.float64)
+        if reference is None:
+            reference = self._reference_from_card(self.face_image)
+        self.reference = {n: float((reference or {}).get(n, NEUTRAL_VALUE)) for n in ALL_FACE_CHA_NAMES}
+        self.grid_step = max(1, int(grid_step))
+
+        pts = self.points
+        self.face_w = float(np.linalg.norm(pts[454] - pts[234]))
+        self.face_h = float(np.linalg.norm(pts[152] - pts[10]))
+        self.center_x = float((pts[454, 0] + pts[234, 0]) / 2)
+        self.sigma = max(2.0, sigma_frac * max(self.face_w, self.face_h))
+        from extract_face_ratios import FACE_OVAL_INDICES
+        oval = np.array(FACE_OVAL_INDICES)
+        nose_y = pts[4, 1]
+        eye_y = (pts[33, 1] + pts[263, 1]) / 2
+        self.groups = {
+            "oval": oval,
+            "lower_oval": oval[pts[oval, 1] > nose_y],
+            "upper_oval": oval[(pts[oval, 1] > eye_y) & (pts[oval, 1] <= nose_y)],
+            "forehead": np.array(_FOREHEAD),
+            "jaw": np.array(_JAW),
+            "chin": np.array(_CHIN),
+            "eyes": (np.array(_LEFT_EYE), np.array(_RIGHT_EYE)),
+            "nose": np.array(_NOSE),
+            "mouth": np.array(sorted(set(_UPPER_LIP + _LOWER_LIP))),
+            "upper_lip": np.array(_UPPER_LIP),
+            "lower_lip": np.array(_LOWER_LIP),
+        }
+        self.mouth_line_y = float((pts[61, 1] + pts[291, 1]) / 2)
+        # 控制點影響範圍外（臉框外擴 3 sigma）不做 warp
+        pad = 3 * self.sigma
+        x0, y0 = np.floor(pts.min(axis=0) - pad).astype(int)
+        x1, y1 = np.ceil(pts.max(axis=0) + pad).astype(int)
+        self.box = (max(0, x0), max(0, y0), min(w, x1), min(h, y1))
+
+    @staticmethod
+    def _reference_from_card(path):
+        try:
+            from chafile_card import ChaFileCard
+            card = ChaFileCard.from_path(path)
+            if card.has_face:
+                return card.read_face_params()
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def target_points(self, face_values):
+        """59 值 dict → 變形後的 (468, 2) 像素座標。"""
+        pts = self.points.copy()
+        for name, group, action, amount in _EFFECTS:
+            v = face_values.get(name)
+            if v is None:
+                continue
+            t = float(np.clip((float(v) - self.reference[name]) / 100.0, -1.5, 2.0))
+            if t == 0.0:
+                continue
+            subsets = self.groups[group] if group == "eyes" else (self.groups[group],)
+            for side, idx in enumerate(subsets):
+                if len(idx) == 0:
+                    continue
+                p = pts[idx]
+                c = p.mean(axis=0)
+                if group == "oval" or (group in ("lower_oval", "upper_oval", "jaw", "chin") and action == "scale_x"):
+                    c = np.array([self.center_x, c[1]])
+                if group in ("upper_lip", "lower_lip"):
+                    c = np.array([c[0], self.mouth_line_y])
+                if action == "scale_x":
+                    p[:, 0] = c[0] + (p[:, 0] - c[0]) * (1.0 + amount * t)
+                elif action == "scale_y":
+                    p[:, 1] = c[1] + (p[:, 1] - c[1]) * (1.0 + amount * t)
+                elif action == "shift_y":
+                    p[:, 1] += amount * t * self.face_h
+                elif action == "shift_x_out":
+                    sign = np.sign(p[:, 0] - self.center_x)
+                    p[:, 0] += sign * amount * t * self.face_w
+                elif action == "rotate":
+                    a = amount * t * (1.0 if side == 0 else -1.0)
+                    ca, sa = math.cos(a), math.sin(a)
+                    d = p - c
+                    p = c + np.stack([d[:, 0] * ca - d[:, 1] * sa, d[:, 0] * sa + d[:, 1] * ca], axis=1)
+                pts[idx] = p
+        return pts
+
+    def render(self, face_values):
+        """59 值 dict → 合成截圖（RGB uint8 陣列，與底圖同尺寸）。"""
+        from PIL import Image
+        dst = self.target_points(face_values)
+        disp = dst - self.points
+        if not np.any(np.abs(disp) > 1e-3):
+            return self.image.copy()
+        x0, y0, x1, y1 = self.box
+        step = self.grid_step
+        gx = np.arange(x0, x1 + step, step, dtype=np.float64)
+        gy = np.arange(y0, y1 + step, step, dtype=np.float64)
+        # 控制點放在變形後的位置：p 處的取樣來源 ≈ p - 位移（backward warp）
+        dx = gx[None, :, None] - dst[None, None, :, 0]
+        dy = gy[:, None, None] - dst[None, None, :, 1]
+        w = np.exp(-(dx * dx + dy * dy) / (2.0 * self.sigma * self.sigma))
+        wsum = w.sum(axis=2)
+        fade = wsum / (wsum + 0.05)  # 離控制點遠處位移淡出為 0
+        denom = np.maximum(wsum, 1e-12)
+        fx = (w @ disp[:, 0]) / denom * fade
+        fy = (w @ disp[:, 1]) / denom * fade
+        bw, bh = x1 - x0, y1 - y0
+        size = (bw, bh)
+        # 粗網格位移場以雙線性放大到像素
+        crop = (0, 0, (bw - 1) / step + 1e-6, (bh - 1) / step + 1e-6)
+        fx = np.asarray(Image.fromarray(fx.astype(np.float32), mode="F").resize(size, Image.BILINEAR, box=crop))
+        fy = np.asarray(Image.fromarray(fy.astype(np.float32), mode="F").resize(size, Image.BILINEAR, box=crop))
+        yy, xx = np.mgrid[y0:y1, x0:x1].astype(np.float32)
+        sx = np.clip(xx - fx, 0, self.image.shape[1] - 1.001)
+        sy = np.clip(yy - fy, 0, self.image.shape[0] - 1.001)
+        ix = sx.astype(np.int32)
+        iy = sy.astype(np.int32)
+        ax = (sx - ix)[..., None]
+        ay = (sy - iy)[..., None]
+        img = self.image.astype(np.float32)
+        top = img[iy, ix] * (1 - ax) + img[iy, ix + 1] * ax
+        bot = img[iy + 1, ix] * (1 - ax) + img[iy + 1, ix + 1] * ax
+        out = self.image.copy()
+        out[y0:y1, x0:x1] = np.clip(top * (1 - ay) + bot * ay + 0.5, 0, 255).astype(np.uint8)
+        return out
+
+    def render_png(self, face_values):
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.fromarray(self.render(face_values)).save(buf, format="PNG")
+        return buf.getvalue()
+
+
+def read_card_face(card_path):
+    """卡片 → 59 值 dict；讀不到臉部資料時 raise ValueError（對應插件 LoadFileLimited 例外）。"""
+    from chafile_card import ChaFileCard
+    return ChaFileCard.from_path(card_path).read_face_params()
+
+
+class HS2Emulator:
+    """
+    一個遊戲實例：背景執行緒監看 instance_dir/load_card_request.txt。
+    stats() 回傳請求數、截圖數、失敗數與每次算繪延遲。
+    """
+
+    def __init__(self, instance_dir, renderer, latency="lognormal:2.5,0.3", ready_delay=0.0, failure_rate=0.0,
+                 drift=0.0, fov=23.5, seed=None, check_interval=0.5, chunk_size=64 * 1024, chunk_delay=0.002, name=None):
+        self.instance_dir = Path(instance_dir)
+        self.request_file = self.instance_dir / REQUEST_FILE_NAME
+        self.screenshot_path = self.instance_dir / SCREENSHOT_NAME
+        self.renderer = renderer
+        self.rng = random.Random(seed)
+        self.latency_spec = latency
+        self._sample_latency = make_latency_sampler(latency, self.rng)
+        self.ready_delay = ready_delay
+        self.failure_rate = failure_rate
+        self.drift = drift
+        self.fov = fov
+        self.check_interval = check_interval
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_delay = chunk_delay
+        self.name = name or self.instance_dir.name
+        self.n_requests = 0
+        self.n_screenshots = 0
+        self.n_failures = 0
+        self.n_missing_card = 0
+        self.latencies = []
+        self._fov_written = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_request(self):
+        try:
+            lines = self.request_file.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return None
+        for line in lines:
+            s = line.strip()
+            if s and not s.startswith("#"):
+                return s
+        return None
+
+    def _clear_request(self):
+        try:
+            self.request_file.write_text("", encoding="utf-8")
+        except OSError:
+            pass
+
+    def _write_screenshot(self, png):
+        # Unity CaptureScreenshot 是原地寫檔；分段寫出讓呼叫端的完整性檢查有東西可測
+        with open(self.screenshot_path, "wb") as f:
+            for i in range(0, len(png), self.chunk_size):
+                f.write(png[i:i + self.chunk_size])
+                f.flush()
+                if self.chunk_delay > 0 and i + self.chunk_size < len(png):
+                    time.sleep(self.chunk_delay)
+
+    def _handle(self, card_path):
+        card = Path(card_path)
+        if not card.exists():
+            self.n_missing_card += 1
+            self._clear_request()
+            return
+        self._clear_request()
+        self.n_requests += 1
+        if self.rng.random() < self.failure_rate:
+            self.n_failures += 1
+            return
+        try:
+            face = read_card_face(card)
+        except (OSError, ValueError):
+            self.n_failures += 1
+            return
+        t0 = time.monotonic()
+        png = self.renderer.render_png(face)
+        latency = self._sample_latency() * (1.0 + self.drift * self.n_requests)
+        remaining = latency - (time.monotonic() - t0)
+        if remaining > 0 and self._stop.wait(remaining):
+            return
+        if not self._fov_written:
+            (self.instance_dir / FOV_FILE_NAME).write_text("%.2f" % self.fov, encoding="utf-8")
+            self._fov_written = True
+        self._write_screenshot(png)
+        self.n_screenshots += 1
+        self.latencies.append(round(time.monotonic() - t0, 4))
+
+    def _run(self):
+        from screenshot_wait import open_watcher
+        if self._stop.wait(self.ready_delay):
+            return
+        (self.instance_dir / READY_FILE_NAME).write_text(datetime.now(timezone.utc).isoformat(), encoding="utf-8")
+        with open_watcher(self.instance_dir) as watcher:
+            while not self._stop.is_set():
+                card = self._read_request()
+                if card:
+                    self._handle(card)
+                    continue
+                # 插件每 0.5 s 檢查一次請求檔；檔案系統事件只是讓替身不必空轉
+                watcher.wait(self.check_interval)
+
+    def start(self):
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        for name in (READY_FILE_NAME, SCREENSHOT_NAME, FOV_FILE_NAME):
+            p = self.instance_dir / name
+            if p.exists():
+                p.unlink()
+        self._thread = threading.Thread(target=self._run, name="hs2-emulator-%s" % self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        lat = sorted(self.latencies)
+        return {
+            "instance": self.name,
+            "latency": self.latency_spec,
+            "requests": self.n_requests,
+            "screenshots": self.n_screenshots,
+            "failures": self.n_failures,
+            "missing_card": self.n_missing_card,
+            "latency_mean_sec": round(sum(lat) / len(lat), 4) if lat else None,
+            "latency_p50_sec": lat[len(lat) // 2] if lat else None,
+            "latency_max_sec": lat[-1] if lat else None,
+        }
+
+
+def start_emulators(output_base, instances=1, face_image=DEFAULT_FACE_IMAGE, seed=None, **kwargs):
+    """在 output_base/instance_<N> 啟動 N 個模擬實例（共用同一個 renderer），回傳 HS2Emulator 列表。"""
+    renderer = SyntheticFaceRenderer(face_image)
+    emus = []
+    for i in range(instances):
+        emu = HS2Emulator(
+            Path(output_base) / ("instance_%d" % i), renderer,
+            seed=None if seed is None else seed + i, name="instance_%d" % i, **kwargs
+        )
+        emus.append(emu.start())
+    return emus
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline HS2 + PhotoToCard plugin emulator (request/screenshot file protocol).")
+    sub = ap.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("serve", help="Run N emulated game instances until Ctrl+C / --duration")
+    s.add_argument("--output-base", type=Path, default=BASE / "output", help="instance_<N> directories are created here")
+    s.add_argument("--instances", type=int, default=1)
+    s.add_argument("--dir", type=Path, default=None, help="Single instance directory instead of output-base/instance_<N> (e.g. output for load_card_request.txt)")
+    s.add_argument("--face-image", type=Path, default=DEFAULT_FACE_IMAGE)
+    s.add_argument("--latency", default="lognormal:2.5,0.3", help="Render latency distribution (see module docstring)")
+    s.add_argument("--ready-delay", type=float, default=0.0, help="Seconds before game_ready.txt appears")
+    s.add_argument("--failure-rate", type=float, default=0.0, help="Probability a consumed request yields no screenshot")
+    s.add_argument("--drift", type=float, default=0.0, help="Latency multiplier grows by this per request")
+    s.add_argument("--fov", type=float, default=23.5, help="Value written to game_screenshot_fov.txt")
+    s.add_argument("--seed", type=int, default=None)
+    s.add_argument("--duration", type=float, default=0, help="Stop after N seconds (0 = until Ctrl+C)")
+    s.add_argument("-o", "--stats-output", type=Path, default=None, help="Write per-instance stats JSON on exit")
+    r = sub.add_parser("render", help="Render the synthetic screenshot for one card")
+    r.add_argument("card", type=Path)
+    r.add_argument("-o", "--output", type=Path, required=True)
+    r.add_argument("--face-image", type=Path, default=DEFAULT_FACE_IMAGE)
+    args = ap.parse_args()
+
+    if not args.face_image.exists():
+        raise SystemExit("Face image not found: %s" % args.face_image)
+
+    if args.command == "render":
+        if not args.card.exists():
+            raise SystemExit("Card not found: %s" % args.card)
+        try:
+            face = read_card_face(args.card)
+        except ValueError as e:
+            raise SystemExit("Card has no readable face data: %s (%s)" % (args.card, e))
+        renderer = SyntheticFaceRenderer(args.face_image)
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_bytes(renderer.render_png(face))
+        _out("Wrote: %s" % args.output)
+        return 0
+
+    try:
+        make_latency_sampler(args.latency, random.Random())
+    except ValueError as e:
+        raise SystemExit(str(e))
+    opts = dict(latency=args.latency, ready_delay=args.ready_delay, failure_rate=args.failure_rate, drift=args.drift, fov=args.fov)
+    if args.dir is not None:
+        renderer = SyntheticFaceRenderer(args.face_image)
+        emus = [HS2Emulator(args.dir, renderer, seed=args.seed, **opts).start()]
+    else:
+        emus = start_emulators(args.output_base, args.instances, face_image=args.face_image, seed=args.seed, **opts)
+    for emu in emus:
+        _out("Emulating %s: request file %s" % (emu.name, emu.request_file.resolve()))
+    t0 = time.monotonic()
+    try:
+        while args.duration <= 0 or time.monotonic() - t0 < args.duration:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for emu in emus:
+            emu.stop()
+    stats = [emu.stats() for emu in emus]
+    for st in stats:
+        _out("  %-12s requests %d  screenshots %d  failures %d  mean latency %s" % (
+            st["instance"], st["requests"], st["screenshots"], st["failures"], st["latency_mean_sec"]))
+    if args.stats_output:
+        args.stats_output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.stats_output, "w", encoding="utf-8") as f:
+            json.dump({"instances": stats}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.stats_output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
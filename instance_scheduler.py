@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+多實例截圖排程：N 個遊戲實例（output/instance_<N>/load_card_request.txt，hs2_photo_to_card_config.py set 的結構）
+共用一條工作佇列，誰閒著誰接下一張卡；每個實例一個 worker thread 呼叫 run_phase1.request_screenshot_and_wait。
+
+  sched = InstanceScheduler(BASE / "output", instances=2)
+  fut = sched.submit(card_path, dest_png)        # concurrent.futures.Future
+  res = fut.result()                             # {"ok", "card", "screenshot", "instance", "attempts", "elapsed_sec", ...}
+
+逾時的工作會重新排入佇列，並優先交給還沒試過它的實例（max_retries 次）；同一實例連續逾時
+max_consecutive_timeouts 次即停用，全部停用時未完成的 future 以 ok=False 結束。
+
+壓測（不開遊戲，用 hs2_emulator 模擬 N 個實例）：
+  python instance_scheduler.py bench --cards output/cards --emulate --instances 1 2 4 --latency lognormal:1.0,0.2
+實機：
+  python instance_scheduler.py run --instances 2 --cards c1.png c2.png ... --dest-dir output/sched_shots
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+class _Job:
+    __slots__ = ("card", "dest", "future", "tried", "attempts", "submitted")
+
+    def __init__(self, card, dest, future):
+        self.card = Path(card).resolve()
+        self.dest = Path(dest)
+        self.future = future
+        self.tried = []
+        self.attempts = 0
+        self.submitted = time.monotonic()
+
+
+class InstanceScheduler:
+    """
+    instances: 實例數（output_base/instance_0..N-1）或實例目錄列表（請求檔為目錄下的 load_card_request.txt）。
+    request_files: 直接給各實例的請求檔（--request-file 可自訂檔名）；給了就不看 output_base / instances，
+    實例目錄為請求檔所在目錄。
+    wait_ready: worker 先等該目錄的 game_ready.txt 才開始接工作（ready_timeout 秒內沒出現即停用）。
+    """
+
+    def __init__(self, output_base=BASE / "output", instances=1, timeout_sec=120, max_retries=1,
+                 max_consecutive_timeouts=3, wait_ready=True, ready_timeout=300, progress_interval=0,
+                 request_files=None):
+        if request_files is not None:
+            request_files = [Path(p) for p in request_files]
+            dirs = [p.parent for p in request_files]
+        elif isinstance(instances, int):
+            dirs = [Path(output_base) / ("instance_%d" % i) for i in range(instances)]
+        else:
+            dirs = [Path(d) for d in instances]
+        if not dirs:
+            raise ValueError("InstanceScheduler needs at least one instance")
+        if request_files is None:
+            request_files = [d / "load_card_request.txt" for d in dirs]
+        self.instance_dirs = dirs
+        self.request_files = request_files
+        # 實例名稱（stats / in_flight 的 key）：目錄名；同名目錄（如兩個請求檔放同一目錄）加 #k 區分
+        self.names = []
+        for d in dirs:
+            name, k = d.name, 1
+            while name in self.names:
+                k += 1
+                name = "%s#%d" % (d.name, k)
+            self.names.append(name)
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.max_consecutive_timeouts = max_consecutive_timeouts
+        self.wait_ready = wait_ready
+        self.ready_timeout = ready_timeout
+        self.progress_interval = progress_interval
+        self._cond = threading.Condition()
+        self._pending = []
+        self._closed = False
+        self._alive = set()
+        self._stats = {}
+        self.in_flight = {}
+        self._threads = []
+        for name, d, rf in zip(self.names, dirs, request_files):
+            self._alive.add(name)
+            self.in_flight[name] = None
+            self._stats[name] = {"instance": name, "done": 0, "timeouts": 0, "busy_sec": 0.0, "disabled": None}
+            t = threading.Thread(target=self._worker, args=(name, d, rf), name="sched-%s" % name, daemon=True)
+            self._threads.append(t)
+        self._started = time.monotonic()
+        for t in self._threads:
+            t.start()
+
+    # ---- public API ----
+
+    def submit(self, card_path, dest_screenshot):
+        """排入一張卡；回傳 Future，result() 為結果 dict（逾時用盡重試時 ok=False，不 raise）。"""
+        fut = Future()
+        job = _Job(card_path, dest_screenshot, fut)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("InstanceScheduler is closed")
+            if not self._alive:
+                self._finish(job, False, None, 0.0, error="no live instances")
+                return fut
+            self._pending.append(job)
+            self._cond.notify_all()
+        return fut
+
+    def map(self, jobs):
+        """jobs: [(card_path, dest_screenshot), ...] → 依輸入順序的結果 dict 列表（阻塞到全部完成）。"""
+        futures = [self.submit(c, d) for c, d in jobs]
+        return [f.result() for f in futures]
+
+    @property
+    def n_alive(self):
+        with self._cond:
+            return len(self._alive)
+
+    def stats(self):
+        """每個實例：完成數、逾時數、忙碌秒數、利用率（忙碌 / 經過時間）、是否停用與原因。"""
+        wall = max(time.monotonic() - self._started, 1e-9)
+        with self._cond:
+            rows = []
+            for name in self.names:
+                st = dict(self._stats[name])
+                st["busy_sec"] = round(st["busy_sec"], 3)
+                st["utilisation"] = round(st["busy_sec"] / wall, 3)
+                st["in_flight"] = str(self.in_flight[name].card) if self.in_flight[name] else None
+                rows.append(st)
+            return {"wall_sec": round(wall, 3), "pending": len(self._pending), "instances": rows}
+
+    def close(self, wait=True):
+        """不再接受新工作；wait=True 時等佇列清空、worker 結束。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- internals ----
+
+    def _finish(self, job, ok, instance, elapsed, error=None):
+        if job.future.done():
+            return
+        job.future.set_result({
+            "ok": ok,
+            "card": str(job.card),
+            "screenshot": str(job.dest) if ok else None,
+            "instance": instance,
+            "attempts": job.attempts,
+            "tried": list(job.tried),
+            "elapsed_sec": round(elapsed, 3),
+            "queued_sec": round(time.monotonic() - job.submitted - elapsed, 3),
+            "error": error,
+        })
+
+    def _take(self, name):
+        """取下一個工作：優先挑此實例沒試過的；全部都試過（或只剩此實例活著）才接重試過的。"""
+        with self._cond:
+            while True:
+                if name not in self._alive:
+                    return None
+                for i, job in enumerate(self._pending):
+                    others = self._alive - set(job.tried)
+                    if name not in job.tried or not others or others == {name}:
+                        self.in_flight[name] = job
+                        return self._pending.pop(i)
+                if self._closed and not self._pending and not any(self.in_flight.values()):
+                    return None
+                self._cond.wait(0.5)
+
+    def _disable(self, name, reason):
+        with self._cond:
+            self._alive.discard(name)
+            self._stats[name]["disabled"] = reason
+            orphaned = []
+            if not self._alive:
+                orphaned, self._pending = self._pending, []
+            self._cond.notify_all()
+        for job in orphaned:
+            self._finish(job, False, None, 0.0, error="all instances disabled")
+
+    def _worker(self, name, instance_dir, request_file):
+        from run_phase1 import request_screenshot_and_wait, wait_for_ready_file
+        if self.wait_ready and not wait_for_ready_file(instance_dir / "game_ready.txt", self.ready_timeout, self.progress_interval):
+            self._disable(name, "ready timeout")
+            return
+        consecutive = 0
+        while True:
+            job = self._take(name)
+            if job is None:
+                return
+            job.attempts += 1
+            job.tried.append(name)
+            t0 = time.monotonic()
+            try:
+                ok = request_screenshot_and_wait(
+                    job.card, request_file, job.dest,
+                    timeout_sec=self.timeout_sec, progress_interval=self.progress_interval,
+                )
+                error = None if ok else "timeout"
+            except Exception as e:
+                # 任何例外都當這次嘗試失敗（future 一定要結束，否則等它的呼叫端會卡住）
+                ok, error = False, "%s: %s" % (type(e).__name__, e)
+            dt = time.monotonic() - t0
+            retry = False
+            with self._cond:
+                self.in_flight[name] = None
+                st = self._stats[name]
+                st["busy_sec"] += dt
+                if ok:
+                    st["done"] += 1
+                    consecutive = 0
+                else:
+                    st["timeouts"] += 1
+                    consecutive += 1
+                    if job.attempts <= self.max_retries and self._alive:
+                        self._pending.insert(0, job)
+                        retry = True
+                self._cond.notify_all()
+            if not retry:
+                self._finish(job, ok, name if ok else None, dt, error=error)
+            if consecutive >= self.max_consecutive_timeouts:
+                self._disable(name, "%d consecutive timeouts" % consecutive)
+                return
+
+
+def _collect_cards(paths):
+    cards = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            cards.extend(sorted(p.rglob("*.png")))
+        elif p.exists():
+            cards.append(p)
+    return cards
+
+
+def _run_batch(sched, cards, dest_dir):
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    jobs = [(c, dest_dir / ("screenshot_%04d_%s" % (i, Path(c).name))) for i, c in enumerate(cards)]
+    results = sched.map(jobs)
+    wall = time.perf_counter() - t0
+    return results, wall
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dispatch card screenshots across N HS2 instances from one shared queue.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="Screenshot cards on running game instances")
+    r.add_argument("--cards", type=Path, nargs="+", required=True, help="Card PNGs or directories")
+    r.add_argument("--instances", type=int, default=2)
+    r.add_argument("--output-base", type=Path, default=BASE / "output")
+    r.add_argument("--dest-dir", type=Path, default=None, help="Default: output-base/sched_screenshots")
+    r.add_argument("--screenshot-timeout", type=int, default=120)
+    r.add_argument("--ready-timeout", type=int, default=300)
+    r.add_argument("--max-retries", type=int, default=1)
+    r.add_argument("--progress-interval", type=int, default=10)
+    r.add_argument("-o", "--output", type=Path, default=None, help="Results + per-instance stats JSON")
+    b = sub.add_parser("bench", help="Throughput vs instance count against hs2_emulator instances")
+    b.add_argument("--cards", type=Path, nargs="+", required=True)
+    b.add_argument("--instances", type=int, nargs="+", default=[1, 2, 4])
+    b.add_argument("--latency", default="lognormal:1.0,0.2")
+    b.add_argument("--failure-rate", type=float, default=0.0)
+    b.add_argument("--screenshot-timeout", type=int, default=10)
+    b.add_argument("--seed", type=int, default=0)
+    b.add_argument("-o", "--output", type=Path, default=None)
+    args = ap.parse_args()
+
+    cards = _collect_cards(args.cards)
+    if not cards:
+        raise SystemExit("No card PNGs found in %s" % [str(p) for p in args.cards])
+
+    if args.command == "run":
+        dest_dir = args.dest_dir or args.output_base / "sched_screenshots"
+        sched = InstanceScheduler(args.output_base, args.instances, timeout_sec=args.screenshot_timeout,
+                                  max_retries=args.max_retries, ready_timeout=args.ready_timeout,
+                                  progress_interval=args.progress_interval)
+        results, wall = _run_batch(sched, cards, dest_dir)
+        sched.close()
+        stats = sched.stats()
+        n_ok = sum(1 for x in results if x["ok"])
+        _out("Screenshots: %d/%d in %.1fs (%.2f cards/s)" % (n_ok, len(results), wall, len(results) / wall))
+        for st in stats["instances"]:
+            _out("  %-12s done %d  timeouts %d  utilisation %.0f%%%s" % (
+                st["instance"], st["done"], st["timeouts"], st["utilisation"] * 100,
+                "  DISABLED: %s" % st["disabled"] if st["disabled"] else ""))
+        if args.output:
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"wall_sec": round(wall, 3), "results": results, "stats": stats}, f, indent=2, ensure_ascii=False)
+            _out("Wrote: %s" % args.output)
+        return 0 if n_ok == len(results) else 1
+
+    from hs2_emulator import start_emulators
+    rows = []
+    for n in args.instances:
+        tmp = Path(tempfile.mkdtemp(prefix="sched_bench_"))
+        emus = start_emulators(tmp, n, latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+        try:
+            sched = InstanceScheduler(tmp, n, timeout_sec=args.screenshot_timeout, ready_timeout=30)
+            results, wall = _run_batch(sched, cards, tmp / "shots")
+            sched.close()
+        finally:
+            for emu in emus:
+                emu.stop()
+            shutil.rmtree(tmp, ignore_errors=True)
+        n_ok = sum(1 for x in results if x["ok"])
+        row = {"instances": n, "cards": len(cards), "ok": n_ok, "wall_sec": round(wall, 3),
+               "cards_per_sec": round(len(cards) / wall, 3), "retries": sum(x["attempts"] - 1 for x in results)}
+        if rows:
+            row["speedup_vs_first"] = round(row["cards_per_sec"] / rows[0]["cards_per_sec"], 2)
+        rows.append(row)
+        _out("  instances %d: %d/%d ok  %.1fs  %.2f cards/s  retries %d%s" % (
+            n, n_ok, len(cards), wall, row["cards_per_sec"], row["retries"],
+            "  speedup %.2fx" % row["speedup_vs_first"] if "speedup_vs_first" in row else ""))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"latency": args.latency, "failure_rate": args.failure_rate, "results": rows}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+MediaPipe landmark 的磁碟快取（content-addressed）：key = 圖檔內容 SHA-256 + 模型檔 face_landmarker.task SHA-256。
+存完整 468 點 (x, y) 歸一化座標（float32 .npy），不只 17 個 ratio，改 ratio 定義或重新分析都不必再跑 MediaPipe。
+偵測不到臉也會記錄（shape (0, 2)），避免同一張壞截圖反覆推論。
+
+容量上限以 LRU 淘汰：命中時更新檔案 mtime，超過上限時從最舊的開始刪。
+
+環境變數 HS4_LANDMARK_CACHE：未設定 = 預設目錄 output/landmark_cache；"off" / "0" / 空字串 = 停用；其他值 = 快取目錄路徑
+（cache_dir_from_env，優化器與 CLI 同一套解析）。
+
+CLI：
+  python landmark_cache.py stats
+  python landmark_cache.py prune --max-mb 256
+  python landmark_cache.py show <image>
+  python landmark_cache.py clear
+  python landmark_cache.py rescore output/experiments/onedim_xxx -o rescored.json   # 只用快取 landmark 重算 ratio
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = BASE / "output" / "landmark_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+ENV_VAR = "HS4_LANDMARK_CACHE"
+LANDMARK_COUNT = 468
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".jfif")
+# 快取格式版本；改變儲存內容時遞增，舊條目自然失效
+CACHE_VERSION = "v1"
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_model_hash_memo = {}
+
+
+def model_hash(model_path):
+    """模型檔 SHA-256（依 path + size + mtime 記憶，process 內只算一次）。"""
+    p = Path(model_path)
+    st = p.stat()
+    memo_key = (str(p.resolve()), st.st_size, st.st_mtime_ns)
+    h = _model_hash_memo.get(memo_key)
+    if h is None:
+        h = file_sha256(p)
+        _model_hash_memo[memo_key] = h
+    return h
+
+
+class LandmarkCache:
+    """
+    root/<version>_<model_hash[:16]>/<sha[:2]>/<sha>.npy
+    get() 回傳 (hit, landmarks)：hit=False 未快取；hit=True 且 landmarks=None 表示該圖已知無臉。
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, model_path=None):
+        self.root = Path(root) if root else DEFAULT_CACHE_DIR
+        self.max_bytes = int(max_bytes)
+        self._model_path = model_path
+        self._namespaces = {}
+        self._approx_bytes = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def namespace(self, model_path=None):
+        """快取子目錄名稱：格式版本 + 模型檔 hash；換模型即自動換一組條目。"""
+        model_path = model_path or self._model_path
+        if model_path is None:
+            from extract_face_ratios import _get_model_path
+            model_path = _get_model_path()
+        model_path = str(model_path)
+        ns = self._namespaces.get(model_path)
+        if ns is None:
+            ns = "%s_%s" % (CACHE_VERSION, model_hash(model_path)[:16])
+            self._namespaces[model_path] = ns
+        return ns
+
+    def _entry_path(self, image_sha, model_path=None):
+        return self.root / self.namespace(model_path) / image_sha[:2] / (image_sha + ".npy")
+
+    def get(self, image_path, image_sha=None, model_path=None):
+        image_sha = image_sha or file_sha256(image_path)
+        p = self._entry_path(image_sha, model_path)
+        try:
+            arr = np.load(p, allow_pickle=False)
+        except (OSError, ValueError):
+            self.misses += 1
+            return False, None
+        try:
+            os.utime(p, None)  # LRU：命中即更新 mtime
+        except OSError:
+            pass
+        self.hits += 1
+        if arr.shape[0] == 0:
+            return True, None
+        return True, arr
+
+    def put(self, image_path, landmarks, image_sha=None, model_path=None):
+        """landmarks: (468, 2) 陣列，或 None 表示無臉。"""
+        image_sha = image_sha or file_sha256(image_path)
+        p = self._entry_path(image_sha, model_path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if landmarks is None:
+            arr = np.zeros((0, 2), dtype=np.float32)
+        else:
+            arr = np.asarray(landmarks, dtype=np.float32)[:LANDMARK_COUNT, :2]
+        tmp = p.with_name("%s.%d.%d.tmp" % (p.stem, os.getpid(), threading.get_ident()))
+        with open(tmp, "wb") as f:
+            np.save(f, arr, allow_pickle=False)
+        os.replace(tmp, p)
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self.total_bytes()
+            else:
+                self._approx_bytes += p.stat().st_size
+            over = self._approx_bytes > self.max_bytes
+        if over:
+            self.prune()
+
+    def load_many(self, image_paths, model_path=None):
+        """
+        批次讀取：回傳 (landmarks (N, 468, 2) float32, status list)。
+        status[i] 為 "ok" / "no_face" / "miss"；非 ok 的列填 NaN（compute_ratio_matrix 對應列全為 NaN）。
+        """
+        out = np.full((len(image_paths), LANDMARK_COUNT, 2), np.nan, dtype=np.float32)
+        status = []
+        for i, path in enumerate(image_paths):
+            hit, lm = self.get(path, model_path=model_path)
+            if not hit:
+                status.append("miss")
+            elif lm is None:
+                status.append("no_face")
+            else:
+                out[i] = lm
+                status.append("ok")
+        return out, status
+
+    def _entries(self):
+        if not self.root.is_dir():
+            return []
+        out = []
+        for p in self.root.rglob("*.npy"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def prune(self, max_bytes=None):
+        """LRU 淘汰到 max_bytes（預設 self.max_bytes）的 90% 以下，回傳 (刪除筆數, 釋放 bytes)。"""
+        limit = self.max_bytes if max_bytes is None else int(max_bytes)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(limit * 0.9) if total > limit else total
+        removed = 0
+        freed = 0
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            removed += 1
+        with self._lock:
+            self._approx_bytes = total
+        return removed, freed
+
+    def clear(self):
+        removed = 0
+        for _, _, p in self._entries():
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._approx_bytes = 0
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        namespaces = {}
+        no_face = 0
+        for _, size, p in entries:
+            ns = p.relative_to(self.root).parts[0]
+            n, b = namespaces.get(ns, (0, 0))
+            namespaces[ns] = (n + 1, b + size)
+            if size <= 128:  # 只有 .npy header 的空陣列 = 無臉
+                no_face += 1
+        mtimes = [m for m, _, _ in entries]
+        return {
+            "root": str(self.root),
+            "entries": len(entries),
+            "no_face_entries": no_face,
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "namespaces": {k: {"entries": v[0], "bytes": v[1]} for k, v in sorted(namespaces.items())},
+            "oldest": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(min(mtimes))) if mtimes else None,
+            "newest": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(max(mtimes))) if mtimes else None,
+        }
+
+
+_OFF_VALUES = ("off", "0", "false", "no", "")
+
+
+def cache_dir_from_env(env_var, default_dir):
+    """
+    快取目錄環境變數（HS4_LANDMARK_CACHE / HS4_EVAL_CACHE）的共用解析：
+    未設定 → default_dir；"off" / "0" / "false" / "no" / 空字串 → None（停用）；其他值 → 該路徑。
+    """
+    env = os.environ.get(env_var)
+    if env is None:
+        return Path(default_dir)
+    if env.strip().lower() in _OFF_VALUES:
+        return None
+    return Path(env).expanduser()
+
+
+_default_cache = None
+_default_cache_resolved = False
+
+
+def get_default_cache():
+    """依 HS4_LANDMARK_CACHE 回傳共用 LandmarkCache；停用時回傳 None。"""
+    global _default_cache, _default_cache_resolved
+    if not _default_cache_resolved:
+        root = cache_dir_from_env(ENV_VAR, DEFAULT_CACHE_DIR)
+        _default_cache = LandmarkCache(root=root) if root is not None else None
+        _default_cache_resolved = True
+    return _default_cache
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect / prune the on-disk MediaPipe landmark cache.")
+    ap.add_argument("--cache-dir", type=Path, default=None, help="Cache root (default: $%s or %s)" % (ENV_VAR, DEFAULT_CACHE_DIR))
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entry count, size, namespaces (one per model hash)")
+    prune_p = sub.add_parser("prune", help="LRU-evict until the cache is under --max-mb")
+    prune_p.add_argument("--max-mb", type=float, required=True)
+    sub.add_parser("clear", help="Delete every cached entry")
+    show_p = sub.add_parser("show", help="Show whether an image is cached (and its ratios)")
+    show_p.add_argument("image", type=Path)
+    rescore_p = sub.add_parser("rescore", help="Recompute ratios for every image under a directory from cached landmarks only")
+    rescore_p.add_argument("images", type=Path, nargs="+", help="Image files or directories (recursive)")
+    rescore_p.add_argument("--detect-missing", action="store_true", help="Run MediaPipe for images not yet in the cache")
+    rescore_p.add_argument("-o", "--output", type=Path, default=None, help="JSON output path (default: stdout summary only)")
+    args = ap.parse_args()
+
+    root = args.cache_dir or cache_dir_from_env(ENV_VAR, DEFAULT_CACHE_DIR)
+    if root is None:
+        raise SystemExit("%s disables the landmark cache; pass --cache-dir to inspect a cache directory." % ENV_VAR)
+    cache = LandmarkCache(root=root)
+
+    if args.command == "stats":
+        st = cache.stats()
+        _out("root: %s" % st["root"])
+        _out("entries: %d (no face: %d)" % (st["entries"], st["no_face_entries"]))
+        _out("size: %.2f MB / limit %.0f MB" % (st["total_bytes"] / 1e6, st["max_bytes"] / 1e6))
+        _out("oldest / newest access: %s / %s" % (st["oldest"], st["newest"]))
+        for ns, v in st["namespaces"].items():
+            _out("  %s: %d entries, %.2f MB" % (ns, v["entries"], v["bytes"] / 1e6))
+    elif args.command == "prune":
+        removed, freed = cache.prune(max_bytes=args.max_mb * 1e6)
+        _out("Pruned %d entries (%.2f MB)" % (removed, freed / 1e6))
+    elif args.command == "clear":
+        _out("Removed %d entries" % cache.clear())
+    elif args.command == "show":
+        if not args.image.exists():
+            raise SystemExit("File not found: %s" % args.image)
+        sha = file_sha256(args.image)
+        hit, lm = cache.get(args.image, image_sha=sha)
+        _out("sha256: %s" % sha)
+        if not hit:
+            _out("not cached")
+        elif lm is None:
+            _out("cached: no face detected")
+        else:
+            from extract_face_ratios import _ratios_from_points
+            _out("cached: %d landmarks" % len(lm))
+            for k, v in _ratios_from_points(lm).items():
+                _out("  %s: %s" % (k, v))
+    elif args.command == "rescore":
+        _rescore(cache, args)
+    return 0
+
+
+def _collect_images(paths):
+    images = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            images.extend(sorted(x for x in p.rglob("*") if x.suffix.lower() in IMAGE_SUFFIXES))
+        elif p.exists():
+            images.append(p)
+    return images
+
+
+def _rescore(cache, args):
+    from extract_face_ratios import compute_ratio_matrix, ratio_rows_to_dicts, extract_landmarks
+
+    images = _collect_images(args.images)
+    if not images:
+        raise SystemExit("No images found in %s" % [str(p) for p in args.images])
+    t0 = time.perf_counter()
+    landmarks, status = cache.load_many(images)
+    if args.detect_missing:
+        for i, path in enumerate(images):
+            if status[i] != "miss":
+                continue
+            try:
+                landmarks[i] = extract_landmarks(path, cache=cache)
+                status[i] = "ok"
+            except ValueError:
+                status[i] = "no_face"
+    t1 = time.perf_counter()
+    rows = ratio_rows_to_dicts(compute_ratio_matrix(landmarks))
+    t2 = time.perf_counter()
+    _out("Images: %d  ok: %d  no face: %d  not cached: %d" % (
+        len(images), status.count("ok"), status.count("no_face"), status.count("miss")))
+    _out("Load: %.1f ms  ratio matrix: %.1f ms" % ((t1 - t0) * 1000.0, (t2 - t1) * 1000.0))
+    if args.output:
+        results = [
+            {"path": str(p), "status": st, "ratios": r if st == "ok" else None}
+            for p, st, r in zip(images, status, rows)
+        ]
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+全 landmark Procrustes loss：截圖的 468 點先以相似變換（平移 + 等比縮放 + 旋轉，不含鏡射）對齊到目標照的 landmark，
+再算各區域（FACE_OVAL、眼、眉、唇、鼻；索引取自 extract_face_ratios）的 RMS 殘差，以「目標臉大小的百分比」表示，
+加權總和即 loss。與 run_phase1._compute_errors_and_loss 的 17 個 ratio 相比，輪廓與五官形狀的資訊都用上，
+輪廓類 slider 不必靠大量 trial 才定得下來。
+
+MediaPipe 座標是依寬、高各自歸一化；對齊前 x 乘上影像寬高比（image_aspect），換成等向座標。
+
+  objective = make_objective("procrustes", target_image, "face_oval=2,lips=1")
+  errors, contributions, total = compute_loss(target_ratios, face_ratios, objective, screenshot_path=...)
+  losses = objective.loss_batch(landmarks_n_468_2, aspects)     # 整批向量化
+
+優化器以 --objective procrustes 選用（run_optuna_face、run_onedim_face、run_experiment）；預設 ratios 維持舊 loss。
+
+CLI（對一批截圖評分，與 ratio loss 並列）：
+  python landmark_loss.py score --target-image SRC/target.jpg output/**/screenshot_*.png
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from extract_face_ratios import (
+    FACE_OVAL_INDICES,
+    LEFT_EYE_INDICES,
+    RIGHT_EYE_INDICES,
+    LEFT_EYEBROW_INDICES,
+    RIGHT_EYEBROW_INDICES,
+    LIPS_INDICES,
+    NOSE_INDICES,
+)
+
+OBJECTIVES = ("ratios", "procrustes")
+REGIONS = {
+    "face_oval": list(FACE_OVAL_INDICES),
+    "eyes": list(LEFT_EYE_INDICES) + list(RIGHT_EYE_INDICES),
+    "eyebrows": list(LEFT_EYEBROW_INDICES) + list(RIGHT_EYEBROW_INDICES),
+    "lips": list(LIPS_INDICES),
+    "nose": list(NOSE_INDICES),
+}
+# 輪廓加重：ratio loss 最難約束的就是臉緣
+DEFAULT_WEIGHTS = {"face_oval": 2.0, "eyes": 1.0, "eyebrows": 0.5, "lips": 1.0, "nose": 1.0}
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def image_aspect(path):
+    """影像寬 / 高（PIL 只讀檔頭）；讀不到時 None。"""
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            w, h = im.size
+    except (OSError, ImportError):
+        return None
+    return w / float(h) if h else None
+
+
+def parse_weights(spec):
+    """"face_oval=2,lips=1" → 完整權重 dict（未指定的區域用 DEFAULT_WEIGHTS）；格式錯誤 ValueError。"""
+    weights = dict(DEFAULT_WEIGHTS)
+    if not spec:
+        return weights
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in REGIONS or not value:
+            raise ValueError("Bad region weight %r (regions: %s)" % (part, ", ".join(REGIONS)))
+        weights[name] = float(value)
+    return weights
+
+
+def procrustes_align(X, Y, w):
+    """
+    加權相似 Procrustes（2D 閉式解，批次）：X (N, P, 2) 對齊到 Y (P, 2)，w (P,) 非負權重。
+    回傳 (aligned (N, P, 2), scale (N,), angle (N,) 弧度)。
+    """
+    import numpy as np
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    w = w / w.sum()
+    mx = np.einsum("p,npk->nk", w, X)
+    my = w @ Y
+    Xc = X - mx[:, None, :]
+    Yc = Y - my
+    a = np.einsum("p,npk,pk->n", w, Xc, Yc)
+    b = np.einsum("p,np,p->n", w, Xc[..., 0], Yc[:, 1]) - np.einsum("p,np,p->n", w, Xc[..., 1], Yc[:, 0])
+    var_x = np.einsum("p,npk,npk->n", w, Xc, Xc)
+    scale = np.sqrt(a * a + b * b) / np.maximum(var_x, 1e-300)
+    angle = np.arctan2(b, a)
+    c, s = np.cos(angle) * scale, np.sin(angle) * scale
+    aligned = np.empty_like(Xc)
+    aligned[..., 0] = c[:, None] * Xc[..., 0] - s[:, None] * Xc[..., 1]
+    aligned[..., 1] = s[:, None] * Xc[..., 0] + c[:, None] * Xc[..., 1]
+    return aligned + my, scale, angle
+
+
+class ProcrustesObjective:
+    """
+    目標 landmark 固定，對任意一批截圖 landmark 算分區殘差與 loss。
+    對齊用所有區域點的聯集，每點權重 = 區域權重 / 區域點數（各區域對對齊的影響與點數無關）。
+    """
+
+    name = "procrustes"
+
+    def __init__(self, target_landmarks, target_aspect=1.0, weights=None):
+        import numpy as np
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.region_names = [r for r in REGIONS if self.weights.get(r, 0) > 0]
+        if not self.region_names:
+            raise ValueError("All region weights are zero")
+        idx = []
+        point_w = []
+        self._slices = []
+        for r in self.region_names:
+            start = len(idx)
+            idx += REGIONS[r]
+            point_w += [self.weights[r] / len(REGIONS[r])] * len(REGIONS[r])
+            self._slices.append(slice(start, len(idx)))
+        self.indices = np.asarray(idx, dtype=np.intp)
+        self.point_weights = np.asarray(point_w)
+        self.region_weights = np.asarray([self.weights[r] for r in self.region_names])
+        Y = self._isotropic(np.asarray(target_landmarks, dtype=np.float64)[None], target_aspect)[0][self.indices]
+        self.target = Y
+        w = self.point_weights / self.point_weights.sum()
+        self.target_scale = float(np.sqrt(w @ ((Y - w @ Y) ** 2).sum(axis=1)))
+        self.target_aspect = target_aspect
+
+    @classmethod
+    def from_image(cls, image_path, weights=None):
+        """目標照 → objective（landmark 走 landmark_cache）；偵測不到臉時 ValueError。"""
+        from extract_face_ratios import extract_landmarks
+        return cls(extract_landmarks(image_path), image_aspect(image_path) or 1.0, weights)
+
+    @staticmethod
+    def _isotropic(L, aspect):
+        import numpy as np
+        L = np.array(L, dtype=np.float64)
+        L[..., 0] *= np.asarray(aspect, dtype=np.float64).reshape(-1, 1) if np.ndim(aspect) else aspect
+        return L
+
+    def region_residuals(self, landmarks, aspects=1.0):
+        """landmarks (N, 468, 2) 或 (468, 2)、aspects 純量或 (N,) → (N, R) 各區 RMS 殘差（目標臉大小的 %）。"""
+        import numpy as np
+        L = np.asarray(landmarks, dtype=np.float64)
+        if L.ndim == 2:
+            L = L[None]
+        X = self._isotropic(L, aspects)[:, self.indices]
+        aligned, _, _ = procrustes_align(X, self.target, self.point_weights)
+        sq = ((aligned - self.target) ** 2).sum(axis=-1)
+        rms = np.stack([np.sqrt(sq[:, sl].mean(axis=1)) for sl in self._slices], axis=1)
+        return rms / self.target_scale * 100.0
+
+    def loss_batch(self, landmarks, aspects=1.0):
+        """(N,) loss = Σ 區域權重 × 區域殘差 %。"""
+        return self.region_residuals(landmarks, aspects) @ self.region_weights
+
+    def score(self, face_ratios=None, landmarks=None, screenshot_path=None, aspect=None):
+        """
+        單張：回傳 (errors, contributions, total)，格式同 _compute_errors_and_loss（errors 為各區殘差 %）。
+        landmarks 為 None 時由 screenshot_path 取（landmark_cache）。aspect 為 None 時讀 screenshot_path 的寬高比，
+        截圖已不在時（舊的 eval_cache 命中）用目標照的。不改動物件狀態，可由多個執行緒同時呼叫。
+        """
+        from extract_face_ratios import extract_landmarks
+        have_shot = screenshot_path is not None and Path(screenshot_path).exists()
+        if landmarks is None:
+            if not have_shot:
+                raise ValueError("Procrustes objective needs landmarks or a screenshot")
+            landmarks = extract_landmarks(screenshot_path)
+        if aspect is None and have_shot:
+            aspect = image_aspect(screenshot_path)
+        if aspect is None:
+            aspect = self.target_aspect
+        res = self.region_residuals(landmarks, aspect)[0]
+        errors = {r: round(float(v), 4) for r, v in zip(self.region_names, res)}
+        contributions = {r: round(float(v * w), 4) for r, v, w in zip(self.region_names, res, self.region_weights)}
+        return errors, contributions, float(res @ self.region_weights)
+
+
+def make_objective(name, target_image=None, weights_spec=None):
+    """name "ratios" → None（沿用 ratio loss）；"procrustes" → ProcrustesObjective。錯誤以 ValueError 回報。"""
+    if name in (None, "ratios"):
+        return None
+    if name != "procrustes":
+        raise ValueError("Unknown objective: %s" % name)
+    if target_image is None:
+        raise ValueError("Procrustes objective needs the target image")
+    return ProcrustesObjective.from_image(target_image, parse_weights(weights_spec))
+
+
+def compute_loss(target_ratios, face_ratios, objective=None, screenshot_path=None, landmarks=None, aspect=None):
+    """
+    評估點共用的 loss：objective 為 None 時即 _compute_errors_and_loss(target_ratios, face_ratios)，
+    否則 objective.score(...)。回傳 (errors, contributions, total)；取不到 landmark 時 ValueError。
+    已抽過 landmark 的呼叫端應傳 landmarks（以及 eval_cache 的 aspect），避免再跑一次 MediaPipe / 讀檔。
+    """
+    if objective is None:
+        from run_phase1 import _compute_errors_and_loss
+        return _compute_errors_and_loss(target_ratios, face_ratios)
+    return objective.score(face_ratios, landmarks=landmarks, screenshot_path=screenshot_path, aspect=aspect)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Score screenshots with the full-landmark Procrustes loss (and the ratio loss for comparison).")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sc = sub.add_parser("score", help="Score a batch of screenshots against a target image")
+    sc.add_argument("--target-image", type=Path, required=True)
+    sc.add_argument("--weights", type=str, default=None, help="區域權重，例如 face_oval=2,lips=1（預設 %s）" % DEFAULT_WEIGHTS)
+    sc.add_argument("screenshots", type=Path, nargs="+")
+    args = ap.parse_args()
+
+    import numpy as np
+    from extract_face_ratios import extract_landmarks, extract_ratios, _ratios_from_points
+    from run_phase1 import _compute_errors_and_loss
+
+    if not args.target_image.exists():
+        raise SystemExit("Target image not found: %s" % args.target_image)
+    try:
+        objective = make_objective("procrustes", args.target_image, args.weights)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    target_ratios = extract_ratios(args.target_image)
+    paths, L, aspects = [], [], []
+    for p in args.screenshots:
+        try:
+            L.append(extract_landmarks(p))
+        except (ValueError, OSError) as e:
+            _out("  skip %s: %s" % (p, e))
+            continue
+        paths.append(p)
+        aspects.append(image_aspect(p) or 1.0)
+    if not paths:
+        raise SystemExit("No screenshot with a detectable face.")
+    L = np.stack(L)
+    res = objective.region_residuals(L, np.asarray(aspects))
+    losses = res @ objective.region_weights
+    _out("%10s %10s  %s  screenshot" % ("procrustes", "ratio", " ".join("%9s" % r for r in objective.region_names)))
+    for k in np.argsort(losses):
+        ratio_loss = _compute_errors_and_loss(target_ratios, _ratios_from_points(L[k]))[2]
+        _out("%10.3f %10.3f  %s  %s" % (losses[k], ratio_loss, " ".join("%9.2f" % v for v in res[k]), paths[k]))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,9 +2,10 @@
 """
 輪廓預覽視窗與驗證順序：優化得 shapeValueFace[0..18] 後 → 預覽視窗（確認 OK）→ 寫卡 → HS2CharEdit --validate。
 支援：僅卡片（從卡讀輪廓參數預覽）、或 照片+卡片（run_poc 風格 mapping + 預覽 + 寫卡 + 驗證）。
+--pre-optimize：送任何截圖前，先以 forward_face_contour 的前向模型（slider_sweep 響應張量）離線擬合輪廓 slider
+到照片的 FACE_OVAL（fit_contour_params）。
 """
 import argparse
-import json
 import os
 import subprocess
 import sys
@@ -54,52 +55,20 @@ def _params_0_18_from_run_poc_style(image_path, card_path, map_path=None):
     if not map_path.exists():
         return _params_0_18_from_card(card_path), None
 
-    with open(map_path, "r", encoding="utf-8") as f:
-        m = json.load(f)
+    from ratio_to_slider import load_compiled_map
+    compiled = load_compiled_map(map_path)
     ratios = extract_ratios(image_path)
-    params = {}
-    calibration = m.get("calibration") or {}
-    for ratio_name, value in ratios.items():
-        if ratio_name not in m.get("ratios", {}):
-            continue
-        r = m["ratios"][ratio_name]
-        slider_name = r["slider"]
-        cal = calibration.get(slider_name) if isinstance(calibration.get(slider_name), dict) else None
-        ratio_min = cal.get("ratio_min") if cal else None
-        ratio_max = cal.get("ratio_max") if cal else None
-        if ratio_min is not None and ratio_max is not None and isinstance(ratio_min, (int, float)) and isinstance(ratio_max, (int, float)):
-            denom = ratio_max - ratio_min
-            v = (value - ratio_min) / denom * 100.0 if abs(denom) > 1e-9 else 50.0
-        else:
-            s = r.get("scale", 100)
-            o = r.get("offset", 0)
-            v = value * s + o
-        clamp = m.get("default_clamp", [0, 100])
-        v = max(clamp[0], min(clamp[1], v))
-        params[slider_name] = round(v, 2)
-
-    game_range = m.get("game_slider_range")
-    if isinstance(game_range, (list, tuple)) and len(game_range) >= 2:
-        g_min, g_max = float(game_range[0]), float(game_range[1])
-        for k in list(params.keys()):
-            x = params[k]
-            params[k] = round(g_min + (x / 100.0) * (g_max - g_min), 2)
-            params[k] = max(g_min, min(g_max, params[k]))
-
-    # poc_name -> list index 0..18（僅輪廓相關）
-    poc_to_idx = {
-        "head_width": 0,
-        "head_upper_depth": 1, "head_upper_height": 2, "head_lower_depth": 3, "head_lower_width": 4,
-        "jaw_width": 5, "jaw_height": 6, "jaw_depth": 7, "jaw_angle": 8, "neck_droop": 9,
-        "chin_size": 10, "chin_height": 11, "chin_depth": 12,
-        "cheek_lower_height": 13, "cheek_lower_depth": 14, "cheek_lower_width": 15,
-        "cheek_upper_height": 16, "cheek_upper_depth": 17, "cheek_upper_width": 18,
-    }
+    params = compiled.ratios_to_params(ratios)
+
+    # 有 mapping 的輪廓 slider（list index 0..18）覆寫卡片值；index 來自 PARAM_TO_LIST_INDICES
     base_0_18 = _params_0_18_from_card(card_path)
-    for poc_name, idx in poc_to_idx.items():
-        if poc_name in params:
-            g = float(params[poc_name])
-            base_0_18[idx] = max(0.0, min(1.0, (g + 100.0) / 300.0))
+    for slider_name, indices in zip(compiled.slider_names, compiled.list_indices):
+        if slider_name not in params:
+            continue
+        norm = max(0.0, min(1.0, (float(params[slider_name]) + 100.0) / 300.0))
+        for idx in indices:
+            if idx < 19:
+                base_0_18[idx] = norm
     return base_0_18, params  # params 用於寫卡（mapped 全量，可選只寫輪廓）
 
 
@@ -153,10 +122,14 @@ def main():
     ap.add_argument("--no-show", action="store_true", help="不開預覽視窗，只跑完流程並寫 log（除錯用）")
     ap.add_argument("--hs2charedit", type=Path, default=None, help="HS2CharEdit.exe 路徑（或設 HS2CHAREDIT_EXE）")
     ap.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="ratio mapping JSON（--image 時用）")
+    ap.add_argument("--pre-optimize", action="store_true", help="以前向輪廓模型離線擬合 0..18 到照片輪廓（需 --image）")
+    ap.add_argument("--sweep", type=Path, default=None, help="前向模型用的 slider_sweep response.npz 或目錄（預設 HS4_CONTOUR_SWEEP / 最新一次掃描）")
     args = ap.parse_args()
 
     if not args.card.exists():
         raise SystemExit(f"Card not found: {args.card}")
+    if args.pre_optimize and not (args.image and args.image.exists()):
+        raise SystemExit("--pre-optimize needs --image (the photo whose contour is fitted)")
 
     # 1) 取得 shapeValueFace[0..18]（0..1）
     run_poc_params = None
@@ -169,9 +142,25 @@ def main():
     else:
         params_0_18 = _params_0_18_from_card(args.card)
 
-    # 2) 2D 輪廓點
-    from forward_face_contour import get_contour_xy_from_params
-    contour_xy = get_contour_xy_from_params(params_0_18)
+    # 2) 前向模型：可選的離線擬合 + 2D 輪廓點
+    from forward_face_contour import load_contour_model, get_contour_xy_from_params, fit_contour_params
+    try:
+        model = load_contour_model(args.sweep)
+    except (FileNotFoundError, ValueError) as e:
+        if args.pre_optimize:
+            raise SystemExit("Forward contour model unavailable: %s" % e)
+        print("Forward contour model unavailable (%s); preview shows the photo contour only." % e)
+        model = None
+    if args.pre_optimize:
+        from extract_face_ratios import extract_landmarks
+        from landmark_loss import image_aspect
+        fitted, info = fit_contour_params(
+            model, extract_landmarks(args.image), image_aspect(args.image) or 1.0, start_rates=params_0_18,
+        )
+        print("Pre-optimized contour sliders %s offline: loss %.4f -> %.4f (%d model evaluations, %.2fs)" % (
+            info["sliders"], info["loss_start"], info["loss"], info["evaluations"], info["sec"]))
+        params_0_18 = [float(v) for v in fitted]
+    contour_xy = get_contour_xy_from_params(params_0_18, model) if model is not None else None
 
     # 3) 可選：照片輪廓 + 量測線段（綠線）一次取得
     photo_contour_xy = None
@@ -186,19 +175,22 @@ def main():
 
     # 4) 預覽視窗：紅輪廓、綠量測、黃 50、青 468、紫五官邊緣（眼眉唇）
     from contour_preview import show_contour_preview
-    title = "Face contour (confirm then close to write card)" if args.output_card else "Face contour"
-    show_contour_preview(
-        contour_xy,
-        photo_contour_xy=photo_contour_xy,
-        image_path=args.image,
-        photo_measurement_segments=photo_measurement_segments if photo_measurement_segments else None,
-        photo_edge_landmarks_xy=photo_edge_landmarks_xy,
-        photo_all_landmarks_468_xy=photo_all_landmarks_468_xy,
-        photo_precise_landmarks_xy=photo_precise_landmarks_xy,
-        photo_facial_feature_edges=photo_facial_feature_edges if photo_facial_feature_edges else None,
-        title=title,
-        show=not args.no_show,
-    )
+    if contour_xy is None and photo_contour_xy is None:
+        print("Nothing to preview (no forward model, no photo contour).")
+    else:
+        title = "Face contour (confirm then close to write card)" if args.output_card else "Face contour"
+        show_contour_preview(
+            contour_xy,
+            photo_contour_xy=photo_contour_xy,
+            image_path=args.image,
+            photo_measurement_segments=photo_measurement_segments if photo_measurement_segments else None,
+            photo_edge_landmarks_xy=photo_edge_landmarks_xy,
+            photo_all_landmarks_468_xy=photo_all_landmarks_468_xy,
+            photo_precise_landmarks_xy=photo_precise_landmarks_xy,
+            photo_facial_feature_edges=photo_facial_feature_edges if photo_facial_feature_edges else None,
+            title=title,
+            show=not args.no_show,
+        )
 
     # 5) 關閉視窗後：寫卡（若有 --output-card）
     if args.output_card:
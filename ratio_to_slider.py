@@ -4,17 +4,21 @@
 供 run_poc、run_phase1、第一輪起點等共用。
 
 Calibration 為線性近似（ratio_min/ratio_max 或 scale/offset）；HS2 實際為
-value 0～1 → 動畫曲線 → 骨骼，非線性。殘差可依 run_experiment 反饋再調，
-或日後改為多點 calibration 與曲線插值。對照表見 docs/17_ratio_to_hs2_slider_對照.md。
+value 0～1 → 動畫曲線 → 骨骼，非線性。calibration 項目含 "curve"（calibrate_from_sweep.py 由 slider_sweep
+響應張量擬合的單調分段曲線，slider 遊戲值 → ratio）時改用曲線：編譯成反查表 CurveLUT（見 load_curve_lut），
+一批目標 ratio 向量一次 NumPy 運算得到 slider 值。對照表見 docs/17_ratio_to_hs2_slider_對照.md。
 
 完整 59 項來源（from_landmarks / from_card）見 docs/HS2_臉部參數_MediaPipe_完整對照表.md、
 hs2_face_param_sources.json。
 """
+import threading
 from pathlib import Path
 
 # 遊戲滑桿顯示範圍，儲存為 float = 遊戲值/100
 GAME_SLIDER_MIN = -100
 GAME_SLIDER_MAX = 200
+# 反查表每個 slider 的 ratio 取樣點數（均勻格點；相鄰格線性內插）
+LUT_SIZE = 1024
 
 
 def load_map(map_path):
@@ -35,45 +39,254 @@ def load_face_sources(sources_path=None):
         return json.load(f)
 
 
+def isotonic_fit(y, increasing=True):
+    """Pool-adjacent-violators：y 的最小平方單調擬合（NaN 不可出現）。"""
+    import numpy as np
+    y = np.asarray(y, dtype=np.float64)
+    if not increasing:
+        return -isotonic_fit(-y, True)
+    vals, weights, counts = [], [], []
+    for v in y:
+        vals.append(v)
+        weights.append(1.0)
+        counts.append(1)
+        while len(vals) > 1 and vals[-2] > vals[-1]:
+            w = weights[-2] + weights[-1]
+            vals[-2] = (vals[-2] * weights[-2] + vals[-1] * weights[-1]) / w
+            weights[-2] = w
+            counts[-2] += counts[-1]
+            del vals[-1], weights[-1], counts[-1]
+    return np.repeat(vals, counts)
+
+
+def pchip_eval(xk, yk, x):
+    """
+    單調三次 Hermite 內插（Fritsch–Carlson）：xk 遞增、yk 單調時結果單調且不過衝。
+    x 超出 [xk[0], xk[-1]] 時夾在端點。
+    """
+    import numpy as np
+    xk = np.asarray(xk, dtype=np.float64)
+    yk = np.asarray(yk, dtype=np.float64)
+    x = np.clip(np.asarray(x, dtype=np.float64), xk[0], xk[-1])
+    h = np.diff(xk)
+    delta = np.diff(yk) / h
+    m = np.zeros_like(yk)
+    if len(xk) == 2:
+        m[:] = delta[0]
+    else:
+        same = delta[:-1] * delta[1:] > 0
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hm = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        m[1:-1] = np.where(same, hm, 0.0)
+        m[0] = delta[0]
+        m[-1] = delta[-1]
+    i = np.clip(np.searchsorted(xk, x, side="right") - 1, 0, len(xk) - 2)
+    t = (x - xk[i]) / h[i]
+    t2, t3 = t * t, t * t * t
+    return ((2 * t3 - 3 * t2 + 1) * yk[i] + (t3 - 2 * t2 + t) * h[i] * m[i]
+            + (-2 * t3 + 3 * t2) * yk[i + 1] + (t3 - t2) * h[i] * m[i + 1])
+
+
+def fit_monotone_curve(levels, ratios):
+    """
+    slider 遊戲值 levels（遞增）與量到的 ratio → 單調曲線節點 {"slider", "ratio"}（方向依相關係數正負）。
+    NaN（截圖失敗）略過；有效點少於 2 或擬合後幾乎無變化時回傳 None（該 slider 維持線性 calibration）。
+    """
+    import numpy as np
+    x = np.asarray(levels, dtype=np.float64)
+    y = np.asarray(ratios, dtype=np.float64)
+    ok = np.isfinite(y)
+    x, y = x[ok], y[ok]
+    if len(x) < 2:
+        return None
+    increasing = np.corrcoef(x, y)[0, 1] >= 0 if np.std(y) > 0 else True
+    fitted = isotonic_fit(y, increasing)
+    if abs(fitted[-1] - fitted[0]) < 1e-6:
+        return None
+    return {"slider": [round(float(v), 4) for v in x], "ratio": [round(float(v), 6) for v in fitted]}
+
+
+class CurveLUT:
+    """
+    曲線 calibration 的反查表：ratio → slider 遊戲值。
+    每條曲線 slider→ratio 以 pchip_eval 在細格點上取樣，反轉成均勻 ratio 格點上的 slider 值 table (S, LUT_SIZE)；
+    lookup 為純陣列運算（無 per-slider 迴圈）。
+    """
+
+    def __init__(self, curves, ratio_names, size=LUT_SIZE):
+        """curves: {slider: (ratio_name, curve dict)}；ratio_names: lookup 輸入欄位順序。"""
+        import numpy as np
+        self.slider_names = list(curves)
+        self.ratio_names = list(ratio_names)
+        self.columns = np.array([self.ratio_names.index(curves[s][0]) for s in self.slider_names], dtype=np.intp)
+        S = len(self.slider_names)
+        self.r_lo = np.zeros(S)
+        self.r_step = np.ones(S)
+        self.table = np.zeros((S, size))
+        for k, s in enumerate(self.slider_names):
+            curve = curves[s][1]
+            xs = np.linspace(curve["slider"][0], curve["slider"][-1], 4 * size)
+            rs = pchip_eval(curve["slider"], curve["ratio"], xs)
+            if rs[-1] < rs[0]:
+                xs, rs = xs[::-1], rs[::-1]
+            # 單調擬合的平台段（ratio 不變）反查到平台中點，而非端點
+            rs, group = np.unique(np.round(np.maximum.accumulate(rs), 10), return_inverse=True)
+            xs = np.bincount(group, weights=xs) / np.bincount(group)
+            grid = np.linspace(rs[0], rs[-1], size)
+            self.r_lo[k] = rs[0]
+            self.r_step[k] = (rs[-1] - rs[0]) / (size - 1)
+            self.table[k] = np.interp(grid, rs, xs)
+        self.size = size
+
+    def lookup(self, ratio_matrix):
+        """(N, len(ratio_names)) 或 (len(ratio_names),) → (N, S) / (S,) slider 遊戲值；範圍外夾在曲線端點，NaN 輸入得 NaN。"""
+        import numpy as np
+        R = np.asarray(ratio_matrix, dtype=np.float64)
+        single = R.ndim == 1
+        R = np.atleast_2d(R)[:, self.columns]
+        t = np.clip((R - self.r_lo) / self.r_step, 0.0, self.size - 1)
+        i = np.minimum(np.nan_to_num(t).astype(np.intp), self.size - 2)
+        f = t - i
+        rows = np.arange(len(self.slider_names))
+        out = self.table[rows, i] * (1 - f) + self.table[rows, i + 1] * f
+        return out[0] if single else out
+
+
+def _curves_from_map(m):
+    curves = {}
+    for slider, cal in (m.get("calibration") or {}).items():
+        if isinstance(cal, dict) and isinstance(cal.get("curve"), dict) and cal.get("ratio_name"):
+            curves[slider] = (cal["ratio_name"], cal["curve"])
+    return curves
+
+
+class CompiledSliderMap:
+    """
+    ratio_to_slider_map.json 編譯一次的結果；所有入口（face_ratios_to_params、get_slider_names、
+    load_game_slider_range、blackbox、optimize_contour）共用，不再各自讀 JSON、跑 dict 迴圈。
+
+    ratio_names / slider_names   map 的 ratios 順序（第 j 個 ratio 對應第 j 個 slider）
+    scale / offset               線性段統一成 v = ratio * scale + offset（0～100；ratio_min/ratio_max 已換算）
+    clamp                        default_clamp
+    game_range                   game_slider_range（None 時 mapping 不換算，game_slider_range 屬性回傳預設 -100～200）
+    list_indices                 各 slider 在 shapeValueFace 的 index（PARAM_TO_LIST_INDICES）
+    curve_lut / curve_columns    曲線 calibration 的 CurveLUT 與其在 slider 軸上的欄位
+    """
+
+    def __init__(self, m):
+        import numpy as np
+        from write_face_params_to_card import PARAM_TO_LIST_INDICES
+        calibration = m.get("calibration") or {}
+        ratios = [(name, r) for name, r in (m.get("ratios") or {}).items() if r.get("slider")]
+        self.ratio_names = [name for name, _ in ratios]
+        self.slider_names = [r["slider"] for _, r in ratios]
+        self._ratio_pos = {name: j for j, name in enumerate(self.ratio_names)}
+        scale = np.empty(len(ratios))
+        offset = np.empty(len(ratios))
+        for j, (_, r) in enumerate(ratios):
+            cal = calibration.get(r["slider"]) if isinstance(calibration.get(r["slider"]), dict) else None
+            ratio_min = cal.get("ratio_min") if cal else None
+            ratio_max = cal.get("ratio_max") if cal else None
+            if isinstance(ratio_min, (int, float)) and isinstance(ratio_max, (int, float)):
+                denom = ratio_max - ratio_min
+                if abs(denom) > 1e-9:
+                    scale[j], offset[j] = 100.0 / denom, -ratio_min * 100.0 / denom
+                else:
+                    scale[j], offset[j] = 0.0, 50.0
+            else:
+                scale[j], offset[j] = r.get("scale", 100), r.get("offset", 0)
+        self.scale = scale
+        self.offset = offset
+        clamp = m.get("default_clamp", [0, 100])
+        self.clamp = (float(clamp[0]), float(clamp[1]))
+        gr = m.get("game_slider_range")
+        self.game_range = (float(gr[0]), float(gr[1])) if isinstance(gr, (list, tuple)) and len(gr) >= 2 else None
+        self.list_indices = [list(PARAM_TO_LIST_INDICES.get(name, ())) for name in self.slider_names]
+        curves = {sl: c for sl, c in _curves_from_map(m).items() if sl in self.slider_names and c[0] in self._ratio_pos}
+        self.curve_lut = CurveLUT(curves, self.ratio_names) if curves else None
+        self.curve_columns = np.array(
+            [self.slider_names.index(sl) for sl in (self.curve_lut.slider_names if self.curve_lut else ())], dtype=np.intp
+        )
+
+    @property
+    def game_slider_range(self):
+        return self.game_range if self.game_range is not None else (float(GAME_SLIDER_MIN), float(GAME_SLIDER_MAX))
+
+    def ratio_matrix(self, ratio_dicts):
+        """face_ratios dict 或其 list → (N, len(ratio_names))，缺的 ratio 為 NaN。"""
+        import numpy as np
+        if isinstance(ratio_dicts, dict):
+            ratio_dicts = [ratio_dicts]
+        nan = float("nan")
+        return np.array([[d.get(name, nan) for name in self.ratio_names] for d in ratio_dicts], dtype=np.float64).reshape(
+            len(ratio_dicts), len(self.ratio_names))
+
+    def map_matrix(self, R):
+        """
+        (N, len(ratio_names)) ratio → (N, len(slider_names)) slider 遊戲值（四捨五入到 0.01），整批陣列運算。
+        線性段：ratio*scale+offset → clamp → game_range；曲線段：CurveLUT 反查。NaN ratio 得 NaN。
+        """
+        import numpy as np
+        R = np.atleast_2d(np.asarray(R, dtype=np.float64))
+        V = np.round(np.clip(R * self.scale + self.offset, *self.clamp), 2)
+        if self.game_range is not None:
+            g_min, g_max = self.game_range
+            V = np.clip(np.round(g_min + (V / 100.0) * (g_max - g_min), 2), g_min, g_max)
+        if self.curve_lut is not None:
+            V[:, self.curve_columns] = np.round(self.curve_lut.lookup(R), 2)
+        return V
+
+    def ratios_to_params(self, ratios):
+        """face_ratios dict → params dict（key 依輸入 ratio 順序，只含 map 有且值非 NaN 者；同 face_ratios_to_params）。"""
+        row = self.map_matrix(self.ratio_matrix(ratios))[0]
+        params = {}
+        for ratio_name in ratios:
+            j = self._ratio_pos.get(ratio_name)
+            if j is not None and row[j] == row[j]:
+                params[self.slider_names[j]] = float(row[j])
+        return params
+
+
+_compiled_cache = {}
+_compiled_lock = threading.Lock()
+
+
+def load_compiled_map(map_path=None):
+    """
+    map_path 編譯後的 CompiledSliderMap（process 內快取）。
+    mtime/size 未變直接沿用；有變時比對檔案 SHA-256，內容相同不重編（只更新 stat）。檔案不存在時 OSError。
+    """
+    if map_path is None:
+        map_path = Path(__file__).resolve().parent / "ratio_to_slider_map.json"
+    p = Path(map_path).resolve()
+    st = p.stat()
+    with _compiled_lock:
+        entry = _compiled_cache.get(str(p))
+    if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+        return entry[2]
+    from landmark_cache import file_sha256
+    sha = file_sha256(p)
+    compiled = entry[2] if entry is not None and entry[1] == sha else CompiledSliderMap(load_map(p))
+    with _compiled_lock:
+        _compiled_cache[str(p)] = ((st.st_mtime_ns, st.st_size), sha, compiled)
+    return compiled
+
+
+def load_curve_lut(map_path=None):
+    """map 內所有曲線 calibration 編譯成的 CurveLUT（沒有曲線時 None）；見 load_compiled_map。"""
+    return load_compiled_map(map_path).curve_lut
+
+
 def face_ratios_to_params(ratios, map_path=None):
     """
     將 extract_face_ratios 的 face_ratios (dict) 映射為寫卡用的 params (dict)。
     map_path: ratio_to_slider_map.json 路徑；若為 None 則用專案根目錄預設。
-    使用 calibration 時為線性映射 (value-ratio_min)/(ratio_max-ratio_min)*100 → game_range。
+    使用 calibration 時為線性映射 (value-ratio_min)/(ratio_max-ratio_min)*100 → game_range；
+    有曲線 calibration 的 slider 由 CurveLUT 反查（直接得遊戲值）。整批請用 load_compiled_map(...).map_matrix。
     """
-    if map_path is None:
-        map_path = Path(__file__).resolve().parent / "ratio_to_slider_map.json"
-    map_path = Path(map_path)
-    m = load_map(map_path)
-    calibration = m.get("calibration") or {}
-    params = {}
-    for ratio_name, value in ratios.items():
-        if ratio_name not in m.get("ratios", {}):
-            continue
-        r = m["ratios"][ratio_name]
-        slider_name = r["slider"]
-        cal = calibration.get(slider_name) if isinstance(calibration.get(slider_name), dict) else None
-        ratio_min = cal.get("ratio_min") if cal else None
-        ratio_max = cal.get("ratio_max") if cal else None
-        if ratio_min is not None and ratio_max is not None and isinstance(ratio_min, (int, float)) and isinstance(ratio_max, (int, float)):
-            denom = ratio_max - ratio_min
-            v = (value - ratio_min) / denom * 100.0 if abs(denom) > 1e-9 else 50.0
-        else:
-            s = r.get("scale", 100)
-            o = r.get("offset", 0)
-            v = value * s + o
-        clamp = m.get("default_clamp", [0, 100])
-        v = max(clamp[0], min(clamp[1], v))
-        params[slider_name] = round(v, 2)
-
-    game_range = m.get("game_slider_range")
-    if isinstance(game_range, (list, tuple)) and len(game_range) >= 2:
-        g_min, g_max = float(game_range[0]), float(game_range[1])
-        for k in list(params.keys()):
-            x = params[k]
-            params[k] = round(g_min + (x / 100.0) * (g_max - g_min), 2)
-            params[k] = max(g_min, min(g_max, params[k]))
-    return params
+    return load_compiled_map(map_path).ratios_to_params(ratios)
 
 
 def full_face_params_from_landmarks_and_card(ratios, card_face_list_59, map_path=None, sources_path=None):
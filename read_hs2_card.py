@@ -5,56 +5,130 @@ Output: JSON with trailing size + raw bytes length; optionally dump a small
 subset for inspection. Full ChaFile parsing (binary format) is game-specific
 and can be extended later.
 """
+import mmap
+import os
 import struct
 import json
 import argparse
 from pathlib import Path
 
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_CHUNK_HEAD = struct.Struct(">I4s")
+
+
+def _find_iend_in_file(f, size):
+    """在已開啟的檔案上走 PNG chunk：只讀 8 bytes chunk header，payload + CRC 以 seek 跳過。"""
+    f.seek(0)
+    if f.read(8) != PNG_SIGNATURE:
+        return None
+    pos = 8
+    while pos + 12 <= size:
+        head = f.read(8)
+        if len(head) < 8:
+            return None
+        length, ctype = _CHUNK_HEAD.unpack(head)
+        pos += 12 + length
+        if ctype == b"IEND":
+            return pos if pos <= size else None
+        f.seek(pos)
+    return None
+
+
 def find_iend_end(path):
     """Return byte offset of first byte after IEND chunk."""
+    path = Path(path)
     with open(path, "rb") as f:
-        if f.read(8) != b"\x89PNG\r\n\x1a\n":
-            return None
-        while True:
-            raw_len = f.read(4)
-            if len(raw_len) < 4:
-                return None
-            length = struct.unpack(">I", raw_len)[0]
-            ctype = f.read(4)
-            f.read(length)
-            f.read(4)
-            if ctype == b"IEND":
-                return f.tell()
-    return None
+        return _find_iend_in_file(f, os.fstat(f.fileno()).st_size)
 
 
-def find_iend_in_bytes(data: bytes):
-    """Return byte offset of first byte after IEND chunk, or None."""
-    if len(data) < 8 or data[:8] != b"\x89PNG\r\n\x1a\n":
+def find_iend_in_bytes(data):
+    """Return byte offset of first byte after IEND chunk, or None. data: bytes / bytearray / memoryview / mmap."""
+    if len(data) < 8 or data[:8] != PNG_SIGNATURE:
         return None
     pos = 8
-    while pos + 12 <= len(data):
-        length = struct.unpack(">I", data[pos : pos + 4])[0]
-        ctype = data[pos + 4 : pos + 8]
+    n = len(data)
+    while pos + 12 <= n:
+        length, ctype = _CHUNK_HEAD.unpack_from(data, pos)
         pos += 8 + length + 4
         if ctype == b"IEND":
-            return pos
+            return pos if pos <= n else None
     return None
 
 
 def read_trailing_data(path):
     """Read all bytes after IEND. Returns (trailing_bytes, total_file_size)."""
-    iend = find_iend_end(path)
-    if iend is None:
-        return None, None
-    size = path.stat().st_size
+    path = Path(path)
     with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        iend = _find_iend_in_file(f, size)
+        if iend is None:
+            return None, None
         f.seek(iend)
         trailing = f.read()
     return trailing, size
 
 
+class MappedCard:
+    """
+    mmap 開啟的角色卡：png / trailing 皆為 memoryview（zero-copy），適合掃描大量卡片只看 trailing 的情境。
+    用 with 區塊或 close() 釋放；close 前請先丟掉由 png / trailing 衍生的 view（否則 mmap 無法關閉）。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self._mm = None
+        self._view = None
+        try:
+            self.size = os.fstat(self._f.fileno()).st_size
+            if self.size == 0:
+                raise ValueError("Empty file: %s" % self.path)
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.iend = find_iend_in_bytes(self._mm)
+            if self.iend is None:
+                raise ValueError("Not a valid PNG or no IEND found: %s" % self.path)
+            self._view = memoryview(self._mm)
+        except Exception:
+            self.close()
+            raise
+        self.png = self._view[: self.iend]
+        self.trailing = self._view[self.iend :]
+
+    @property
+    def view(self):
+        """整張卡的 memoryview（PNG + trailing）。"""
+        return self._view
+
+    def close(self):
+        self.png = None
+        self.trailing = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # 仍有外部 view（例如 ChaFileCard.from_mapped）；交給 GC 釋放
+            self._mm = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def open_card(path):
+    """MappedCard(path)：失敗（非 PNG、無 IEND、空檔）時丟 ValueError。"""
+    return MappedCard(path)
+
+
 def main():
     ap = argparse.ArgumentParser(description="Read HS2 card PNG, extract trailing data info")
     ap.add_argument("card", type=Path, help="Path to HS2 character card PNG")
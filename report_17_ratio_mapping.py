@@ -73,18 +73,22 @@ def get_target_ratios_from_experiment(round_dir: Path):
     return data.get("face_ratios"), data.get("source_image")
 
 
-def get_screenshot_from_experiment(round_dir: Path):
-    """從 round 目錄找 screenshots/screenshot_*_*.png，回傳第一個。"""
+def get_screenshots_from_experiment(round_dir: Path):
+    """從 round 目錄找 screenshots/screenshot_*_*.png，依檔名排序回傳全部（可能為空列表）。"""
     screenshots_dir = Path(round_dir) / "screenshots"
     if not screenshots_dir.is_dir():
-        return None
+        return []
     candidates = list(screenshots_dir.glob("screenshot_*_*.png"))
     if not candidates:
         candidates = list(screenshots_dir.glob("screenshot_*.png"))
-    if not candidates:
-        return None
     candidates.sort(key=lambda p: p.name)
-    return candidates[0]
+    return candidates
+
+
+def get_screenshot_from_experiment(round_dir: Path):
+    """從 round 目錄找 screenshots/screenshot_*_*.png，回傳第一個。"""
+    candidates = get_screenshots_from_experiment(round_dir)
+    return candidates[0] if candidates else None
 
 
 def run_report(target_ratios: dict, actual_ratios: dict, source_label: str, screenshot_label: str):
@@ -144,6 +148,91 @@ def run_report(target_ratios: dict, actual_ratios: dict, source_label: str, scre
     }
 
 
+def _markdown_lines(report: dict, threshold: float):
+    """單一報告（run_report 回傳）的 Markdown 表（誤差一律以百分比 % 表示）。"""
+    lines = [
+        "# 17 ratio mapping 驗證：原始圖 vs 遊戲截圖（誤差單位：%）",
+        "",
+        "- **原始/目標**: %s" % report["source_label"],
+        "- **截圖**: %s" % report["screenshot_label"],
+        "- **達標門檻**: 誤差 ≤ %.0f%%" % threshold,
+        "- **摘要**: %s，total_loss = %s（表中誤差欄位單位：%%）" % (
+            report["summary"]["within_10pct_summary"],
+            report["summary"]["total_loss"],
+        ),
+        "",
+        "| ratio | slider | target | actual | 誤差(%%) | ≤10%% |",
+        "|-------|--------|--------|--------|----------|-------|",
+    ]
+    for r in report["rows"]:
+        err = "%.2f%%" % r["error_pct"] if r["error_pct"] is not None else "—"
+        ok = "✓" if r.get("within_10pct") else "✗" if r.get("within_10pct") is False else "—"
+        lines.append("| %s | %s | %s | %s | %s | %s |" % (
+            r["ratio"],
+            r["slider"],
+            r["target"] if r["target"] is not None else "—",
+            r["actual"] if r["actual"] is not None else "—",
+            err,
+            ok,
+        ))
+    return lines
+
+
+def _main_all_screenshots(args):
+    """--all-screenshots：round 目錄內每張截圖各出一份報告，MediaPipe 以 extract_ratios_batch 一次處理。"""
+    round_dir = Path(args.experiment_dir)
+    target_ratios, source_image = get_target_ratios_from_experiment(round_dir)
+    if target_ratios is None:
+        raise SystemExit("No target_mediapipe_*.json in %s" % round_dir)
+    screenshots = get_screenshots_from_experiment(round_dir)
+    if not screenshots:
+        raise SystemExit("No screenshot in %s/screenshots" % round_dir)
+    from extract_face_ratios import extract_ratios_batch
+    source_label = source_image or "target_mediapipe (from experiment)"
+    reports = []
+    failed = []
+    for res in extract_ratios_batch(screenshots, workers=args.workers):
+        if res["ratios"] is None:
+            failed.append({"screenshot": res["path"], "error": res["error"]})
+            continue
+        reports.append(run_report(target_ratios, res["ratios"], source_label, res["path"]))
+    out_data = {
+        "source": source_label,
+        "threshold_pct": args.threshold,
+        "error_unit": "percent",
+        "reports": [
+            {"screenshot": r["screenshot_label"], "rows": r["rows"], "summary": r["summary"]} for r in reports
+        ],
+        "failed_screenshots": failed,
+    }
+    if args.output:
+        out_stem = args.output.with_suffix("") if args.output.suffix else args.output
+        out_stem.parent.mkdir(parents=True, exist_ok=True)
+        json_path = out_stem.with_suffix(".json")
+        md_path = out_stem.with_suffix(".md")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(out_data, f, indent=2, ensure_ascii=False)
+        print("JSON:", json_path)
+        lines = []
+        for r in reports:
+            lines.extend(_markdown_lines(r, args.threshold))
+            lines.append("")
+        for fl in failed:
+            lines.append("- 無法偵測臉部：%s（%s）" % (fl["screenshot"], fl["error"]))
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        print("Markdown:", md_path)
+    else:
+        print(json.dumps(out_data, indent=2, ensure_ascii=False))
+    for r in reports:
+        print("%s: %s, total_loss %s" % (
+            Path(r["screenshot_label"]).name,
+            r["summary"]["within_10pct_summary"],
+            r["summary"]["total_loss"],
+        ))
+    return 0
+
+
 def main():
     ap = argparse.ArgumentParser(
         description="17 ratio mapping 驗證：原始 JPG vs 遊戲截圖的 MediaPipe 誤差 % 報告（用於評估 mapping 改善）。"
@@ -158,8 +247,15 @@ def main():
     )
     ap.add_argument("-o", "--output", type=Path, default=None, help="報告輸出路徑（不含副檔名，寫入 .json 與 .md）")
     ap.add_argument("--threshold", type=float, default=10.0, help="達標門檻：誤差 ≤ 此值視為通過（預設 10%%）")
+    ap.add_argument("--all-screenshots", action="store_true", help="搭配 --experiment-dir：對目錄內每張截圖各產一份報告（批次 MediaPipe）")
+    ap.add_argument("--workers", type=int, default=0, help="--all-screenshots 時 MediaPipe 平行 process 數（0=依序）")
     args = ap.parse_args()
 
+    if args.all_screenshots:
+        if not args.experiment_dir or not Path(args.experiment_dir).is_dir():
+            raise SystemExit("--all-screenshots requires --experiment-dir <round dir>")
+        return _main_all_screenshots(args)
+
     target_ratios = None
     actual_ratios = None
     source_label = ""
@@ -222,31 +318,7 @@ def main():
         print("JSON:", json_path)
 
         # Markdown 表（誤差一律以百分比 % 表示）
-        lines = [
-            "# 17 ratio mapping 驗證：原始圖 vs 遊戲截圖（誤差單位：%）",
-            "",
-            "- **原始/目標**: %s" % source_label,
-            "- **截圖**: %s" % screenshot_label,
-            "- **達標門檻**: 誤差 ≤ %.0f%%" % args.threshold,
-            "- **摘要**: %s，total_loss = %s（表中誤差欄位單位：%%）" % (
-                report["summary"]["within_10pct_summary"],
-                report["summary"]["total_loss"],
-            ),
-            "",
-            "| ratio | slider | target | actual | 誤差(%%) | ≤10%% |",
-            "|-------|--------|--------|--------|----------|-------|",
-        ]
-        for r in report["rows"]:
-            err = "%.2f%%" % r["error_pct"] if r["error_pct"] is not None else "—"
-            ok = "✓" if r.get("within_10pct") else "✗" if r.get("within_10pct") is False else "—"
-            lines.append("| %s | %s | %s | %s | %s | %s |" % (
-                r["ratio"],
-                r["slider"],
-                r["target"] if r["target"] is not None else "—",
-                r["actual"] if r["actual"] is not None else "—",
-                err,
-                ok,
-            ))
+        lines = _markdown_lines(report, args.threshold)
         with open(md_path, "w", encoding="utf-8") as f:
             f.write("\n".join(lines))
         print("Markdown:", md_path)
@@ -40,20 +40,23 @@ def _run_one_round(
     target_ratios,
     guesses,
     base_card_path,
-    request_file,
+    request_files,
     screenshot_timeout,
     progress_interval,
     map_path,
     run_ts,
+    mediapipe_workers=0,
+    objective=None,
 ):
     """
-    執行一輪：產 N 張卡 → 依序載卡截圖 → MediaPipe×N → 寫入 mediapipe_results.json。
+    執行一輪：產 N 張卡 → 載卡截圖 → MediaPipe×N → 寫入 mediapipe_results.json。
+    三段由 eval_pipeline 以有界佇列重疊執行（各 stage utilisation 寫入 pipeline_stats）。
+    request_files: 載卡請求檔清單；多個遊戲實例時本輪 N 張卡分散到各實例平行截圖。
+    mediapipe_workers: >=2 時 MediaPipe 以 process pool 平行（get_batch_pool）；0/1 為本 process 依序。
+    objective: landmark_loss 的 objective（--objective procrustes）；None 為 ratio loss。
     回傳 (total_loss_per_screenshot, best_index, mediapipe_results_dict)。
     """
-    from read_hs2_card import find_iend_in_bytes
-    from write_face_params_to_card import write_face_params_into_trailing
-    from run_phase1 import request_screenshot_and_wait, _compute_errors_and_loss
-    from extract_face_ratios import extract_ratios
+    from read_hs2_card import find_iend_end
 
     round_dir = exp_dir / ("round_%d" % round_k)
     cards_dir = round_dir / "cards"
@@ -62,66 +65,46 @@ def _run_one_round(
     screenshots_dir.mkdir(parents=True, exist_ok=True)
 
     n = len(guesses)
-    base_bytes = Path(base_card_path).read_bytes()
-    iend = find_iend_in_bytes(base_bytes)
-    if iend is None:
+    if find_iend_end(Path(base_card_path)) is None:
         raise SystemExit("Base card has no trailing data (IEND not found).")
-    base_png = base_bytes[:iend]
-    base_trailing = base_bytes[iend:]
-
-    # 產 N 張卡
-    _out("  [round %d] Producing %d cards..." % (round_k, n))
-    for i, g in enumerate(guesses):
-        result = write_face_params_into_trailing(base_trailing, g)
-        if result is None:
-            raise SystemExit("write_face_params_into_trailing failed for guess %d." % i)
-        new_trailing, _ = result
-        card_path = cards_dir / ("card_%02d_%s.png" % (i, run_ts))
-        with open(card_path, "wb") as f:
-            f.write(base_png)
-            f.write(new_trailing)
-
-    # 依序載卡、截圖
-    _out("  [round %d] Requesting %d screenshots (timeout %ds each)..." % (round_k, n, screenshot_timeout))
-    for i in range(n):
-        card_path = (cards_dir / ("card_%02d_%s.png" % (i, run_ts))).resolve()
-        dest = screenshots_dir / ("screenshot_%02d_%s.png" % (i, run_ts))
-        ok = request_screenshot_and_wait(
-            card_path,
-            Path(request_file),
-            dest,
-            timeout_sec=screenshot_timeout,
-            progress_interval=progress_interval,
-        )
-        if not ok:
-            _out("  WARNING: Screenshot %d timeout; continuing." % i)
 
-    # MediaPipe×N、誤差與 Loss
-    _out("  [round %d] MediaPipe and loss for %d screenshots..." % (round_k, n))
+    # 產卡 → 載卡截圖 → MediaPipe → loss 以 eval_pipeline 重疊執行：遊戲算繪第 i+1 張時 CPU 對第 i 張跑 MediaPipe
+    from eval_pipeline import run_pipeline, format_stage_stats
+    _out("  [round %d] Pipeline: %d cards -> screenshots (timeout %ds each) -> MediaPipe..." % (round_k, n, screenshot_timeout))
+    jobs = [
+        {
+            "params": g,
+            "card_path": cards_dir / ("card_%02d_%s.png" % (i, run_ts)),
+            "screenshot_path": screenshots_dir / ("screenshot_%02d_%s.png" % (i, run_ts)),
+            "run_ts": run_ts,
+        }
+        for i, g in enumerate(guesses)
+    ]
+    results, pipeline_stats = run_pipeline(
+        jobs, target_ratios, base_card_path, list(request_files),
+        screenshot_timeout=screenshot_timeout, progress_interval=progress_interval, score_workers=mediapipe_workers,
+        objective=objective,
+    )
+    for line in format_stage_stats(pipeline_stats):
+        _out("  [round %d] %s" % (round_k, line))
     screenshot_entries = []
     total_losses = []
-    for i in range(n):
-        path = screenshots_dir / ("screenshot_%02d_%s.png" % (i, run_ts))
-        entry = {"path": str(path), "index": i}
-        if not path.exists():
-            entry["face_ratios"] = None
-            entry["errors_percent"] = None
-            entry["loss_contributions"] = None
-            entry["total_loss"] = None
-            total_losses.append(None)
-            screenshot_entries.append(entry)
-            continue
-        try:
-            actual_ratios = extract_ratios(path)
-            errors, contributions, total_loss = _compute_errors_and_loss(target_ratios, actual_ratios)
-            entry["face_ratios"] = actual_ratios
-            entry["errors_percent"] = errors
-            entry["loss_contributions"] = contributions
-            entry["total_loss"] = round(total_loss, 4)
-            total_losses.append(total_loss)
-        except Exception as e:
+    for i, res in enumerate(results):
+        if res["error"] and res["error"].startswith("card write failed"):
+            raise SystemExit("write_face_params_into_trailing failed for guess %d (%s)." % (i, res["error"]))
+        if res["error"] == "screenshot timeout":
+            _out("  WARNING: Screenshot %d timeout; continuing." % i)
+        entry = {"path": res["screenshot_path"], "index": i}
+        if res["ok"]:
+            entry["face_ratios"] = res["face_ratios"]
+            entry["errors_percent"] = res["errors_percent"]
+            entry["loss_contributions"] = res["loss_contributions"]
+            entry["total_loss"] = round(res["total_loss"], 4)
+            total_losses.append(res["total_loss"])
+        else:
             entry["face_ratios"] = None
-            entry["error"] = str(e)
+            if res["error"] != "screenshot timeout":
+                entry["error"] = res["error"]
             entry["errors_percent"] = None
             entry["loss_contributions"] = None
             entry["total_loss"] = None
@@ -134,9 +117,12 @@ def _run_one_round(
 
     mediapipe_results = {
         "target_ratios": target_ratios,
+        "base_card": str(Path(base_card_path).resolve()),
         "screenshots": screenshot_entries,
         "best_index": best_index,
         "total_losses": total_losses,
+        "pipeline_stats": pipeline_stats,
+        "objective": getattr(objective, "name", "ratios"),
     }
     if valid_losses:
         best_loss = total_losses[best_index]
@@ -168,12 +154,23 @@ def main():
     ap.add_argument("--ready-timeout", type=int, default=180, help="等待 game_ready.txt 逾時秒數")
     ap.add_argument("--ready-file", type=Path, default=None, help="就緒檔路徑，預設請求檔同目錄 game_ready.txt")
     ap.add_argument("--n-guesses", type=int, default=10, help="每輪猜測數 N（預設 10，黑盒子 stub 產 100%%～109%%）")
+    ap.add_argument("--strategy", choices=("stub", "cmaes"), default="stub", help="黑盒子策略：stub（100%%～109%% 縮放）或 cmaes（每輪 N 組為 CMA-ES 一代）")
+    ap.add_argument("--sigma0", type=float, default=0.2, help="cmaes 初始步長（game_slider_range 比例，預設 0.2）")
+    ap.add_argument("--instances", type=int, default=0, help="遊戲實例數 N：使用 <output-dir>/instance_<i>/load_card_request.txt，每輪平行截圖；0 = 單一 --request-file")
+    ap.add_argument("--mediapipe-workers", type=int, default=0, help="每輪 MediaPipe 平行 process 數（0=本 process 依序，>=2 用 process pool）")
+    ap.add_argument("--objective", choices=("ratios", "procrustes"), default="ratios", help="loss：ratios = 17 個 ratio（預設）；procrustes = 全 landmark 相似對齊後的分區殘差（landmark_loss.py）")
+    ap.add_argument("--objective-weights", type=str, default=None, help="procrustes 的區域權重，例如 face_oval=2,lips=1")
     args = ap.parse_args()
 
     if not args.target_image.exists():
         raise SystemExit("Target image not found: %s" % args.target_image)
     if not args.base_card.exists():
         raise SystemExit("Base card not found: %s" % args.base_card)
+    from landmark_loss import make_objective
+    try:
+        objective = make_objective(args.objective, args.target_image, args.objective_weights)
+    except ValueError as e:
+        raise SystemExit("Objective %s: %s" % (args.objective, e))
 
     from extract_face_ratios import extract_ratios
     from ratio_to_slider import face_ratios_to_params
@@ -181,9 +178,13 @@ def main():
     from blackbox import get_next_guesses
 
     output_dir = Path(args.output_dir)
-    request_file = Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"
-    ready_file = Path(args.ready_file) if args.ready_file else request_file.parent / "game_ready.txt"
-    request_file.parent.mkdir(parents=True, exist_ok=True)
+    if args.instances > 0:
+        request_files = [output_dir / ("instance_%d" % i) / "load_card_request.txt" for i in range(args.instances)]
+    else:
+        request_files = [Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"]
+    ready_file = Path(args.ready_file) if args.ready_file else request_files[0].parent / "game_ready.txt"
+    for rf in request_files:
+        rf.parent.mkdir(parents=True, exist_ok=True)
 
     run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     experiment_id = args.experiment_id or ("exp_%s" % run_ts)
@@ -194,8 +195,8 @@ def main():
     _out("--- run_experiment ---")
     _out("  experiment_id: %s" % experiment_id)
     _out("  output: %s" % exp_dir.resolve())
-    _out("  request_file: %s" % request_file.resolve())
-    _out("  n_guesses: %d" % args.n_guesses)
+    _out("  request files: %s" % ", ".join(str(rf.resolve()) for rf in request_files))
+    _out("  n_guesses: %d, strategy: %s" % (args.n_guesses, args.strategy))
     _out("")
 
     # 可選：啟動遊戲並等 game_ready.txt
@@ -214,9 +215,11 @@ def main():
             raise SystemExit("Game ready timeout. Plugin writes %s when in CharaCustom." % ready_file)
         _out("  Game ready.")
     else:
-        _out("[0] Waiting for game ready: %s (timeout %ds)..." % (ready_file, args.ready_timeout))
-        if not wait_for_ready_file(ready_file, args.ready_timeout, args.progress_interval):
-            raise SystemExit("Game ready timeout. Start HS2 first or use --launch-game.")
+        ready_files = [ready_file] if args.instances <= 0 else [rf.parent / "game_ready.txt" for rf in request_files]
+        for rdy in ready_files:
+            _out("[0] Waiting for game ready: %s (timeout %ds)..." % (rdy, args.ready_timeout))
+            if not wait_for_ready_file(rdy, args.ready_timeout, args.progress_interval):
+                raise SystemExit("Game ready timeout. Start HS2 first or use --launch-game.")
         _out("  Game ready.")
     _out("")
 
@@ -255,6 +258,8 @@ def main():
                 experiment_id=experiment_id,
                 map_path=str(args.map),
                 input_params=one_params,
+                strategy=args.strategy,
+                sigma0=args.sigma0,
             )
         else:
             guesses = get_next_guesses(
@@ -264,6 +269,8 @@ def main():
                 base_card_path=str(args.base_card),
                 experiment_id=experiment_id,
                 map_path=str(args.map),
+                strategy=args.strategy,
+                sigma0=args.sigma0,
             )
         if not guesses:
             _out("  No guesses from blackbox; exiting.")
@@ -279,11 +286,13 @@ def main():
             target_ratios,
             guesses,
             args.base_card,
-            request_file,
+            request_files,
             args.screenshot_timeout,
             args.progress_interval,
             args.map,
             run_ts,
+            mediapipe_workers=args.mediapipe_workers,
+            objective=objective,
         )
 
         # 供下一輪黑盒子使用
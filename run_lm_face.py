@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Levenberg–Marquardt 臉型優化：有限差分估 ratio × slider 的 Jacobian，再走阻尼 Gauss–Newton 步。
+blackbox.get_next_guesses 只把輸入縮放 100%～109%，不知道每個 slider 怎麼動每個 ratio；一次一維掃描每輪要 16 維 × 數個點。
+這裡每一輪只有一批卡：
+
+  Jacobian   起點 x0 + 每個 slider 各擾動 h 一張（16 張同一批，--instances 個遊戲實例平行截圖）
+  LM 步      (JᵀJ + λ·diag(JᵀJ)) δ = −Jᵀr，一批同時試數個 λ（λ/4、λ、4λ…，每個實例一張），取殘差平方和最小者
+  更新       接受時 λ 變小、以 Broyden rank-1 更新 J；失敗時 λ 變大，連續失敗或每 --refresh-every 步重估 Jacobian
+
+殘差 r_k = (actual_k − target_k) / |target_k| × 100（帶號的百分比誤差，total_loss 的 e 去掉絕對值）；
+最佳解依 run_phase1 的 total_loss 選。所有評估經 eval_pipeline（先查 eval_cache）寫入實驗目錄下 iter_<k>/… 的 trial 目錄。
+產出（實驗目錄 <output-dir>/experiments/<experiment_id>/，experiment_id 預設 lm_<run_ts>）：
+best_params_lm_<run_ts>.json、lm_history_<run_ts>.json、manifest_<run_ts>.json。
+會動到 HS2 時一鍵還原：python hs2_photo_to_card_config.py restore --hs2-root <路徑>
+"""
+import json
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from run_optuna_face import get_slider_names, load_game_slider_range, _out, _fix_console_encoding
+
+BASE = Path(__file__).resolve().parent
+
+
+def residual_vector(target_ratios, actual_ratios, names, epsilon=1e-9):
+    """帶號百分比誤差向量（順序同 names）；actual 缺 key 時 None。"""
+    r = []
+    for k in names:
+        if k not in actual_ratios:
+            return None
+        t = target_ratios[k]
+        r.append((actual_ratios[k] - t) / max(abs(t), epsilon) * 100.0)
+    return np.asarray(r, dtype=np.float64)
+
+
+def _to_params(x, slider_names, base_params):
+    params = dict(base_params)
+    for name, v in zip(slider_names, x):
+        params[name] = round(float(v), 2)
+    return params
+
+
+def lm_step(J, r, lam, lo, hi, x):
+    """Marquardt 縮放的阻尼 Gauss–Newton 步，結果夾在 [lo, hi] 內；回傳新的 x。"""
+    JtJ = J.T @ J
+    d = np.diag(JtJ).copy()
+    d[d < 1e-9 * max(d.max(), 1e-12)] = max(d.max(), 1.0) * 1e-6  # 沒有反應的 slider 仍給一點阻尼，避免奇異
+    delta = np.linalg.solve(JtJ + lam * np.diag(d), -J.T @ r)
+    return np.clip(x + delta, lo, hi)
+
+
+def broyden_update(J, dx, dr):
+    """Broyden rank-1：J ← J + (dr − J dx) dxᵀ / (dxᵀ dx)。"""
+    denom = float(dx @ dx)
+    if denom <= 1e-12:
+        return J
+    return J + np.outer(dr - J @ dx, dx) / denom
+
+
+def optimize_lm(x0, slider_names, base_params, evaluate_batch, lo, hi, fd_step=10.0, lam0=1.0,
+                max_iters=10, refresh_every=4, lambdas_per_batch=3, tol=1e-3, on_iter=None):
+    """
+    evaluate_batch(list of params dicts, tag) → list of (total_loss, residual or None)，同一批平行評估。
+    回傳 {"best_x", "best_loss", "best_ssr", "history", "batches", "evaluations"}。
+    """
+    x = np.clip(np.asarray(x0, dtype=np.float64), lo, hi)
+    n = len(x)
+    history = []
+    n_batches = 0
+    n_evals = 0
+
+    def run(xs, tag):
+        nonlocal n_batches, n_evals
+        n_batches += 1
+        n_evals += len(xs)
+        return evaluate_batch([_to_params(v, slider_names, base_params) for v in xs], tag)
+
+    def jacobian(x, r, tag):
+        """每個 slider 一張擾動卡；超出上界時改往下擾動。失敗的欄填 0（下一次重估再補）。"""
+        steps = np.where(x + fd_step <= hi, fd_step, -fd_step)
+        xs = [x + steps[i] * np.eye(n)[i] for i in range(n)]
+        res = run(xs, tag)
+        J = np.zeros((len(r), n))
+        for i, (_, ri) in enumerate(res):
+            if ri is not None:
+                J[:, i] = (ri - r) / steps[i]
+        return J
+
+    (loss, r), = run([x], "iter_00/start")
+    if r is None:
+        raise RuntimeError("Start point evaluation failed (screenshot timeout or no face).")
+    ssr = float(r @ r)
+    best = {"x": x.copy(), "loss": loss, "ssr": ssr}
+    J = jacobian(x, r, "iter_00/jacobian")
+    lam = float(lam0)
+    since_refresh = 0
+    fails = 0
+    history.append({"iter": 0, "loss": round(loss, 4), "ssr": round(ssr, 4), "lambda": lam, "jacobian": "finite difference"})
+    for it in range(1, max_iters + 1):
+        lams = [lam * (4.0 ** (k - (lambdas_per_batch - 1) // 2)) for k in range(max(1, lambdas_per_batch))]
+        cands = [lm_step(J, r, l, lo, hi, x) for l in lams]
+        res = run(cands, "iter_%02d/step" % it)
+        scored = [(float(ri @ ri), li, xi, ri, lossi) for (lossi, ri), li, xi in zip(res, lams, cands) if ri is not None]
+        entry = {"iter": it, "lambdas": [round(l, 6) for l in lams]}
+        if scored and min(scored, key=lambda s: s[0])[0] < ssr:
+            new_ssr, lam_used, x_new, r_new, loss_new = min(scored, key=lambda s: s[0])
+            rel = (ssr - new_ssr) / max(ssr, 1e-12)
+            J = broyden_update(J, x_new - x, r_new - r)
+            x, r, ssr = x_new, r_new, new_ssr
+            lam = max(lam_used / 4.0, 1e-6)
+            fails = 0
+            since_refresh += 1
+            entry.update(accepted=True, loss=round(loss_new, 4), ssr=round(ssr, 4), rel_improvement=round(rel, 5))
+            if loss_new < best["loss"]:
+                best = {"x": x.copy(), "loss": loss_new, "ssr": ssr}
+        else:
+            lam = lam * 16.0
+            fails += 1
+            rel = None
+            entry.update(accepted=False, loss=None, ssr=round(ssr, 4))
+        if fails >= 2 or since_refresh >= refresh_every:
+            J = jacobian(x, r, "iter_%02d/jacobian" % it)
+            entry["jacobian"] = "finite difference"
+            since_refresh = 0
+            fails = 0
+        entry["lambda"] = round(lam, 6)
+        history.append(entry)
+        if on_iter is not None:
+            on_iter(entry)
+        if rel is not None and rel < tol:
+            break
+        if lam > 1e8:
+            break
+    return {
+        "best_x": best["x"], "best_loss": best["loss"], "best_ssr": best["ssr"],
+        "history": history, "batches": n_batches, "evaluations": n_evals,
+    }
+
+
+def main():
+    _fix_console_encoding()
+    ap = argparse.ArgumentParser(
+        description="Levenberg–Marquardt face optimization: finite-difference Jacobian in one batch of cards, then damped Gauss–Newton steps."
+    )
+    ap.add_argument("--target-image", type=Path, required=True, help="目標臉孔圖路徑")
+    ap.add_argument("--base-card", type=Path, required=True, help="基底 HS2 角色卡路徑")
+    ap.add_argument("--output-dir", type=Path, default=BASE / "output", help="輸出根目錄")
+    ap.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="ratio_to_slider_map.json")
+    ap.add_argument("--request-file", type=Path, default=None, help="載卡請求檔，預設 <output-dir>/load_card_request.txt")
+    ap.add_argument("--instances", type=int, default=0, help="遊戲實例數 N：使用 <output-dir>/instance_<i>/load_card_request.txt，每批平行截圖；0 = 單一 --request-file")
+    ap.add_argument("--ready-timeout", type=int, default=180, help="等待 game_ready.txt 逾時秒數")
+    ap.add_argument("--screenshot-timeout", type=int, default=120, help="每張截圖等待秒數")
+    ap.add_argument("--progress-interval", type=int, default=10, help="等待截圖時每隔 N 秒印進度")
+    ap.add_argument("--experiment-id", type=str, default=None, help="實驗 ID，預設 lm_<timestamp>")
+    ap.add_argument("--knn-index", type=Path, default=None, metavar="NPZ", help="face_knn.py build 產生的索引；以最接近目標 ratio 的既有卡當 base card 與起點")
+    ap.add_argument("--knn-k", type=int, default=5, help="k-NN 候選數（記錄於 knn_start_*.json）")
+    ap.add_argument("--max-iters", type=int, default=10, help="LM 步數上限（每步一批卡）")
+    ap.add_argument("--fd-step", type=float, default=10.0, help="有限差分擾動量（遊戲單位，預設 10；太小會被 MediaPipe 雜訊淹沒）")
+    ap.add_argument("--refresh-every", type=int, default=4, help="每接受幾步重估一次完整 Jacobian（其間用 Broyden 更新）")
+    ap.add_argument("--lambda0", type=float, default=1.0, help="初始阻尼 λ")
+    ap.add_argument("--lambdas-per-batch", type=int, default=None, help="每步同批試幾個 λ（預設 max(3, --instances)）")
+    args = ap.parse_args()
+
+    if not args.target_image.exists():
+        raise SystemExit("Target image not found: %s" % args.target_image)
+    if not args.base_card.exists():
+        raise SystemExit("Base card not found: %s" % args.base_card)
+
+    from extract_face_ratios import extract_ratios
+    from ratio_to_slider import face_ratios_to_params
+    from run_phase1 import wait_for_ready_file
+    from evaluate_face_guess import evaluate_guesses_and_record, FAIL_LOSS
+
+    output_dir = Path(args.output_dir)
+    if args.instances > 0:
+        request_files = [output_dir / ("instance_%d" % i) / "load_card_request.txt" for i in range(args.instances)]
+    else:
+        request_files = [Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"]
+    for rf in request_files:
+        rf.parent.mkdir(parents=True, exist_ok=True)
+
+    run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    experiment_id = args.experiment_id or ("lm_%s" % run_ts)
+    exp_dir = output_dir / "experiments" / experiment_id
+    exp_dir.mkdir(parents=True, exist_ok=True)
+    slider_names = get_slider_names(args.map)
+    g_min, g_max = load_game_slider_range(args.map)
+    lambdas_per_batch = args.lambdas_per_batch or max(3, args.instances)
+
+    _out("--- run_lm_face (Levenberg–Marquardt) ---")
+    _out("  experiment_id: %s" % experiment_id)
+    _out("  output: %s" % exp_dir.resolve())
+    _out("  request files: %s" % ", ".join(str(rf) for rf in request_files))
+    _out("  sliders: %d, fd step %.1f, max iters %d, %d lambdas per batch" % (len(slider_names), args.fd_step, args.max_iters, lambdas_per_batch))
+    _out("")
+
+    for rf in request_files:
+        ready_file = rf.parent / "game_ready.txt"
+        _out("[0] Waiting for game ready: %s (timeout %ds)..." % (ready_file, args.ready_timeout))
+        if not wait_for_ready_file(ready_file, args.ready_timeout, args.progress_interval):
+            raise SystemExit("Game ready timeout. Start HS2 first.")
+    _out("")
+
+    _out("[1] Target face ratios -> start params...")
+    target_ratios = extract_ratios(args.target_image)
+    start_params = face_ratios_to_params(target_ratios, args.map)
+    from face_knn import resolve_start
+    base_card, start_params = resolve_start(
+        args.knn_index, args.knn_k, target_ratios, slider_names, args.base_card, start_params, exp_dir, run_ts
+    )
+    with open(exp_dir / ("target_mediapipe_%s.json" % run_ts), "w", encoding="utf-8") as f:
+        json.dump({"source_image": str(args.target_image), "face_ratios": target_ratios}, f, indent=2, ensure_ascii=False)
+    ratio_names = list(target_ratios.keys())
+    _out("")
+
+    counters = {}
+
+    def evaluate_batch(guesses, tag):
+        k = counters.get(tag, 0)
+        counters[tag] = k + len(guesses)
+        trial_dirs = [exp_dir / tag / ("card_%02d" % (k + i)) for i in range(len(guesses))]
+        ratios = [None] * len(guesses)
+
+        def on_result(res):
+            ratios[res["index"]] = res["face_ratios"]
+
+        t0 = time.perf_counter()
+        losses, stats = evaluate_guesses_and_record(
+            guesses, target_ratios, base_card, request_files, trial_dirs, run_ts,
+            args.screenshot_timeout, args.progress_interval, on_result=on_result,
+        )
+        _out("  %s: %d cards in %.1fs (%d eval cache hits)" % (tag, len(guesses), time.perf_counter() - t0, stats.get("cache_hits", 0)))
+        out = []
+        for loss, rat in zip(losses, ratios):
+            r = residual_vector(target_ratios, rat, ratio_names) if rat else None
+            out.append((float(loss) if r is not None else FAIL_LOSS, r))
+        return out
+
+    def on_iter(entry):
+        if entry.get("accepted"):
+            _out("  [iter %d] accepted: loss %.4f, ssr %.2f (-%.1f%%), lambda -> %.4g%s" % (
+                entry["iter"], entry["loss"], entry["ssr"], entry["rel_improvement"] * 100, entry["lambda"],
+                ", Jacobian refreshed" if entry.get("jacobian") else ""))
+        else:
+            _out("  [iter %d] rejected (ssr stays %.2f), lambda -> %.4g%s" % (
+                entry["iter"], entry["ssr"], entry["lambda"], ", Jacobian refreshed" if entry.get("jacobian") else ""))
+
+    _out("[2] LM: start point + Jacobian (%d perturbed cards)..." % len(slider_names))
+    x0 = [start_params.get(name, 0.0) for name in slider_names]
+    t0 = time.perf_counter()
+    try:
+        result = optimize_lm(
+            x0, slider_names, start_params, evaluate_batch, g_min, g_max, fd_step=args.fd_step, lam0=args.lambda0,
+            max_iters=args.max_iters, refresh_every=args.refresh_every, lambdas_per_batch=lambdas_per_batch, on_iter=on_iter,
+        )
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    elapsed = time.perf_counter() - t0
+    best_params = _to_params(result["best_x"], slider_names, start_params)
+    _out("  best loss %.4f after %d batches / %d cards (%.0fs)" % (result["best_loss"], result["batches"], result["evaluations"], elapsed))
+    _out("")
+
+    experiment_params = {
+        "fd_step": args.fd_step,
+        "max_iters": args.max_iters,
+        "refresh_every": args.refresh_every,
+        "lambda0": args.lambda0,
+        "lambdas_per_batch": lambdas_per_batch,
+        "instances": len(request_files),
+    }
+    out_best = exp_dir / ("best_params_lm_%s.json" % run_ts)
+    with open(out_best, "w", encoding="utf-8") as f:
+        json.dump({
+            "experiment_id": experiment_id,
+            "run_ts": run_ts,
+            "best_params": best_params,
+            "best_loss": round(result["best_loss"], 4),
+            "best_residual_ssr": round(result["best_ssr"], 4),
+            "batches": result["batches"],
+            "total_cards_evaluated": result["evaluations"],
+            "elapsed_sec": round(elapsed, 1),
+            "experiment_params": experiment_params,
+        }, f, indent=2, ensure_ascii=False)
+    history_path = exp_dir / ("lm_history_%s.json" % run_ts)
+    with open(history_path, "w", encoding="utf-8") as f:
+        json.dump(result["history"], f, indent=2, ensure_ascii=False)
+    manifest_path = exp_dir / ("manifest_%s.json" % run_ts)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "experiment_id": experiment_id,
+            "run_ts": run_ts,
+            "output_files": {
+                "best_params": out_best.name,
+                "history": history_path.name,
+                "target_mediapipe": "target_mediapipe_%s.json" % run_ts,
+                "layout": "iter_<k>/{start,jacobian,step}/card_<i>/ contains cards/, screenshots/, comparison_<run_ts>.json",
+            },
+            "experiment_params": experiment_params,
+        }, f, indent=2, ensure_ascii=False)
+    _out("  Best params written: %s" % out_best)
+    _out("  Manifest: %s" % manifest_path)
+    _out("--- run_lm_face done ---")
+    _out("  One-click restore HS2 config: python hs2_photo_to_card_config.py restore --hs2-root <HS2_path>")
+
+
+if __name__ == "__main__":
+    main()
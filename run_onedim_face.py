@@ -5,6 +5,11 @@
 沿用 run_optuna_face、evaluate_face_guess 與既有模組。
 會動到 HS2 時一鍵還原：python hs2_photo_to_card_config.py restore --hs2-root <路徑>
 見 docs/臉型優化_一次一維_計畫.md
+續跑：每次評估記錄於 <exp_dir>/evaluations.jsonl（study_store），當掉後以同一個 --experiment-id 重跑，
+已評估的點直接重播不再截圖；--from-experiment 另以舊實驗已評估點中對新目標 loss 最低者當起點（暖啟動）。
+掃描順序：每維由中心往兩側，每批最多 --instances 張平行截圖；某一側 loss 高於本維最佳超過 --stop-tolerance 即停止該側
+（loss 曲線單峰時，最低點另一側不必再看）。第 2 輪起依上一輪量到的敏感度（該維 loss 最大−最小）排序，
+低影響的維放最後，--skip-insensitive 可直接略過。
 """
 import json
 import argparse
@@ -22,7 +27,7 @@ from run_optuna_face import (
     _out,
     _fix_console_encoding,
 )
-from evaluate_face_guess import evaluate_one_guess_and_record, FAIL_LOSS
+from evaluate_face_guess import evaluate_guesses_and_record, FAIL_LOSS
 
 
 def _values_for_dim(center_val, range_k, step_k, g_min, g_max):
@@ -45,6 +50,55 @@ def _values_for_dim(center_val, range_k, step_k, g_min, g_max):
     return points if points else [round(center_val, 2)]
 
 
+def _sweep_dimension(values, center_val, evaluate_batch, width=1, stop_tolerance=0.02, allowed=None):
+    """
+    由中心往兩側掃描 values（_values_for_dim 的結果）。
+    evaluate_batch([index, ...]) → [loss, ...]；每批最多 width 個點，左右兩側輪流取點。
+    stop_tolerance: 某側最新一點的 loss > 本維最佳 × (1 + stop_tolerance) 時停止該側；None = 全部掃完。
+    allowed: 只評估這些 index（surrogate 篩選）；None = 全部。
+    回傳 {index: loss}（只含評估過的點）。
+    """
+    from evaluate_face_guess import FAIL_LOSS
+    center_idx = min(range(len(values)), key=lambda i: abs(values[i] - center_val))
+    sides = [list(range(center_idx - 1, -1, -1)), list(range(center_idx + 1, len(values)))]
+    if allowed is not None:
+        sides = [[i for i in side if i in allowed] for side in sides]
+    pending = [center_idx] if allowed is None or center_idx in allowed else []
+    active = [bool(side) for side in sides]
+    last = [None, None]
+    turn = 0
+    losses = {}
+    width = max(1, int(width))
+    while pending or any(active):
+        batch = pending[:width]
+        pending = pending[width:]
+        while len(batch) < width and any(active):
+            if active[turn % 2]:
+                idx = sides[turn % 2].pop(0)
+                batch.append(idx)
+                last[turn % 2] = idx
+                active[turn % 2] = bool(sides[turn % 2])
+            turn += 1
+        for idx, loss in zip(batch, evaluate_batch(batch)):
+            losses[idx] = loss
+        valid = [L for L in losses.values() if L < FAIL_LOSS]
+        if stop_tolerance is None or not valid:
+            continue
+        limit = min(valid) * (1 + stop_tolerance)
+        for k in (0, 1):
+            if active[k] and last[k] is not None and limit < losses.get(last[k], FAIL_LOSS) < FAIL_LOSS:
+                active[k] = False
+                sides[k] = []
+    return losses
+
+
+def _dimension_sensitivity(losses):
+    """該維評估點 loss 的最大−最小（失敗點除外）；少於 2 點時 0。"""
+    from evaluate_face_guess import FAIL_LOSS
+    valid = [L for L in losses.values() if L < FAIL_LOSS]
+    return (max(valid) - min(valid)) if len(valid) >= 2 else 0.0
+
+
 def main():
     _fix_console_encoding()
     ap = argparse.ArgumentParser(
@@ -55,12 +109,13 @@ def main():
     ap.add_argument("--output-dir", type=Path, default=BASE / "output", help="輸出根目錄")
     ap.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="ratio_to_slider_map.json")
     ap.add_argument("--request-file", type=Path, default=None, help="載卡請求檔，預設 <output-dir>/load_card_request.txt")
+    ap.add_argument("--instances", type=int, default=0, help="遊戲實例數 N：使用 <output-dir>/instance_<i>/load_card_request.txt，每維候選點每批 N 張平行截圖；0 = 單一 --request-file")
     ap.add_argument("--launch-game", type=Path, default=None, metavar="EXE", help="啟動 HS2 執行檔路徑")
     ap.add_argument("--ready-timeout", type=int, default=180, help="等待 game_ready.txt 逾時秒數")
     ap.add_argument("--screenshot-timeout", type=int, default=120, help="每張截圖等待秒數")
     ap.add_argument("--progress-interval", type=int, default=10, help="等待截圖時每隔 N 秒印進度")
     ap.add_argument("--post-screenshot-delay", type=float, default=0, help="每張截圖成功後延遲 N 秒再發下一個請求（0=不延遲；若中段開始常 timeout 可試 2～5 秒）")
-    ap.add_argument("--experiment-id", type=str, default=None, help="實驗 ID，預設 onedim_<timestamp>")
+    ap.add_argument("--experiment-id", type=str, default=None, help="實驗 ID，預設 onedim_<timestamp>；指定既有 ID 時從其 evaluations.jsonl 續跑")
     # 一次一維可調參數
     ap.add_argument("--rounds", type=int, default=2, help="要做幾輪一維掃描（預設 2）")
     ap.add_argument("--range1", type=float, default=90, help="第 1 輪每維 ± 半寬（預設 90）")
@@ -69,7 +124,16 @@ def main():
     ap.add_argument("--step2", type=float, default=15, help="第 2 輪一維步長（預設 15）")
     ap.add_argument("--range3", type=float, default=10, help="第 3 輪每維 ± 半寬（預設 10，rounds>=3 時使用）")
     ap.add_argument("--step3", type=float, default=5, help="第 3 輪一維步長（預設 5，rounds>=3 時使用）")
-    ap.add_argument("--from-experiment", type=Path, default=None, metavar="JSON", help="從先前實驗的 manifest_*.json 或 best_params_onedim_*.json 讀取 rounds、range_per_round、step_per_round 作為本輪參數")
+    ap.add_argument("--from-experiment", type=Path, default=None, metavar="JSON", help="從先前實驗的 manifest_*.json 或 best_params_onedim_*.json 讀取 rounds、range_per_round、step_per_round 作為本輪參數，並以該實驗已評估點中對新目標最佳者為起點")
+    ap.add_argument("--knn-index", type=Path, default=None, metavar="NPZ", help="face_knn.py build 產生的索引；以最接近目標 ratio 的既有卡當 base card 與起點（找不到時退回 --base-card）")
+    ap.add_argument("--knn-k", type=int, default=5, help="k-NN 候選數（記錄於 knn_start_*.json）")
+    ap.add_argument("--surrogate-keep", type=int, default=0, help="以同一 base card 的歷史評估訓練代理模型（surrogate.py），每維只送預測 loss 最低的 K 個點截圖（0=不篩）")
+    ap.add_argument("--surrogate-min-train", type=int, default=30, help="訓練點數達此值才開始篩選")
+    ap.add_argument("--stop-tolerance", type=float, default=0.02, help="某側 loss 高於本維最佳超過此比例即停止該側（預設 0.02，雜訊門檻）")
+    ap.add_argument("--full-sweep", action="store_true", help="不提前停止，每維所有點都評估（舊行為）")
+    ap.add_argument("--objective", choices=("ratios", "procrustes"), default="ratios", help="loss：ratios = 17 個 ratio（預設）；procrustes = 全 landmark 相似對齊後的分區殘差（landmark_loss.py）")
+    ap.add_argument("--objective-weights", type=str, default=None, help="procrustes 的區域權重，例如 face_oval=2,lips=1")
+    ap.add_argument("--skip-insensitive", type=float, default=0.0, metavar="FRAC", help="第 2 輪起略過敏感度低於最大敏感度 × FRAC 的維（預設 0 = 不略過，只排最後）")
     args = ap.parse_args()
 
     # 未指定 --launch-game 時，改讀環境變數 HS2_EXE 或專案內 hs2_launch_path.txt（一行：exe 路徑）
@@ -124,20 +188,47 @@ def main():
         raise SystemExit("Target image not found: %s" % args.target_image)
     if not args.base_card.exists():
         raise SystemExit("Base card not found: %s" % args.base_card)
+    if args.surrogate_keep > 0 and args.objective != "ratios":
+        raise SystemExit("--surrogate-keep predicts the ratio loss; it cannot be combined with --objective %s." % args.objective)
 
     from extract_face_ratios import extract_ratios
     from ratio_to_slider import face_ratios_to_params
     from run_phase1 import wait_for_ready_file
 
     output_dir = Path(args.output_dir)
-    request_file = Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"
-    ready_file = request_file.parent / "game_ready.txt"
-    request_file.parent.mkdir(parents=True, exist_ok=True)
+    if args.instances > 0:
+        request_files = [output_dir / ("instance_%d" % i) / "load_card_request.txt" for i in range(args.instances)]
+    else:
+        request_files = [Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"]
+    ready_file = request_files[0].parent / "game_ready.txt"
+    for rf in request_files:
+        rf.parent.mkdir(parents=True, exist_ok=True)
+
+    from study_store import (
+        load_run_state, save_run_state, EvaluationJournal, experiment_dir_of, load_evaluated_points, rescore_points,
+    )
 
     run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     experiment_id = args.experiment_id or ("onedim_%s" % run_ts)
     exp_dir = output_dir / "experiments" / experiment_id
     exp_dir.mkdir(parents=True, exist_ok=True)
+    state = load_run_state(exp_dir)
+    if state is not None:
+        # 續跑：沿用第一次執行的 run_ts（檔名）、起點與 base card，一維掃描依序重播
+        if Path(state["target_image"]).resolve() != args.target_image.resolve():
+            raise SystemExit("Experiment %s was started for %s; use a new --experiment-id for another target." % (
+                experiment_id, state["target_image"]))
+        if state.get("objective", "ratios") != args.objective or state.get("objective_weights") != args.objective_weights:
+            raise SystemExit("Experiment %s uses --objective %s (weights %s); recorded losses are not comparable." % (
+                experiment_id, state.get("objective", "ratios"), state.get("objective_weights")))
+        run_ts = state["run_ts"]
+    journal = EvaluationJournal(exp_dir)
+
+    from landmark_loss import make_objective
+    try:
+        objective = make_objective(args.objective, args.target_image, args.objective_weights)
+    except ValueError as e:
+        raise SystemExit("Objective %s: %s" % (args.objective, e))
 
     slider_names = get_slider_names(args.map)
     g_min, g_max = load_game_slider_range(args.map)
@@ -148,7 +239,7 @@ def main():
     step_list = [args.step1, args.step2] + [getattr(args, "step3", args.step2)] * max(0, args.rounds - 2)
     range_list = range_list[: args.rounds]
     step_list = step_list[: args.rounds]
-    if getattr(args, "from_experiment", None) and args.from_experiment and args.from_experiment.exists():
+    if getattr(args, "from_experiment", None) and args.from_experiment and args.from_experiment.is_file():
         with open(args.from_experiment, "r", encoding="utf-8") as f:
             prev = json.load(f)
         rounds = int(prev.get("rounds", rounds))
@@ -160,12 +251,13 @@ def main():
     _out("--- run_onedim_face (一次一維) ---")
     _out("  experiment_id: %s" % experiment_id)
     _out("  output: %s" % exp_dir.resolve())
-    _out("  request_file: %s" % request_file.resolve())
+    _out("  request files: %s" % ", ".join(str(rf.resolve()) for rf in request_files))
     if getattr(args, "from_experiment", None) and args.from_experiment:
         _out("  (params from --from-experiment: %s)" % args.from_experiment)
     _out("  rounds: %d" % rounds)
     _out("  range/step per round: %s / %s" % (range_list, step_list))
     _out("  sliders: %d" % len(slider_names))
+    _out("  objective: %s" % args.objective)
     _out("")
 
     # #region agent log
@@ -227,34 +319,84 @@ def main():
             pass
         # #endregion
         _out("[0] 未使用 --launch-game，不會自動啟動 HS2。請先手動啟動 HS2 並進入 CharaCustom，或加上 --launch-game \"<HS2.exe 路徑>\" 由本腳本代為啟動。")
-        _out("[0] Waiting for game ready: %s (timeout %ds)..." % (ready_file, args.ready_timeout))
-        if not wait_for_ready_file(ready_file, args.ready_timeout, args.progress_interval):
-            raise SystemExit("Game ready timeout. Start HS2 first or use --launch-game.")
+        for rf in request_files:
+            rdy = rf.parent / "game_ready.txt"
+            _out("[0] Waiting for game ready: %s (timeout %ds)..." % (rdy, args.ready_timeout))
+            if not wait_for_ready_file(rdy, args.ready_timeout, args.progress_interval):
+                raise SystemExit("Game ready timeout. Start HS2 first or use --launch-game.")
         _out("  Game ready.")
     _out("")
 
     _out("[1] Target face ratios -> start params...")
-    target_ratios = extract_ratios(args.target_image)
-    start_params = face_ratios_to_params(target_ratios, args.map)
-    target_path = exp_dir / ("target_mediapipe_%s.json" % run_ts)
-    with open(target_path, "w", encoding="utf-8") as f:
-        json.dump({"source_image": str(args.target_image), "face_ratios": target_ratios}, f, indent=2, ensure_ascii=False)
     start_params_path = exp_dir / ("start_params_%s.json" % run_ts)
-    with open(start_params_path, "w", encoding="utf-8") as f:
-        json.dump({
+    if state is not None:
+        target_ratios = state["target_ratios"]
+        base_card = Path(state["base_card"])
+        start_params = state["start_params"]
+        _out("  resuming experiment %s (run_ts %s, %d evaluations recorded)" % (experiment_id, run_ts, len(journal)))
+    else:
+        target_ratios = extract_ratios(args.target_image)
+        start_params = face_ratios_to_params(target_ratios, args.map)
+        from face_knn import resolve_start
+        base_card, start_params = resolve_start(
+            args.knn_index, args.knn_k, target_ratios, slider_names, args.base_card, start_params, exp_dir, run_ts
+        )
+        source = "face_knn nearest card (%s)" % base_card if base_card != args.base_card else "face_ratios_to_params from target image MediaPipe ratios"
+        if args.from_experiment:
+            # 暖啟動：舊實驗已評估的點對新目標重算 loss，最佳者當起點（同時沿用其 base card，loss 才可比）
+            prev_dir = experiment_dir_of(args.from_experiment)
+            scored = rescore_points(load_evaluated_points(prev_dir), target_ratios)
+            if scored:
+                warm_loss, warm_params, _ = scored[0]
+                start_params = dict(start_params)
+                start_params.update({name: warm_params[name] for name in slider_names if name in warm_params})
+                prev_state = load_run_state(prev_dir)
+                if not args.knn_index and prev_state and Path(prev_state["base_card"]).exists():
+                    base_card = Path(prev_state["base_card"])
+                source = "warm start: best of %d evaluated points in %s (loss %.4f for this target)" % (len(scored), prev_dir, warm_loss)
+                _out("  %s" % source)
+        target_path = exp_dir / ("target_mediapipe_%s.json" % run_ts)
+        with open(target_path, "w", encoding="utf-8") as f:
+            json.dump({"source_image": str(args.target_image), "face_ratios": target_ratios}, f, indent=2, ensure_ascii=False)
+        with open(start_params_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "run_ts": run_ts,
+                "start_params": dict(start_params),
+                "source": source,
+            }, f, indent=2, ensure_ascii=False)
+        save_run_state(exp_dir, {
+            "experiment_id": experiment_id,
             "run_ts": run_ts,
+            "target_image": str(args.target_image.resolve()),
+            "target_ratios": target_ratios,
+            "base_card": str(Path(base_card).resolve()),
             "start_params": dict(start_params),
-            "source": "face_ratios_to_params from target image MediaPipe ratios",
-        }, f, indent=2, ensure_ascii=False)
+            "objective": args.objective,
+            "objective_weights": args.objective_weights,
+        })
     _out("  start_params keys: %s" % list(start_params.keys()))
     _out("  start_params saved: %s" % start_params_path.name)
     _out("")
 
+    screen = None
+    if args.surrogate_keep > 0:
+        from surrogate import build_prescreener
+        screen, n_hist = build_prescreener(base_card, target_ratios, output_dir / "experiments", min_train=args.surrogate_min_train)
+        screen.min_observed = 0  # rank 只比較候選點之間的預測，不需要 loss 分位數
+        _out("  surrogate: %d historical evaluations on this base card, keeping %d points per dimension" % (n_hist, args.surrogate_keep))
+        _out("")
+
     # 目前中心（每輪結束後更新為本輪 16 維最佳）；每輪結束時之 best_loss 供寫入 JSON 與報告
     center = dict(start_params)
     final_loss = None
     total_cards = 0
-    # 預估總張數（用 start_params 當中心估算，實際可能因每輪最佳值更新略異）
+    n_replayed = 0
+    n_skipped_points = 0
+    stop_tolerance = None if args.full_sweep else args.stop_tolerance
+    # 各維敏感度（上一輪量到的 loss 最大−最小）；第 1 輪依 map 順序
+    sensitivity = {}
+    sensitivity_per_round = []
+    # 預估總張數上限（用 start_params 當中心估算；提前停止時實際較少）
     total_expected = 0
     for _r in range(1, rounds + 1):
         _rk = range_list[_r - 1]
@@ -267,43 +409,93 @@ def main():
         step_k = step_list[round_k - 1]
         round_dir = exp_dir / ("round_%d" % round_k)
         round_dir.mkdir(parents=True, exist_ok=True)
-        _out("[round %d/%d] range=%.0f, step=%.0f（已完成 %d 張，總共約 %d 張）" % (round_k, rounds, range_k, step_k, total_cards, total_expected))
+        _out("[round %d/%d] range=%.0f, step=%.0f（已完成 %d 張，總共最多約 %d 張）" % (round_k, rounds, range_k, step_k, total_cards, total_expected))
         _out("")
 
-        for dim_index, name in enumerate(slider_names):
+        dim_order = list(slider_names)
+        skipped_dims = []
+        if sensitivity:
+            dim_order.sort(key=lambda n: -sensitivity.get(n, 0.0))
+            top = max(sensitivity.values())
+            if args.skip_insensitive > 0 and top > 0:
+                skipped_dims = [n for n in dim_order if sensitivity.get(n, 0.0) < top * args.skip_insensitive]
+                dim_order = [n for n in dim_order if n not in skipped_dims]
+            _out("  dimension order by sensitivity: %s" % ", ".join("%s(%.1f)" % (n, sensitivity.get(n, 0.0)) for n in dim_order))
+            if skipped_dims:
+                _out("  skipped (sensitivity < %.0f%% of max): %s" % (args.skip_insensitive * 100, ", ".join(skipped_dims)))
+        round_sensitivity = {}
+
+        best_loss = FAIL_LOSS
+        for name in dim_order:
             center_val = center.get(name, 0.0)
             values = _values_for_dim(center_val, range_k, step_k, g_min, g_max)
             dim_dir = round_dir / ("dim_%s" % name)
             dim_dir.mkdir(parents=True, exist_ok=True)
 
+            allowed = None
+            if screen is not None:
+                candidates = [dict(center, **{name: v}) for v in values]
+                allowed = set(screen.rank(candidates, args.surrogate_keep))
+                allowed |= {i for i, v in enumerate(values) if v == round(center_val, 2)}
+
+            def evaluate_batch(indices, name=name, values=values, dim_dir=dim_dir):
+                """同一維的一批點：evaluations.jsonl 有紀錄者重播，其餘一次送 eval_pipeline（多實例平行）。"""
+                nonlocal total_cards, n_replayed
+                out = {}
+                todo = []
+                for pt_index in indices:
+                    params = dict(center)
+                    params[name] = values[pt_index]
+                    trial_dir = dim_dir / ("point_%02d" % pt_index)
+                    key = trial_dir.relative_to(exp_dir).as_posix()
+                    recorded = journal.get(key, params)
+                    if recorded is not None:
+                        out[pt_index] = recorded["loss"]
+                        n_replayed += 1
+                    else:
+                        todo.append((pt_index, params, trial_dir, key))
+                if todo:
+                    details = {}
+
+                    def on_result(res):
+                        details[res["index"]] = res
+
+                    losses, _ = evaluate_guesses_and_record(
+                        [t[1] for t in todo], target_ratios, base_card, request_files, [t[2] for t in todo], run_ts,
+                        args.screenshot_timeout, args.progress_interval, on_result=on_result, objective=objective,
+                    )
+                    for j, ((pt_index, params, _, key), loss) in enumerate(zip(todo, losses)):
+                        out[pt_index] = loss
+                        res = details.get(j) or {}
+                        if loss < FAIL_LOSS:
+                            # 截圖逾時的點不記錄，續跑時重試
+                            journal.append(key, params, loss, res.get("face_ratios"))
+                            if screen is not None and not res.get("cache_hit"):
+                                screen.observe(params, loss, res.get("face_ratios"))
+                    if getattr(args, "post_screenshot_delay", 0) > 0:
+                        import time as _t
+                        _t.sleep(args.post_screenshot_delay)
+                total_cards += len(indices)
+                return [out[i] for i in indices]
+
+            dim_losses = _sweep_dimension(
+                values, center_val, evaluate_batch, width=len(request_files), stop_tolerance=stop_tolerance, allowed=allowed,
+            )
+            n_skipped_points += len(values) - len(dim_losses)
             best_val = center_val
             best_loss = FAIL_LOSS
-
-            for pt_index, val in enumerate(values):
-                params = dict(center)
-                params[name] = val
-                trial_dir = dim_dir / ("point_%02d" % pt_index)
-                loss = evaluate_one_guess_and_record(
-                    params,
-                    target_ratios,
-                    args.base_card,
-                    request_file,
-                    trial_dir,
-                    run_ts,
-                    args.screenshot_timeout,
-                    args.progress_interval,
-                    trial_index=total_cards,
-                )
-                total_cards += 1
-                if getattr(args, "post_screenshot_delay", 0) > 0 and loss < FAIL_LOSS:
-                    import time as _t
-                    _t.sleep(args.post_screenshot_delay)
-                if loss < best_loss:
-                    best_loss = loss
-                    best_val = val
+            for pt_index in sorted(dim_losses):
+                if dim_losses[pt_index] < best_loss:
+                    best_loss = dim_losses[pt_index]
+                    best_val = values[pt_index]
+            round_sensitivity[name] = _dimension_sensitivity(dim_losses)
 
             center[name] = round(best_val, 2)
-            _out("  [round %d/%d] %s: best_val=%.2f loss=%.4f (tried %d points) — 進度: %d/%d 張" % (round_k, rounds, name, center[name], best_loss, len(values), total_cards, total_expected))
+            _out("  [round %d/%d] %s: best_val=%.2f loss=%.4f (tried %d of %d points) — 進度: %d/%d 張" % (
+                round_k, rounds, name, center[name], best_loss, len(dim_losses), len(values), total_cards, total_expected))
+
+        sensitivity.update(round_sensitivity)
+        sensitivity_per_round.append({n: round(v, 4) for n, v in round_sensitivity.items()})
 
         # 每輪結束多存一份：該輪結束時的最佳猜測（center）與該輪 best_loss
         round_best_loss = best_loss
@@ -318,6 +510,9 @@ def main():
                 "step": step_list[round_k - 1],
                 "best_params": dict(center),
                 "best_loss": round(round_best_loss, 4),
+                "dimension_order": dim_order,
+                "skipped_dimensions": skipped_dims,
+                "sensitivity": sensitivity_per_round[-1],
             }, f, indent=2, ensure_ascii=False)
         _out("  Round %d best saved: %s (loss=%.4f)" % (round_k, round_best_path.name, round_best_loss))
 
@@ -333,7 +528,14 @@ def main():
             "range_per_round": range_list,
             "step_per_round": step_list,
             "total_cards_evaluated": total_cards,
+            "points_skipped_by_early_stop": n_skipped_points,
+            "stop_tolerance": stop_tolerance,
+            "sensitivity_per_round": sensitivity_per_round,
+            "objective": args.objective,
+            "objective_weights": args.objective_weights,
         }
+        if screen is not None:
+            out_payload["surrogate"] = screen.report()
         if final_loss is not None:
             out_payload["best_loss"] = round(final_loss, 4)
         json.dump(out_payload, f, indent=2, ensure_ascii=False)
@@ -357,7 +559,9 @@ def main():
             "one_click_restore_cmd": "python hs2_photo_to_card_config.py restore --hs2-root <HS2_path>",
         }, f, indent=2, ensure_ascii=False)
     _out("  Manifest: %s" % manifest_path)
-    _out("  Total cards evaluated: %d" % total_cards)
+    _out("  Total cards evaluated: %d (%d points skipped by early stop / screening)" % (total_cards, n_skipped_points))
+    if n_replayed:
+        _out("  (%d of them replayed from evaluations.jsonl)" % n_replayed)
 
     # 產出差異報告：讀取本實驗目錄 JSON，寫入 round_summary_<run_ts>.md（僅標準庫，不修改既有模組）
     summary_path = exp_dir / ("round_summary_%s.md" % run_ts)
@@ -2,6 +2,9 @@
 """
 兩階段 Optuna 臉型優化：起始點 ±90／步長 30 → 第一輪 → ±45／步長 15 → 第二輪。
 產出：各 trial 目錄含人物卡、截圖（檔名含 run_ts）；實驗 ID 為 optuna_<run_ts>，不覆寫舊實驗。
+多實例：--instances N 以 ask/tell 同時評估 N 個 trial（TPE constant liar），每個遊戲實例一個，stage 牆鐘時間約除以 N。
+續跑：study 存於 <exp_dir>/optuna_journal.log（study_store），當掉後以同一個 --experiment-id 重跑即接續；
+--from-experiment 另把舊實驗已評估的點對新目標重算 loss 後加入 stage 1（暖啟動）。
 僅呼叫既有模組，不修改既有程式。
 會動到 HS2 時一鍵還原：python hs2_photo_to_card_config.py restore --hs2-root <路徑>
 """
@@ -9,6 +12,8 @@ import json
 import argparse
 import os
 import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -40,9 +45,8 @@ def get_slider_names(map_path=None):
     """從 ratio_to_slider_map.json 的 ratios 取得 16 個 slider 名稱（與 face_ratios_to_params 輸出 key 一致，依 map 順序）。"""
     if map_path is None:
         map_path = BASE / "ratio_to_slider_map.json"
-    from ratio_to_slider import load_map
-    m = load_map(map_path)
-    return [m["ratios"][r]["slider"] for r in m.get("ratios", {}) if m["ratios"][r].get("slider")]
+    from ratio_to_slider import load_compiled_map
+    return list(load_compiled_map(map_path).slider_names)
 
 
 def load_game_slider_range(map_path=None):
@@ -65,55 +69,27 @@ def evaluate_one_guess(
     run_ts,
     screenshot_timeout,
     progress_interval,
+    details=None,
+    objective=None,
 ):
     """
-    給定一組 params（16 slider dict）、目標 target_ratios，產一張卡 → 請求截圖 → MediaPipe → 回傳 total_loss。
-    僅呼叫既有函數，不重寫邏輯。截圖失敗或無臉時回傳 FAIL_LOSS。
+    給定一組 params（16 slider dict）、目標 target_ratios，以 evaluate_face_guess.evaluate_card（截圖經 request_file
+    的單一遊戲實例）評估並回傳 total_loss。產卡、截圖失敗或無臉時回傳 FAIL_LOSS。
+    details 給 dict 時填入 face_ratios（供 study 記錄、之後對新目標重算 loss）。
+    同一 base card + 相同臉型值已評估過時（eval_cache）直接沿用先前的 ratio，不載卡截圖。
+    objective：landmark_loss 的 objective（--objective procrustes）；None 為 ratio loss。
     """
-    from read_hs2_card import find_iend_in_bytes
-    from write_face_params_to_card import write_face_params_into_trailing
-    from run_phase1 import request_screenshot_and_wait, _compute_errors_and_loss
-    from extract_face_ratios import extract_ratios
+    from run_phase1 import request_screenshot_and_wait
+    from evaluate_face_guess import evaluate_card
 
-    trial_dir = Path(trial_dir)
-    cards_dir = trial_dir / "cards"
-    screenshots_dir = trial_dir / "screenshots"
-    cards_dir.mkdir(parents=True, exist_ok=True)
-    screenshots_dir.mkdir(parents=True, exist_ok=True)
-
-    base_bytes = Path(base_card_path).read_bytes()
-    iend = find_iend_in_bytes(base_bytes)
-    if iend is None:
-        return FAIL_LOSS
-    base_png = base_bytes[:iend]
-    base_trailing = base_bytes[iend:]
-
-    result = write_face_params_into_trailing(base_trailing, params)
-    if result is None:
-        return FAIL_LOSS
-    new_trailing, _ = result
-    card_path = cards_dir / ("card_00_%s.png" % run_ts)
-    with open(card_path, "wb") as f:
-        f.write(base_png)
-        f.write(new_trailing)
-
-    dest = screenshots_dir / ("screenshot_00_%s.png" % run_ts)
-    ok = request_screenshot_and_wait(
-        card_path.resolve(),
-        Path(request_file),
-        dest,
-        timeout_sec=screenshot_timeout,
-        progress_interval=progress_interval,
-    )
-    if not ok or not dest.exists():
-        return FAIL_LOSS
+    def shoot(card_path, dest):
+        return request_screenshot_and_wait(
+            card_path.resolve(), Path(request_file), dest,
+            timeout_sec=screenshot_timeout, progress_interval=progress_interval,
+        )
 
-    try:
-        actual_ratios = extract_ratios(dest)
-    except Exception:
-        return FAIL_LOSS
-    errors, contributions, total_loss = _compute_errors_and_loss(target_ratios, actual_ratios)
-    return float(total_loss)
+    res = evaluate_card(params, target_ratios, base_card_path, trial_dir, run_ts, shoot, objective=objective, details=details)
+    return res["total_loss"] if res["ok"] else FAIL_LOSS
 
 
 def _align_step(value, center, step):
@@ -124,6 +100,172 @@ def _align_step(value, center, step):
     return round(center + k * step, 2)
 
 
+def _stage_bounds(slider_names, centers, half_range, g_min, g_max):
+    """每個 slider 的搜尋區間 {name: (lo, hi)}：center ± half_range 夾在遊戲範圍內。"""
+    bounds = {}
+    for name in slider_names:
+        center = centers[name]
+        lo = max(g_min, center - half_range)
+        hi = min(g_max, center + half_range)
+        if lo >= hi:
+            lo, hi = g_min, g_max
+        bounds[name] = (lo, hi)
+    return bounds
+
+
+def _suggest_params(trial, slider_names, centers, half_range, step, g_min, g_max):
+    """每個 slider 在 center ± half_range 內 suggest_float，再以 _align_step 對齊到 center + k*step。"""
+    params = {}
+    for name, (lo, hi) in _stage_bounds(slider_names, centers, half_range, g_min, g_max).items():
+        center = centers[name]
+        x = trial.suggest_float(name, lo, hi)
+        v = _align_step(x, center, step)
+        v = max(g_min, min(g_max, v))
+        params[name] = round(v, 2)
+    return params
+
+
+_score_lock = threading.Lock()
+
+
+def evaluate_one_guess_scheduled(params, target_ratios, base_card_path, scheduler, trial_dir, run_ts, details=None,
+                                 objective=None):
+    """
+    evaluate_one_guess 的多實例版：產卡後交給 InstanceScheduler（哪個遊戲實例閒著就誰截圖、逾時換實例重試），
+    MediaPipe 以鎖串行（共用 session）。可由多個執行緒同時呼叫。先查 eval_cache，命中時不佔用遊戲實例。
+    """
+    from evaluate_face_guess import evaluate_card
+
+    def shoot(card_path, dest):
+        return scheduler.submit(card_path, dest).result()["ok"]
+
+    res = evaluate_card(params, target_ratios, base_card_path, trial_dir, run_ts, shoot, objective=objective,
+                        details=details, extract_lock=_score_lock)
+    return res["total_loss"] if res["ok"] else FAIL_LOSS
+
+
+def optimize_ask_tell(study, n_trials, suggest, evaluate, stage_dir, in_flight=1, label="stage", screen=None):
+    """
+    ask/tell 迴圈：同時最多 in_flight 個 trial 在評估中（每個遊戲實例一個）。
+    suggest(trial) → params dict（已對齊格點）；evaluate(params, trial_dir) → loss 或 (loss, face_ratios)（在 worker thread 執行）。
+    對齊後與已完成 trial 相同的 params 直接 tell 同一個 loss；與評估中 trial 相同者等它完成一起 tell（不重複載卡截圖）。
+    平行時 sampler 應開 constant_liar，讓 TPE 把評估中的 trial 視為暫定值，避免多個 worker 拿到相同建議。
+    study 為持久化 study 時可續跑：已完成的 trial（暖啟動加入的除外）計入 n_trials，
+    上次中斷仍 RUNNING 的 trial 以相同參數重新排入。trial 記錄 user_attrs aligned_params / face_ratios。
+    screen：surrogate.Prescreener；預測 loss 夠差的建議直接 tell 預測值（user_attrs surrogate_predicted），不截圖。
+    回傳 {"evaluated", "duplicates", "resumed", "requeued", "screened"}。
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from study_store import recover_running_trials, completed_trials
+
+    in_flight = max(1, int(in_flight))
+    n_requeued = recover_running_trials(study)
+    pending = {}
+    waiting = {}
+    done_loss = {}
+    done_ratios = {}
+    n_resumed = 0
+    best = None
+    for t in completed_trials(study):
+        aligned = t.user_attrs.get("aligned_params")
+        if aligned and not t.user_attrs.get("surrogate_predicted"):
+            key = tuple(sorted(aligned.items()))
+            done_loss[key] = t.value
+            done_ratios[key] = t.user_attrs.get("face_ratios")
+        if not t.user_attrs.get("warm_start"):
+            n_resumed += 1
+        if best is None or t.value < best:
+            best = t.value
+    if n_resumed or n_requeued:
+        _out("  [%s] resuming: %d trials already done, %d interrupted trials re-queued" % (label, n_resumed, n_requeued))
+
+    def tell(trial, loss, key):
+        if done_ratios.get(key):
+            trial.set_user_attr("face_ratios", done_ratios[key])
+        study.tell(trial, loss)
+
+    pool = ThreadPoolExecutor(in_flight, thread_name_prefix="optuna-eval")
+    n_asked = n_resumed
+    n_evaluated = 0
+    n_dup = 0
+    n_screened = 0
+    try:
+        while n_asked < n_trials or pending:
+            while n_asked < n_trials and len(pending) < in_flight:
+                trial = study.ask()
+                n_asked += 1
+                params = suggest(trial)
+                trial.set_user_attr("aligned_params", params)
+                key = tuple(sorted(params.items()))
+                if key in done_loss:
+                    tell(trial, done_loss[key], key)
+                    n_dup += 1
+                    continue
+                if key in waiting:
+                    waiting[key].append(trial)
+                    n_dup += 1
+                    continue
+                predicted = screen.skip(params) if screen is not None else None
+                if predicted is not None:
+                    trial.set_user_attr("surrogate_predicted", True)
+                    study.tell(trial, predicted)
+                    n_screened += 1
+                    continue
+                waiting[key] = []
+                fut = pool.submit(evaluate, params, stage_dir / ("trial_%04d" % trial.number))
+                pending[fut] = (trial, key, params)
+            if not pending:
+                continue
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                trial, key, params = pending.pop(fut)
+                ratios = None
+                try:
+                    res = fut.result()
+                    loss, ratios = res if isinstance(res, tuple) else (res, None)
+                    loss = float(loss)
+                except Exception as e:
+                    _out("  [%s] trial %d failed: %s" % (label, trial.number, e))
+                    loss = FAIL_LOSS
+                n_evaluated += 1
+                done_loss[key] = loss
+                done_ratios[key] = ratios
+                if screen is not None and loss < FAIL_LOSS:
+                    screen.observe(params, loss, ratios)
+                tell(trial, loss, key)
+                for t in waiting.pop(key, []):
+                    tell(t, loss, key)
+                if best is None or loss < best:
+                    best = loss
+                    _out("  [%s] trial %d loss %.4f (new best; %d/%d asked, %d in flight)" % (
+                        label, trial.number, loss, n_asked, n_trials, len(pending)))
+    finally:
+        pool.shutdown(wait=True)
+    return {"evaluated": n_evaluated, "duplicates": n_dup, "resumed": n_resumed, "requeued": n_requeued, "screened": n_screened}
+
+
+def warm_start_study(study, points, target_ratios, bounds):
+    """
+    把舊實驗已評估的點（study_store.load_evaluated_points）對新目標重算 loss，落在本 stage 區間內者以
+    COMPLETE trial 加入 study（user_attrs warm_start=True，不計入 n_trials）。回傳加入數。
+    """
+    import optuna
+    from study_store import rescore_points
+
+    distributions = {name: optuna.distributions.FloatDistribution(lo, hi) for name, (lo, hi) in bounds.items()}
+    n = 0
+    for loss, params, ratios in rescore_points(points, target_ratios):
+        if any(name not in params or not (lo <= params[name] <= hi) for name, (lo, hi) in bounds.items()):
+            continue
+        aligned = {name: params[name] for name in bounds}
+        study.add_trial(optuna.trial.create_trial(
+            params=aligned, distributions=distributions, value=loss,
+            user_attrs={"aligned_params": aligned, "face_ratios": ratios, "warm_start": True},
+        ))
+        n += 1
+    return n
+
+
 def main():
     _fix_console_encoding()
     ap = argparse.ArgumentParser(
@@ -140,8 +282,17 @@ def main():
     ap.add_argument("--progress-interval", type=int, default=10, help="等待截圖時每隔 N 秒印進度")
     ap.add_argument("--n-trials-stage1", type=int, default=80, help="第一輪 Optuna trial 數")
     ap.add_argument("--n-trials-stage2", type=int, default=50, help="第二輪 Optuna trial 數")
-    ap.add_argument("--experiment-id", type=str, default=None, help="實驗 ID，預設 optuna_<timestamp>")
-    ap.add_argument("--from-experiment", type=Path, default=None, metavar="JSON", help="從先前實驗的 best_params_stage2_*.json 讀取 experiment_params 作為本輪參數（幾輪、範圍、步長、n_trials）")
+    ap.add_argument("--experiment-id", type=str, default=None, help="實驗 ID，預設 optuna_<timestamp>；指定既有 ID 時從其 optuna_journal.log 續跑")
+    ap.add_argument("--from-experiment", type=Path, default=None, metavar="JSON", help="從先前實驗的 best_params_stage2_*.json 讀取 experiment_params 作為本輪參數（幾輪、範圍、步長、n_trials），並以該實驗已評估的點暖啟動 stage 1")
+    ap.add_argument("--knn-index", type=Path, default=None, metavar="NPZ", help="face_knn.py build 產生的索引；以最接近目標 ratio 的既有卡當 base card 與起點（找不到時退回 --base-card）")
+    ap.add_argument("--knn-k", type=int, default=5, help="k-NN 候選數（記錄於 knn_start_*.json）")
+    ap.add_argument("--instances", type=int, default=0, help="遊戲實例數 N：使用 <output-dir>/instance_<i>/load_card_request.txt（hs2_photo_to_card_config.py set），0 = 單一 --request-file")
+    ap.add_argument("--in-flight", type=int, default=None, help="同時評估中的 trial 數（預設 = --instances，單實例為 1）")
+    ap.add_argument("--surrogate", action="store_true", help="以同一 base card 的歷史評估訓練代理模型（surrogate.py），預測 loss 差的建議不送遊戲截圖")
+    ap.add_argument("--surrogate-quantile", type=float, default=0.5, help="預測 loss 高於已觀測 loss 的此分位數即略過（預設 0.5）")
+    ap.add_argument("--surrogate-min-train", type=int, default=30, help="訓練點數達此值才開始篩選")
+    ap.add_argument("--objective", choices=("ratios", "procrustes"), default="ratios", help="loss：ratios = 17 個 ratio（預設）；procrustes = 全 landmark 相似對齊後的分區殘差（landmark_loss.py）")
+    ap.add_argument("--objective-weights", type=str, default=None, help="procrustes 的區域權重，例如 face_oval=2,lips=1")
     args = ap.parse_args()
 
     # 未指定 --launch-game 時，改讀環境變數 HS2_EXE 或專案內 hs2_launch_path.txt（一行：exe 路徑）
@@ -171,7 +322,7 @@ def main():
     stage2_step = 15.0
     n_trials_s1 = args.n_trials_stage1
     n_trials_s2 = args.n_trials_stage2
-    if getattr(args, "from_experiment", None) and args.from_experiment and args.from_experiment.exists():
+    if getattr(args, "from_experiment", None) and args.from_experiment and args.from_experiment.is_file():
         with open(args.from_experiment, "r", encoding="utf-8") as f:
             prev = json.load(f)
         ep = prev.get("experiment_params") or prev
@@ -186,6 +337,8 @@ def main():
         raise SystemExit("Target image not found: %s" % args.target_image)
     if not args.base_card.exists():
         raise SystemExit("Base card not found: %s" % args.base_card)
+    if args.surrogate and args.objective != "ratios":
+        raise SystemExit("--surrogate predicts the ratio loss; it cannot be combined with --objective %s." % args.objective)
 
     import optuna
     from extract_face_ratios import extract_ratios
@@ -197,10 +350,28 @@ def main():
     ready_file = request_file.parent / "game_ready.txt"
     request_file.parent.mkdir(parents=True, exist_ok=True)
 
+    from study_store import load_run_state, save_run_state, open_study, experiment_dir_of, load_evaluated_points
+
     run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     experiment_id = args.experiment_id or ("optuna_%s" % run_ts)
     exp_dir = output_dir / "experiments" / experiment_id
     exp_dir.mkdir(parents=True, exist_ok=True)
+    state = load_run_state(exp_dir)
+    if state is not None:
+        # 續跑：沿用第一次執行的 run_ts（檔名）、起點與 base card
+        if Path(state["target_image"]).resolve() != args.target_image.resolve():
+            raise SystemExit("Experiment %s was started for %s; use a new --experiment-id for another target." % (
+                experiment_id, state["target_image"]))
+        if state.get("objective", "ratios") != args.objective or state.get("objective_weights") != args.objective_weights:
+            raise SystemExit("Experiment %s uses --objective %s (weights %s); losses of another objective are not comparable." % (
+                experiment_id, state.get("objective", "ratios"), state.get("objective_weights")))
+        run_ts = state["run_ts"]
+
+    from landmark_loss import make_objective
+    try:
+        objective = make_objective(args.objective, args.target_image, args.objective_weights)
+    except ValueError as e:
+        raise SystemExit("Objective %s: %s" % (args.objective, e))
 
     slider_names = get_slider_names(args.map)
     g_min, g_max = load_game_slider_range(args.map)
@@ -210,13 +381,27 @@ def main():
     _out("  output: %s" % exp_dir.resolve())
     _out("  request_file: %s" % request_file.resolve())
     _out("  sliders: %d" % len(slider_names))
+    _out("  objective: %s" % args.objective)
     if getattr(args, "from_experiment", None) and args.from_experiment:
         _out("  (params from --from-experiment: stage1 ±%.0f step %.0f, stage2 ±%.0f step %.0f, n_trials %d/%d)" % (stage1_range, stage1_step, stage2_range, stage2_step, n_trials_s1, n_trials_s2))
     else:
         _out("  stage1: ±%.0f step %.0f (n_trials=%d), stage2: ±%.0f step %.0f (n_trials=%d)" % (stage1_range, stage1_step, n_trials_s1, stage2_range, stage2_step, n_trials_s2))
     _out("")
 
-    if args.launch_game and Path(args.launch_game).exists():
+    scheduler = None
+    in_flight = args.in_flight or max(1, args.instances)
+    if args.instances <= 0 and in_flight > 1:
+        # 單一 request_file 一次只能有一個截圖請求；並行 trial 需要 InstanceScheduler
+        raise SystemExit("--in-flight %d needs --instances N (single request_file supports only one trial in flight)." % in_flight)
+    if args.instances > 0:
+        from instance_scheduler import InstanceScheduler
+        scheduler = InstanceScheduler(
+            output_dir, args.instances, timeout_sec=args.screenshot_timeout,
+            ready_timeout=args.ready_timeout, progress_interval=args.progress_interval,
+        )
+        _out("[0] %d game instances under %s (each waits for its game_ready.txt), %d trials in flight" % (
+            args.instances, output_dir.resolve(), in_flight))
+    elif args.launch_game and Path(args.launch_game).exists():
         _out("[0] Launching game: %s" % args.launch_game)
         import subprocess
         try:
@@ -239,88 +424,129 @@ def main():
     _out("")
 
     _out("[1] Target face ratios -> start params...")
-    target_ratios = extract_ratios(args.target_image)
-    start_params = face_ratios_to_params(target_ratios, args.map)
-    target_path = exp_dir / ("target_mediapipe_%s.json" % run_ts)
-    with open(target_path, "w", encoding="utf-8") as f:
-        json.dump({"source_image": str(args.target_image), "face_ratios": target_ratios}, f, indent=2, ensure_ascii=False)
+    if state is not None:
+        target_ratios = state["target_ratios"]
+        base_card = Path(state["base_card"])
+        start_params = state["start_params"]
+        _out("  resuming experiment %s (run_ts %s)" % (experiment_id, run_ts))
+    else:
+        target_ratios = extract_ratios(args.target_image)
+        start_params = face_ratios_to_params(target_ratios, args.map)
+        from face_knn import resolve_start
+        base_card, start_params = resolve_start(
+            args.knn_index, args.knn_k, target_ratios, slider_names, args.base_card, start_params, exp_dir, run_ts
+        )
+        if args.from_experiment and not args.knn_index:
+            # 暖啟動的點是在舊實驗的 base card 上量的，沿用同一張卡 loss 才可比
+            prev_state = load_run_state(experiment_dir_of(args.from_experiment))
+            if prev_state and Path(prev_state["base_card"]).exists():
+                base_card = Path(prev_state["base_card"])
+        target_path = exp_dir / ("target_mediapipe_%s.json" % run_ts)
+        with open(target_path, "w", encoding="utf-8") as f:
+            json.dump({"source_image": str(args.target_image), "face_ratios": target_ratios}, f, indent=2, ensure_ascii=False)
+        state = {
+            "experiment_id": experiment_id,
+            "run_ts": run_ts,
+            "target_image": str(args.target_image.resolve()),
+            "target_ratios": target_ratios,
+            "base_card": str(Path(base_card).resolve()),
+            "start_params": start_params,
+            "objective": args.objective,
+            "objective_weights": args.objective_weights,
+        }
+        save_run_state(exp_dir, state)
     _out("  start_params keys: %s" % list(start_params.keys()))
     _out("")
 
+    screen = None
+    if args.surrogate:
+        from surrogate import build_prescreener
+        screen, n_hist = build_prescreener(
+            base_card, target_ratios, output_dir / "experiments",
+            quantile=args.surrogate_quantile, min_train=args.surrogate_min_train,
+        )
+        _out("  surrogate: %d historical evaluations on this base card (screening starts at %d)" % (n_hist, args.surrogate_min_train))
+
     stage1_dir = exp_dir / "stage1"
     stage2_dir = exp_dir / "stage2"
     stage1_dir.mkdir(parents=True, exist_ok=True)
     stage2_dir.mkdir(parents=True, exist_ok=True)
 
-    def make_objective_stage1():
-        def objective(trial):
-            params = {}
-            for name in slider_names:
-                start = start_params.get(name, 0.0)
-                lo = max(g_min, start - stage1_range)
-                hi = min(g_max, start + stage1_range)
-                if lo >= hi:
-                    lo, hi = g_min, g_max
-                x = trial.suggest_float(name, lo, hi)
-                v = _align_step(x, start, stage1_step)
-                v = max(g_min, min(g_max, v))
-                params[name] = round(v, 2)
-            trial_dir = stage1_dir / ("trial_%04d" % trial.number)
+    def evaluate(params, trial_dir):
+        details = {}
+        if scheduler is not None:
+            loss = evaluate_one_guess_scheduled(
+                params, target_ratios, base_card, scheduler, trial_dir, run_ts, details=details, objective=objective,
+            )
+        else:
             loss = evaluate_one_guess(
                 params,
                 target_ratios,
-                args.base_card,
+                base_card,
                 request_file,
                 trial_dir,
                 run_ts,
                 args.screenshot_timeout,
                 args.progress_interval,
+                details=details,
+                objective=objective,
             )
-            return loss
-        return objective
-
-    _out("[2] Stage 1 Optuna: start ±%.0f, step %.0f, n_trials=%d..." % (stage1_range, stage1_step, n_trials_s1))
-    study1 = optuna.create_study(direction="minimize")
-    study1.optimize(make_objective_stage1(), n_trials=n_trials_s1, show_progress_bar=True)
+        return loss, details.get("face_ratios")
+
+    def make_study(name):
+        # 多個 trial 同時評估時以 constant liar 補評估中的 trial，TPE 不會對每個 worker 給出相同建議
+        sampler = optuna.samplers.TPESampler(constant_liar=True) if in_flight > 1 else None
+        return open_study(exp_dir, name, sampler=sampler)
+
+    stage_times = {}
+    start_centers = {name: start_params.get(name, 0.0) for name in slider_names}
+    _out("[2] Stage 1 Optuna: start ±%.0f, step %.0f, n_trials=%d, in flight %d..." % (stage1_range, stage1_step, n_trials_s1, in_flight))
+    study1 = make_study("stage1")
+    if args.from_experiment and not study1.trials and objective is not None:
+        _out("  warm start skipped: stored evaluations are rescored by ratio loss only (--objective %s)" % args.objective)
+    elif args.from_experiment and not study1.trials:
+        points = load_evaluated_points(experiment_dir_of(args.from_experiment))
+        n_warm = warm_start_study(
+            study1, points, target_ratios, _stage_bounds(slider_names, start_centers, stage1_range, g_min, g_max)
+        )
+        _out("  warm start: %d of %d evaluated points from %s fall inside the stage 1 range" % (
+            n_warm, len(points), experiment_dir_of(args.from_experiment)))
+    t0 = time.perf_counter()
+    st1 = optimize_ask_tell(
+        study1, n_trials_s1,
+        lambda trial: _suggest_params(trial, slider_names, start_centers, stage1_range, stage1_step, g_min, g_max),
+        evaluate, stage1_dir, in_flight=in_flight, label="stage1", screen=screen,
+    )
+    stage_times["stage1_sec"] = round(time.perf_counter() - t0, 2)
     best1 = study1.best_params
     best1_loss = study1.best_value
-    _out("  Stage 1 best loss: %.4f" % best1_loss)
+    _out("  Stage 1 best loss: %.4f (%.0fs, %d evaluated, %d duplicate suggestions reused, %d screened by surrogate)" % (
+        best1_loss, stage_times["stage1_sec"], st1["evaluated"], st1["duplicates"], st1["screened"]))
     _out("")
 
-    def make_objective_stage2():
-        def objective(trial):
-            params = {}
-            for name in slider_names:
-                center = best1.get(name, start_params.get(name, 0.0))
-                lo = max(g_min, center - stage2_range)
-                hi = min(g_max, center + stage2_range)
-                if lo >= hi:
-                    lo, hi = g_min, g_max
-                x = trial.suggest_float(name, lo, hi)
-                v = _align_step(x, center, stage2_step)
-                v = max(g_min, min(g_max, v))
-                params[name] = round(v, 2)
-            trial_dir = stage2_dir / ("trial_%04d" % trial.number)
-            loss = evaluate_one_guess(
-                params,
-                target_ratios,
-                args.base_card,
-                request_file,
-                trial_dir,
-                run_ts,
-                args.screenshot_timeout,
-                args.progress_interval,
-            )
-            return loss
-        return objective
-
-    _out("[3] Stage 2 Optuna: best1 ±%.0f, step %.0f, n_trials=%d..." % (stage2_range, stage2_step, n_trials_s2))
-    study2 = optuna.create_study(direction="minimize")
-    study2.optimize(make_objective_stage2(), n_trials=n_trials_s2, show_progress_bar=True)
+    # stage 2 的中心寫入 run_state，續跑時 study2 的區間不變
+    best1_centers = state.get("stage2_centers") or {name: best1.get(name, start_params.get(name, 0.0)) for name in slider_names}
+    if "stage2_centers" not in state:
+        state["stage2_centers"] = best1_centers
+        save_run_state(exp_dir, state)
+    _out("[3] Stage 2 Optuna: best1 ±%.0f, step %.0f, n_trials=%d, in flight %d..." % (stage2_range, stage2_step, n_trials_s2, in_flight))
+    study2 = make_study("stage2")
+    t0 = time.perf_counter()
+    st2 = optimize_ask_tell(
+        study2, n_trials_s2,
+        lambda trial: _suggest_params(trial, slider_names, best1_centers, stage2_range, stage2_step, g_min, g_max),
+        evaluate, stage2_dir, in_flight=in_flight, label="stage2", screen=screen,
+    )
+    stage_times["stage2_sec"] = round(time.perf_counter() - t0, 2)
     best2 = study2.best_params
     best2_loss = study2.best_value
-    _out("  Stage 2 best loss: %.4f" % best2_loss)
+    _out("  Stage 2 best loss: %.4f (%.0fs, %d evaluated, %d duplicate suggestions reused, %d screened by surrogate)" % (
+        best2_loss, stage_times["stage2_sec"], st2["evaluated"], st2["duplicates"], st2["screened"]))
     _out("")
+    if scheduler is not None:
+        scheduler.close()
+        for st in scheduler.stats()["instances"]:
+            _out("  %-12s done %d  timeouts %d  utilisation %.0f%%" % (st["instance"], st["done"], st["timeouts"], st["utilisation"] * 100))
 
     experiment_params = {
         "rounds": 2,
@@ -340,6 +566,11 @@ def main():
             "best_loss": round(best2_loss, 4),
             "stage1_best_loss": round(best1_loss, 4),
             "experiment_params": experiment_params,
+            "in_flight": in_flight,
+            "stage_times": stage_times,
+            "objective": args.objective,
+            "objective_weights": args.objective_weights,
+            "surrogate": screen.report() if screen is not None else None,
         }, f, indent=2, ensure_ascii=False)
     _out("  Best params written: %s" % out_best)
     manifest_path = exp_dir / ("manifest_%s.json" % run_ts)
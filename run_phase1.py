@@ -5,7 +5,7 @@
 流程：
   0. 可選 --launch-game <exe> 啟動 HS2；等待插件寫出 game_ready.txt（遊戲已進 CharaCustom）。
   1. 從目標臉圖取得 face_ratios，映射為 params，產出一張人物卡。
-  2. 將該卡絕對路徑寫入載卡請求檔，輪詢等待 BepInEx 插件寫出 game_screenshot.png。
+  2. 將該卡絕對路徑寫入載卡請求檔，等待 BepInEx 插件寫完 game_screenshot.png（檔案系統通知，見 screenshot_wait.py）。
   3. 對截圖跑 MediaPipe，與目標 ratios 比對，計算誤差與 loss，寫入 mediapipe_results.json。
 
 前置：BepInEx 載卡截圖插件已安裝，且插件設定 AutoEnterCharaCustom=true、RequestFile 與本腳本 --request-file 一致。
@@ -80,62 +80,58 @@ def _compute_errors_and_loss(target_ratios, actual_ratios, epsilon=1e-9):
     return errors, contributions, total
 
 
-def request_screenshot_and_wait(card_path: Path, request_file: Path, dest_screenshot: Path, timeout_sec=120, poll_interval=1.5, progress_interval=10):
+def request_screenshot_and_wait(card_path: Path, request_file: Path, dest_screenshot: Path, timeout_sec=120, poll_interval=0.05, progress_interval=10, backend=None):
     """
-    將 card_path（絕對路徑）寫入 request_file，輪詢與 request_file 同目錄的 game_screenshot.png，
-    且須為「寫入請求檔之後」才產生的檔案（避免沿用上次的舊截圖）。複製到 dest_screenshot，回傳 True；逾時回傳 False。
+    將 card_path（絕對路徑）寫入 request_file，等待與 request_file 同目錄的 game_screenshot.png，
+    且須為「寫入請求檔之後」才產生、且已寫完（PNG 到 IEND）的檔案（避免沿用上次的舊截圖或複製到寫一半的檔）。
+    複製到 dest_screenshot，回傳 True；逾時回傳 False。
+    等待由 screenshot_wait 以檔案系統通知喚醒（inotify / Windows change notification），
+    backend: None 時依 HS4_SCREENSHOT_WAIT（auto / inotify / win32 / poll）；poll_interval 只用於 poll 退路。
     progress_interval: 每隔幾秒印一次「等待中」進度（0 表示不印）。
     """
+    from screenshot_wait import open_watcher, wait_for_new_file
+
     request_file = Path(request_file)
     dest_screenshot = Path(dest_screenshot)
     screenshot_path = request_file.parent / "game_screenshot.png"
     card_path = Path(card_path).resolve()
     request_file.parent.mkdir(parents=True, exist_ok=True)
-    request_file.write_text(str(card_path), encoding="utf-8")
-    # 只接受此時間之後寫入的截圖，確保是本次請求由 HS2 插件產生的，而非舊檔
-    request_write_time = time.time()
     dest_screenshot.parent.mkdir(parents=True, exist_ok=True)
-    deadline = time.monotonic() + timeout_sec
-    last_progress = time.monotonic()
+
+    def _progress(elapsed, total):
+        _out("  Waiting for game screenshot... (%ds / %ds) HS2 in CharaCustom + plugin?" % (elapsed, total))
+
     # #region agent log
     wait_start = time.monotonic()
     # #endregion
-    while time.monotonic() < deadline:
-        if screenshot_path.exists():
-            try:
-                mtime = screenshot_path.stat().st_mtime
-                if mtime > request_write_time:
-                    shutil.copy2(screenshot_path, dest_screenshot)
-                    # #region agent log
-                    try:
-                        elapsed = round(time.monotonic() - wait_start, 2)
-                        import json as _j
-                        _lp = Path(__file__).resolve().parent / "debug-e56dbd.log"
-                        with open(_lp, "a", encoding="utf-8") as _f:
-                            _f.write(_j.dumps({"sessionId": "e56dbd", "hypothesisId": "H1,H3", "location": "run_phase1.py:screenshot_ok", "message": "screenshot_received", "data": {"elapsed_sec": elapsed, "timeout_sec": timeout_sec}, "timestamp": int(time.time() * 1000)}) + "\n")
-                    except Exception:
-                        pass
-                    # #endregion
-                    return True
-            except OSError:
-                time.sleep(poll_interval)
-                continue
-        now = time.monotonic()
-        if progress_interval > 0 and (now - last_progress) >= progress_interval:
-            elapsed = int(now - (deadline - timeout_sec))
-            _out("  Waiting for game screenshot... (%ds / %ds) HS2 in CharaCustom + plugin?" % (elapsed, timeout_sec))
-            last_progress = now
-        time.sleep(poll_interval)
+    # 先開 watcher 再寫請求檔，插件再快也不會漏掉事件
+    with open_watcher(request_file.parent, backend=backend, poll_interval=poll_interval) as watcher:
+        request_file.write_text(str(card_path), encoding="utf-8")
+        # 只接受此時間之後寫入的截圖，確保是本次請求由 HS2 插件產生的，而非舊檔
+        request_write_time = time.time()
+        ok = wait_for_new_file(
+            screenshot_path, request_write_time, timeout_sec, watcher=watcher,
+            progress_interval=progress_interval, on_progress=_progress,
+        )
+    if ok:
+        try:
+            shutil.copy2(screenshot_path, dest_screenshot)
+        except OSError:
+            ok = False
     # #region agent log
     try:
+        elapsed = round(time.monotonic() - wait_start, 2)
         import json as _j
         _lp = Path(__file__).resolve().parent / "debug-e56dbd.log"
         with open(_lp, "a", encoding="utf-8") as _f:
-            _f.write(_j.dumps({"sessionId": "e56dbd", "hypothesisId": "H3", "location": "run_phase1.py:screenshot_timeout", "message": "screenshot_timeout", "data": {"elapsed_sec": timeout_sec}, "timestamp": int(time.time() * 1000)}) + "\n")
+            if ok:
+                _f.write(_j.dumps({"sessionId": "e56dbd", "hypothesisId": "H1,H3", "location": "run_phase1.py:screenshot_ok", "message": "screenshot_received", "data": {"elapsed_sec": elapsed, "timeout_sec": timeout_sec, "backend": watcher.name}, "timestamp": int(time.time() * 1000)}) + "\n")
+            else:
+                _f.write(_j.dumps({"sessionId": "e56dbd", "hypothesisId": "H3", "location": "run_phase1.py:screenshot_timeout", "message": "screenshot_timeout", "data": {"elapsed_sec": elapsed, "backend": watcher.name}, "timestamp": int(time.time() * 1000)}) + "\n")
     except Exception:
         pass
     # #endregion
-    return False
+    return ok
 
 
 def wait_for_ready_file(ready_path: Path, timeout_sec: int, progress_interval: int = 10):
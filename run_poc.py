@@ -25,6 +25,7 @@ def main():
     ap.add_argument("--white-preview", action="store_true", help="Replace card PNG preview image with solid white (keeps trailing)")
     ap.add_argument("--mock-face", action="store_true", help="Use mock face ratios (no mediapipe)")
     ap.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="Mapping JSON")
+    ap.add_argument("--knn-index", type=Path, default=None, metavar="NPZ", help="face_knn index: copy the nearest existing card (by ratios) instead of CARD for --output-card")
     args = ap.parse_args()
 
     # 1) Extract face ratios from image
@@ -43,6 +44,17 @@ def main():
     from ratio_to_slider import face_ratios_to_params
     params = face_ratios_to_params(ratios, args.map)
 
+    # Nearest already-rendered card as base (non-mapped sliders then come from a similar face)
+    knn_match = None
+    if args.knn_index is not None:
+        from face_knn import knn_start
+        _, knn_match, _ = knn_start(args.knn_index, ratios, list(params.keys()))
+        if knn_match is not None:
+            args.card = Path(knn_match["card_path"])
+            print("k-NN base card: %s (dist=%.4f)" % (args.card, knn_match["distance"]))
+        else:
+            print("k-NN: no usable match in %s; using %s" % (args.knn_index, args.card))
+
     # Track which cha_names we modify (from JPEG/MediaPipe) vs leave unchanged
     from write_face_params_to_card import PARAM_TO_LIST_INDICES, ALL_FACE_CHA_NAMES
     modified_indices = set()
@@ -76,6 +88,7 @@ def main():
         "mapped_params": params,
         "params_modified_by_program": params_modified_by_program,
         "params_unchanged_report": params_unchanged_report,
+        "knn_match": knn_match,
         "note": "Params written to ChaFile when --output-card is used (if card format supports shapeValueFace offsets).",
     }
     args.output.parent.mkdir(parents=True, exist_ok=True)
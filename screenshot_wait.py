@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+事件驅動等待 game_screenshot.png：取代 run_phase1 原本 1.5 s 的 sleep + stat 輪詢。
+
+後端（HS4_SCREENSHOT_WAIT 環境變數或 backend 參數：auto / inotify / win32 / poll）：
+  inotify  Linux，ctypes 呼叫 libc inotify；目錄有 create / modify / close_write / moved_to 立即喚醒
+  win32    Windows，FindFirstChangeNotificationW（檔名 / 大小 / 最後寫入時間變動）
+  poll     其他平台或上述初始化失敗時的退路，預設每 50 ms stat 一次
+事件後端仍每 recheck_interval 秒主動檢查一次，漏掉事件最多只多等這麼久。
+
+完成判定：Unity 的 ScreenCapture.CaptureScreenshot 是原地寫檔，剛出現的檔案可能只寫了一半。
+PNG 必須已寫到完整的 IEND chunk（00 00 00 00 'IEND' AE 42 60 82）才算完成；非 PNG 內容則要求大小與 mtime
+連續 settle_sec 秒不變。兩者都要求 mtime 晚於寫入請求檔的時間（避免沿用上次的舊截圖）。
+
+本機替身（不開遊戲測等待邏輯）：
+  python screenshot_wait.py stand-in --request-file output/load_card_request.txt --source SRC/AI_191856.png
+  python screenshot_wait.py bench --source SRC/AI_191856.png -n 10 --delay 0.3
+stand-in 模擬插件：讀到請求檔 → 清空 → 等 --delay 秒 → 以 --chunk-kb 分段寫出 game_screenshot.png。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+ENV_BACKEND = "HS4_SCREENSHOT_WAIT"
+PNG_IEND_TRAILER = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+# inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+# FindFirstChangeNotificationW
+_FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+_FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+_FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+_WAIT_OBJECT_0 = 0
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+class PollWatcher:
+    """退路：固定間隔睡眠，wait() 一律回傳 True（呼叫端自行 stat）。"""
+    name = "poll"
+
+    def __init__(self, directory, interval=0.05):
+        self.directory = Path(directory)
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(max(0.0, min(self.interval, timeout)))
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InotifyWatcher(PollWatcher):
+    """Linux inotify（ctypes，無第三方套件）。wait() 在目錄有變動時回傳 True，逾時回傳 False。"""
+    name = "inotify"
+
+    def __init__(self, directory, interval=None):
+        import ctypes
+        import ctypes.util
+        self.directory = Path(directory)
+        self.interval = interval
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(str(self.directory)), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, "inotify_add_watch failed: %s" % self.directory)
+        self._fd = fd
+
+    def wait(self, timeout):
+        import select
+        ready, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not ready:
+            return False
+        # 把累積的事件讀光；只關心「有變動」，不解析 inotify_event
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class Win32Watcher(PollWatcher):
+    """Windows change notification handle；wait() 以 WaitForSingleObject 等待目錄變動。"""
+    name = "win32"
+
+    def __init__(self, directory, interval=None):
+        import ctypes
+        from ctypes import wintypes
+        self.directory = Path(directory)
+        self.interval = interval
+        k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        k32.FindFirstChangeNotificationW.argtypes = [wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD]
+        k32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+        k32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+        k32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+        k32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        k32.WaitForSingleObject.restype = wintypes.DWORD
+        flags = _FILE_NOTIFY_CHANGE_FILE_NAME | _FILE_NOTIFY_CHANGE_SIZE | _FILE_NOTIFY_CHANGE_LAST_WRITE
+        handle = k32.FindFirstChangeNotificationW(str(self.directory), False, flags)
+        if not handle or handle == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_last_error(), "FindFirstChangeNotificationW failed: %s" % self.directory)
+        self._k32 = k32
+        self._handle = handle
+
+    def wait(self, timeout):
+        rc = self._k32.WaitForSingleObject(self._handle, int(max(0.0, timeout) * 1000))
+        if rc != _WAIT_OBJECT_0:
+            return False
+        self._k32.FindNextChangeNotification(self._handle)
+        return True
+
+    def close(self):
+        if self._handle is not None:
+            self._k32.FindCloseChangeNotification(self._handle)
+            self._handle = None
+
+
+def open_watcher(directory, backend=None, poll_interval=0.05):
+    """
+    backend: None 時讀環境變數 HS4_SCREENSHOT_WAIT（預設 auto）。
+    auto：Linux 用 inotify、Windows 用 win32，初始化失敗一律退回 poll。
+    """
+    backend = (backend or os.environ.get(ENV_BACKEND) or "auto").strip().lower()
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if backend == "auto":
+        if sys.platform.startswith("linux"):
+            backend = "inotify"
+        elif sys.platform == "win32":
+            backend = "win32"
+        else:
+            backend = "poll"
+    if backend in ("inotify", "win32"):
+        cls = InotifyWatcher if backend == "inotify" else Win32Watcher
+        try:
+            return cls(directory)
+        except (OSError, AttributeError):
+            pass
+    return PollWatcher(directory, interval=poll_interval)
+
+
+def png_is_complete(path):
+    """
+    PNG 已寫到 IEND chunk 時回傳 True；非 PNG 回傳 None；讀取失敗或不完整回傳 False。
+    一般截圖檔尾就是 IEND（只讀最後 12 bytes）；檔尾另有資料（如角色卡）時改走 chunk header 確認 IEND 完整。
+    """
+    from read_hs2_card import PNG_SIGNATURE, _find_iend_in_file
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+            if len(head) < 8:
+                return False
+            if head != PNG_SIGNATURE:
+                return None
+            size = os.fstat(f.fileno()).st_size
+            if size < 8 + len(PNG_IEND_TRAILER):
+                return False
+            f.seek(-len(PNG_IEND_TRAILER), os.SEEK_END)
+            if f.read() == PNG_IEND_TRAILER:
+                return True
+            return _find_iend_in_file(f, size) is not None
+    except OSError:
+        return False
+
+
+def wait_for_new_file(path, since, timeout_sec, watcher=None, settle_sec=0.25, recheck_interval=0.5,
+                      progress_interval=0, on_progress=None):
+    """
+    等待 path 出現「mtime > since 且已寫完」的版本。回傳 True；逾時回傳 False。
+    watcher: open_watcher(path.parent) 的結果；None 時自行開一個（建議在寫請求檔之前就開好，避免漏掉事件）。
+    on_progress(elapsed_sec, timeout_sec): 每 progress_interval 秒呼叫一次（0 不呼叫）。
+    """
+    path = Path(path)
+    own = watcher is None
+    if own:
+        watcher = open_watcher(path.parent)
+    try:
+        start = time.monotonic()
+        deadline = start + timeout_sec
+        last_progress = start
+        stable_key = None
+        stable_since = 0.0
+        while True:
+            now = time.monotonic()
+            try:
+                st = path.stat()
+            except OSError:
+                st = None
+            if st is not None and st.st_mtime > since and st.st_size > 0:
+                done = png_is_complete(path)
+                if done:
+                    return True
+                if done is None:
+                    # 非 PNG：大小與 mtime 連續 settle_sec 不變才算寫完
+                    key = (st.st_size, st.st_mtime_ns)
+                    if key != stable_key:
+                        stable_key, stable_since = key, now
+                    elif now - stable_since >= settle_sec:
+                        return True
+            if now >= deadline:
+                return False
+            if on_progress is not None and progress_interval > 0 and (now - last_progress) >= progress_interval:
+                on_progress(int(now - start), timeout_sec)
+                last_progress = now
+            wait = min(deadline - now, recheck_interval)
+            if stable_key is not None:
+                wait = min(wait, settle_sec)
+            watcher.wait(wait)
+    finally:
+        if own:
+            watcher.close()
+
+
+class StandInWriter:
+    """
+    插件替身（背景執行緒）：輪詢 request_file，讀到卡路徑就清空請求檔、等 delay 秒，
+    再把 source PNG 以 chunk_size 分段原地寫成同目錄的 game_screenshot.png（每段間隔 chunk_delay 秒），
+    模擬 Unity 寫到一半的檔案。handled 記錄處理過的卡路徑。
+    """
+
+    def __init__(self, request_file, source_png, delay=0.3, chunk_size=64 * 1024, chunk_delay=0.005, scan_interval=0.01):
+        self.request_file = Path(request_file)
+        self.screenshot_path = self.request_file.parent / "game_screenshot.png"
+        self.data = Path(source_png).read_bytes()
+        self.delay = delay
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_delay = chunk_delay
+        self.scan_interval = scan_interval
+        self.handled = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _write_screenshot(self):
+        with open(self.screenshot_path, "wb") as f:
+            for i in range(0, len(self.data), self.chunk_size):
+                f.write(self.data[i:i + self.chunk_size])
+                f.flush()
+                if self.chunk_delay > 0 and i + self.chunk_size < len(self.data):
+                    time.sleep(self.chunk_delay)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                card = self.request_file.read_text(encoding="utf-8").strip()
+            except OSError:
+                card = ""
+            if card:
+                self.request_file.write_text("", encoding="utf-8")
+                self.handled.append(card)
+                if self._stop.wait(self.delay):
+                    break
+                self._write_screenshot()
+            self._stop.wait(self.scan_interval)
+
+    def start(self):
+        self.request_file.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="screenshot-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _legacy_request_and_wait(card_path, request_file, dest_screenshot, timeout_sec, poll_interval=1.5):
+    """舊版 run_phase1.request_screenshot_and_wait：sleep(1.5) + mtime 檢查，不確認是否寫完。bench 對照用。"""
+    import shutil
+    screenshot_path = Path(request_file).parent / "game_screenshot.png"
+    Path(request_file).write_text(str(card_path), encoding="utf-8")
+    request_write_time = time.time()
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        if screenshot_path.exists():
+            try:
+                if screenshot_path.stat().st_mtime > request_write_time:
+                    shutil.copy2(screenshot_path, dest_screenshot)
+                    return True
+            except OSError:
+                pass
+        time.sleep(poll_interval)
+    return False
+
+
+def _bench(args):
+    from run_phase1 import request_screenshot_and_wait
+
+    def _new(backend, interval):
+        def run(card, request_file, dest):
+            return request_screenshot_and_wait(card, request_file, dest, timeout_sec=args.timeout,
+                                               poll_interval=interval, progress_interval=0, backend=backend)
+        return run
+
+    configs = [
+        ("legacy", "sleep 1.5s", lambda card, rf, dest: _legacy_request_and_wait(card, rf, dest, args.timeout)),
+        ("poll", "poll", _new("poll", 0.05)),
+        ("event", None, _new("auto", 0.05)),
+    ]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="shot_wait_") as tmp:
+        tmp = Path(tmp)
+        request_file = tmp / "load_card_request.txt"
+        card = tmp / "card.png"
+        card.write_bytes(b"")
+        with StandInWriter(request_file, args.source, delay=args.delay, chunk_size=args.chunk_kb * 1024, chunk_delay=args.chunk_delay):
+            for label, backend_name, fn in configs:
+                if backend_name is None:
+                    with open_watcher(tmp, "auto") as w:
+                        backend_name = w.name
+                lat = []
+                n_partial = 0
+                for i in range(args.n):
+                    dest = tmp / ("shot_%s_%03d.png" % (label, i))
+                    t0 = time.perf_counter()
+                    ok = fn(card, request_file, dest)
+                    dt = time.perf_counter() - t0
+                    if not ok:
+                        raise SystemExit("Timeout in %s after %d screenshots" % (label, i))
+                    if not png_is_complete(dest):
+                        n_partial += 1
+                    lat.append(dt)
+                    # 等替身寫完，下一輪的 mtime 判定才乾淨
+                    time.sleep(args.chunk_delay * (os.path.getsize(args.source) // (args.chunk_kb * 1024) + 1) + 0.02)
+                lat.sort()
+                r = {
+                    "config": label,
+                    "backend": backend_name,
+                    "n": len(lat),
+                    "mean_sec": round(sum(lat) / len(lat), 4),
+                    "p50_sec": round(lat[len(lat) // 2], 4),
+                    "max_sec": round(lat[-1], 4),
+                    "overhead_mean_sec": round(sum(lat) / len(lat) - args.delay, 4),
+                    "partial_copies": n_partial,
+                }
+                results.append(r)
+                _out("  %-7s (%-10s) mean %.3fs  p50 %.3fs  max %.3fs  overhead %.3fs  partial copies %d" % (
+                    label, backend_name, r["mean_sec"], r["p50_sec"], r["max_sec"], r["overhead_mean_sec"], n_partial))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"delay_sec": args.delay, "results": results}, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Screenshot wait backends: plugin stand-in writer and latency benchmark.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("stand-in", help="Act as the HS2 plugin: answer load_card_request.txt with a screenshot")
+    s.add_argument("--request-file", type=Path, default=BASE / "output" / "load_card_request.txt")
+    s.add_argument("--source", type=Path, required=True, help="PNG written as game_screenshot.png")
+    s.add_argument("--delay", type=float, default=0.3, help="Seconds between request and first byte (default 0.3)")
+    s.add_argument("--chunk-kb", type=int, default=64)
+    s.add_argument("--chunk-delay", type=float, default=0.005)
+    b = sub.add_parser("bench", help="Request -> copied latency per wait backend against the stand-in")
+    b.add_argument("--source", type=Path, required=True)
+    b.add_argument("-n", type=int, default=10, help="Screenshots per backend")
+    b.add_argument("--delay", type=float, default=0.3)
+    b.add_argument("--chunk-kb", type=int, default=64)
+    b.add_argument("--chunk-delay", type=float, default=0.005)
+    b.add_argument("--timeout", type=int, default=30)
+    b.add_argument("-o", "--output", type=Path, default=None)
+    args = ap.parse_args()
+
+    if not args.source.exists():
+        raise SystemExit("Source PNG not found: %s" % args.source)
+    if args.command == "bench":
+        return _bench(args)
+
+    request_file = args.request_file.resolve()
+    _out("Stand-in watching %s (Ctrl+C to stop)" % request_file)
+    writer = StandInWriter(request_file, args.source, delay=args.delay, chunk_size=args.chunk_kb * 1024, chunk_delay=args.chunk_delay)
+    writer.start()
+    try:
+        seen = 0
+        while True:
+            time.sleep(0.2)
+            while seen < len(writer.handled):
+                _out("  request: %s -> %s" % (writer.handled[seen], writer.screenshot_path))
+                seen += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
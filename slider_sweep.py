@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+逐 slider 響應曲線掃描：中性 base card 上，59 個 shapeValueFace slider 各自設成 K 個等距 level（其餘維持 base 值），
+產卡 → 載卡截圖（多實例平行）→ MediaPipe，存成完整 landmark 響應張量，供下游校正（取代 calibrate_eye_vertical 的
+兩張手動截圖、calibrate_from_reference 的單點線性擬合）。
+
+輸出 <output-dir>/slider_sweep/<sweep-id>/：
+  response.npz     slider_names (S,)、levels (K,) 遊戲值、base_values (S,) 遊戲值、
+                   landmarks (S, K, 468, 2) float32（失敗為 NaN）、ok (S, K) bool、
+                   base_landmarks (468, 2)（base card 本身）、ratios (S, K, 17)、ratio_names (17,)
+  manifest.json    參數、每格卡 / 截圖路徑、失敗清單
+  <slider>/level_<k>/cards|screenshots/
+
+產卡截圖走 eval_pipeline，已評估過的 (base card, 臉型值) 由 eval_cache 命中、不重新截圖：
+中斷後用同一個 --sweep-id 重跑即可接續，換 K 或範圍時重疊的 level 也直接命中。
+
+  python slider_sweep.py run --base-card SRC/neutral.png --levels 7 --instances 3
+  python slider_sweep.py summary output/slider_sweep/<sweep-id>/response.npz
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+RESPONSE_NAME = "response.npz"
+MANIFEST_NAME = "manifest.json"
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def sweep_levels(k, g_min, g_max):
+    """[g_min, g_max] 內 K 個等距遊戲值（round 到 0.01，與寫卡量化一致）。"""
+    import numpy as np
+    if k < 2:
+        raise ValueError("need at least 2 levels")
+    return [round(float(v), 2) for v in np.linspace(g_min, g_max, k)]
+
+
+def sweep_jobs(slider_names, levels, sweep_dir, run_ts):
+    """(slider, level) → eval_pipeline job；job 依 slider 再依 level 排序，index = s * K + k。"""
+    jobs = []
+    for name in slider_names:
+        for k, level in enumerate(levels):
+            cell = Path(sweep_dir) / name / ("level_%02d" % k)
+            jobs.append({
+                "params": {name: level},
+                "card_path": cell / "cards" / ("card_%s.png" % run_ts),
+                "screenshot_path": cell / "screenshots" / ("screenshot_%s.png" % run_ts),
+                "run_ts": run_ts,
+            })
+    return jobs
+
+
+def _landmarks_for(result, base_card, params):
+    """pipeline 結果 → (468, 2)；先查 landmark 快取（剛截的圖必中），截圖已不在時退回 eval_cache 存的 landmark。"""
+    import numpy as np
+    from extract_face_ratios import extract_landmarks
+    path = result.get("screenshot_path")
+    if path and Path(path).exists():
+        try:
+            return extract_landmarks(path)
+        except ValueError:
+            return None
+    from eval_cache import lookup
+    entry = lookup(base_card, params)
+    if entry and entry.get("landmarks"):
+        return np.asarray(entry["landmarks"], dtype=np.float32)
+    return None
+
+
+def run_sweep(base_card, slider_names, levels, request_files, sweep_dir, screenshot_timeout=120,
+              progress_interval=10, score_workers=0, on_progress=None):
+    """
+    掃描並寫入 sweep_dir/response.npz、manifest.json；回傳 response dict（同 load_response）。
+    base card 本身先截一張當參考（base_landmarks；各格的 loss 即相對 base 的 ratio 誤差）。
+    """
+    import numpy as np
+    from chafile_card import load_card_template
+    from eval_pipeline import run_pipeline
+    from extract_face_ratios import RATIO_NAMES, compute_ratio_matrix
+    from write_face_params_to_card import CHA_NAME_TO_LIST_INDEX
+
+    sweep_dir = Path(sweep_dir)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_values = load_card_template(base_card).base_values
+    base_game = [round(float(base_values[CHA_NAME_TO_LIST_INDEX[n]]) * 100, 2) for n in slider_names]
+
+    # base card 本身（params 為空 = 全部維持 base 值）
+    base_job = {
+        "params": {},
+        "card_path": sweep_dir / "base" / "cards" / ("card_%s.png" % run_ts),
+        "screenshot_path": sweep_dir / "base" / "screenshots" / ("screenshot_%s.png" % run_ts),
+        "run_ts": run_ts,
+    }
+    placeholder = {name: 0.0 for name in RATIO_NAMES}
+    (base_res,), _ = run_pipeline(
+        [base_job], placeholder, base_card, request_files,
+        screenshot_timeout=screenshot_timeout, progress_interval=progress_interval, score_workers=score_workers,
+    )
+    if not base_res["ok"]:
+        raise RuntimeError("Base card screenshot failed: %s" % base_res["error"])
+    base_ratios = base_res["face_ratios"]
+    base_landmarks = _landmarks_for(base_res, base_card, {})
+
+    jobs = sweep_jobs(slider_names, levels, sweep_dir, run_ts)
+    S, K = len(slider_names), len(levels)
+    landmarks = np.full((S, K, 468, 2), np.nan, dtype=np.float32)
+    ok = np.zeros((S, K), dtype=bool)
+    done = [0]
+    t0 = time.perf_counter()
+
+    def on_result(res):
+        done[0] += 1
+        if on_progress:
+            on_progress(done[0], len(jobs), time.perf_counter() - t0)
+
+    results, stats = run_pipeline(
+        jobs, base_ratios, base_card, request_files,
+        screenshot_timeout=screenshot_timeout, progress_interval=progress_interval,
+        score_workers=score_workers, on_result=on_result,
+    )
+    cells = []
+    failures = []
+    for job, res in zip(jobs, results):
+        s, k = divmod(res["index"], K)
+        cell = {
+            "slider": slider_names[s],
+            "level": levels[k],
+            "card_path": str(res["card_path"]) if res["card_path"] else None,
+            "screenshot_path": str(res["screenshot_path"]) if res["screenshot_path"] else None,
+            "cache_hit": bool(res.get("cache_hit")),
+            "loss_vs_base": round(res["total_loss"], 4) if res["ok"] else None,
+        }
+        xy = _landmarks_for(res, base_card, job["params"]) if res["ok"] else None
+        if xy is not None:
+            landmarks[s, k] = xy
+            ok[s, k] = True
+        else:
+            cell["error"] = res["error"] or "landmarks unavailable"
+            failures.append(cell)
+        cells.append(cell)
+
+    ratios = compute_ratio_matrix(landmarks.reshape(S * K, 468, 2)).reshape(S, K, len(RATIO_NAMES))
+    response = {
+        "slider_names": np.asarray(slider_names),
+        "levels": np.asarray(levels, dtype=np.float64),
+        "base_values": np.asarray(base_game, dtype=np.float64),
+        "landmarks": landmarks,
+        "ok": ok,
+        "base_landmarks": np.asarray(base_landmarks if base_landmarks is not None else np.full((468, 2), np.nan), dtype=np.float32),
+        "ratios": ratios,
+        "ratio_names": np.asarray(RATIO_NAMES),
+    }
+    np.savez_compressed(sweep_dir / RESPONSE_NAME, **response)
+    with open(sweep_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump({
+            "base_card": str(Path(base_card).resolve()),
+            "run_ts": run_ts,
+            "levels": levels,
+            "slider_names": slider_names,
+            "request_files": [str(rf) for rf in request_files],
+            "base_ratios": base_ratios,
+            "cells": cells,
+            "failures": failures,
+            "pipeline_stats": stats,
+        }, f, indent=2, ensure_ascii=False)
+    return response
+
+
+def load_response(path):
+    """response.npz（或其所在目錄）→ dict of arrays（同 run_sweep 回傳）。"""
+    import numpy as np
+    path = Path(path)
+    if path.is_dir():
+        path = path / RESPONSE_NAME
+    with np.load(path, allow_pickle=False) as z:
+        return {k: z[k] for k in z.files}
+
+
+def response_summary(response):
+    """每個 slider 的響應幅度：[(slider, 成功格數, landmark 平均位移最大值, 變化最大的 ratio, 該 ratio 的變化量)]，依位移排序。"""
+    import numpy as np
+    lm = response["landmarks"].astype(np.float64)
+    base = response["base_landmarks"].astype(np.float64)
+    ratios = response["ratios"]
+    names = [str(n) for n in response["ratio_names"]]
+    rows = []
+    for s, slider in enumerate(response["slider_names"]):
+        ok = response["ok"][s]
+        if not ok.any():
+            rows.append((str(slider), 0, float("nan"), None, float("nan")))
+            continue
+        disp = np.sqrt(((lm[s, ok] - base) ** 2).sum(axis=-1)).mean(axis=-1)
+        r = ratios[s, ok]
+        span = np.nanmax(r, axis=0) - np.nanmin(r, axis=0)
+        j = int(np.nanargmax(span)) if np.isfinite(span).any() else 0
+        rows.append((str(slider), int(ok.sum()), float(np.nanmax(disp)), names[j], float(span[j])))
+    rows.sort(key=lambda row: -row[2] if row[2] == row[2] else 0)
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-slider response sweep: K levels per shapeValueFace slider -> landmark tensor.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="Generate cards, screenshot them and store response.npz")
+    run_p.add_argument("--base-card", type=Path, required=True, help="中性 base card（其餘 slider 維持其值）")
+    run_p.add_argument("--levels", type=int, default=7, help="每個 slider 的 level 數 K（預設 7）")
+    run_p.add_argument("--min", type=float, default=None, help="最低 level（遊戲值，預設 game_slider_range 下限）")
+    run_p.add_argument("--max", type=float, default=None, help="最高 level（遊戲值，預設 game_slider_range 上限）")
+    run_p.add_argument("--sliders", type=str, default=None, help="逗號分隔的 cha_name 子集（預設全部 59 個）")
+    run_p.add_argument("--map", type=Path, default=BASE / "ratio_to_slider_map.json", help="ratio_to_slider_map.json（game_slider_range）")
+    run_p.add_argument("--output-dir", type=Path, default=BASE / "output", help="輸出根目錄")
+    run_p.add_argument("--sweep-id", type=str, default=None, help="掃描 ID，預設 sweep_<timestamp>；同 ID 重跑時已評估格由 eval_cache 命中")
+    run_p.add_argument("--request-file", type=Path, default=None, help="載卡請求檔，預設 <output-dir>/load_card_request.txt")
+    run_p.add_argument("--instances", type=int, default=0, help="遊戲實例數 N：使用 <output-dir>/instance_<i>/load_card_request.txt 平行截圖；0 = 單一 --request-file")
+    run_p.add_argument("--ready-timeout", type=int, default=180, help="等待 game_ready.txt 逾時秒數")
+    run_p.add_argument("--screenshot-timeout", type=int, default=120, help="每張截圖等待秒數")
+    run_p.add_argument("--progress-interval", type=int, default=10, help="等待截圖時每隔 N 秒印進度")
+    run_p.add_argument("--mediapipe-workers", type=int, default=0, help="MediaPipe 平行 process 數（0=本 process 依序）")
+    sum_p = sub.add_parser("summary", help="Per-slider response magnitude of a stored sweep")
+    sum_p.add_argument("response", type=Path, help="response.npz 或其目錄")
+    args = ap.parse_args()
+
+    if args.command == "summary":
+        if not args.response.exists():
+            raise SystemExit("File not found: %s" % args.response)
+        resp = load_response(args.response)
+        _out("%d sliders x %d levels %s" % (len(resp["slider_names"]), len(resp["levels"]), [float(v) for v in resp["levels"]]))
+        _out("%-20s %4s %12s  %s" % ("slider", "ok", "max disp", "most affected ratio (span)"))
+        for slider, n_ok, disp, ratio, span in response_summary(resp):
+            _out("%-20s %4d %12.5f  %s (%.4f)" % (slider, n_ok, disp, ratio, span))
+        return 0
+
+    if not args.base_card.exists():
+        raise SystemExit("Base card not found: %s" % args.base_card)
+    from run_optuna_face import load_game_slider_range
+    from run_phase1 import wait_for_ready_file
+    from write_face_params_to_card import ALL_FACE_CHA_NAMES
+
+    g_min, g_max = load_game_slider_range(args.map)
+    lo = args.min if args.min is not None else g_min
+    hi = args.max if args.max is not None else g_max
+    try:
+        levels = sweep_levels(args.levels, lo, hi)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    slider_names = list(ALL_FACE_CHA_NAMES)
+    if args.sliders:
+        slider_names = [s.strip() for s in args.sliders.split(",") if s.strip()]
+        unknown = [s for s in slider_names if s not in ALL_FACE_CHA_NAMES]
+        if unknown:
+            raise SystemExit("Unknown slider(s): %s" % ", ".join(unknown))
+
+    output_dir = Path(args.output_dir)
+    if args.instances > 0:
+        request_files = [output_dir / ("instance_%d" % i) / "load_card_request.txt" for i in range(args.instances)]
+    else:
+        request_files = [Path(args.request_file) if args.request_file else output_dir / "load_card_request.txt"]
+    for rf in request_files:
+        rf.parent.mkdir(parents=True, exist_ok=True)
+    sweep_id = args.sweep_id or ("sweep_%s" % datetime.now().strftime("%Y%m%d_%H%M%S"))
+    sweep_dir = output_dir / "slider_sweep" / sweep_id
+
+    _out("--- slider_sweep ---")
+    _out("  sweep_id: %s" % sweep_id)
+    _out("  output: %s" % sweep_dir.resolve())
+    _out("  %d sliders x %d levels = %d cards (+1 base)" % (len(slider_names), len(levels), len(slider_names) * len(levels)))
+    _out("  levels: %s" % levels)
+    _out("  request files: %s" % ", ".join(str(rf) for rf in request_files))
+    for rf in request_files:
+        ready_file = rf.parent / "game_ready.txt"
+        _out("[0] Waiting for game ready: %s (timeout %ds)..." % (ready_file, args.ready_timeout))
+        if not wait_for_ready_file(ready_file, args.ready_timeout, args.progress_interval):
+            raise SystemExit("Game ready timeout. Start HS2 first.")
+
+    last = [0.0]
+
+    def on_progress(done, total, elapsed):
+        if done == total or elapsed - last[0] >= args.progress_interval:
+            last[0] = elapsed
+            _out("  %d/%d cells (%.1fs)" % (done, total, elapsed))
+
+    try:
+        resp = run_sweep(
+            args.base_card, slider_names, levels, request_files, sweep_dir,
+            screenshot_timeout=args.screenshot_timeout, progress_interval=args.progress_interval,
+            score_workers=args.mediapipe_workers, on_progress=on_progress,
+        )
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    n_ok = int(resp["ok"].sum())
+    _out("  response tensor %s, %d/%d cells ok" % (resp["landmarks"].shape, n_ok, resp["ok"].size))
+    _out("  written: %s" % (sweep_dir / RESPONSE_NAME))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+優化實驗的持久化與續跑：遊戲或 Windows 當掉後，用同一個 --experiment-id 重跑即可接續。
+
+  run_state.json        實驗開始時固定的狀態（run_ts、start_params、base_card、target ratios），續跑時沿用
+  optuna_journal.log    run_optuna_face 的 Optuna JournalStorage（stage1 / stage2 兩個 study，純檔案、不需 DB）
+  evaluations.jsonl     run_onedim_face 每次評估一行（trial_dir、params、loss、face_ratios），續跑時重播不再截圖
+
+Optuna 續跑：已完成的 trial 計入 n_trials；當掉時仍在 RUNNING 的 trial 標為 FAIL 並以相同參數重新排入（enqueue）。
+--from-experiment 暖啟動：讀舊實驗已評估的點（face_ratios），對新目標重算 loss 後加入新 study / 當作一次一維起點。
+"""
+import json
+import os
+from pathlib import Path
+
+RUN_STATE_NAME = "run_state.json"
+JOURNAL_NAME = "optuna_journal.log"
+EVALUATIONS_NAME = "evaluations.jsonl"
+
+
+def load_run_state(exp_dir):
+    path = Path(exp_dir) / RUN_STATE_NAME
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_run_state(exp_dir, state):
+    path = Path(exp_dir) / RUN_STATE_NAME
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def journal_storage(exp_dir):
+    """exp_dir/optuna_journal.log 的 JournalStorage（Optuna 3.x / 4.x 皆可；用 open lock，Windows 不需 symlink 權限）。"""
+    import optuna
+    path = str(Path(exp_dir) / JOURNAL_NAME)
+    try:
+        from optuna.storages.journal import JournalFileBackend, JournalFileOpenLock
+        backend = JournalFileBackend(path, lock_obj=JournalFileOpenLock(path))
+    except ImportError:
+        from optuna.storages import JournalFileStorage, JournalFileOpenLock
+        backend = JournalFileStorage(path, lock_obj=JournalFileOpenLock(path))
+    return optuna.storages.JournalStorage(backend)
+
+
+def open_study(exp_dir, name, sampler=None):
+    """建立或載入 exp_dir 內名為 name 的 minimize study。"""
+    import optuna
+    return optuna.create_study(
+        study_name=name, storage=journal_storage(exp_dir), direction="minimize", sampler=sampler, load_if_exists=True,
+    )
+
+
+def recover_running_trials(study):
+    """上次中斷時仍為 RUNNING 的 trial：標 FAIL 並以相同參數 enqueue，回傳重新排入的數量。"""
+    from optuna.trial import TrialState
+    n = 0
+    for t in study.get_trials(deepcopy=False, states=(TrialState.RUNNING,)):
+        study.tell(t.number, state=TrialState.FAIL)
+        if t.params:
+            study.enqueue_trial(dict(t.params), skip_if_exists=False)
+        n += 1
+    return n
+
+
+def completed_trials(study):
+    from optuna.trial import TrialState
+    return study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,))
+
+
+class EvaluationJournal:
+    """append-only JSONL：每行 {"key", "params", "loss", "face_ratios", ...}。key 通常為 trial_dir 相對路徑。"""
+
+    def __init__(self, exp_dir):
+        self.path = Path(exp_dir) / EVALUATIONS_NAME
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue  # 當掉時寫到一半的最後一行
+                    self.entries[e["key"]] = e
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, params):
+        """key 有紀錄且參數相同時回傳該筆，否則 None。"""
+        e = self.entries.get(key)
+        if e is None or e.get("params") != params:
+            return None
+        return e
+
+    def append(self, key, params, loss, face_ratios=None, **extra):
+        e = {"key": key, "params": params, "loss": loss, "face_ratios": face_ratios}
+        e.update(extra)
+        self.entries[key] = e
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return e
+
+
+def experiment_dir_of(path):
+    """--from-experiment 可給實驗目錄或其中的 JSON（best_params_*、manifest_*）。"""
+    path = Path(path)
+    return path if path.is_dir() else path.parent
+
+
+def load_evaluated_points(exp_dir):
+    """
+    舊實驗中有 face_ratios 的已評估點：[(params, face_ratios), ...]。
+    來源：optuna_journal.log 內 COMPLETE trial 的 user_attrs（aligned_params、face_ratios；暖啟動加入的除外）與 evaluations.jsonl。
+    """
+    exp_dir = Path(exp_dir)
+    points = []
+    if (exp_dir / JOURNAL_NAME).exists():
+        import optuna
+        storage = journal_storage(exp_dir)
+        for summary in optuna.get_all_study_summaries(storage):
+            study = optuna.load_study(study_name=summary.study_name, storage=storage)
+            for t in completed_trials(study):
+                params = t.user_attrs.get("aligned_params")
+                ratios = t.user_attrs.get("face_ratios")
+                if params and ratios and not t.user_attrs.get("warm_start"):
+                    points.append((params, ratios))
+    if (exp_dir / EVALUATIONS_NAME).exists():
+        for e in EvaluationJournal(exp_dir).entries.values():
+            if e.get("face_ratios"):
+                points.append((e["params"], e["face_ratios"]))
+    return points
+
+
+def rescore_points(points, target_ratios):
+    """對新目標重算 loss：[(loss, params, face_ratios)]，依 loss 排序。"""
+    from run_phase1 import _compute_errors_and_loss
+    scored = []
+    for params, ratios in points:
+        _, _, loss = _compute_errors_and_loss(target_ratios, ratios)
+        scored.append((float(loss), params, ratios))
+    scored.sort(key=lambda x: x[0])
+    return scored
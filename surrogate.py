@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+代理模型（surrogate）：由同一張 base card 的歷史評估學 params → 17 個 face ratio，先篩掉預測很差的猜測再送進遊戲截圖。
+
+訓練資料（load_history，依 base card 內容 SHA-256 篩選）：
+  eval_cache        每筆成功評估（所有 evaluator 都會寫入）
+  evaluations.jsonl / optuna_journal.log   run_onedim_face / run_optuna_face 的實驗（run_state.json 記 base card）
+  mediapipe_results_*.json + guesses_*.json  run_experiment 的每輪結果（記錄 base_card 者）
+
+模型（純 NumPy，不需 scikit-learn）：特徵 = 寫卡時實際的 59 個 shapeValueFace 值（只取有變化的欄位，標準化），
+17 個 ratio 共用核矩陣：先線性 ridge，殘差再以 Gaussian RBF ridge 內插（長度尺度 = 中位數成對距離）。
+observe() 每加入一筆真實評估，先用目前模型預測並記錄誤差（online error，量測代理模型準不準），再累積到下次 predict 前重訓。
+
+Prescreener：
+  skip(params)          預測 loss 高於已觀測真實 loss 的 quantile 時回傳預測值（呼叫端不截圖），否則 None
+  rank(params_list, k)  預測 loss 最低的 k 組索引（一維掃描每維只送 k 個點）
+  report()              訓練點數、LOO / online RMSE（每個 ratio）、省下的截圖數
+
+  python surrogate.py evaluate --base-card SRC/AI_191856.png            # 歷史資料的 LOO 與時間序 holdout 誤差
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+DEFAULT_EXPERIMENTS_ROOT = BASE / "output" / "experiments"
+
+
+def _out(s):
+    try:
+        print(s)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((s + "\n").encode("utf-8", errors="replace"))
+        sys.stdout.buffer.flush()
+
+
+def _ratio_names():
+    from extract_face_ratios import RATIO_NAMES
+    return RATIO_NAMES
+
+
+def load_history(base_card_path, experiments_root=None, use_eval_cache=True):
+    """同一張 base card（內容相同）的歷史 [(params, face_ratios)]；params 為 slider dict 或 59 值 list。"""
+    from eval_cache import card_hash, get_default_cache
+    from study_store import load_run_state, load_evaluated_points
+
+    sha = card_hash(base_card_path)
+    history = []
+    cache = get_default_cache() if use_eval_cache else None
+    if cache:
+        for p in cache._entries():
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    e = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if e.get("base_card_sha256") == sha and e.get("face_ratios"):
+                history.append((e["params"], e["face_ratios"]))
+    root = Path(experiments_root) if experiments_root else DEFAULT_EXPERIMENTS_ROOT
+    if root.is_dir():
+        for exp_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+            state = load_run_state(exp_dir)
+            if state and Path(state.get("base_card", "")).exists() and card_hash(state["base_card"]) == sha:
+                history.extend(load_evaluated_points(exp_dir))
+            for res_path in sorted(exp_dir.glob("round_*/mediapipe_results_*.json")):
+                try:
+                    with open(res_path, "r", encoding="utf-8") as f:
+                        res = json.load(f)
+                    card = res.get("base_card")
+                    if not card or not Path(card).exists() or card_hash(card) != sha:
+                        continue
+                    guesses_path = res_path.with_name(res_path.name.replace("mediapipe_results_", "guesses_"))
+                    with open(guesses_path, "r", encoding="utf-8") as f:
+                        guesses = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for g, shot in zip(guesses, res.get("screenshots", [])):
+                    if shot.get("face_ratios"):
+                        history.append((g, shot["face_ratios"]))
+    return history
+
+
+class RatioSurrogate:
+    """params → 17 ratio 的 linear + RBF ridge 模型；見模組說明。"""
+
+    def __init__(self, base_card_path, smoothing=1e-3, max_points=2000, refit_every=1):
+        self.base_card_path = Path(base_card_path)
+        self.names = _ratio_names()
+        self.smoothing = float(smoothing)
+        self.max_points = int(max_points)
+        self.refit_every = max(1, int(refit_every))
+        self._X = []
+        self._Y = []
+        self._keys = set()
+        self._pending = 0
+        self._model = None
+        self.online_errors = []
+
+    def features(self, params):
+        from eval_cache import face_values_for
+        values = face_values_for(self.base_card_path, params)
+        return None if values is None else np.asarray(values, dtype=np.float64)
+
+    def _ratio_row(self, ratios):
+        row = np.array([ratios.get(n, np.nan) for n in self.names], dtype=np.float64)
+        return None if np.isnan(row).any() else row
+
+    def __len__(self):
+        return len(self._X)
+
+    def add(self, params, ratios):
+        """加入一筆訓練資料（同一組臉型值只收第一筆）；回傳是否加入。"""
+        x = self.features(params)
+        y = self._ratio_row(ratios) if ratios else None
+        if x is None or y is None:
+            return False
+        key = tuple(np.round(x * 1e4).astype(np.int64))
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self._X.append(x)
+        self._Y.append(y)
+        self._pending += 1
+        return True
+
+    def observe(self, params, ratios):
+        """真實評估結果：先記錄目前模型對它的預測誤差（online），再加入訓練資料。"""
+        if self.ready and ratios:
+            y = self._ratio_row(ratios)
+            pred = self.predict_matrix([params])
+            if y is not None and pred is not None:
+                self.online_errors.append(pred[0] - y)
+        return self.add(params, ratios)
+
+    @property
+    def ready(self):
+        return len(self._X) >= 2
+
+    def fit(self):
+        """以目前資料重訓（資料超過 max_points 時取最新的 max_points 筆）。"""
+        X = np.asarray(self._X[-self.max_points:])
+        Y = np.asarray(self._Y[-self.max_points:])
+        cols = np.flatnonzero(X.std(axis=0) > 1e-9)
+        if len(cols) == 0:
+            cols = np.arange(min(1, X.shape[1]))
+        mu = X[:, cols].mean(axis=0)
+        sd = X[:, cols].std(axis=0)
+        sd[sd <= 1e-9] = 1.0
+        Z = (X[:, cols] - mu) / sd
+        # 線性 ridge（含截距）
+        A = np.hstack([Z, np.ones((len(Z), 1))])
+        reg = self.smoothing * np.eye(A.shape[1])
+        reg[-1, -1] = 0.0
+        beta = np.linalg.solve(A.T @ A + reg, A.T @ Y)
+        R = Y - A @ beta
+        # Gaussian RBF ridge 擬合殘差
+        d2 = _sq_dists(Z, Z)
+        med = np.median(d2[np.triu_indices(len(Z), 1)]) if len(Z) > 1 else 1.0
+        ls2 = med if med > 1e-12 else 1.0
+        K = np.exp(-d2 / ls2)
+        Kreg = K + self.smoothing * len(Z) * np.eye(len(Z))
+        Kinv = np.linalg.inv(Kreg)
+        alpha = Kinv @ R
+        loo = alpha / np.diag(Kinv)[:, None]
+        self._model = {
+            "cols": cols, "mu": mu, "sd": sd, "Z": Z, "beta": beta, "alpha": alpha, "ls2": ls2,
+            "loo_rmse": np.sqrt(np.mean(loo ** 2, axis=0)), "n": len(Z),
+        }
+        self._pending = 0
+        return self
+
+    def _ensure_fit(self):
+        if self._model is None or self._pending >= self.refit_every:
+            self.fit()
+
+    def predict_matrix(self, params_list):
+        """(N, 17) 預測 ratio（欄位順序同 RATIO_NAMES）；資料不足時 None。"""
+        if not self.ready:
+            return None
+        rows = [self.features(p) for p in params_list]
+        return self.predict_features(np.asarray([r if r is not None else np.full(len(self._X[0]), np.nan) for r in rows]))
+
+    def predict_features(self, X):
+        """(N, 59) 臉型值 → (N, 17) 預測 ratio。"""
+        self._ensure_fit()
+        m = self._model
+        Z = (np.asarray(X, dtype=np.float64)[:, m["cols"]] - m["mu"]) / m["sd"]
+        A = np.hstack([Z, np.ones((len(Z), 1))])
+        K = np.exp(-_sq_dists(Z, m["Z"]) / m["ls2"])
+        return A @ m["beta"] + K @ m["alpha"]
+
+    def predict(self, params_list):
+        """預測 ratio dict 列表；資料不足時 None。"""
+        P = self.predict_matrix(params_list)
+        if P is None:
+            return None
+        return [{n: round(float(v), 4) for n, v in zip(self.names, row)} for row in P]
+
+    def predict_loss(self, params_list, target_ratios):
+        """對 target_ratios 的預測 total_loss 列表；資料不足時 None。"""
+        from run_phase1 import _compute_errors_and_loss
+        preds = self.predict(params_list)
+        if preds is None:
+            return None
+        return [float(_compute_errors_and_loss(target_ratios, p)[2]) for p in preds]
+
+    def error_report(self):
+        """每個 ratio 的 LOO RMSE（RBF 階段的閉式解）與 online RMSE（加入前的預測誤差）。"""
+        out = {"n_train": len(self._X), "n_online": len(self.online_errors)}
+        if self.ready:
+            self._ensure_fit()
+            out["loo_rmse"] = {n: round(float(v), 5) for n, v in zip(self.names, self._model["loo_rmse"])}
+        if self.online_errors:
+            E = np.asarray(self.online_errors)
+            out["online_rmse"] = {n: round(float(v), 5) for n, v in zip(self.names, np.sqrt(np.mean(E ** 2, axis=0)))}
+        return out
+
+
+def _sq_dists(A, B):
+    d2 = (A * A).sum(1)[:, None] + (B * B).sum(1)[None, :] - 2.0 * A @ B.T
+    return np.maximum(d2, 0.0)
+
+
+class Prescreener:
+    """
+    用 RatioSurrogate 篩選猜測。訓練點數達 min_train 且已觀測 min_observed 次真實 loss 後才開始篩；
+    skip(params) 預測 loss > 已觀測真實 loss 的 quantile 時回傳預測值（不截圖），否則 None。
+    """
+
+    def __init__(self, surrogate, target_ratios, quantile=0.5, min_train=30, min_observed=10):
+        self.surrogate = surrogate
+        self.target_ratios = target_ratios
+        self.quantile = float(quantile)
+        self.min_train = int(min_train)
+        self.min_observed = int(min_observed)
+        self.losses = []
+        self.n_screened = 0
+        self.n_passed = 0
+        self.loss_errors = []
+
+    @property
+    def active(self):
+        return len(self.surrogate) >= self.min_train and len(self.losses) >= self.min_observed
+
+    def skip(self, params):
+        if not self.active:
+            return None
+        pred = self.surrogate.predict_loss([params], self.target_ratios)[0]
+        if pred > float(np.quantile(self.losses, self.quantile)):
+            self.n_screened += 1
+            return pred
+        self.n_passed += 1
+        return None
+
+    def rank(self, params_list, keep):
+        """預測 loss 最低的 keep 組索引（原順序）；未啟用時回傳全部索引。"""
+        if not self.active or keep >= len(params_list):
+            return list(range(len(params_list)))
+        pred = self.surrogate.predict_loss(params_list, self.target_ratios)
+        kept = sorted(np.argsort(pred, kind="stable")[:keep].tolist())
+        self.n_screened += len(params_list) - len(kept)
+        self.n_passed += len(kept)
+        return kept
+
+    def observe(self, params, loss, ratios):
+        """真實評估完成：記錄 loss 與代理模型對這筆的 loss 預測誤差，並加入訓練資料。"""
+        if ratios is None:
+            return
+        if self.surrogate.ready:
+            pred = self.surrogate.predict_loss([params], self.target_ratios)[0]
+            self.loss_errors.append(pred - loss)
+        self.losses.append(float(loss))
+        self.surrogate.observe(params, ratios)
+
+    def report(self):
+        out = self.surrogate.error_report()
+        out.update({
+            "screenshots_saved": self.n_screened,
+            "passed_to_game": self.n_passed,
+            "quantile": self.quantile,
+        })
+        if self.loss_errors:
+            e = np.asarray(self.loss_errors)
+            out["loss_mae"] = round(float(np.mean(np.abs(e))), 4)
+        return out
+
+
+def build_prescreener(base_card_path, target_ratios, experiments_root=None, quantile=0.5, min_train=30):
+    """load_history → RatioSurrogate → Prescreener；回傳 (prescreener, 歷史筆數)。"""
+    surrogate = RatioSurrogate(base_card_path)
+    n = sum(1 for params, ratios in load_history(base_card_path, experiments_root) if surrogate.add(params, ratios))
+    return Prescreener(surrogate, target_ratios, quantile=quantile, min_train=min_train), n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit the params -> ratios surrogate on a base card's history and report its prediction error.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    e = sub.add_parser("evaluate", help="LOO RMSE on all history plus a time-ordered holdout (train on the first part, predict the rest)")
+    e.add_argument("--base-card", type=Path, required=True)
+    e.add_argument("--experiments-root", type=Path, default=None, help="Default: output/experiments")
+    e.add_argument("--holdout", type=float, default=0.2, help="Fraction of the newest points used as holdout")
+    e.add_argument("-o", "--output", type=Path, default=None)
+    args = ap.parse_args()
+    if not args.base_card.exists():
+        raise SystemExit("Base card not found: %s" % args.base_card)
+
+    history = load_history(args.base_card, args.experiments_root)
+    full = RatioSurrogate(args.base_card)
+    for params, ratios in history:
+        full.add(params, ratios)
+    if not full.ready:
+        raise SystemExit("Not enough history for %s (%d usable points)." % (args.base_card, len(full)))
+    n_train = max(2, int(round(len(full) * (1.0 - args.holdout))))
+    online = RatioSurrogate(args.base_card)
+    online._X, online._Y = list(full._X[:n_train]), list(full._Y[:n_train])
+    online._pending = n_train
+    P = online.predict_features(np.asarray(full._X[n_train:])) if len(full) > n_train else None
+    report = {"base_card": str(args.base_card), "history": len(history), "usable": len(full), **full.error_report()}
+    if P is not None:
+        err = P - np.asarray(full._Y[n_train:])
+        report["holdout"] = {
+            "n_train": n_train,
+            "n_test": len(err),
+            "rmse": {n: round(float(v), 5) for n, v in zip(full.names, np.sqrt(np.mean(err ** 2, axis=0)))},
+            "ratio_std": {n: round(float(v), 5) for n, v in zip(full.names, np.asarray(full._Y).std(axis=0))},
+        }
+    _out("history: %d points (%d usable, distinct face vectors)" % (len(history), len(full)))
+    for n in full.names:
+        line = "  %-32s LOO %.4f" % (n, report["loo_rmse"][n])
+        if P is not None:
+            line += "  holdout %.4f  (ratio std %.4f)" % (report["holdout"]["rmse"][n], report["holdout"]["ratio_std"][n])
+        _out(line)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        _out("Wrote: %s" % args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -28,7 +28,7 @@ def read_7bit_length_string(data: bytes, pos: int):
     if p + length > len(data):
         return None, p
     try:
-        s = data[p : p + length].decode("utf-8")
+        s = bytes(data[p : p + length]).decode("utf-8")
         return s, p + length
     except Exception:
         return None, p
@@ -25,13 +25,13 @@ def _build_table(source_ratios, screenshots_data, tolerance):
     回傳 (table_rows for markdown, table_data for JSON)。
     """
     if not source_ratios or not screenshots_data:
-        return [], []
+        return [], [], [], []
 
     common_keys = sorted(set(source_ratios) & set(screenshots_data[0].get("ratios") or {}))
     for s in screenshots_data[1:]:
         common_keys = sorted(set(common_keys) & set(s.get("ratios") or {}))
     if not common_keys:
-        return [], []
+        return [], [], [], []
 
     # 每張截圖的 errors_pct 若沒有則現場算
     names = [Path(s["path"]).name for s in screenshots_data]
@@ -82,6 +82,7 @@ def main():
         "-o", "--output", type=Path, default=None,
         help="Report base path (default: Output/validate_mediapipe_report). Writes <path>.json and <path>.md"
     )
+    ap.add_argument("--workers", type=int, default=0, help="截圖 MediaPipe 平行 process 數（0=依序；>=2 用 process pool）")
     ap.add_argument("--params-report", type=Path, default=None, metavar="PATH", help="Optional .params.json to list modified params in report")
     args = ap.parse_args()
 
@@ -91,27 +92,28 @@ def main():
         if not p.exists():
             raise SystemExit("File not found: %s" % p)
 
-    from extract_face_ratios import extract_ratios
+    from extract_face_ratios import extract_ratios, iter_ratios_batch, FaceLandmarkerSession
 
-    try:
-        ratios_source = extract_ratios(args.source)
-    except ValueError as e:
-        raise SystemExit("Source image: %s" % e)
-
-    screenshots_data = []
-    all_common = set(ratios_source.keys())
-    for p in args.screenshots:
+    # 原始圖與所有截圖共用同一個 landmarker（模型只載入一次）；--workers >= 2 時截圖改走 process pool
+    with FaceLandmarkerSession() as session:
         try:
-            ratios = extract_ratios(p)
+            ratios_source = extract_ratios(args.source, session=session)
         except ValueError as e:
-            screenshots_data.append({"path": str(p), "ratios": None, "errors_pct": None, "error": str(e)})
-            continue
-        errors_pct = {}
-        for k in ratios_source:
-            if k in ratios:
-                errors_pct[k] = _pct_diff(ratios_source[k], ratios[k])
-        all_common &= set(ratios.keys())
-        screenshots_data.append({"path": str(p), "ratios": ratios, "errors_pct": errors_pct})
+            raise SystemExit("Source image: %s" % e)
+
+        screenshots_data = []
+        all_common = set(ratios_source.keys())
+        for p, res in zip(args.screenshots, iter_ratios_batch(args.screenshots, workers=args.workers, session=session)):
+            ratios = res["ratios"]
+            if ratios is None:
+                screenshots_data.append({"path": str(p), "ratios": None, "errors_pct": None, "error": res["error"]})
+                continue
+            errors_pct = {}
+            for k in ratios_source:
+                if k in ratios:
+                    errors_pct[k] = _pct_diff(ratios_source[k], ratios[k])
+            all_common &= set(ratios.keys())
+            screenshots_data.append({"path": str(p), "ratios": ratios, "errors_pct": errors_pct})
 
     common_keys = sorted(all_common)
     missing_in_source = sorted(set(ratios_source.keys()) - all_common)
@@ -23,8 +23,6 @@ try:
 except ImportError:
     Image = None
 
-from read_hs2_card import read_trailing_data, find_iend_in_bytes
-from parse_chafile_blocks import read_trailing_header, parse_block_header, get_block_info
 
 # #region agent log
 def _agent_log(data_dict):
@@ -264,43 +262,11 @@ def read_face_from_trailing_messagepack(trailing: bytes):
     """Read shapeValueFace from Custom block (MessagePack). Returns dict cha_name -> game_value (int), or None."""
     if msgpack is None:
         return None
-    bh_bytes, base_pos, err = read_trailing_header(trailing)
-    if err:
-        return None
-    lst_info, err = parse_block_header(bh_bytes)
-    if err:
-        return None
-    info = get_block_info(lst_info, "Custom")
-    if not info:
-        return None
-    pos = int(info.get("pos", 0))
-    size = int(info.get("size", 0))
-    start = base_pos + pos
-    if start + size > len(trailing):
-        return None
-    blob = trailing[start : start + size]
+    from chafile_card import ChaFileCard
     try:
-        up = msgpack.Unpacker(raw=False, strict_map_key=False)
-    except TypeError:
-        up = msgpack.Unpacker(raw=False)
-    up.feed(blob)
-    objs = []
-    while up.tell() < len(blob):
-        try:
-            objs.append(up.unpack())
-        except Exception:
-            break
-    for o in objs:
-        if isinstance(o, dict) and "shapeValueFace" in o:
-            face_list = list(o["shapeValueFace"])
-            if len(face_list) < 59:
-                return None
-            return {
-                name: round(float(face_list[i]) * 100)
-                for i, name in enumerate(ALL_FACE_CHA_NAMES)
-                if i < len(face_list)
-            }
-    return None
+        return ChaFileCard.from_trailing(trailing).read_face_params()
+    except ValueError:
+        return None
 
 
 def _write_via_custom_block(trailing: bytes, params):
@@ -315,109 +281,78 @@ def _write_via_custom_block(trailing: bytes, params):
         return None
 
 
-def _write_via_custom_block_impl(trailing: bytes, params):
-    bh_bytes, base_pos, err = read_trailing_header(trailing)
-    if err:
-        return None
-    lst_info, err = parse_block_header(bh_bytes)
-    if err:
-        return None
-    info = get_block_info(lst_info, "Custom")
-    if not info:
-        return None
-    pos = int(info.get("pos", 0))
-    size = int(info.get("size", 0))
-    start = base_pos + pos
-    if start + size > len(trailing):
-        return None
-    blob = trailing[start : start + size]
-    # Unpack all objects in Custom block
-    try:
-        up = msgpack.Unpacker(raw=False, strict_map_key=False)
-    except TypeError:
-        up = msgpack.Unpacker(raw=False)
-    up.feed(blob)
-    objs = []
-    while up.tell() < len(blob):
-        try:
-            objs.append(up.unpack())
-        except Exception:
-            break
-    face_obj_idx = None
-    for i, o in enumerate(objs):
-        if isinstance(o, dict) and "shapeValueFace" in o:
-            face_obj_idx = i
-            break
-    if face_obj_idx is None:
-        return None
-    face_list = list(objs[face_obj_idx]["shapeValueFace"])
-    if len(face_list) < 59:
-        _agent_log({"hypothesisId": "H2,H3", "path": "custom_block", "face_list_len": len(face_list), "reason": "list_too_short"})
-        return None
+def _apply_face_params(face_list, params):
+    """Set values in face_list (59 stored floats) in place. Returns written [(name, list_index, value), ...]."""
     written = []
     if isinstance(params, list):
-        if len(params) != 59:
-            return None
         for i in range(59):
             f = _game_val_to_float(params[i])
             face_list[i] = f
             written.append((ALL_FACE_CHA_NAMES[i], i, round(f * 100) if abs(f * 100 - round(f * 100)) < 0.01 else f * 100))
-    else:
-        for key, value in params.items():
-            if key in CHA_NAME_TO_LIST_INDEX:
-                idx = CHA_NAME_TO_LIST_INDEX[key]
-                f = _game_val_to_float(value)
-                face_list[idx] = f
-                written.append((key, idx, round(float(value)) if isinstance(value, (int, float)) else value))
-            elif key in PARAM_TO_LIST_INDICES:
-                try:
-                    v = max(GAME_SLIDER_MIN, min(GAME_SLIDER_MAX, float(value)))
-                    v_int = round(v)
-                    f = v_int / 100.0
-                    for idx in PARAM_TO_LIST_INDICES[key]:
-                        if idx < len(face_list):
-                            face_list[idx] = f
-                            written.append((key, idx, float(v_int)))
-                except (TypeError, ValueError):
-                    pass
-    objs[face_obj_idx]["shapeValueFace"] = face_list
-    # Repack all objects
-    new_parts = []
-    for o in objs:
-        new_parts.append(_msgpack_pack(o))
-    new_blob = b"".join(new_parts)
-    blob_ok = len(new_blob) == size
-    _agent_log({"hypothesisId": "H2,H3,H4", "path": "custom_block", "face_list_len": len(face_list), "written": written[:5], "new_blob_len": len(new_blob), "block_size": size, "blob_size_ok": blob_ok})
-    if not blob_ok:
-        return None  # block size must not change for simple in-place replace
-    new_trailing = trailing[:start] + new_blob + trailing[start + size :]
-    return new_trailing, written
+        return written
+    for key, value in params.items():
+        if key in CHA_NAME_TO_LIST_INDEX:
+            idx = CHA_NAME_TO_LIST_INDEX[key]
+            f = _game_val_to_float(value)
+            face_list[idx] = f
+            written.append((key, idx, round(float(value)) if isinstance(value, (int, float)) else value))
+        elif key in PARAM_TO_LIST_INDICES:
+            try:
+                v = max(GAME_SLIDER_MIN, min(GAME_SLIDER_MAX, float(value)))
+                v_int = round(v)
+                f = v_int / 100.0
+                for idx in PARAM_TO_LIST_INDICES[key]:
+                    if idx < len(face_list):
+                        face_list[idx] = f
+                        written.append((key, idx, float(v_int)))
+            except (TypeError, ValueError):
+                pass
+    return written
+
+
+def _write_via_custom_block_impl(trailing, params):
+    from chafile_card import ChaFileCard
+    card = trailing if isinstance(trailing, ChaFileCard) else ChaFileCard.from_trailing(trailing)
+    try:
+        written = card.set_face_params(params)
+    except ValueError as e:
+        _agent_log({"hypothesisId": "H2,H3,H4", "path": "custom_block", "error": str(e)})
+        return None
+    return card.trailing_bytes(), written
+
+
+def _display_written(written):
+    from read_face_params_from_card import FACE_OFFSETS
+    idx_to_name = {(off - 3) // 5: name for off, name in FACE_OFFSETS}
+    display = []
+    for item in written:
+        if len(item) == 3:
+            name_or_poc, idx, v = item
+            display.append((idx_to_name.get(idx, name_or_poc if isinstance(name_or_poc, str) else "idx" + str(idx)), v))
+        else:
+            display.append(item)
+    return display
 
 
 def write_face_params_into_trailing(trailing: bytes, params):
     """
     Modify trailing with face params. Prefer Custom block MessagePack; fallback to raw offset.
+    trailing: bytes, or a chafile_card.ChaFileCard (parsed once; repeated calls reuse its header and block layout).
     params: dict (cha_name or poc_name -> value) or list of 59 (values by index, game value or float).
     Returns (new_trailing, written_list) or None. written_list entries are (cha_name, value) for display.
     Note: When using MessagePack, the game reads correct values; HS2CharEdit expects raw key+offset layout
     and may show wrong values. Use in-game load to verify face.
     """
     from read_face_params_from_card import FACE_OFFSETS
-    idx_to_name = {(off - 3) // 5: name for off, name in FACE_OFFSETS}
     cha_name_to_offset = {name: off for off, name in FACE_OFFSETS}
     result = _write_via_custom_block(trailing, params)
     _agent_log({"hypothesisId": "H1", "used_messagepack_path": result is not None})
     if result is not None:
         new_trailing, written = result
-        display = []
-        for item in written:
-            if len(item) == 3:
-                name_or_poc, idx, v = item
-                display.append((idx_to_name.get(idx, name_or_poc if isinstance(name_or_poc, str) else "idx" + str(idx)), v))
-            else:
-                display.append(item)
-        return new_trailing, display
+        return new_trailing, _display_written(written)
     # Fallback: raw offset write (all 59)
+    if not isinstance(trailing, (bytes, bytearray)):
+        trailing = bytes(trailing.trailing)
     idx = search(trailing, KEY_FACE)
     _agent_log({"hypothesisId": "H1", "raw_fallback": True, "key_found": idx >= 0})
     if idx < 0:
@@ -511,26 +446,26 @@ def main():
     if not params:
         raise SystemExit("No params: use --params JSON, --chareditor-read JSON, --face-list JSON, or --set name=value")
 
-    trailing, _ = read_trailing_data(args.card)
-    if trailing is None:
+    from chafile_card import ChaFileCard
+    try:
+        card = ChaFileCard.from_path(args.card)
+    except ValueError:
+        raise SystemExit("Not a valid PNG")
+    if len(card.trailing) == 0:
         raise SystemExit("No trailing data")
-    result = write_face_params_into_trailing(trailing, params)
+    result = write_face_params_into_trailing(card, params)
     if result is None:
         raise SystemExit("shapeValueFace not found in trailing (card format may be MessagePack-only)")
     new_trailing, written = result
 
-    card_bytes = args.card.read_bytes()
-    iend = find_iend_in_bytes(card_bytes)
-    if iend is None:
-        raise SystemExit("Not a valid PNG")
     if args.preview_image is not None:
         if not args.preview_image.exists():
             raise SystemExit(f"Preview image not found: {args.preview_image}")
         split_r = getattr(args, "preview_split", 0.5)
         split_r = max(0.01, min(0.99, float(split_r)))
-        png_part = _png_bytes_from_preview_split(card_bytes[:iend], args.preview_image, split_ratio=split_r)
+        png_part = _png_bytes_from_preview_split(bytes(card.png_bytes), args.preview_image, split_ratio=split_r)
     else:
-        png_part = card_bytes[:iend]
+        png_part = card.png_bytes
     out_dir = BASE / "output"
     out_path = args.output or out_dir / (args.card.stem + "_edited.png")
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -540,41 +475,10 @@ def main():
     print("Wrote:", out_path)
     print("Written sliders:", written)
     # #region agent log readback
-    try:
-        tr2, _ = read_trailing_data(out_path)
-        if tr2 and msgpack:
-            bh_bytes2, base_pos2, err2 = read_trailing_header(tr2)
-            if not err2:
-                lst_info2, err2b = parse_block_header(bh_bytes2)
-                if not err2b and lst_info2:
-                    info2 = get_block_info(lst_info2, "Custom")
-                    if info2:
-                        pos2 = int(info2.get("pos", 0))
-                        size2 = int(info2.get("size", 0))
-                        start2 = base_pos2 + pos2
-                        if start2 + size2 <= len(tr2):
-                            blob2 = tr2[start2 : start2 + size2]
-                            try:
-                                up2 = msgpack.Unpacker(raw=False, strict_map_key=False)
-                            except TypeError:
-                                up2 = msgpack.Unpacker(raw=False)
-                            try:
-                                up2.feed(blob2)
-                                objs2 = []
-                                while up2.tell() < len(blob2):
-                                    try:
-                                        objs2.append(up2.unpack())
-                                    except Exception:
-                                        break
-                                for o2 in objs2:
-                                    if isinstance(o2, dict) and "shapeValueFace" in o2:
-                                        lst2 = list(o2["shapeValueFace"])
-                                        _agent_log({"hypothesisId": "H3,H4", "readback_file": str(out_path), "shapeValueFace_len": len(lst2), "idx19_value": lst2[19] if len(lst2) > 19 else None})
-                                        break
-                            except Exception as e:
-                                _agent_log({"hypothesisId": "H3,H4", "readback_error": str(e)})
-    except Exception as e:
-        _agent_log({"hypothesisId": "H3,H4", "readback_exception": str(e)})
+    # 由同一個 ChaFileCard 的 in-memory face object 讀回（不再重新讀檔、解析）
+    if card.has_face:
+        lst2 = card.face_values()
+        _agent_log({"hypothesisId": "H3,H4", "readback_file": str(out_path), "shapeValueFace_len": len(lst2), "idx19_value": lst2[19] if len(lst2) > 19 else None})
     # #endregion
     return 0
 